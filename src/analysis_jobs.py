@@ -0,0 +1,37 @@
+"""
+SonicWall Analysis Jobs
+Analysis tool entry points executed inside AnalysisPool workers
+"""
+
+import asyncio
+from typing import Dict, Any, List, Optional
+
+from analysis_pool import worker_cache
+from config_model import ConfigModel
+from dependency_graph import DependencyGraph
+from nat_engine import NatEngine
+from route_engine import RouteEngine
+from tools import object_impact, nat_lookup, route_lookup
+
+# Jobs take the worker's copy of the config model first and return the tool
+# output. Compiled engines are cached per snapshot, so repeated lookups
+# against an unchanged config skip the compile step.
+
+
+def object_impact_job(model: ConfigModel, name: str, kind: Optional[str] = None) -> str:
+    # The server keeps the graph of its shared model up to date and ships it in the snapshot
+    graph = model.indexes.get("dependency_graph")
+    if graph is None:
+        graph = worker_cache("dependency_graph", lambda: DependencyGraph.from_model(model))
+    return asyncio.run(object_impact(graph, name, kind))
+
+
+def nat_lookup_job(model: ConfigModel, flows: List[Dict[str, Any]]) -> str:
+    engine = worker_cache("nat_engine", lambda: NatEngine.from_model(model))
+    return asyncio.run(nat_lookup(engine, flows))
+
+
+def route_lookup_job(model: ConfigModel, dst: str, src: Optional[str] = None,
+                     protocol: Optional[str] = None, port: Optional[int] = None) -> str:
+    engine = worker_cache("route_engine", lambda: RouteEngine.from_model(model))
+    return asyncio.run(route_lookup(engine, dst, src, protocol, port))
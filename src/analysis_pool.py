@@ -0,0 +1,325 @@
+"""
+SonicWall Analysis Pool
+Runs CPU-heavy config analysis in worker processes fed from shared-memory config snapshots
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import traceback
+from array import array
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds a single analysis job may run before its worker is killed
+DEFAULT_TIME_BUDGET = float(os.getenv("SONICWALL_ANALYSIS_BUDGET", "60"))
+
+# Worker processes; 0 runs jobs in a thread of the server process instead
+DEFAULT_WORKERS = int(os.getenv("SONICWALL_ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# A snapshot is pickled this many objects at a time, yielding to the event
+# loop in between; a model that changes meanwhile is pickled again, up to
+# PUBLISH_ATTEMPTS times before the last try runs without yielding
+PICKLE_BATCH = 500
+PUBLISH_ATTEMPTS = 3
+
+_ATOMS = (str, bytes, int, float, bool, type(None), array)
+
+
+class AnalysisError(Exception):
+    """An analysis job raised inside its worker."""
+
+
+class AnalysisTimeout(AnalysisError):
+    """An analysis job exceeded its time budget and was killed."""
+
+
+class Snapshot:
+    """A pickled config model published once into a shared memory segment.
+
+    Workers attach by name and unpickle it the first time they see it, so a
+    job only carries the segment name instead of the whole config. The
+    segment holds a stream of pickles sharing one memo (see
+    ``pickle_in_batches``); the last of them is the model.
+    """
+
+    __slots__ = ("model", "generation", "size", "users", "_shm")
+
+    def __init__(self, model: Any, generation: int, data: bytes):
+        self.model = model
+        self.generation = generation
+        self.size = len(data)
+        self.users = 0
+        self._shm = shared_memory.SharedMemory(create=True, size=max(self.size, 1))
+        self._shm.buf[:self.size] = data
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def matches(self, model: Any) -> bool:
+        return self.model is model and self.generation == model.generation
+
+    def release(self):
+        try:
+            self._shm.close()
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Worker-process state: the snapshot currently decoded and objects derived from it
+_worker_snapshot: Optional[str] = None
+_worker_model: Any = None
+_worker_cache: Dict[str, Any] = {}
+
+
+def _children(obj: Any) -> List[Any]:
+    if isinstance(obj, dict):
+        return list(obj.keys()) + list(obj.values())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return list(obj)
+    state = getattr(obj, "__dict__", None)
+    if state is not None:
+        return list(state.values())
+    return [getattr(obj, name, None) for cls in type(obj).__mro__ for name in getattr(cls, "__slots__", ())]
+
+
+def _walk(obj: Any, depth: int = 0):
+    """Yield the parts of ``obj`` to pickle first, bottom up: the top levels and
+    any large container are opened up (and yielded after their contents),
+    everything below is yielded whole."""
+    if isinstance(obj, _ATOMS):
+        return
+    for child in _children(obj):
+        if not isinstance(child, _ATOMS) and (
+                depth < 2 or (isinstance(child, (dict, list, tuple, set, frozenset)) and len(child) > PICKLE_BATCH)):
+            yield from _walk(child, depth + 1)
+        yield child
+
+
+async def pickle_in_batches(model: Any) -> Optional[Tuple[int, bytes]]:
+    """Pickle ``model`` without holding the event loop for the whole dump.
+
+    Its parts are dumped ``PICKLE_BATCH`` at a time through one pickler, so
+    their memo entries make the final dump of the model itself mostly back
+    references, and the loop runs between batches. (A thread would not
+    help: the pickler holds the GIL throughout.) Returns (generation,
+    bytes), or None if the model changed before the dump finished.
+    """
+    generation = model.generation
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    batch = []
+    try:
+        for part in _walk(model):
+            batch.append(part)
+            if len(batch) >= PICKLE_BATCH:
+                pickler.dump(batch)
+                batch = []
+                await asyncio.sleep(0)
+                if model.generation != generation:
+                    return None
+        pickler.dump(batch)
+        pickler.dump(model)
+    except RuntimeError:
+        # A container changed size while it was being opened up
+        return None
+    return generation, buffer.getvalue()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track flag
+        return shared_memory.SharedMemory(name=name)
+
+
+def _load_snapshot(name: str, size: int) -> Any:
+    global _worker_snapshot, _worker_model
+    if name == _worker_snapshot:
+        return _worker_model
+
+    shm = _attach(name)
+    view = shm.buf[:size]
+    try:
+        unpickler = pickle.Unpickler(io.BytesIO(view))
+        while True:
+            try:
+                model = unpickler.load()
+            except EOFError:
+                break
+    finally:
+        view.release()
+        shm.close()
+
+    _worker_snapshot, _worker_model = name, model
+    _worker_cache.clear()
+    return model
+
+
+def worker_cache(key: str, factory: Callable[[], Any]) -> Any:
+    """Memoize an object derived from the worker's current snapshot (e.g. a compiled engine)."""
+    if key not in _worker_cache:
+        _worker_cache[key] = factory()
+    return _worker_cache[key]
+
+
+def _worker_main(conn):
+    """Worker loop: receive (func, args, snapshot) jobs, reply ("ok"|"error", value)."""
+    # Ctrl-C goes to the server; workers are stopped by the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        func, args, snapshot = job
+        try:
+            if snapshot is not None:
+                args = (_load_snapshot(*snapshot),) + tuple(args)
+            reply = ("ok", func(*args))
+        except Exception:
+            reply = ("error", traceback.format_exc())
+
+        try:
+            conn.send(reply)
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class _Worker:
+    __slots__ = ("process", "conn")
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=1)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+
+
+class AnalysisPool:
+    """Process pool for analysis jobs with per-job time budgets and cancellation.
+
+    A job is a module-level function; when a model is given it receives the
+    worker's copy of that model as its first argument. The model is pickled
+    once per generation into shared memory, not once per job. A job that
+    runs past its budget, or whose caller is cancelled, has its worker
+    killed and replaced, so a runaway analysis never keeps a CPU busy.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, budget: float = DEFAULT_TIME_BUDGET):
+        self.max_workers = workers
+        self.budget = budget
+        # spawn keeps workers free of the server's event loop, sockets and threads
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[_Worker] = []
+        self._slots = asyncio.Semaphore(max(workers, 1))
+        self._snapshot: Optional[Snapshot] = None
+        self._retired: List[Snapshot] = []
+        self._publishing = asyncio.Lock()
+
+    async def _publish(self, model: Any) -> Snapshot:
+        async with self._publishing:
+            if self._snapshot is not None and self._snapshot.matches(model):
+                return self._snapshot
+            generation, data = await self._pickle(model)
+            snapshot = Snapshot(model, generation, data)
+            if self._snapshot is not None:
+                self._retired.append(self._snapshot)
+            self._snapshot = snapshot
+            logger.debug(f"Published config snapshot {snapshot.name} ({snapshot.size} bytes)")
+            self._release_retired()
+            return snapshot
+
+    @staticmethod
+    async def _pickle(model: Any) -> Tuple[int, bytes]:
+        for _ in range(PUBLISH_ATTEMPTS):
+            pickled = await pickle_in_batches(model)
+            if pickled is not None:
+                return pickled
+        logger.debug("Config model kept changing; pickling its snapshot in one go")
+        return model.generation, pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _release_retired(self):
+        for snapshot in [s for s in self._retired if s.users == 0]:
+            snapshot.release()
+            self._retired.remove(snapshot)
+
+    def _checkout(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.alive():
+                return worker
+        return _Worker(self._context)
+
+    async def run(self, func: Callable, *args, model: Any = None, budget: Optional[float] = None) -> Any:
+        """Run ``func(*args)`` (or ``func(model, *args)``) in a worker and return its result."""
+        budget = self.budget if budget is None else budget
+
+        if self.max_workers <= 0:
+            call_args = ((model,) if model is not None else ()) + args
+            return await asyncio.wait_for(asyncio.to_thread(func, *call_args), budget)
+
+        async with self._slots:
+            snapshot = await self._publish(model) if model is not None else None
+            worker = self._checkout()
+            if snapshot is not None:
+                snapshot.users += 1
+            finished = False
+            try:
+                worker.conn.send((func, args, (snapshot.name, snapshot.size) if snapshot else None))
+                status, value = await asyncio.wait_for(asyncio.to_thread(worker.conn.recv), budget)
+                finished = True
+            except asyncio.TimeoutError:
+                raise AnalysisTimeout(f"{func.__name__} exceeded its {budget:g}s time budget")
+            except (EOFError, OSError) as e:
+                raise AnalysisError(f"Analysis worker died: {e}")
+            finally:
+                if finished:
+                    self._idle.append(worker)
+                else:
+                    # Timed out, cancelled or broken: the worker may still be computing
+                    worker.kill()
+                if snapshot is not None:
+                    snapshot.users -= 1
+                    self._release_retired()
+
+        if status == "error":
+            logger.debug(f"Analysis job {func.__name__} failed:\n{value}")
+            raise AnalysisError(value.strip().splitlines()[-1])
+        return value
+
+    async def close(self):
+        """Stop all workers and free shared memory."""
+        workers, self._idle = self._idle, []
+        for worker in workers:
+            await asyncio.to_thread(worker.stop)
+        for snapshot in self._retired + ([self._snapshot] if self._snapshot else []):
+            snapshot.release()
+        self._retired, self._snapshot = [], None
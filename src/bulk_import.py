@@ -0,0 +1,396 @@
+"""
+SonicWall Bulk Import
+Streams address and service objects from CSV/JSON files into bulk API writes
+"""
+
+import asyncio
+import csv
+import ipaddress
+import json
+import logging
+import os
+import re
+from typing import Dict, Any, Callable, Iterator, List, Optional, Set, Tuple
+
+from config_loader import CONFIG_ENDPOINTS, ENTRY_WRAPPERS
+from config_model import ConfigModel
+from change_set import DEFAULT_BATCH_SIZE, bulk_body
+from sonicwall_client import SonicWallClient
+from spec_validator import ValidationError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMPORT_CONCURRENCY = 4
+
+# Log progress every this many rows
+PROGRESS_EVERY = 1000
+
+# Bytes read per step when streaming a JSON file
+_READ_SIZE = 64 * 1024
+
+_MAC = re.compile(r"^[0-9A-Fa-f]{2}([:-]?)[0-9A-Fa-f]{2}(\1[0-9A-Fa-f]{2}){4}$")
+_FQDN = re.compile(r"^(\*\.)?([A-Za-z0-9_-]{1,63}\.)+[A-Za-z]{2,63}\.?$")
+
+# (row number, record) as read from the file
+Row = Tuple[int, Dict[str, Any]]
+
+
+def _iter_csv(path: str) -> Iterator[Row]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, {k.strip().lower(): (v or "").strip() for k, v in record.items() if k}
+
+
+def _iter_json(path: str) -> Iterator[Row]:
+    """Entries of a top-level JSON array, or of JSON Lines, decoded one at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = f.read(_READ_SIZE).lstrip()
+        if buffer.startswith("["):
+            buffer = buffer[1:]
+        row = 0
+        eof = False
+        while True:
+            buffer = buffer.lstrip(" \t\r\n,")
+            if not buffer:
+                if eof:
+                    return
+                chunk = f.read(_READ_SIZE)
+                eof = not chunk
+                buffer = chunk
+                continue
+            if buffer[0] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(_READ_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            row += 1
+            buffer = buffer[end:]
+            yield row, record
+
+
+def resolve_import_path(directory: str, path: str) -> str:
+    """Resolve ``path`` (absolute, or relative to ``directory``) and refuse
+    anything outside ``directory``, so clients cannot read arbitrary files
+    or create error reports elsewhere on the server."""
+    root = os.path.realpath(directory)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Import files must be inside {root}")
+    return resolved
+
+
+def read_rows(path: str) -> Iterator[Row]:
+    """Stream records from a .csv, .json or .jsonl file."""
+    if path.lower().endswith(".csv"):
+        return _iter_csv(path)
+    return _iter_json(path)
+
+
+def _range(value: str) -> Tuple[str, str]:
+    begin, end = (part.strip() for part in value.split("-", 1))
+    return begin, end
+
+
+def parse_address(record: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Turn a flat (name, type, value, zone) record or an API-shaped entry into
+    (category, entry). Raises ValueError for anything the firewall would reject."""
+    if len(record) == 1 and next(iter(record)) in ENTRY_WRAPPERS:
+        family, entry = next(iter(record.items()))
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise ValueError("entry needs a name")
+        category = f"address_objects_{family}"
+        if category not in CONFIG_ENDPOINTS:
+            raise ValueError(f"unsupported address family '{family}'")
+        return category, entry
+
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    value = str(record.get("value") or record.get("address") or "").strip()
+    if not value:
+        raise ValueError("missing value")
+    kind = str(record.get("type") or "").strip().lower()
+    entry: Dict[str, Any] = {"name": name}
+    if record.get("zone"):
+        entry["zone"] = str(record["zone"]).strip()
+
+    host = None
+    if not kind:
+        if _MAC.match(value):
+            kind = "mac"
+        elif "-" in value and not _FQDN.match(value):
+            kind = "range"
+        elif "/" in value:
+            kind = "network"
+        else:
+            try:
+                host = ipaddress.ip_address(value)
+                kind = "host"
+            except ValueError:
+                kind = "fqdn"
+
+    if kind == "host":
+        family = f"ipv{(host or ipaddress.ip_address(value)).version}"
+        entry["host"] = {"ip": value}
+    elif kind == "network":
+        network = ipaddress.ip_network(value, strict=False)
+        family = f"ipv{network.version}"
+        if network.version == 4:
+            entry["network"] = {"subnet": str(network.network_address), "mask": str(network.netmask)}
+        else:
+            entry["network"] = {"subnet": str(network.network_address), "mask": str(network.prefixlen)}
+    elif kind == "range":
+        if "-" not in value:
+            raise ValueError("range must be 'begin-end'")
+        begin, end = _range(value)
+        first, last = ipaddress.ip_address(begin), ipaddress.ip_address(end)
+        if first.version != last.version or first > last:
+            raise ValueError(f"invalid range '{value}'")
+        family = f"ipv{first.version}"
+        entry["range"] = {"begin": begin, "end": end}
+    elif kind == "fqdn":
+        if not _FQDN.match(value):
+            raise ValueError(f"invalid FQDN '{value}'")
+        family = "fqdn"
+        entry["domain"] = value
+    elif kind == "mac":
+        if not _MAC.match(value):
+            raise ValueError(f"invalid MAC address '{value}'")
+        family = "mac"
+        entry["address"] = value
+    else:
+        raise ValueError(f"unsupported type '{kind}'")
+    return f"address_objects_{family}", entry
+
+
+def parse_service(record: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Turn a flat (name, protocol, port) record or an API-shaped entry into
+    ("service_objects", entry). Raises ValueError for invalid rows."""
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    if "protocol" not in record:
+        # Already shaped like the API, e.g. {"name": "x", "tcp": {"begin": 80, "end": 80}}
+        if len(record) < 2:
+            raise ValueError("missing protocol")
+        return "service_objects", record
+
+    protocol = str(record["protocol"]).strip().lower()
+    entry: Dict[str, Any] = {"name": name}
+    if protocol in ("tcp", "udp"):
+        ports = str(record.get("port") or record.get("value") or "").strip()
+        if not ports and record.get("begin"):
+            ports = f"{record['begin']}-{record.get('end') or record['begin']}"
+        if not ports:
+            raise ValueError("missing port")
+        begin, end = _range(ports) if "-" in ports else (ports, ports)
+        try:
+            begin, end = int(begin), int(end)
+        except ValueError:
+            raise ValueError(f"invalid port '{ports}'")
+        if not 1 <= begin <= end <= 65535:
+            raise ValueError(f"invalid port range '{ports}'")
+        entry[protocol] = {"begin": begin, "end": end}
+    elif protocol in ("icmp", "icmpv6"):
+        entry[protocol] = str(record.get("value") or record.get("port") or "echo-request").strip()
+    else:
+        raise ValueError(f"unsupported protocol '{protocol}'")
+    return "service_objects", entry
+
+
+PARSERS: Dict[str, Callable[[Dict[str, Any]], Tuple[str, Dict[str, Any]]]] = {
+    "address": parse_address,
+    "service": parse_service,
+}
+
+
+class ImportReport:
+    """Counters for one import run."""
+
+    def __init__(self, path: str, error_path: str):
+        self.path = path
+        self.error_path = error_path
+        self.rows = 0
+        self.imported = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+        self.requests = 0
+        self.committed = False
+        self.commit_error: Optional[str] = None
+
+    @property
+    def errors(self) -> int:
+        return self.duplicates + self.invalid + self.failed
+
+
+class _ErrorFile:
+    """Per-row error CSV, created on the first error."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._writer = None
+
+    def write(self, row: int, name: str, status: str, error: str):
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["row", "name", "status", "error"])
+        self._writer.writerow([row, name, status, error])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+async def import_objects(client: SonicWallClient, path: str, kind: str = "address",
+                         model: Optional[ConfigModel] = None,
+                         on_duplicate: str = "skip",
+                         batch_size: int = DEFAULT_BATCH_SIZE,
+                         concurrency: int = DEFAULT_IMPORT_CONCURRENCY,
+                         dry_run: bool = False,
+                         commit: bool = True,
+                         error_path: Optional[str] = None,
+                         progress: Optional[Callable[[ImportReport], None]] = None) -> ImportReport:
+    """Import objects from ``path`` through a parse → dedupe → validate → batch pipeline.
+
+    Rows are read lazily and at most ``concurrency`` batches of
+    ``batch_size`` entries are held or in flight at once, so memory stays
+    flat however large the file is (apart from the set of names seen, used
+    to drop repeats within the file). Names already in ``model`` are skipped,
+    or sent as updates with ``on_duplicate="update"``. A batch the firewall
+    rejects is retried one entry at a time so each bad row is reported. All
+    accepted writes are committed once at the end.
+    """
+    if kind not in PARSERS:
+        raise ValueError(f"Unsupported import kind '{kind}'")
+    if on_duplicate not in ("skip", "update"):
+        raise ValueError("on_duplicate must be 'skip' or 'update'")
+    parse = PARSERS[kind]
+    table = None
+    if model is not None:
+        table = model.address_objects if kind == "address" else model.service_objects
+
+    await client.validators_ready()
+    report = ImportReport(path, error_path or f"{os.path.splitext(path)[0]}.errors.csv")
+    errors = _ErrorFile(report.error_path)
+    seen: Set[str] = set()
+    # (method, category) -> [(row, entry)]
+    buffers: Dict[Tuple[str, str], List[Tuple[int, Dict[str, Any]]]] = {}
+    in_flight: Set[asyncio.Task] = set()
+    batch_size = max(1, batch_size)
+
+    async def send(method: str, category: str, batch: List[Tuple[int, Dict[str, Any]]]):
+        endpoint = CONFIG_ENDPOINTS[category][0]
+        write = client.post if method == "POST" else client.put
+        try:
+            report.requests += 1
+            await write(endpoint, bulk_body(category, [entry for _, entry in batch]))
+            done = len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                row, entry = batch[0]
+                report.failed += 1
+                errors.write(row, entry.get("name", ""), "failed", str(e))
+                return
+            # Find the bad rows: resend one entry per request
+            done = 0
+            for row, entry in batch:
+                try:
+                    report.requests += 1
+                    await write(endpoint, bulk_body(category, [entry]))
+                    done += 1
+                except Exception as entry_error:
+                    report.failed += 1
+                    errors.write(row, entry.get("name", ""), "failed", str(entry_error))
+        if method == "POST":
+            report.imported += done
+        else:
+            report.updated += done
+        if progress is not None:
+            progress(report)
+
+    async def flush(key: Tuple[str, str]):
+        batch = buffers.pop(key)
+        if dry_run:
+            if key[0] == "POST":
+                report.imported += len(batch)
+            else:
+                report.updated += len(batch)
+            return
+        while len(in_flight) >= concurrency:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            in_flight.difference_update(done)
+        in_flight.add(asyncio.create_task(send(key[0], key[1], batch)))
+
+    try:
+        for row, record in read_rows(path):
+            report.rows += 1
+            if report.rows % PROGRESS_EVERY == 0:
+                logger.info(f"Import of {os.path.basename(path)}: {report.rows} rows read")
+            name = str(record.get("name", "")) if isinstance(record, dict) else ""
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("row is not an object")
+                category, entry = parse(record)
+            except ValueError as e:
+                report.invalid += 1
+                errors.write(row, name, "invalid", str(e))
+                continue
+
+            name = entry["name"]
+            method = "POST"
+            if name in seen:
+                report.duplicates += 1
+                errors.write(row, name, "duplicate", "repeated earlier in the file")
+                continue
+            seen.add(name)
+            if table is not None and name in table:
+                if on_duplicate == "skip":
+                    report.duplicates += 1
+                    errors.write(row, name, "duplicate", "already exists on the firewall")
+                    continue
+                method = "PUT"
+            # Spec check per row, so a typo is reported here instead of failing a whole batch
+            try:
+                client.validate(method, CONFIG_ENDPOINTS[category][0], bulk_body(category, [entry]))
+            except ValidationError as e:
+                report.invalid += 1
+                errors.write(row, name, "invalid", "; ".join(e.errors))
+                continue
+
+            key = (method, category)
+            buffers.setdefault(key, []).append((row, entry))
+            if len(buffers[key]) >= batch_size:
+                await flush(key)
+
+        for key in list(buffers):
+            await flush(key)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    finally:
+        for task in in_flight:
+            task.cancel()
+        errors.close()
+
+    if commit and not dry_run and report.imported + report.updated:
+        try:
+            await client.commit_config()
+            report.committed = True
+        except Exception as e:
+            report.commit_error = str(e)
+            logger.error(f"Import commit failed: {str(e)}")
+    logger.info(
+        f"Imported {report.imported} new and {report.updated} updated objects from {path} "
+        f"in {report.requests} requests ({report.errors} rows not imported)"
+    )
+    return report
@@ -0,0 +1,375 @@
+"""
+SonicWall Capture Flows
+Incremental libpcap/pcapng parsing into a fixed-size table of per-flow counters
+"""
+
+import heapq
+import ipaddress
+import logging
+import struct
+from array import array
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Flows tracked before further new flows are only counted in aggregate
+MAX_FLOWS = 65536
+
+# Largest record accepted; anything bigger means the stream is not what its header says
+MAX_RECORD = 16 * 1024 * 1024
+
+# Link types (https://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+PROTOCOLS = {1: "icmp", 6: "tcp", 17: "udp", 47: "gre", 50: "esp", 58: "icmpv6", 132: "sctp"}
+
+# TCP flag bits, in the order they are shown
+TCP_FLAGS = ((0x02, "S"), (0x10, "A"), (0x08, "P"), (0x01, "F"), (0x04, "R"), (0x20, "U"))
+
+_VLAN_TYPES = (0x8100, 0x88A8, 0x9100)
+_IPV6_EXTENSIONS = (0, 43, 60)
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+_PCAPNG_SECTION = 0x0A0D0D0A
+_PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+
+# (protocol, source address, source port, destination address, destination port, TCP flags, TCP seq,
+#  payload length); addresses are raw bytes, ports are 0 for protocols without them
+Packet = Tuple[int, bytes, int, bytes, int, int, int, int]
+
+
+def decode_packet(linktype: int, data: memoryview) -> Optional[Packet]:
+    """The flow fields of one captured frame, or None if it is not IP (or is too short to tell).
+
+    Lengths come from the IP headers, not from what was captured, so
+    truncated captures (small snaplen) still count full payloads.
+    """
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            ethertype = struct.unpack_from("!H", data, 12)[0]
+            offset = 14
+            while ethertype in _VLAN_TYPES:
+                ethertype = struct.unpack_from("!H", data, offset + 2)[0]
+                offset += 4
+        elif linktype == LINKTYPE_LINUX_SLL:
+            ethertype = struct.unpack_from("!H", data, 14)[0]
+            offset = 16
+        elif linktype == LINKTYPE_NULL:
+            family = struct.unpack_from("=I", data, 0)[0]
+            ethertype = 0x0800 if family == 2 else 0x86DD if family in (10, 24, 28, 30) else 0
+            offset = 4
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            version = data[0] >> 4
+            ethertype = 0x0800 if version == 4 else 0x86DD if version == 6 else 0
+            offset = 0
+        else:
+            return None
+
+        if ethertype == 0x0800:
+            header = (data[offset] & 0x0F) * 4
+            total, fragment = struct.unpack_from("!H2xH", data, offset + 2)
+            protocol = data[offset + 9]
+            source = bytes(data[offset + 12:offset + 16])
+            destination = bytes(data[offset + 16:offset + 20])
+            transport = offset + header
+            end = offset + total
+            if fragment & 0x1FFF:
+                # Later fragments carry no transport header
+                return protocol, source, 0, destination, 0, 0, 0, max(end - transport, 0)
+        elif ethertype == 0x86DD:
+            payload, protocol = struct.unpack_from("!HB", data, offset + 4)
+            source = bytes(data[offset + 8:offset + 24])
+            destination = bytes(data[offset + 24:offset + 40])
+            transport = offset + 40
+            end = transport + payload
+            while protocol in _IPV6_EXTENSIONS or protocol == 44:
+                if protocol == 44:
+                    fragment = struct.unpack_from("!H", data, transport + 2)[0]
+                    protocol = data[transport]
+                    transport += 8
+                    if fragment & 0xFFF8:
+                        return protocol, source, 0, destination, 0, 0, 0, max(end - transport, 0)
+                else:
+                    protocol, length = data[transport], (data[transport + 1] + 1) * 8
+                    transport += length
+        else:
+            return None
+
+        if protocol == 6:
+            source_port, destination_port, seq = struct.unpack_from("!HHI", data, transport)
+            header = (data[transport + 12] >> 4) * 4
+            flags = data[transport + 13]
+            return protocol, source, source_port, destination, destination_port, flags, seq, \
+                max(end - transport - header, 0)
+        if protocol in (17, 132):
+            source_port, destination_port = struct.unpack_from("!HH", data, transport)
+            return protocol, source, source_port, destination, destination_port, 0, 0, max(end - transport - 8, 0)
+        return protocol, source, 0, destination, 0, 0, 0, max(end - transport, 0)
+    except (struct.error, IndexError):
+        return None
+
+
+class FlowTable:
+    """Bidirectional flows with counters in flat, preallocated-per-row arrays.
+
+    A flow is keyed by the 5-tuple of its first packet; the reverse tuple
+    maps to the same row, so replies count against the same flow in the
+    other direction. Only the key dictionary holds Python objects; every
+    counter is one slot in an ``array``. Once ``max_flows`` flows exist,
+    packets of new flows only go into the ``unattributed`` totals, so
+    memory is bounded whatever the size of the capture.
+    """
+
+    def __init__(self, max_flows: int = MAX_FLOWS):
+        self.max_flows = max_flows
+        self.keys: List[Tuple[int, bytes, int, bytes, int]] = []
+        self.rows: Dict[Tuple[int, bytes, int, bytes, int], int] = {}
+        self.packets = array("Q")
+        self.bytes_out = array("Q")        # initiator -> responder
+        self.bytes_in = array("Q")         # responder -> initiator
+        self.first = array("d")
+        self.last = array("d")
+        self.flags = array("B")            # TCP flags seen in either direction
+        self.retransmits = array("I")
+        # Next expected TCP sequence number per direction; -1 until a segment is seen
+        self.next_out = array("q")
+        self.next_in = array("q")
+        self.total_packets = 0
+        self.total_bytes = 0
+        self.other_packets = 0             # not IP
+        self.unattributed_packets = 0      # IP, but the table was full
+        self.unattributed_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, timestamp: float, wire_length: int, packet: Optional[Packet]):
+        self.total_packets += 1
+        self.total_bytes += wire_length
+        if packet is None:
+            self.other_packets += 1
+            return
+        protocol, source, source_port, destination, destination_port, flags, seq, payload = packet
+        key = (protocol, source, source_port, destination, destination_port)
+        row = self.rows.get(key)
+        if row is None:
+            if len(self.keys) >= self.max_flows:
+                self.unattributed_packets += 1
+                self.unattributed_bytes += wire_length
+                return
+            row = len(self.keys)
+            self.keys.append(key)
+            self.rows[key] = row
+            self.rows[(protocol, destination, destination_port, source, source_port)] = row
+            for column in (self.packets, self.bytes_out, self.bytes_in, self.flags, self.retransmits):
+                column.append(0)
+            self.first.append(timestamp)
+            self.last.append(timestamp)
+            self.next_out.append(-1)
+            self.next_in.append(-1)
+        outbound = self.keys[row][1] == source and self.keys[row][2] == source_port
+        self.packets[row] += 1
+        if outbound:
+            self.bytes_out[row] += wire_length
+        else:
+            self.bytes_in[row] += wire_length
+        if timestamp > self.last[row]:
+            self.last[row] = timestamp
+        elif timestamp < self.first[row]:
+            self.first[row] = timestamp
+        if protocol == 6:
+            self.flags[row] |= flags
+            # SYN and FIN each take one sequence number
+            length = payload + (1 if flags & 0x03 else 0)
+            if length:
+                expected = self.next_out if outbound else self.next_in
+                end = (seq + length) & 0xFFFFFFFF
+                previous = expected[row]
+                if previous < 0 or 0 < (end - previous) & 0xFFFFFFFF < 0x80000000:
+                    expected[row] = end
+                elif payload:
+                    # Ends at or before data already seen in this direction
+                    self.retransmits[row] += 1
+
+    def top(self, sort: str = "bytes", limit: int = 25) -> List[Dict[str, Any]]:
+        """The ``limit`` largest flows by bytes, packets, retransmits or duration, as display rows."""
+        if sort == "packets":
+            weight = self.packets.__getitem__
+        elif sort == "retransmits":
+            weight = self.retransmits.__getitem__
+        elif sort == "duration":
+            weight = lambda row: self.last[row] - self.first[row]
+        else:
+            weight = lambda row: self.bytes_out[row] + self.bytes_in[row]
+        return [self.row(row) for row in heapq.nlargest(limit, range(len(self.keys)), key=weight)]
+
+    def row(self, row: int) -> Dict[str, Any]:
+        protocol, source, source_port, destination, destination_port = self.keys[row]
+        flags = self.flags[row]
+        return {
+            "proto": PROTOCOLS.get(protocol, str(protocol)),
+            "src": _endpoint(source, source_port),
+            "dst": _endpoint(destination, destination_port),
+            "packets": self.packets[row],
+            "bytes": self.bytes_out[row] + self.bytes_in[row],
+            "bytes_out": self.bytes_out[row],
+            "bytes_in": self.bytes_in[row],
+            "duration": round(self.last[row] - self.first[row], 3),
+            "flags": "".join(name for bit, name in TCP_FLAGS if flags & bit) if protocol == 6 else "",
+            "retransmits": self.retransmits[row] if protocol == 6 else "",
+        }
+
+
+def _endpoint(address: bytes, port: int) -> str:
+    ip = ipaddress.ip_address(address)
+    if not port:
+        return str(ip)
+    return f"[{ip}]:{port}" if ip.version == 6 else f"{ip}:{port}"
+
+
+class CaptureParser:
+    """Push parser for libpcap and pcapng streams feeding a ``FlowTable``.
+
+    ``feed`` takes chunks of any size as they arrive. Records are decoded
+    in place through a memoryview; only the incomplete record at the end
+    of a chunk is carried over, so memory does not grow with the capture.
+    """
+
+    def __init__(self, flows: Optional[FlowTable] = None):
+        self.flows = flows if flows is not None else FlowTable()
+        self.format: Optional[str] = None
+        self.bytes = 0
+        self._carry = b""
+        # libpcap
+        self._order = "<"
+        self._resolution = 1e-6
+        self._linktype = LINKTYPE_ETHERNET
+        # pcapng: (linktype, seconds per timestamp unit) per interface of the current section
+        self._interfaces: List[Tuple[int, float]] = []
+
+    def feed(self, chunk: bytes):
+        self.bytes += len(chunk)
+        data = self._carry + chunk if self._carry else chunk
+        with memoryview(data) as view:
+            if self.format is None:
+                consumed = self._header(view)
+                if self.format is None:
+                    self._carry = bytes(data)
+                    return
+            else:
+                consumed = 0
+            if self.format == "pcap":
+                consumed = self._pcap_records(view, consumed)
+            else:
+                consumed = self._pcapng_blocks(view, consumed)
+            self._carry = bytes(view[consumed:])
+
+    def close(self):
+        """Check that the stream did not end inside a record."""
+        if self.format is None:
+            raise ValueError("Not a pcap or pcapng capture" if self.bytes else "Empty capture")
+        if self._carry:
+            logger.warning(f"Capture ended inside a record ({len(self._carry)} bytes left over)")
+
+    def _header(self, view: memoryview) -> int:
+        if len(view) < 4:
+            return 0
+        magic = bytes(view[:4])
+        if magic in _PCAP_MAGIC:
+            if len(view) < 24:
+                return 0
+            self._order, self._resolution = _PCAP_MAGIC[magic]
+            self._linktype = struct.unpack_from(self._order + "I", view, 20)[0] & 0xFFFF
+            self.format = "pcap"
+            return 24
+        if struct.unpack_from("<I", view, 0)[0] == _PCAPNG_SECTION:
+            self.format = "pcapng"
+            return 0
+        raise ValueError("Not a pcap or pcapng capture")
+
+    def _pcap_records(self, view: memoryview, position: int) -> int:
+        record = struct.Struct(self._order + "IIII")
+        add = self.flows.add
+        linktype = self._linktype
+        resolution = self._resolution
+        size = len(view)
+        while position + 16 <= size:
+            seconds, fraction, captured, wire = record.unpack_from(view, position)
+            if captured > MAX_RECORD:
+                raise ValueError(f"Corrupt capture: record of {captured} bytes at offset {position}")
+            end = position + 16 + captured
+            if end > size:
+                break
+            add(seconds + fraction * resolution, wire, decode_packet(linktype, view[position + 16:end]))
+            position = end
+        return position
+
+    def _pcapng_blocks(self, view: memoryview, position: int) -> int:
+        size = len(view)
+        while position + 12 <= size:
+            if struct.unpack_from("<I", view, position)[0] == _PCAPNG_SECTION:
+                # Each section header carries its own byte order
+                self._order = "<" if struct.unpack_from("<I", view, position + 8)[0] == _PCAPNG_BYTE_ORDER else ">"
+            order = self._order
+            kind, length = struct.unpack_from(order + "II", view, position)
+            if length < 12 or length > MAX_RECORD or length % 4:
+                raise ValueError(f"Corrupt capture: block of {length} bytes at offset {position}")
+            end = position + length
+            if end > size:
+                break
+            body = view[position + 8:end - 4]
+            if kind == _PCAPNG_SECTION:
+                self._interfaces = []
+            elif kind == 1:
+                self._interfaces.append(self._interface(body, order))
+            elif kind == 6:
+                interface, high, low, captured, wire = struct.unpack_from(order + "IIIII", body, 0)
+                linktype, resolution = self._interfaces[interface] if interface < len(self._interfaces) \
+                    else (LINKTYPE_ETHERNET, 1e-6)
+                timestamp = ((high << 32) | low) * resolution
+                self.flows.add(timestamp, wire, decode_packet(linktype, body[20:20 + captured]))
+            elif kind == 3:
+                wire = struct.unpack_from(order + "I", body, 0)[0]
+                linktype = self._interfaces[0][0] if self._interfaces else LINKTYPE_ETHERNET
+                self.flows.add(0.0, wire, decode_packet(linktype, body[4:4 + min(wire, len(body) - 4)]))
+            position = end
+        return position
+
+    @staticmethod
+    def _interface(body: memoryview, order: str) -> Tuple[int, float]:
+        """(link type, timestamp unit in seconds) from an interface description block."""
+        linktype = struct.unpack_from(order + "H", body, 0)[0]
+        resolution = 1e-6
+        position = 8
+        while position + 4 <= len(body):
+            code, length = struct.unpack_from(order + "HH", body, position)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = body[position + 4]
+                resolution = 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+            position += 4 + (length + 3) // 4 * 4
+        return linktype, resolution
+
+
+def summarize_file(path: str, max_flows: int = MAX_FLOWS, chunk_size: int = 1024 * 1024) -> CaptureParser:
+    """Parse a saved capture a chunk at a time."""
+    parser = CaptureParser(FlowTable(max_flows))
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+    return parser
@@ -0,0 +1,168 @@
+"""
+SonicWall Change Set
+Stages config writes, sends them as bulk collection bodies and commits them once
+"""
+
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from config_loader import CONFIG_ENDPOINTS, ENTRY_WRAPPERS
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def _family(category: str) -> Optional[str]:
+    """Wrapper key for a category's entries ("ipv4" for "address-objects/ipv4"), if any."""
+    parts = CONFIG_ENDPOINTS[category][0].split("/")
+    return parts[1] if len(parts) > 1 and parts[1] in ENTRY_WRAPPERS else None
+
+
+def bulk_body(category: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Collection body for a multi-entry POST/PUT, e.g. {"address_objects": [{"ipv4": {...}}]}."""
+    family = _family(category)
+    collection_key = CONFIG_ENDPOINTS[category][1]
+    return {collection_key: [{family: entry} if family else entry for entry in entries]}
+
+
+class Change:
+    """One staged write: POST/PUT carry an entry, DELETE carries a key."""
+
+    __slots__ = ("method", "category", "entry", "key", "by")
+
+    def __init__(self, method: str, category: str, entry: Optional[Dict[str, Any]] = None,
+                 key: Optional[str] = None, by: str = "name"):
+        self.method = method
+        self.category = category
+        self.entry = entry
+        self.key = key
+        self.by = by
+
+    def describe(self) -> str:
+        if self.method == "DELETE":
+            return f"DELETE {self.category} {self.by}={self.key}"
+        name = self.entry.get("name") or self.entry.get("uuid") or "?"
+        return f"{self.method} {self.category} {name}"
+
+
+class ChangeSet:
+    """Config writes staged locally and sent to the device in bulk.
+
+    ``add`` and ``update`` queue POST and PUT entries; ``apply`` sends each
+    run of consecutive operations on the same category as one collection
+    body (``{"address_objects": [{"ipv4": {...}}, ...]}``) of up to
+    ``batch_size`` entries, so N objects cost N / batch_size requests
+    instead of N writes and N commits. The SonicOS API has no bulk DELETE,
+    so deletes go out one per entry, in order with the rest. Nothing is
+    live until ``commit``, which applies anything still staged and then
+    commits the device's pending config once.
+
+    Each operation is checked against the API spec when it is staged (if
+    the client has validators), so a bad entry is refused up front rather
+    than failing its batch halfway through ``apply``.
+    """
+
+    def __init__(self, client: SonicWallClient, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self.staged: List[Change] = []
+        self.applied: List[Change] = []
+
+    def __len__(self) -> int:
+        return len(self.staged)
+
+    def _check(self, category: str):
+        if category not in CONFIG_ENDPOINTS:
+            raise ValueError(f"Unknown config category '{category}'")
+
+    def _validate(self, method: str, category: str, entry: Optional[Dict[str, Any]] = None,
+                  key: Optional[str] = None, by: str = "name"):
+        path = CONFIG_ENDPOINTS[category][0]
+        if method == "DELETE":
+            self.client.validate(method, f"{path}/{by}/{key}")
+        else:
+            self.client.validate(method, path, bulk_body(category, [entry]))
+
+    def add(self, category: str, entry: Dict[str, Any]):
+        """Stage a new entry (POST)."""
+        self._check(category)
+        self._validate("POST", category, entry)
+        self.staged.append(Change("POST", category, entry=entry))
+
+    def update(self, category: str, entry: Dict[str, Any]):
+        """Stage a modified entry (PUT); the entry must carry its name or uuid."""
+        self._check(category)
+        if not (entry.get("name") or entry.get("uuid")):
+            raise ValueError("Updated entries need a 'name' or 'uuid'")
+        self._validate("PUT", category, entry)
+        self.staged.append(Change("PUT", category, entry=entry))
+
+    def delete(self, category: str, key: str, by: str = "name"):
+        """Stage removal of an entry by name or uuid."""
+        self._check(category)
+        if by not in ("name", "uuid"):
+            raise ValueError("Delete by must be 'name' or 'uuid'")
+        self._validate("DELETE", category, key=key, by=by)
+        self.staged.append(Change("DELETE", category, key=key, by=by))
+
+    def clear(self):
+        self.staged.clear()
+
+    def _batches(self) -> List[Tuple[str, str, List[Change]]]:
+        """Group staged changes into (method, category, changes) requests, keeping their order."""
+        batches: List[Tuple[str, str, List[Change]]] = []
+        for change in self.staged:
+            if (change.method != "DELETE" and batches
+                    and batches[-1][0] == change.method and batches[-1][1] == change.category
+                    and len(batches[-1][2]) < self.batch_size):
+                batches[-1][2].append(change)
+            else:
+                batches.append((change.method, change.category, [change]))
+        return batches
+
+    async def apply(self) -> int:
+        """Send staged changes to the device as pending (uncommitted) config.
+
+        Returns the number of requests made. On failure the changes already
+        sent stay pending on the device and the rest stay staged.
+        """
+        requests = 0
+        for method, category, changes in self._batches():
+            path = CONFIG_ENDPOINTS[category][0]
+            if method == "DELETE":
+                change = changes[0]
+                await self.client.delete(f"{path}/{change.by}/{change.key}")
+            else:
+                body = bulk_body(category, [c.entry for c in changes])
+                if method == "POST":
+                    await self.client.post(path, body)
+                else:
+                    await self.client.put(path, body)
+            requests += 1
+            del self.staged[:len(changes)]
+            self.applied.extend(changes)
+        logger.info(f"Applied {len(self.applied)} staged changes in {requests} requests")
+        return requests
+
+    async def pending(self) -> Dict[str, Any]:
+        """The device's pending (applied but uncommitted) config changes."""
+        return await self.client.get_pending()
+
+    async def commit(self, best_effort: bool = False) -> Dict[str, Any]:
+        """Apply anything still staged, then commit all pending config once.
+
+        With ``best_effort`` the device commits what it can and reports the
+        rest instead of rejecting the whole set.
+        """
+        await self.apply()
+        result = await self.client.commit_config(best_effort=best_effort)
+        self.applied.clear()
+        return result
+
+    async def discard(self) -> Dict[str, Any]:
+        """Drop staged changes and discard the device's pending config."""
+        self.staged.clear()
+        self.applied.clear()
+        return await self.client.discard_pending()
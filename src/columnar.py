@@ -0,0 +1,422 @@
+"""
+SonicWall Columnar Segments
+Immutable compressed column files with per-group min/max and bloom filters, compaction and retention
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from itertools import accumulate
+from typing import Dict, Any, Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SMCOL001"
+
+# Rows per row group; each group's columns are compressed and skipped independently
+GROUP_ROWS = 65536
+
+COMPRESSION_LEVEL = 6
+
+# Bloom filter sizing: about 1% false positives
+BLOOM_BITS_PER_VALUE = 10
+BLOOM_HASHES = 7
+
+# Column kinds:
+#   time  float seconds, stored as microsecond deltas (int64)
+#   f8    float64
+#   dict  strings, stored as a dictionary plus uint32 codes, with a bloom filter of the dictionary
+#   blob  bytes, stored as uint32 lengths plus the concatenated data
+KINDS = ("time", "f8", "dict", "blob")
+
+DAY = 86400
+
+
+class BloomFilter:
+    """Bit array with k hash positions per value from one BLAKE2 digest (double hashing)."""
+
+    __slots__ = ("size", "hashes", "bits")
+
+    def __init__(self, size: int, hashes: int = BLOOM_HASHES, bits: Optional[bytearray] = None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_values(cls, values: Iterable[str], count: int) -> "BloomFilter":
+        bloom = cls(max(64, count * BLOOM_BITS_PER_VALUE))
+        for value in values:
+            bloom.add(value)
+        return bloom
+
+    def _positions(self, value: str) -> Iterable[int]:
+        digest = hashlib.blake2b(value.encode("utf-8", "surrogateescape"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return ((first + i * second) % size for i in range(self.hashes))
+
+    def add(self, value: str):
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def to_json(self) -> List[Any]:
+        return [self.size, self.hashes, base64.b64encode(bytes(self.bits)).decode()]
+
+    @classmethod
+    def from_json(cls, data: List[Any]) -> "BloomFilter":
+        return cls(data[0], data[1], bytearray(base64.b64decode(data[2])))
+
+
+def _encode(kind: str, values: Sequence[Any]) -> Tuple[List[bytes], Dict[str, Any]]:
+    """Raw (uncompressed) chunks for one column of one group, plus its statistics."""
+    stats: Dict[str, Any] = {}
+    if kind == "time":
+        micros = [round(v * 1e6) for v in values]
+        deltas = array("q", (b - a for a, b in zip([0] + micros[:-1], micros)))
+        stats["min"], stats["max"] = min(values), max(values)
+        return [deltas.tobytes()], stats
+    if kind == "f8":
+        data = array("d", values)
+        stats["min"], stats["max"] = min(data), max(data)
+        return [data.tobytes()], stats
+    if kind == "dict":
+        dictionary: Dict[str, int] = {}
+        codes = array("I", (dictionary.setdefault(v, len(dictionary)) for v in values))
+        stats["bloom"] = BloomFilter.for_values(dictionary, len(dictionary)).to_json()
+        return ["\0".join(dictionary).encode("utf-8", "surrogateescape"), codes.tobytes()], stats
+    lengths = array("I", map(len, values))
+    return [lengths.tobytes() + b"".join(values)], stats
+
+
+class SegmentWriter:
+    """Writes rows into a new segment file; it only appears under its final name once closed.
+
+    Layout: magic, then each row group's column chunks (zlib), then a JSON
+    footer with the schema and, per group, row count, chunk locations,
+    min/max of numeric columns and bloom filters of dictionary columns,
+    then the footer length and the magic again.
+    """
+
+    def __init__(self, path: str, schema: Dict[str, str], group_rows: int = GROUP_ROWS):
+        for name, kind in schema.items():
+            if kind not in KINDS:
+                raise ValueError(f"Unknown column kind '{kind}' for '{name}'")
+        self.path = path
+        self.schema = schema
+        self.group_rows = group_rows
+        self.groups: List[Dict[str, Any]] = []
+        self.rows = 0
+        self._pending: Dict[str, List[Any]] = {name: [] for name in schema}
+        self._temporary = f"{path}.tmp"
+        self._file = open(self._temporary, "wb")
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+
+    def append(self, columns: Dict[str, Sequence[Any]]):
+        """Add rows given as equal-length column sequences."""
+        pending = self._pending
+        for name in self.schema:
+            pending[name].extend(columns[name])
+        first = next(iter(self.schema))
+        while len(pending[first]) >= self.group_rows:
+            self._write_group(self.group_rows)
+
+    def _write_group(self, rows: int):
+        group: Dict[str, Any] = {"rows": rows, "chunks": {}, "min": {}, "max": {}, "blooms": {}}
+        for name, kind in self.schema.items():
+            values = self._pending[name][:rows]
+            del self._pending[name][:rows]
+            chunks, stats = _encode(kind, values)
+            locations = []
+            for chunk in chunks:
+                compressed = zlib.compress(chunk, COMPRESSION_LEVEL)
+                self._file.write(compressed)
+                locations.append([self._offset, len(compressed)])
+                self._offset += len(compressed)
+            group["chunks"][name] = locations
+            if "min" in stats:
+                group["min"][name], group["max"][name] = stats["min"], stats["max"]
+            if "bloom" in stats:
+                group["blooms"][name] = stats["bloom"]
+        self.groups.append(group)
+        self.rows += rows
+
+    def close(self):
+        remaining = len(self._pending[next(iter(self.schema))])
+        if remaining:
+            self._write_group(remaining)
+        footer = json.dumps({
+            "version": 1,
+            "schema": self.schema,
+            "rows": self.rows,
+            "groups": self.groups,
+        }, separators=(",", ":")).encode()
+        self._file.write(footer)
+        self._file.write(struct.pack("<I", len(footer)) + MAGIC)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temporary, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._temporary)
+        except OSError:
+            pass
+
+
+class ColumnarSegment:
+    """Read-only view of a segment file through mmap.
+
+    Only the footer is parsed on open; a column chunk is decompressed
+    straight from the mapping when a query asks for that column of that
+    group.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._view = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        tail = self._view[-12:]
+        if self._view[:8] != MAGIC or tail[4:] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a column segment")
+        length = struct.unpack("<I", tail[:4])[0]
+        meta = json.loads(self._view[-12 - length:-12])
+        self.schema: Dict[str, str] = meta["schema"]
+        self.rows: int = meta["rows"]
+        self.groups: List[Dict[str, Any]] = meta["groups"]
+        self._blooms: Dict[Tuple[int, str], BloomFilter] = {}
+        times = [name for name, kind in self.schema.items() if kind == "time"]
+        self.time_column = times[0] if times else None
+        if self.time_column and self.groups:
+            self.min_time = min(g["min"][self.time_column] for g in self.groups)
+            self.max_time = max(g["max"][self.time_column] for g in self.groups)
+        else:
+            self.min_time = self.max_time = 0.0
+
+    def close(self):
+        try:
+            self._view.close()
+        finally:
+            self._file.close()
+
+    def _chunk(self, location: List[int]) -> bytes:
+        offset, length = location
+        return zlib.decompress(memoryview(self._view)[offset:offset + length])
+
+    def overlaps(self, group: int, start: float, end: float) -> bool:
+        meta = self.groups[group]
+        return meta["max"][self.time_column] >= start and meta["min"][self.time_column] <= end
+
+    def may_contain(self, group: int, column: str, value: str) -> bool:
+        """False only if the group's dictionary for ``column`` certainly lacks ``value``."""
+        bloom = self._blooms.get((group, column))
+        if bloom is None:
+            data = self.groups[group]["blooms"].get(column)
+            if data is None:
+                return True
+            bloom = self._blooms[(group, column)] = BloomFilter.from_json(data)
+        return value in bloom
+
+    def column(self, group: int, name: str) -> Any:
+        """Decoded column of one group.
+
+        time/f8 give ``array('d')``; dict gives (codes ``array('I')``,
+        dictionary list); blob gives (offsets list, data bytes) where row i
+        is data[offsets[i]:offsets[i + 1]].
+        """
+        kind = self.schema[name]
+        chunks = self.groups[group]["chunks"][name]
+        rows = self.groups[group]["rows"]
+        if kind == "time":
+            deltas = array("q")
+            deltas.frombytes(self._chunk(chunks[0]))
+            return array("d", (m / 1e6 for m in accumulate(deltas)))
+        if kind == "f8":
+            values = array("d")
+            values.frombytes(self._chunk(chunks[0]))
+            return values
+        if kind == "dict":
+            dictionary = self._chunk(chunks[0]).decode("utf-8", "surrogateescape").split("\0")
+            codes = array("I")
+            codes.frombytes(self._chunk(chunks[1]))
+            return codes, dictionary
+        raw = self._chunk(chunks[0])
+        lengths = array("I")
+        lengths.frombytes(raw[:4 * rows])
+        return list(accumulate(lengths, initial=0)), raw[4 * rows:]
+
+    def read_all(self, group: int) -> Dict[str, List[Any]]:
+        """Every column of a group as plain per-row lists (for compaction)."""
+        columns: Dict[str, List[Any]] = {}
+        for name, kind in self.schema.items():
+            value = self.column(group, name)
+            if kind == "dict":
+                codes, dictionary = value
+                columns[name] = [dictionary[c] for c in codes]
+            elif kind == "blob":
+                offsets, data = value
+                columns[name] = [data[a:b] for a, b in zip(offsets, offsets[1:])]
+            else:
+                columns[name] = list(value)
+        return columns
+
+
+def rows_with(codes: array, wanted: Set[int]) -> List[int]:
+    """Ascending row numbers whose code is in ``wanted``.
+
+    For a few codes the uint32 column is searched as bytes, so the scan
+    runs in C; a match must also be 4-byte aligned to count.
+    """
+    if not wanted:
+        return []
+    if len(wanted) > 8:
+        return [i for i, code in enumerate(codes) if code in wanted]
+    data = codes.tobytes()
+    rows: List[int] = []
+    for code in wanted:
+        needle = code.to_bytes(4, sys.byteorder)
+        at = data.find(needle)
+        while at >= 0:
+            if at & 3:
+                at = data.find(needle, at + 1)
+                continue
+            rows.append(at >> 2)
+            at = data.find(needle, at + 4)
+    if len(wanted) > 1:
+        rows.sort()
+    return rows
+
+
+def _day_name(timestamp: float) -> str:
+    return time.strftime("%Y%m%d", time.gmtime(timestamp))
+
+
+def compact(directory: str, retention_days: float, now: Optional[float] = None,
+            on_swap: Optional[Callable[[Callable[[], None]], None]] = None) -> Dict[str, int]:
+    """Drop segments past retention and merge each finished UTC day's segments into one file.
+
+    A day is merged once it is over and has more than one file (or one
+    that is not yet the day file). ``on_swap`` runs the final rename and
+    deletes, so the caller can make that step atomic for its readers.
+    Returns counts of removed and merged files.
+    """
+    now = now or time.time()
+    cutoff = now - retention_days * DAY
+    today = _day_name(now)
+    removed = merged = 0
+    by_day: Dict[str, List[Tuple[float, str]]] = {}
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+        if not name.endswith(".col"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            segment = ColumnarSegment(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable segment {path}: {str(e)}")
+            continue
+        try:
+            if segment.max_time and segment.max_time < cutoff:
+                expired = True
+            else:
+                expired = False
+                day = _day_name(segment.min_time)
+                by_day.setdefault(day, []).append((segment.min_time, path))
+        finally:
+            segment.close()
+        if expired:
+            (on_swap or (lambda swap: swap()))(lambda p=path: os.remove(p))
+            removed += 1
+
+    for day, files in sorted(by_day.items()):
+        target = os.path.join(directory, f"{day}.col")
+        if day >= today or (len(files) == 1 and files[0][1] == target):
+            continue
+        files.sort()
+        readers = [ColumnarSegment(path) for _, path in files]
+        writer = None
+        try:
+            writer = SegmentWriter(f"{target}.merge", readers[0].schema)
+            for reader in readers:
+                if reader.schema != writer.schema:
+                    raise ValueError(f"{reader.path} has a different schema")
+                for group in range(len(reader.groups)):
+                    writer.append(reader.read_all(group))
+            writer.close()
+        except Exception as e:
+            if writer is not None:
+                writer.abort()
+            logger.warning(f"Compacting {day} in {directory} failed: {str(e)}")
+            continue
+        finally:
+            for reader in readers:
+                reader.close()
+
+        def swap(paths=[p for _, p in files], merged_path=f"{target}.merge", target=target):
+            os.replace(merged_path, target)
+            for path in paths:
+                if path != target:
+                    os.remove(path)
+        (on_swap or (lambda swap: swap()))(swap)
+        merged += len(files)
+    return {"removed": removed, "merged": merged}
+
+
+class Compactor:
+    """Runs ``compact`` on a schedule in a worker thread, so merging never blocks the event loop."""
+
+    def __init__(self, job: Callable[[], Dict[str, int]], interval: float = 3600.0, name: str = "segments"):
+        self.job = job
+        self.interval = interval
+        self.name = name
+        self.last: Optional[Dict[str, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        while True:
+            try:
+                self.last = await asyncio.to_thread(self.job)
+                if self.last.get("removed") or self.last.get("merged"):
+                    logger.info(f"Compacted {self.name}: {self.last}")
+            except Exception as e:
+                logger.warning(f"Compacting {self.name} failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def segment_name(timestamp: float, resolution: str = "%Y%m%dT%H%M%S") -> str:
+    """File name for a segment starting at ``timestamp`` (UTC)."""
+    return time.strftime(resolution, time.gmtime(timestamp)) + ".col"
+
@@ -0,0 +1,89 @@
+"""
+SonicWall Config Loader
+Fetches the configuration collections used by the local analysis tools
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Iterable
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+# Category name -> (API path, collection key in the response body).
+# Paths and keys follow the SonicOS 7.x OpenAPI spec (your_firewall_api.yml).
+CONFIG_ENDPOINTS: Dict[str, tuple] = {
+    "address_objects_ipv4": ("address-objects/ipv4", "address_objects"),
+    "address_objects_ipv6": ("address-objects/ipv6", "address_objects"),
+    "address_objects_fqdn": ("address-objects/fqdn", "address_objects"),
+    "address_objects_mac": ("address-objects/mac", "address_objects"),
+    "address_groups_ipv4": ("address-groups/ipv4", "address_groups"),
+    "address_groups_ipv6": ("address-groups/ipv6", "address_groups"),
+    "service_objects": ("service-objects", "service_objects"),
+    "service_groups": ("service-groups", "service_groups"),
+    "security_policies_ipv4": ("security-policies/ipv4", "security_policies"),
+    "security_policies_ipv6": ("security-policies/ipv6", "security_policies"),
+    "access_rules_ipv4": ("access-rules/ipv4", "access_rules"),
+    "access_rules_ipv6": ("access-rules/ipv6", "access_rules"),
+    "nat_policies_ipv4": ("nat-policies/ipv4", "nat_policies"),
+    "nat_policies_ipv6": ("nat-policies/ipv6", "nat_policies"),
+    "nat_policies_nat64": ("nat-policies/nat64", "nat_policies"),
+    "route_policies_ipv4": ("route-policies/ipv4", "route_policies"),
+    "route_policies_ipv6": ("route-policies/ipv6", "route_policies"),
+    "interfaces_ipv4": ("interfaces/ipv4", "interfaces"),
+    "zones": ("zones", "zones"),
+}
+
+# Wrapper keys SonicOS uses around a single collection entry, e.g. {"ipv4": {...}}
+ENTRY_WRAPPERS = ("ipv4", "ipv6", "nat64", "fqdn", "mac")
+
+
+def unwrap_entry(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip the family wrapper from a collection entry, if present."""
+    if isinstance(item, dict) and len(item) == 1:
+        key = next(iter(item))
+        if key in ENTRY_WRAPPERS and isinstance(item[key], dict):
+            return item[key]
+    return item
+
+
+def extract_entries(response: Dict[str, Any], collection_key: str) -> List[Dict[str, Any]]:
+    """Pull the unwrapped entry list out of a collection response."""
+    if not isinstance(response, dict):
+        return []
+    items = response.get(collection_key, [])
+    if not isinstance(items, list):
+        items = [items] if items else []
+    return [unwrap_entry(item) for item in items if isinstance(item, dict)]
+
+
+async def fetch_category(client: SonicWallClient, category: str) -> List[Dict[str, Any]]:
+    """Fetch a single config category and return its entries."""
+    path, collection_key = CONFIG_ENDPOINTS[category]
+    response = await client.get(path)
+    return extract_entries(response, collection_key)
+
+
+async def fetch_config(client: SonicWallClient, categories: Optional[Iterable[str]] = None,
+                       skip_failed: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """Fetch several config categories concurrently.
+
+    Categories that fail to load (e.g. IPv6 disabled, no permission) are
+    logged and returned as empty lists so analysis can continue, or left
+    out of the result with ``skip_failed`` so they cannot pass for empty.
+    """
+    names = list(categories) if categories is not None else list(CONFIG_ENDPOINTS)
+    results = await asyncio.gather(
+        *(fetch_category(client, name) for name in names),
+        return_exceptions=True
+    )
+
+    config: Dict[str, List[Dict[str, Any]]] = {}
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logger.debug(f"Config category {name} unavailable: {result}")
+            if not skip_failed:
+                config[name] = []
+        else:
+            config[name] = result
+    return config
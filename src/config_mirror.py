@@ -0,0 +1,299 @@
+"""
+SonicWall Config Mirror
+Keeps a local in-memory and on-disk copy of config categories in sync with the device
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from config_loader import CONFIG_ENDPOINTS, ENTRY_WRAPPERS, extract_entries, unwrap_entry
+from config_model import ConfigModel, CATEGORY_KINDS, POLICY_KINDS
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+# Categories the listing and analysis tools read
+MIRROR_CATEGORIES = (
+    "address_objects_ipv4", "address_objects_ipv6", "address_objects_fqdn",
+    "address_groups_ipv4", "address_groups_ipv6",
+    "service_objects", "service_groups",
+    "security_policies_ipv4", "security_policies_ipv6",
+    "access_rules_ipv4",
+    "nat_policies_ipv4", "nat_policies_ipv6",
+    "interfaces_ipv4", "zones",
+)
+
+DEFAULT_SYNC_INTERVAL = 300.0
+DEFAULT_SYNC_CONCURRENCY = 4
+
+# A category synced (or written to disk) longer ago than this many intervals is
+# stale: syncs of it are failing, or the disk copy is from an earlier run
+STALE_INTERVALS = 3
+
+# Seconds between a partial update and the re-read of its category, so a
+# burst of writes is followed by a single fetch
+RESYNC_DELAY = 1.0
+
+
+def _singular(segment: str) -> str:
+    if segment.endswith("ies"):
+        return segment[:-3] + "y"
+    return segment.rstrip("s")
+
+
+def _path_index() -> Dict[Tuple[str, Optional[str]], str]:
+    """(singular resource, family) -> category, so both "address-objects/ipv4"
+    and the older "address-object/ipv4" write paths resolve."""
+    index = {}
+    for category, (path, _) in CONFIG_ENDPOINTS.items():
+        parts = path.split("/")
+        family = parts[1] if len(parts) > 1 else None
+        index[(_singular(parts[0]), family)] = category
+    return index
+
+
+_PATH_INDEX = _path_index()
+
+
+def category_for_path(path: str) -> Optional[str]:
+    """Map a config API path (e.g. "access-rule/ipv4/name/X") to its category."""
+    parts = [p for p in path.strip("/").split("/") if p]
+    if parts and parts[0] == "config":
+        parts = parts[1:]
+    if not parts:
+        return None
+    family = parts[1] if len(parts) > 1 and parts[1] in ENTRY_WRAPPERS else None
+    return _PATH_INDEX.get((_singular(parts[0]), family))
+
+
+def _path_key(path: str) -> Optional[str]:
+    """Entry key from a ".../name/<name>" or ".../uuid/<uuid>" path."""
+    parts = [p for p in path.strip("/").split("/") if p]
+    for marker in ("uuid", "name"):
+        if marker in parts[:-1]:
+            return parts[parts.index(marker) + 1]
+    return None
+
+
+def _body_entries(data: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Entries in a write body such as {"address-object": {"ipv4": {...}}}."""
+    entries = []
+    for value in (data or {}).values():
+        for item in value if isinstance(value, list) else [value]:
+            item = unwrap_entry(item)
+            if isinstance(item, dict) and (item.get("name") or item.get("uuid")):
+                entries.append(item)
+    return entries
+
+
+def _entry_key(category: str, entry: Dict[str, Any]) -> str:
+    if CATEGORY_KINDS[category] in POLICY_KINDS:
+        return entry.get("uuid") or entry.get("name") or ""
+    name = entry.get("name") or ""
+    if CATEGORY_KINDS[category] == "interface" and entry.get("vlan"):
+        return f"{name}:V{entry['vlan']}"
+    return name
+
+
+def _digest(entry: Dict[str, Any]) -> bytes:
+    return hashlib.blake2b(json.dumps(entry, sort_keys=True).encode(), digest_size=16).digest()
+
+
+class ConfigMirror:
+    """Periodically synced mirror of config categories, backed by ``ConfigModel``.
+
+    Each sync fetches categories with bounded concurrency and hashes every
+    entry. Unchanged categories are left alone; changed ones are applied to
+    the model as per-entry upserts and removals (policies are re-ingested as
+    a whole because their order matters) and written to disk, so the next
+    start is warm. Config writes made through the client are applied right
+    away (a PUT may carry only the changed fields, so its category is
+    re-read shortly after instead), and a sync that raced with a write is
+    discarded for that category.
+    """
+
+    def __init__(self, client: SonicWallClient, model: ConfigModel,
+                 categories: Iterable[str] = MIRROR_CATEGORIES,
+                 directory: Optional[str] = None,
+                 interval: float = DEFAULT_SYNC_INTERVAL,
+                 concurrency: int = DEFAULT_SYNC_CONCURRENCY):
+        self.client = client
+        self.model = model
+        self.categories = tuple(categories)
+        self.directory = directory
+        self.interval = interval
+        self.concurrency = concurrency
+        self.synced_at: Dict[str, float] = {}
+        self._digests: Dict[str, Dict[str, bytes]] = {}
+        self._writes: Dict[str, int] = {}
+        self._resyncs: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        client.write_listeners.append(self.record_write)
+
+    def _file(self, category: str) -> str:
+        return os.path.join(self.directory, f"{category}.json")
+
+    def load_disk(self) -> List[str]:
+        """Warm the model from the on-disk mirror; returns the categories loaded."""
+        loaded = []
+        if not self.directory:
+            return loaded
+        for category in self.categories:
+            try:
+                with open(self._file(category)) as f:
+                    stored = json.load(f)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable mirror file for {category}: {str(e)}")
+                continue
+            entries = stored.get("entries", [])
+            self._digests[category] = {_entry_key(category, e): _digest(e) for e in entries}
+            self.model.ingest(category, entries)
+            self.synced_at[category] = stored.get("synced_at", 0.0)
+            loaded.append(category)
+        logger.info(f"Config mirror loaded {len(loaded)} categories from disk")
+        return loaded
+
+    def _save(self, category: str, entries: List[Dict[str, Any]]):
+        os.makedirs(self.directory, exist_ok=True)
+        target = self._file(category)
+        tmp = f"{target}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"synced_at": self.synced_at[category], "entries": entries}, f)
+        os.replace(tmp, target)
+
+    async def sync(self, categories: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, int, int]]:
+        """Fetch and apply categories; returns {category: (added, changed, removed)} for those that changed."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        changes: Dict[str, Tuple[int, int, int]] = {}
+
+        async def _sync(category: str):
+            path, collection_key = CONFIG_ENDPOINTS[category]
+            async with semaphore:
+                writes = self._writes.get(category, 0)
+                try:
+                    response = await self.client.get(path)
+                except Exception as e:
+                    logger.debug(f"Mirror sync of {category} failed: {e}")
+                    return
+            if self._writes.get(category, 0) != writes:
+                # A local write landed mid-fetch; the response may predate it
+                return
+            entries = extract_entries(response, collection_key)
+            delta = self._apply(category, entries)
+            if delta is not None:
+                changes[category] = delta
+                if self.directory:
+                    await asyncio.to_thread(self._save, category, entries)
+
+        await asyncio.gather(*(_sync(c) for c in (categories or self.categories)))
+        if changes:
+            logger.info(f"Config mirror updated: {', '.join(sorted(changes))}")
+        return changes
+
+    def _apply(self, category: str, entries: List[Dict[str, Any]]) -> Optional[Tuple[int, int, int]]:
+        """Diff fetched entries against the mirror and apply the delta to the model."""
+        self.synced_at[category] = time.time()
+        old = self._digests.get(category)
+        new = {_entry_key(category, e): _digest(e) for e in entries}
+
+        if old is not None and old == new and list(old) == list(new):
+            return None
+        self._digests[category] = new
+
+        if old is None or CATEGORY_KINDS[category] in POLICY_KINDS:
+            self.model.ingest(category, entries)
+        else:
+            for entry in entries:
+                key = _entry_key(category, entry)
+                if old.get(key) != new[key]:
+                    self.model.upsert_entry(category, entry)
+            for key in old.keys() - new.keys():
+                self.model.remove_entry(category, key)
+            self.model.categories.add(category)
+
+        old = old or {}
+        added = len(new.keys() - old.keys())
+        removed = len(old.keys() - new.keys())
+        changed = sum(1 for key in new.keys() & old.keys() if new[key] != old[key])
+        return added, changed, removed
+
+    def record_write(self, method: str, path: str, data: Optional[Dict[str, Any]]):
+        """Client write listener: apply a POST/PUT/DELETE to the mirror immediately."""
+        category = category_for_path(path)
+        if category is None or category not in self.categories:
+            return
+
+        self._writes[category] = self._writes.get(category, 0) + 1
+        # Not synced yet: the first sync replaces the category wholesale anyway
+        digests = self._digests.get(category, {})
+        if method == "DELETE":
+            key = _path_key(path)
+            if key:
+                self.model.remove_entry(category, key)
+                digests.pop(key, None)
+        elif method == "PUT":
+            # The body may hold only the fields being changed, which would
+            # wipe the rest of the record; keep it until the device is re-read
+            for entry in _body_entries(data):
+                digests[_entry_key(category, entry)] = b""
+            self._schedule_resync(category)
+        else:
+            for entry in _body_entries(data):
+                self.model.upsert_entry(category, entry)
+                # Unknown digest: the next sync re-reads whatever the device stored
+                digests[_entry_key(category, entry)] = b""
+
+    def _schedule_resync(self, category: str):
+        task = self._resyncs.get(category)
+        if task is None or task.done():
+            self._resyncs[category] = asyncio.create_task(self._resync(category))
+
+    async def _resync(self, category: str):
+        writes = None
+        while writes != self._writes.get(category, 0):
+            # Writes during the fetch discard it, so go round until one lands cleanly
+            await asyncio.sleep(RESYNC_DELAY)
+            writes = self._writes.get(category, 0)
+            try:
+                await self.sync([category])
+            except Exception as e:
+                logger.warning(f"Config mirror resync of {category} failed: {str(e)}")
+                return
+
+    def fresh(self, category: str) -> bool:
+        """True if the category was synced (or warmed from disk) within the last few intervals."""
+        synced_at = self.synced_at.get(category)
+        return (synced_at is not None and category in self.model.categories
+                and time.time() - synced_at < STALE_INTERVALS * self.interval)
+
+    async def run(self):
+        """Sync forever on the configured interval."""
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Config mirror sync failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        for task in self._resyncs.values():
+            task.cancel()
+        self._resyncs.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,730 @@
+"""
+SonicWall Config Model
+Compact typed records for fetched configuration, shared by the analysis and listing tools
+"""
+
+import asyncio
+import ipaddress
+import logging
+import sys
+from array import array
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from config_loader import CONFIG_ENDPOINTS, unwrap_entry
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+# Config category (see config_loader.CONFIG_ENDPOINTS) -> record kind
+CATEGORY_KINDS: Dict[str, str] = {
+    "address_objects_ipv4": "address_object",
+    "address_objects_ipv6": "address_object",
+    "address_objects_fqdn": "address_object",
+    "address_objects_mac": "address_object",
+    "address_groups_ipv4": "address_group",
+    "address_groups_ipv6": "address_group",
+    "service_objects": "service_object",
+    "service_groups": "service_group",
+    "security_policies_ipv4": "security_policy",
+    "security_policies_ipv6": "security_policy",
+    "access_rules_ipv4": "access_rule",
+    "access_rules_ipv6": "access_rule",
+    "nat_policies_ipv4": "nat_policy",
+    "nat_policies_ipv6": "nat_policy",
+    "nat_policies_nat64": "nat_policy",
+    "route_policies_ipv4": "route_policy",
+    "route_policies_ipv6": "route_policy",
+    "interfaces_ipv4": "interface",
+    "zones": "zone",
+}
+
+CATEGORY_FAMILIES: Dict[str, str] = {
+    "address_objects_ipv4": "ipv4",
+    "address_objects_ipv6": "ipv6",
+    "address_objects_fqdn": "fqdn",
+    "address_objects_mac": "mac",
+    "address_groups_ipv4": "ipv4",
+    "address_groups_ipv6": "ipv6",
+    "security_policies_ipv4": "ipv4",
+    "security_policies_ipv6": "ipv6",
+    "access_rules_ipv4": "ipv4",
+    "access_rules_ipv6": "ipv6",
+    "nat_policies_ipv4": "ipv4",
+    "nat_policies_ipv6": "ipv6",
+    "nat_policies_nat64": "nat64",
+    "route_policies_ipv4": "ipv4",
+    "route_policies_ipv6": "ipv6",
+    "interfaces_ipv4": "ipv4",
+}
+
+POLICY_KINDS = ("security_policy", "access_rule", "nat_policy", "route_policy")
+
+# Address object kinds, stored as one byte per row
+ADDRESS_KINDS = ("unknown", "host", "network", "range", "fqdn", "mac")
+_ADDRESS_KIND_CODES = {kind: code for code, kind in enumerate(ADDRESS_KINDS)}
+_FAMILY_CODES = {"ipv4": 4, "ipv6": 6, "fqdn": 1, "mac": 2}
+_FAMILY_NAMES = {code: family for family, code in _FAMILY_CODES.items()}
+
+PROTOCOL_NUMBERS: Dict[str, int] = {
+    "icmp": 1,
+    "igmp": 2,
+    "tcp": 6,
+    "udp": 17,
+    "6over4": 41,
+    "gre": 47,
+    "esp": 50,
+    "ah": 51,
+    "icmpv6": 58,
+    "icmpv6_custom": 58,
+    "eigrp": 88,
+    "ospf": 89,
+    "pim": 103,
+    "ipcomp": 108,
+    "l2tp": 115,
+}
+
+_MASK64 = (1 << 64) - 1
+
+# A reference to another object: ("name" | "group" | "host", interned name/IP).
+# None stands for "any" / "original".
+Selector = Optional[Tuple[str, str]]
+
+
+def _intern(value: Any) -> Optional[str]:
+    """Intern repeated strings (zones, object names) so records share one copy."""
+    if value is None:
+        return None
+    return sys.intern(str(value))
+
+
+def selector(value: Any) -> Selector:
+    """Compress a SonicOS selector such as {"name": "X"} or {"any": true}."""
+    if not isinstance(value, dict):
+        return None
+    for key in ("name", "group", "host"):
+        if value.get(key):
+            return (key, _intern(value[key]))
+    return None
+
+
+def _member_names(members: Any) -> List[str]:
+    if not isinstance(members, list):
+        return []
+    return [m["name"] for m in members if isinstance(m, dict) and m.get("name")]
+
+
+class AddressObject:
+    """Row view over ``AddressTable``."""
+
+    __slots__ = ("name", "uuid", "zone", "kind", "family", "lo", "hi", "value")
+
+    def __init__(self, name, uuid, zone, kind, family, lo, hi, value):
+        self.name = name
+        self.uuid = uuid
+        self.zone = zone
+        self.kind = kind
+        self.family = family
+        self.lo = lo
+        self.hi = hi
+        self.value = value
+
+
+class AddressTable:
+    """Columnar address objects: names/zones interned, IP ranges in 64-bit arrays.
+
+    IPv6 addresses need 128 bits, so each bound is split into a high and a
+    low 64-bit word.
+    """
+
+    __slots__ = ("names", "uuids", "zones", "kinds", "families",
+                 "lo_high", "lo_low", "hi_high", "hi_low", "values", "_rows")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.uuids: List[Optional[str]] = []
+        self.zones: List[Optional[str]] = []
+        self.kinds = array("B")
+        self.families = array("B")
+        self.lo_high = array("Q")
+        self.lo_low = array("Q")
+        self.hi_high = array("Q")
+        self.hi_low = array("Q")
+        self.values: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+
+    def add(self, entry: Dict[str, Any], family: str) -> Optional[int]:
+        """Append (or overwrite by name) an address object entry; returns its row."""
+        name = entry.get("name")
+        if not name:
+            return None
+
+        kind, lo, hi, value = "unknown", 0, 0, None
+        try:
+            if isinstance(entry.get("host"), dict) and entry["host"].get("ip"):
+                kind = "host"
+                lo = hi = int(ipaddress.ip_address(entry["host"]["ip"].strip()))
+            elif isinstance(entry.get("network"), dict) and entry["network"].get("subnet"):
+                kind = "network"
+                network = entry["network"]
+                subnet = network["subnet"].strip()
+                if network.get("mask") is not None and "/" not in subnet:
+                    subnet = f"{subnet}/{str(network['mask']).strip().lstrip('/')}"
+                net = ipaddress.ip_network(subnet, strict=False)
+                lo, hi = int(net.network_address), int(net.broadcast_address)
+            elif isinstance(entry.get("range"), dict) and entry["range"].get("begin"):
+                kind = "range"
+                lo = int(ipaddress.ip_address(entry["range"]["begin"].strip()))
+                hi = int(ipaddress.ip_address(entry["range"].get("end", entry["range"]["begin"]).strip()))
+            elif family == "fqdn" or entry.get("domain"):
+                kind, value = "fqdn", entry.get("domain")
+            elif family == "mac" or entry.get("address"):
+                kind, value = "mac", entry.get("address")
+        except ValueError as e:
+            logger.debug(f"Unparseable address object {name}: {e}")
+            kind = "unknown"
+
+        row = self._rows.get(name)
+        columns = (
+            _intern(name), entry.get("uuid"), _intern(entry.get("zone")),
+            _ADDRESS_KIND_CODES[kind], _FAMILY_CODES.get(family, 4),
+            lo >> 64, lo & _MASK64, hi >> 64, hi & _MASK64, value,
+        )
+        if row is None:
+            row = len(self.names)
+            self._rows[columns[0]] = row
+            for column, item in zip(self._columns(), columns):
+                column.append(item)
+        else:
+            for column, item in zip(self._columns(), columns):
+                column[row] = item
+        return row
+
+    def _columns(self):
+        return (self.names, self.uuids, self.zones, self.kinds, self.families,
+                self.lo_high, self.lo_low, self.hi_high, self.hi_low, self.values)
+
+    def row_of(self, name: str) -> Optional[int]:
+        return self._rows.get(name)
+
+    def range(self, row: int) -> Optional[Tuple[int, int]]:
+        """Integer address range for a row, or None for FQDN/MAC/unparsed rows."""
+        if self.kinds[row] in (0, _ADDRESS_KIND_CODES["fqdn"], _ADDRESS_KIND_CODES["mac"]):
+            return None
+        return ((self.lo_high[row] << 64) | self.lo_low[row],
+                (self.hi_high[row] << 64) | self.hi_low[row])
+
+    def get(self, name: str) -> Optional[AddressObject]:
+        row = self._rows.get(name)
+        return None if row is None else self.record(row)
+
+    def record(self, row: int) -> AddressObject:
+        bounds = self.range(row) or (None, None)
+        return AddressObject(
+            self.names[row], self.uuids[row], self.zones[row], ADDRESS_KINDS[self.kinds[row]],
+            _FAMILY_NAMES.get(self.families[row]), bounds[0], bounds[1], self.values[row],
+        )
+
+    def __iter__(self) -> Iterator[AddressObject]:
+        for row in range(len(self.names)):
+            if self.names[row] is not None:
+                yield self.record(row)
+
+    def remove(self, name: str):
+        """Tombstone a row; the columns are compacted once most rows are dead."""
+        row = self._rows.pop(name, None)
+        if row is not None:
+            self.names[row] = None
+            self.kinds[row] = 0
+            if len(self.names) > 2 * len(self._rows) + 64:
+                self.compact()
+
+    def remove_family(self, family: str) -> List[str]:
+        """Drop every row that came from one address family endpoint; returns their names."""
+        code = _FAMILY_CODES.get(family, 4)
+        removed = []
+        for name, row in list(self._rows.items()):
+            if self.families[row] == code:
+                self._rows.pop(name)
+                self.names[row] = None
+                removed.append(name)
+        self.compact()
+        return removed
+
+    def compact(self):
+        """Rebuild the columns without tombstoned rows; row numbers change."""
+        live = sorted(self._rows.values())
+        if len(live) == len(self.names):
+            return
+        for attr in self.__slots__[:-1]:
+            column = getattr(self, attr)
+            kept = [column[row] for row in live]
+            setattr(self, attr, array(column.typecode, kept) if isinstance(column, array) else kept)
+        self._rows = {name: row for row, name in enumerate(self.names)}
+
+
+class ServiceObject:
+    """Row view over ``ServiceTable``."""
+
+    __slots__ = ("name", "uuid", "protocol", "port_lo", "port_hi")
+
+    def __init__(self, name, uuid, protocol, port_lo, port_hi):
+        self.name = name
+        self.uuid = uuid
+        self.protocol = protocol
+        self.port_lo = port_lo
+        self.port_hi = port_hi
+
+
+class ServiceTable:
+    """Columnar service objects: protocol and port bounds in typed arrays."""
+
+    __slots__ = ("names", "uuids", "protocols", "port_lo", "port_hi", "_rows")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.uuids: List[Optional[str]] = []
+        self.protocols = array("h")  # -1 for unrecognised service types
+        self.port_lo = array("H")
+        self.port_hi = array("H")
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+
+    def add(self, entry: Dict[str, Any]) -> Optional[int]:
+        name = entry.get("name")
+        if not name:
+            return None
+
+        protocol, lo, hi = -1, 0, 65535
+        try:
+            for proto in ("tcp", "udp"):
+                ports = entry.get(proto)
+                if isinstance(ports, dict):
+                    protocol = PROTOCOL_NUMBERS[proto]
+                    begin, end = ports.get("begin"), ports.get("end")
+                    if begin is not None:
+                        lo = int(begin)
+                        hi = int(end) if end is not None else lo
+                    break
+            else:
+                if entry.get("custom") is not None:
+                    protocol = int(entry["custom"])
+                else:
+                    for proto, number in PROTOCOL_NUMBERS.items():
+                        if entry.get(proto) not in (None, False):
+                            protocol = number
+                            break
+            if not (0 <= lo <= hi <= 65535 and -1 <= protocol <= 255):
+                raise ValueError(f"ports {lo}-{hi}, protocol {protocol} out of range")
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Unparseable service object {name}: {e}")
+            protocol, lo, hi = -1, 0, 65535
+
+        row = self._rows.get(name)
+        columns = (_intern(name), entry.get("uuid"), protocol, lo, hi)
+        if row is None:
+            row = len(self.names)
+            self._rows[columns[0]] = row
+            for column, item in zip(self._columns(), columns):
+                column.append(item)
+        else:
+            for column, item in zip(self._columns(), columns):
+                column[row] = item
+        return row
+
+    def _columns(self):
+        return (self.names, self.uuids, self.protocols, self.port_lo, self.port_hi)
+
+    def row_of(self, name: str) -> Optional[int]:
+        return self._rows.get(name)
+
+    def range(self, row: int) -> Optional[Tuple[int, int, int]]:
+        """(protocol, first port, last port) for a row, or None if unrecognised."""
+        if self.protocols[row] < 0:
+            return None
+        return (self.protocols[row], self.port_lo[row], self.port_hi[row])
+
+    def get(self, name: str) -> Optional[ServiceObject]:
+        row = self._rows.get(name)
+        return None if row is None else self.record(row)
+
+    def record(self, row: int) -> ServiceObject:
+        return ServiceObject(self.names[row], self.uuids[row], self.protocols[row],
+                             self.port_lo[row], self.port_hi[row])
+
+    def __iter__(self) -> Iterator[ServiceObject]:
+        for row in range(len(self.names)):
+            if self.names[row] is not None:
+                yield self.record(row)
+
+    def remove(self, name: str):
+        row = self._rows.pop(name, None)
+        if row is not None:
+            self.names[row] = None
+            self.protocols[row] = -1
+
+
+class Group:
+    """Address or service group; members are (member kind, interned name) pairs."""
+
+    __slots__ = ("kind", "name", "uuid", "family", "members")
+
+    def __init__(self, kind: str, entry: Dict[str, Any], family: Optional[str] = None):
+        self.kind = kind
+        self.name = _intern(entry.get("name"))
+        self.uuid = entry.get("uuid")
+        self.family = family
+        members: List[Tuple[str, str]] = []
+        if kind == "address_group":
+            for members_by_family in (entry.get("address_object") or {}).values():
+                members.extend(("address_object", _intern(n)) for n in _member_names(members_by_family))
+            for members_by_family in (entry.get("address_group") or {}).values():
+                members.extend(("address_group", _intern(n)) for n in _member_names(members_by_family))
+        else:
+            members.extend(("service_object", _intern(n)) for n in _member_names(entry.get("service_object")))
+            members.extend(("service_group", _intern(n)) for n in _member_names(entry.get("service_group")))
+        self.members: Tuple[Tuple[str, str], ...] = tuple(members)
+
+
+class Policy:
+    """Security policy, access rule, NAT policy or route policy.
+
+    One record type covers all four; fields a policy kind does not use stay
+    None. Object references are kept as compact selectors.
+    """
+
+    __slots__ = (
+        "kind", "family", "uuid", "name", "enabled", "priority", "comment",
+        "from_zone", "to_zone", "action",
+        "source", "destination", "source_port", "service",
+        "translated_source", "translated_destination", "translated_service",
+        "inbound", "outbound",
+        "interface", "gateway", "metric", "distance", "route_type", "profile",
+    )
+
+    def __init__(self, kind: str, entry: Dict[str, Any], family: Optional[str] = None):
+        self.kind = kind
+        self.family = family
+        self.uuid = entry.get("uuid")
+        self.name = _intern(entry.get("name") or entry.get("uuid") or "Unnamed")
+        self.enabled = entry.get("enable", True) is not False
+        self.comment = entry.get("comment") or None
+
+        priority = entry.get("priority")
+        if isinstance(priority, dict):
+            priority = priority.get("manual")
+        self.priority = int(priority) if isinstance(priority, (int, float)) else None
+
+        self.from_zone = _intern(entry.get("from"))
+        self.to_zone = _intern(entry.get("to"))
+        self.action = _intern(entry.get("action"))
+
+        self.translated_source = self.translated_destination = self.translated_service = None
+        self.inbound = self.outbound = None
+        self.interface = self.gateway = self.metric = self.distance = None
+        self.route_type = self.profile = None
+        self.source_port = None
+
+        if kind in ("security_policy", "access_rule"):
+            source = entry.get("source") or {}
+            destination = entry.get("destination") or {}
+            self.source = selector(source.get("address"))
+            self.destination = selector(destination.get("address"))
+            self.source_port = selector(source.get("port"))
+            self.service = selector(entry.get("service"))
+        elif kind == "nat_policy":
+            self.source = selector(entry.get("source"))
+            self.destination = selector(entry.get("destination") if family != "nat64" else entry.get("pref64"))
+            self.service = selector(entry.get("service"))
+            self.translated_source = selector(entry.get("translated_source"))
+            self.translated_destination = selector(entry.get("translated_destination"))
+            self.translated_service = selector(entry.get("translated_service"))
+            self.inbound = _intern(entry.get("inbound") or "Any")
+            self.outbound = _intern(entry.get("outbound") or "Any")
+        else:
+            self.source = selector(entry.get("source"))
+            self.destination = selector(entry.get("destination"))
+            self.service = selector(entry.get("service"))
+            self.interface = _intern(entry.get("interface") or "Unknown")
+            self.gateway = selector(entry.get("gateway"))
+            metric = entry.get("metric")
+            self.metric = int(metric) if metric not in (None, "") else 1
+            self.distance = int((entry.get("distance") or {}).get("value", 0) or 0)
+            self.route_type = _intern(entry.get("type") or "standard")
+            self.profile = _intern(entry.get("path_selection_profile"))
+
+    @property
+    def key(self) -> str:
+        return self.uuid or self.name
+
+    def references(self) -> List[Tuple[str, str]]:
+        """Object nodes (kind, name) this policy refers to."""
+        refs = []
+        for sel in (self.source, self.destination, self.translated_source, self.translated_destination):
+            if sel and sel[0] == "name":
+                refs.append(("address_object", sel[1]))
+            elif sel and sel[0] == "group":
+                refs.append(("address_group", sel[1]))
+        for sel in (self.source_port, self.service, self.translated_service):
+            if sel and sel[0] == "name":
+                refs.append(("service_object", sel[1]))
+            elif sel and sel[0] == "group":
+                refs.append(("service_group", sel[1]))
+        if self.gateway and self.gateway[0] == "name":
+            refs.append(("address_object", self.gateway[1]))
+        return refs
+
+
+class Interface:
+    __slots__ = ("name", "zone", "ip", "netmask", "gateway", "admin", "comment")
+
+    def __init__(self, entry: Dict[str, Any]):
+        name = entry.get("name", "Unknown")
+        vlan = entry.get("vlan")
+        self.name = _intern(f"{name}:V{vlan}" if vlan else name)
+        assignment = entry.get("ip_assignment") or {}
+        static = (assignment.get("mode") or {}).get("static") or {}
+        self.zone = _intern(assignment.get("zone"))
+        self.ip = static.get("ip")
+        self.netmask = static.get("netmask")
+        self.gateway = static.get("gateway")
+        self.admin = entry.get("admin")
+        self.comment = entry.get("comment") or None
+
+
+class Zone:
+    __slots__ = ("name", "uuid", "security_type")
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.name = _intern(entry.get("name"))
+        self.uuid = entry.get("uuid")
+        self.security_type = _intern(entry.get("security_type"))
+
+
+def build_record(kind: str, entry: Dict[str, Any], family: Optional[str] = None):
+    """Build the record for a single group/policy/interface/zone entry."""
+    if kind in ("address_group", "service_group"):
+        return Group(kind, entry, family)
+    if kind in POLICY_KINDS:
+        return Policy(kind, entry, family)
+    if kind == "interface":
+        return Interface(entry)
+    if kind == "zone":
+        return Zone(entry)
+    raise ValueError(f"No record type for kind '{kind}'")
+
+
+class ConfigModel:
+    """Typed, compact in-memory representation of the fetched configuration."""
+
+    def __init__(self):
+        self.address_objects = AddressTable()
+        self.service_objects = ServiceTable()
+        self.address_groups: Dict[str, Group] = {}
+        self.service_groups: Dict[str, Group] = {}
+        self.policies: Dict[str, List[Policy]] = {kind: [] for kind in POLICY_KINDS}
+        self.interfaces: Dict[str, Interface] = {}
+        self.zones: Dict[str, Zone] = {}
+        self.categories: set = set()
+        # Bumped on every ingest so derived indexes can tell they are stale
+        self.generation = 0
+        # Indexes kept current record by record (e.g. the dependency graph)
+        # and shipped with the model; see ``_changed``
+        self.indexes: Dict[str, Any] = {}
+
+    def _changed(self, category: str, key: Optional[str], record: Any):
+        """Tell the indexes a record was added or replaced (``record`` None: removed).
+
+        Groups, policies, interfaces and zones pass their record; address and
+        service objects pass their raw entry.
+        """
+        if key:
+            for index in self.indexes.values():
+                index.apply(category, key, record)
+
+    def add_entry(self, category: str, entry: Dict[str, Any]):
+        """Convert one raw entry of a config category into the model."""
+        kind = CATEGORY_KINDS[category]
+        family = CATEGORY_FAMILIES.get(category)
+        if kind == "address_object":
+            if self.address_objects.add(entry, family) is not None:
+                self._changed(category, entry["name"], entry)
+        elif kind == "service_object":
+            if self.service_objects.add(entry) is not None:
+                self._changed(category, entry["name"], entry)
+        elif kind == "address_group":
+            group = Group(kind, entry, family)
+            if group.name:
+                self.address_groups[group.name] = group
+                self._changed(category, group.name, group)
+        elif kind == "service_group":
+            group = Group(kind, entry, family)
+            if group.name:
+                self.service_groups[group.name] = group
+                self._changed(category, group.name, group)
+        elif kind in POLICY_KINDS:
+            policy = Policy(kind, entry, family)
+            self.policies[kind].append(policy)
+            self._changed(category, policy.key, policy)
+        elif kind == "interface":
+            iface = Interface(entry)
+            self.interfaces[iface.name] = iface
+            self._changed(category, iface.name, iface)
+        elif kind == "zone":
+            zone = Zone(entry)
+            if zone.name:
+                self.zones[zone.name] = zone
+                self._changed(category, zone.name, zone)
+
+    def clear_category(self, category: str):
+        """Drop the records that came from one category before re-ingesting it."""
+        kind = CATEGORY_KINDS[category]
+        family = CATEGORY_FAMILIES.get(category)
+        removed: List[str] = []
+        if kind == "address_object":
+            removed = self.address_objects.remove_family(family)
+        elif kind == "service_object":
+            removed = [name for name in self.service_objects.names if name is not None]
+            self.service_objects = ServiceTable()
+        elif kind == "address_group":
+            removed = [n for n, g in self.address_groups.items() if g.family == family]
+            self.address_groups = {n: g for n, g in self.address_groups.items() if g.family != family}
+        elif kind == "service_group":
+            removed = list(self.service_groups)
+            self.service_groups = {}
+        elif kind in POLICY_KINDS:
+            removed = [p.key for p in self.policies[kind] if p.family == family]
+            self.policies[kind] = [p for p in self.policies[kind] if p.family != family]
+        elif kind == "interface":
+            removed = list(self.interfaces)
+            self.interfaces = {}
+        elif kind == "zone":
+            removed = list(self.zones)
+            self.zones = {}
+        for key in removed:
+            self._changed(category, key, None)
+        self.categories.discard(category)
+
+    def ingest(self, category: str, entries: Iterable[Dict[str, Any]]):
+        """Replace a category with the given entries, converting them one at a time."""
+        self.clear_category(category)
+        count = 0
+        for entry in entries:
+            self.add_entry(category, entry)
+            count += 1
+        self.categories.add(category)
+        self.generation += 1
+        logger.debug(f"Config model ingested {count} entries for {category}")
+
+    def ingest_response(self, category: str, response: Dict[str, Any]):
+        """Ingest a raw API response, releasing each raw entry once converted."""
+        _, collection_key = CONFIG_ENDPOINTS[category]
+        self.ingest(category, iter_release(response, collection_key))
+
+    def upsert_entry(self, category: str, entry: Dict[str, Any]):
+        """Add or replace a single entry in place, keeping policy order."""
+        kind = CATEGORY_KINDS[category]
+        if kind in POLICY_KINDS:
+            policy = Policy(kind, entry, CATEGORY_FAMILIES.get(category))
+            policies = self.policies[kind]
+            for i, existing in enumerate(policies):
+                if existing.family == policy.family and existing.key == policy.key:
+                    policies[i] = policy
+                    break
+            else:
+                policies.append(policy)
+            self._changed(category, policy.key, policy)
+        else:
+            self.add_entry(category, entry)
+        self.generation += 1
+
+    def remove_entry(self, category: str, key: str):
+        """Remove a single entry by name (or UUID for policies)."""
+        kind = CATEGORY_KINDS[category]
+        family = CATEGORY_FAMILIES.get(category)
+        if kind == "address_object":
+            self.address_objects.remove(key)
+        elif kind == "service_object":
+            self.service_objects.remove(key)
+        elif kind == "address_group":
+            self.address_groups.pop(key, None)
+        elif kind == "service_group":
+            self.service_groups.pop(key, None)
+        elif kind in POLICY_KINDS:
+            kept = []
+            for policy in self.policies[kind]:
+                if policy.family != family or key not in (policy.uuid, policy.name):
+                    kept.append(policy)
+                else:
+                    self._changed(category, policy.key, None)
+            self.policies[kind] = kept
+        elif kind == "interface":
+            self.interfaces.pop(key, None)
+        elif kind == "zone":
+            self.zones.pop(key, None)
+        if kind not in POLICY_KINDS:
+            self._changed(category, key, None)
+        self.generation += 1
+
+    @classmethod
+    def from_config(cls, config: Dict[str, List[Dict[str, Any]]]) -> "ConfigModel":
+        """Build a model from already-unwrapped entries (``config_loader.fetch_config`` output)."""
+        model = cls()
+        for category, entries in config.items():
+            if category in CATEGORY_KINDS:
+                model.ingest(category, entries)
+        return model
+
+    async def load(self, client: SonicWallClient, categories: Iterable[str], refresh: bool = False):
+        """Fetch categories from the device into the model, skipping ones already loaded."""
+        wanted = [c for c in categories if refresh or c not in self.categories]
+        if not wanted:
+            return self
+
+        async def _load(category: str):
+            path, _ = CONFIG_ENDPOINTS[category]
+            try:
+                response = await client.get(path)
+            except Exception as e:
+                # Not marked loaded, so the next call fetches it again; a
+                # refresh that fails keeps the records already held
+                logger.warning(f"Config category {category} unavailable: {e}")
+                return
+            self.ingest_response(category, response)
+
+        await asyncio.gather(*(_load(category) for category in wanted))
+        return self
+
+    def all_policies(self) -> Iterator[Policy]:
+        for kind in POLICY_KINDS:
+            yield from self.policies[kind]
+
+
+def iter_release(response: Any, collection_key: str) -> Iterator[Dict[str, Any]]:
+    """Yield unwrapped entries of a collection response, dropping each raw dict after use.
+
+    This lets the parsed JSON be freed progressively while the model is built
+    instead of keeping the whole response alive until conversion finishes.
+    """
+    if not isinstance(response, dict):
+        return
+    items = response.pop(collection_key, None)
+    if items is None:
+        return
+    if not isinstance(items, list):
+        items = [items]
+    for i in range(len(items)):
+        item = items[i]
+        items[i] = None
+        if isinstance(item, dict):
+            yield unwrap_entry(item)
@@ -0,0 +1,887 @@
+"""
+SonicWall Config Query
+Compiled JMESPath-style expressions over the config model, with indexed lookups
+"""
+
+import base64
+import bisect
+import hashlib
+import ipaddress
+import json
+import re
+import weakref
+from functools import lru_cache
+from typing import Dict, Any, Callable, Iterable, List, Optional, Set, Tuple
+
+from config_model import ConfigModel, Policy, AddressObject, Group
+from object_resolver import ObjectResolver, Range, in_ranges, merge_ranges
+from query import View, VIEWS, Page
+
+# Collection name -> (config categories it is built from, records in model order)
+COLLECTIONS: Dict[str, Tuple[Tuple[str, ...], Callable[[ConfigModel], Iterable[Any]]]] = {
+    "firewall_rules": (("access_rules_ipv4", "access_rules_ipv6"), lambda m: m.policies["access_rule"]),
+    "security_policies": (("security_policies_ipv4", "security_policies_ipv6"),
+                          lambda m: m.policies["security_policy"]),
+    "nat_policies": (("nat_policies_ipv4", "nat_policies_ipv6", "nat_policies_nat64"),
+                     lambda m: m.policies["nat_policy"]),
+    "route_policies": (("route_policies_ipv4", "route_policies_ipv6"), lambda m: m.policies["route_policy"]),
+    "address_objects": (("address_objects_ipv4", "address_objects_ipv6", "address_objects_fqdn",
+                         "address_objects_mac"), lambda m: m.address_objects),
+    "address_groups": (("address_groups_ipv4", "address_groups_ipv6"), lambda m: m.address_groups.values()),
+    "service_objects": (("service_objects",), lambda m: m.service_objects),
+    "service_groups": (("service_groups",), lambda m: m.service_groups.values()),
+    "interfaces": (("interfaces_ipv4",), lambda m: m.interfaces.values()),
+    "zones": (("zones",), lambda m: m.zones.values()),
+}
+
+# Categories contains_ip() resolves object names against
+_ADDRESS_CATEGORIES = COLLECTIONS["address_objects"][0] + COLLECTIONS["address_groups"][0]
+
+# Fields with an equality index
+INDEXED_FIELDS = ("name", "zone", "uuid")
+
+# Policy fields contains_ip() understands -> Policy attribute holding the selector
+_SELECTOR_FIELDS = {
+    "source": "source", "destination": "destination",
+    "original_source": "source", "original_destination": "destination",
+    "translated_source": "translated_source", "translated_destination": "translated_destination",
+    "gateway": "gateway",
+}
+
+
+class Item:
+    """A model record seen through its listing view; fields are computed on access."""
+
+    __slots__ = ("view", "record", "position")
+
+    def __init__(self, view: View, record: Any, position: int):
+        self.view = view
+        self.record = record
+        self.position = position
+
+    def get(self, field: str) -> Any:
+        getter = self.view.fields.get(field)
+        return getter(self.record) if getter else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: self.view.fields[field](self.record) for field in self.view.default_fields}
+
+
+def to_plain(value: Any) -> Any:
+    """Replace Items in a result with plain dicts."""
+    if isinstance(value, Item):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    return value
+
+
+def _covers(ranges: Optional[List[Range]], first: int, last: int) -> bool:
+    """Whether IP ranges (None meaning any) contain the whole of first..last."""
+    if ranges is None:
+        return True
+    if first == last:
+        return in_ranges(first, ranges)
+    return any(lo <= first and last <= hi for lo, hi in merge_ranges(ranges))
+
+
+class QueryContext:
+    """Collections, indexes and resolved IP ranges for one generation of a model."""
+
+    def __init__(self, model: ConfigModel):
+        self.model = model
+        self.generation = model.generation
+        self.resolver = ObjectResolver(model)
+        self._collections: Dict[str, List[Item]] = {}
+        self._indexes: Dict[Tuple[str, str], Dict[Any, List[int]]] = {}
+        self._address_starts: Dict[int, Tuple[List[int], List[Item]]] = {}
+        self._ranges: Dict[Tuple[int, str], Optional[List[Range]]] = {}
+        self._covering: Dict[Tuple[str, Optional[str], int, int], List[int]] = {}
+
+    def collection(self, name: str) -> List[Item]:
+        items = self._collections.get(name)
+        if items is None:
+            view = VIEWS[name]
+            items = [Item(view, record, i) for i, record in enumerate(COLLECTIONS[name][1](self.model))]
+            self._collections[name] = items
+        return items
+
+    def lookup(self, name: str, field: str, value: Any) -> List[int]:
+        """Positions of items whose ``field`` equals ``value`` (equality index)."""
+        index = self._indexes.get((name, field))
+        if index is None:
+            index = {}
+            for item in self.collection(name):
+                index.setdefault(item.get(field), []).append(item.position)
+            self._indexes[(name, field)] = index
+        return index.get(value, [])
+
+    def ranges(self, item: Item, field: Optional[str]) -> Optional[List[Range]]:
+        """IP ranges an item (or one of its address fields) covers; None means any."""
+        key = (id(item.record), field or "")
+        if key in self._ranges:
+            return self._ranges[key]
+        record = item.record
+        ranges: Optional[List[Range]] = []
+        if isinstance(record, Policy):
+            attr = _SELECTOR_FIELDS.get(field or "")
+            ranges = self.resolver.resolve_address(getattr(record, attr)) if attr else []
+        elif isinstance(record, AddressObject):
+            ranges = [(record.lo, record.hi)] if record.lo is not None else []
+        elif isinstance(record, Group) and record.kind == "address_group":
+            ranges = self.resolver.address_ranges("group", record.name)
+        self._ranges[key] = ranges
+        return ranges
+
+    def covering(self, name: str, field: Optional[str], first: int, last: int) -> List[int]:
+        """Positions of items whose address field covers first..last; memoized per lookup."""
+        key = (name, field, first, last)
+        found = self._covering.get(key)
+        if found is None:
+            found = [item.position for item in self.collection(name)
+                     if _covers(self.ranges(item, field), first, last)]
+            self._covering[key] = found
+        return found
+
+    def address_candidates(self, value: int, family: int) -> List[int]:
+        """Positions of address objects whose range contains an address (sorted-start index)."""
+        index = self._address_starts.get(family)
+        if index is None:
+            rows = sorted(
+                ((item.record.lo, item) for item in self.collection("address_objects")
+                 if item.record.lo is not None and item.record.family == f"ipv{family}"),
+                key=lambda row: row[0],
+            )
+            index = ([lo for lo, _ in rows], [item for _, item in rows])
+            self._address_starts[family] = index
+        starts, items = index
+        end = bisect.bisect_right(starts, value)
+        return sorted(item.position for item in items[:end] if item.record.hi >= value)
+
+
+_contexts: "weakref.WeakKeyDictionary[ConfigModel, QueryContext]" = weakref.WeakKeyDictionary()
+
+
+def context_for(model: ConfigModel) -> QueryContext:
+    """Shared query context for a model, rebuilt when the model changes."""
+    ctx = _contexts.get(model)
+    if ctx is None or ctx.generation != model.generation:
+        ctx = QueryContext(model)
+        _contexts[model] = ctx
+    return ctx
+
+
+def _parse_ip(text: Any) -> Tuple[int, int, int]:
+    """(first, last, version) for an IP, CIDR or "a-b" range string."""
+    text = str(text).strip()
+    if "-" in text:
+        begin, end = (ipaddress.ip_address(p.strip()) for p in text.split("-", 1))
+        return int(begin), int(end), begin.version
+    if "/" in text:
+        network = ipaddress.ip_network(text, strict=False)
+        return int(network.network_address), int(network.broadcast_address), network.version
+    address = ipaddress.ip_address(text)
+    return int(address), int(address), address.version
+
+
+# ---------------------------------------------------------------------------
+# Lexer and parser (a JMESPath subset)
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<number>-?\d+)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+    | "(?P<qident>(?:[^"\\]|\\.)*)"
+    | '(?P<raw>(?:[^'\\]|\\.)*)'
+    | `(?P<json>(?:[^`\\]|\\.)*)`
+    | (?P<op>\|\||&&|==|!=|<=|>=|\[\?|\[\]|[<>!|.\[\]{}(),:@&*])
+    )""", re.X)
+
+# Left binding power of each token
+_LBP = {
+    "eof": 0, "number": 0, "ident": 0, "qident": 0, "raw": 0, "json": 0,
+    "]": 0, ")": 0, ",": 0, "}": 0, ":": 0, "@": 0, "&": 0,
+    "|": 1, "||": 2, "&&": 3,
+    "==": 5, "!=": 5, "<": 5, "<=": 5, ">": 5, ">=": 5,
+    "[]": 9, "*": 20, "[?": 21, ".": 40, "!": 45, "{": 50, "[": 55, "(": 60,
+}
+
+_COMPARATORS = ("==", "!=", "<", "<=", ">", ">=")
+
+
+def _tokenize(expression: str) -> List[Tuple[str, Any, int]]:
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN.match(expression, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Unexpected character at position {pos}: {expression[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "number":
+            tokens.append(("number", int(text), match.start(kind)))
+        elif kind == "qident":
+            tokens.append(("ident", json.loads(f'"{text}"'), match.start(kind)))
+        elif kind == "raw":
+            tokens.append(("raw", text.replace("\\'", "'"), match.start(kind)))
+        elif kind == "json":
+            try:
+                value = json.loads(text.replace("\\`", "`"))
+            except ValueError:
+                value = text
+            tokens.append(("json", value, match.start(kind)))
+        elif kind == "op":
+            tokens.append((text, text, match.start(kind)))
+        else:
+            tokens.append((kind, text, match.start(kind)))
+        pos = match.end()
+    tokens.append(("eof", None, len(expression)))
+    return tokens
+
+
+class _Parser:
+    """Pratt parser producing tuple ASTs, e.g. ("sub", ("field", "zones"), ...)."""
+
+    def __init__(self, expression: str):
+        self.tokens = _tokenize(expression)
+        self.i = 0
+
+    def peek(self, offset: int = 0) -> str:
+        return self.tokens[self.i + offset][0]
+
+    def advance(self) -> Tuple[str, Any, int]:
+        token = self.tokens[self.i]
+        self.i += 1
+        return token
+
+    def expect(self, kind: str):
+        token = self.advance()
+        if token[0] != kind:
+            raise ValueError(f"Expected '{kind}' at position {token[2]}, found '{token[1]}'")
+        return token
+
+    def parse(self) -> tuple:
+        node = self.expression(0)
+        if self.peek() != "eof":
+            token = self.tokens[self.i]
+            raise ValueError(f"Unexpected '{token[1]}' at position {token[2]}")
+        return node
+
+    def expression(self, bp: int) -> tuple:
+        left = self.nud(self.advance())
+        while bp < _LBP.get(self.peek(), 0):
+            left = self.led(self.advance(), left)
+        return left
+
+    def nud(self, token) -> tuple:
+        kind, value, pos = token
+        if kind == "eof":
+            raise ValueError("Unexpected end of expression")
+        if kind in ("raw", "json", "number"):
+            return ("literal", value)
+        if kind == "ident":
+            if self.peek() == "(":
+                self.advance()
+                return ("func", value, self.arguments())
+            return ("field", value)
+        if kind == "@":
+            return ("current",)
+        if kind == "&":
+            return ("expref", self.expression(0))
+        if kind == "!":
+            return ("not", self.expression(_LBP["!"]))
+        if kind == "(":
+            node = self.expression(0)
+            self.expect(")")
+            return node
+        if kind == "*":
+            return ("projection", ("values", ("current",)), self.projection_rhs(_LBP["*"]))
+        if kind == "[":
+            if self.peek() in ("number", ":"):
+                return self.index_or_slice(("current",))
+            if self.peek() == "*" and self.peek(1) == "]":
+                self.advance()
+                self.advance()
+                return ("projection", ("current",), self.projection_rhs(_LBP["*"]))
+            return self.multiselect_list()
+        if kind == "[?":
+            return self.filter(("current",))
+        if kind == "[]":
+            return ("projection", ("flatten", ("current",)), self.projection_rhs(_LBP["[]"]))
+        if kind == "{":
+            return self.multiselect_hash()
+        raise ValueError(f"Unexpected '{value}' at position {pos}")
+
+    def led(self, token, left) -> tuple:
+        kind, value, pos = token
+        if kind == ".":
+            if self.peek() == "*":
+                self.advance()
+                return ("projection", ("values", left), self.projection_rhs(_LBP["*"]))
+            return ("sub", left, self.dot_rhs(_LBP["."]))
+        if kind == "|":
+            return ("pipe", left, self.expression(_LBP["|"]))
+        if kind == "||":
+            return ("or", left, self.expression(_LBP["||"]))
+        if kind == "&&":
+            return ("and", left, self.expression(_LBP["&&"]))
+        if kind in _COMPARATORS:
+            return ("cmp", kind, left, self.expression(_LBP[kind]))
+        if kind == "[":
+            if self.peek() in ("number", ":"):
+                return self.index_or_slice(left)
+            if self.peek() == "*" and self.peek(1) == "]":
+                self.advance()
+                self.advance()
+                return ("projection", left, self.projection_rhs(_LBP["*"]))
+            raise ValueError(f"Expected index, slice or '*' at position {pos}")
+        if kind == "[?":
+            return self.filter(left)
+        if kind == "[]":
+            return ("projection", ("flatten", left), self.projection_rhs(_LBP["[]"]))
+        raise ValueError(f"Unexpected '{value}' at position {pos}")
+
+    def arguments(self) -> List[tuple]:
+        args = []
+        while self.peek() != ")":
+            args.append(self.expression(0))
+            if self.peek() == ",":
+                self.advance()
+        self.expect(")")
+        return args
+
+    def index_or_slice(self, left) -> tuple:
+        parts: List[Optional[int]] = [None, None, None]
+        slot = 0
+        while self.peek() != "]":
+            if self.peek() == ":":
+                slot += 1
+                if slot > 2:
+                    raise ValueError("Too many ':' in slice")
+                self.advance()
+            else:
+                parts[slot] = self.expect("number")[1]
+        self.advance()
+        if slot == 0:
+            return ("sub", left, ("index", parts[0]))
+        return ("projection", ("sub", left, ("slice", parts[0], parts[1], parts[2])),
+                self.projection_rhs(_LBP["*"]))
+
+    def filter(self, left) -> tuple:
+        condition = self.expression(0)
+        self.expect("]")
+        return ("filter", left, condition, self.projection_rhs(_LBP["[?"]))
+
+    def projection_rhs(self, bp: int) -> tuple:
+        kind = self.peek()
+        if _LBP.get(kind, 0) < 10:
+            return ("current",)
+        if kind in ("[", "[?", "[]"):
+            return self.expression(bp)
+        if kind == ".":
+            self.advance()
+            return self.dot_rhs(bp)
+        token = self.tokens[self.i]
+        raise ValueError(f"Unexpected '{token[1]}' at position {token[2]}")
+
+    def dot_rhs(self, bp: int) -> tuple:
+        kind = self.peek()
+        if kind == "ident":
+            return self.expression(bp)
+        if kind == "[":
+            self.advance()
+            return self.multiselect_list()
+        if kind == "{":
+            self.advance()
+            return self.multiselect_hash()
+        token = self.tokens[self.i]
+        raise ValueError(f"Expected a field after '.' at position {token[2]}")
+
+    def multiselect_list(self) -> tuple:
+        items = []
+        while True:
+            items.append(self.expression(0))
+            if self.peek() == "]":
+                break
+            self.expect(",")
+        self.advance()
+        return ("list", items)
+
+    def multiselect_hash(self) -> tuple:
+        pairs = []
+        while True:
+            key = self.expect("ident")[1]
+            self.expect(":")
+            pairs.append((key, self.expression(0)))
+            if self.peek() == "}":
+                break
+            self.expect(",")
+        self.advance()
+        return ("hash", pairs)
+
+
+# ---------------------------------------------------------------------------
+# Evaluation
+
+def _truthy(value: Any) -> bool:
+    return not (value is None or value is False or value == "" or value == [] or value == {})
+
+
+def _key(value: Any) -> Any:
+    if isinstance(value, Item):
+        return value.to_dict()
+    return value
+
+
+def _compare(op: str, a: Any, b: Any) -> Optional[bool]:
+    a, b = _key(a), _key(b)
+    if op == "==":
+        return a == b
+    if op == "!=":
+        return a != b
+    numeric = (int, float)
+    if isinstance(a, bool) or isinstance(b, bool):
+        return None
+    if not ((isinstance(a, numeric) and isinstance(b, numeric)) or (isinstance(a, str) and isinstance(b, str))):
+        return None
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+
+def _sort_key(value: Any):
+    return (value is None, value if isinstance(value, (int, float, str)) else str(value))
+
+
+# A compiled node: (current value, query context) -> result
+Fn = Callable[[Any, QueryContext], Any]
+
+# The value expressions start from; each collection is one of its fields
+_ROOT = object()
+
+
+class _ExprRef:
+    """An &expression argument, evaluated by the function it is passed to."""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Fn):
+        self.fn = fn
+
+
+def _project(items: Iterable[Any], right: Optional[Fn], ctx: QueryContext) -> List[Any]:
+    if right is None:
+        return [item for item in items if item is not None]
+    results = []
+    for item in items:
+        result = right(item, ctx)
+        if result is not None:
+            results.append(result)
+    return results
+
+
+def _compile(node: tuple) -> Fn:
+    """Turn an AST node into a closure; done once per expression."""
+    kind = node[0]
+
+    if kind == "current":
+        return lambda value, ctx: value
+
+    if kind == "literal":
+        literal = node[1]
+        return lambda value, ctx: literal
+
+    if kind == "field":
+        name = node[1]
+
+        def field(value, ctx):
+            if type(value) is Item:
+                getter = value.view.fields.get(name)
+                return getter(value.record) if getter else None
+            if isinstance(value, dict):
+                return value.get(name)
+            if value is _ROOT and name in COLLECTIONS:
+                return ctx.collection(name)
+            return None
+        return field
+
+    if kind in ("sub", "pipe"):
+        left, right = _compile(node[1]), _compile(node[2])
+        return lambda value, ctx: right(left(value, ctx), ctx)
+
+    if kind == "index":
+        position = node[1]
+
+        def index(value, ctx):
+            if isinstance(value, list) and -len(value) <= position < len(value):
+                return value[position]
+            return None
+        return index
+
+    if kind == "slice":
+        window = slice(node[1], node[2], node[3])
+        return lambda value, ctx: value[window] if isinstance(value, list) else None
+
+    if kind == "values":
+        base = _compile(node[1])
+
+        def values(value, ctx):
+            value = base(value, ctx)
+            if isinstance(value, Item):
+                value = value.to_dict()
+            return list(value.values()) if isinstance(value, dict) else None
+        return values
+
+    if kind == "flatten":
+        base = _compile(node[1])
+
+        def flatten(value, ctx):
+            value = base(value, ctx)
+            if not isinstance(value, list):
+                return None
+            flat = []
+            for element in value:
+                if isinstance(element, list):
+                    flat.extend(element)
+                else:
+                    flat.append(element)
+            return flat
+        return flatten
+
+    if kind == "projection":
+        base = _compile(node[1])
+        right = None if node[2] == ("current",) else _compile(node[2])
+
+        def projection(value, ctx):
+            value = base(value, ctx)
+            return _project(value, right, ctx) if isinstance(value, list) else None
+        return projection
+
+    if kind == "filter":
+        base, condition = _compile(node[1]), _compile(node[2])
+        right = None if node[3] == ("current",) else _compile(node[3])
+
+        def filter_(value, ctx):
+            value = base(value, ctx)
+            if not isinstance(value, list):
+                return None
+            return _project([item for item in value if _truthy(condition(item, ctx))], right, ctx)
+        return filter_
+
+    if kind == "indexed_filter":
+        return _compile_indexed_filter(node)
+
+    if kind == "or":
+        left, right = _compile(node[1]), _compile(node[2])
+
+        def or_(value, ctx):
+            result = left(value, ctx)
+            return result if _truthy(result) else right(value, ctx)
+        return or_
+
+    if kind == "and":
+        left, right = _compile(node[1]), _compile(node[2])
+
+        def and_(value, ctx):
+            result = left(value, ctx)
+            return right(value, ctx) if _truthy(result) else result
+        return and_
+
+    if kind == "not":
+        operand = _compile(node[1])
+        return lambda value, ctx: not _truthy(operand(value, ctx))
+
+    if kind == "cmp":
+        op, left, right = node[1], _compile(node[2]), _compile(node[3])
+        return lambda value, ctx: _compare(op, left(value, ctx), right(value, ctx))
+
+    if kind == "expref":
+        ref = _ExprRef(_compile(node[1]))
+        return lambda value, ctx: ref
+
+    if kind == "list":
+        items = [_compile(item) for item in node[1]]
+        return lambda value, ctx: None if value is None else [item(value, ctx) for item in items]
+
+    if kind == "hash":
+        pairs = [(key, _compile(item)) for key, item in node[1]]
+        return lambda value, ctx: None if value is None else {key: item(value, ctx) for key, item in pairs}
+
+    if kind == "func":
+        return _compile_function(node[1], node[2])
+
+    raise ValueError(f"Cannot compile '{kind}'")
+
+
+def _compile_indexed_filter(node: tuple) -> Fn:
+    """Filter on a root collection whose condition pins an indexed field.
+
+    Each lookup narrows the collection to candidate positions (equality
+    index, or sorted range starts for address objects); the smallest
+    candidate set is then checked against the full condition.
+    """
+    _, collection, lookups, condition, right = node
+    condition = _compile(condition)
+    right = None if right == ("current",) else _compile(right)
+    ip_lookups = {operand: _parse_ip(operand) for kind, _, operand in lookups if kind == "ip"}
+
+    def indexed_filter(value, ctx):
+        if value is not _ROOT:
+            return None
+        items = ctx.collection(collection)
+        positions: Optional[List[int]] = None
+        for kind, field, operand in lookups:
+            if kind == "eq":
+                found = ctx.lookup(collection, field, operand)
+            else:
+                first, last, version = ip_lookups[operand]
+                if collection == "address_objects" and field in (None, "value"):
+                    found = ctx.address_candidates(first, version)
+                else:
+                    found = ctx.covering(collection, field, first, last)
+            if positions is None or len(found) < len(positions):
+                positions = found
+        candidates = [items[i] for i in positions or ()]
+        return _project([item for item in candidates if _truthy(condition(item, ctx))], right, ctx)
+    return indexed_filter
+
+
+def _compile_function(name: str, args: List[tuple]) -> Fn:
+    if name == "contains_ip":
+        if len(args) != 2:
+            raise ValueError("contains_ip(field, ip) takes two arguments")
+        target, operand = args
+        field = target[1] if target[0] == "field" else None
+        by_ranges = target[0] == "current" or field in _SELECTOR_FIELDS or field == "value"
+        range_field = None if field == "value" else field
+        fixed = _parse_ip(operand[1]) if operand[0] == "literal" else None
+        target, operand = _compile(target), _compile(operand)
+
+        def contains_ip(value, ctx):
+            first, last, _ = fixed or _parse_ip(operand(value, ctx))
+            if by_ranges and type(value) is Item:
+                return _covers(ctx.ranges(value, range_field), first, last)
+            text = target(value, ctx)
+            if not isinstance(text, str):
+                return False
+            try:
+                lo, hi, _ = _parse_ip(text)
+            except ValueError:
+                return False
+            return lo <= first and last <= hi
+        return contains_ip
+
+    arity = {"length": 1, "contains": 2, "starts_with": 2, "ends_with": 2, "lower": 1, "to_string": 1,
+             "keys": 1, "reverse": 1, "sort": 1, "sort_by": 2, "max_by": 2, "min_by": 2}
+    if name not in arity:
+        raise ValueError(f"Unknown function '{name}'")
+    if len(args) != arity[name]:
+        raise ValueError(f"{name}() takes {arity[name]} argument(s)")
+    fns = [_compile(arg) for arg in args]
+
+    if name == "length":
+        def length(value, ctx):
+            subject = _key(fns[0](value, ctx))
+            return len(subject) if isinstance(subject, (str, list, dict)) else None
+        return length
+
+    if name in ("contains", "starts_with", "ends_with"):
+        def text_match(value, ctx):
+            subject, search = fns[0](value, ctx), fns[1](value, ctx)
+            if isinstance(subject, list):
+                return name == "contains" and search in subject
+            if not isinstance(subject, str) or not isinstance(search, str):
+                return False
+            if name == "contains":
+                return search in subject
+            return subject.startswith(search) if name == "starts_with" else subject.endswith(search)
+        return text_match
+
+    if name == "lower":
+        def lower(value, ctx):
+            subject = fns[0](value, ctx)
+            return subject.lower() if isinstance(subject, str) else subject
+        return lower
+
+    if name == "to_string":
+        def to_string(value, ctx):
+            subject = fns[0](value, ctx)
+            return subject if isinstance(subject, str) else json.dumps(to_plain(subject), default=str)
+        return to_string
+
+    if name == "keys":
+        def keys(value, ctx):
+            subject = _key(fns[0](value, ctx))
+            return list(subject) if isinstance(subject, dict) else None
+        return keys
+
+    if name == "reverse":
+        def reverse(value, ctx):
+            subject = fns[0](value, ctx)
+            return subject[::-1] if isinstance(subject, (list, str)) else None
+        return reverse
+
+    if name == "sort":
+        def sort(value, ctx):
+            subject = fns[0](value, ctx)
+            return sorted(subject, key=_sort_key) if isinstance(subject, list) else None
+        return sort
+
+    def by_expression(value, ctx):
+        subject, ref = fns[0](value, ctx), fns[1](value, ctx)
+        if not isinstance(subject, list) or not isinstance(ref, _ExprRef):
+            raise ValueError(f"{name}(array, &field) expects an array and an &expression")
+        keyed = [(_sort_key(ref.fn(item, ctx)), item) for item in subject]
+        if name == "sort_by":
+            return [item for _, item in sorted(keyed, key=lambda pair: pair[0])]
+        if not keyed:
+            return None
+        return (max if name == "max_by" else min)(keyed, key=lambda pair: pair[0])[1]
+    return by_expression
+
+
+# ---------------------------------------------------------------------------
+# Compilation
+
+def _root_fields(node: tuple) -> Set[str]:
+    """Names looked up on the root value, i.e. the collections an expression reads."""
+    kind = node[0]
+    if kind == "field":
+        return {node[1]}
+    if kind in ("sub", "projection", "filter", "pipe", "values", "flatten"):
+        return _root_fields(node[1])
+    if kind in ("or", "and"):
+        return _root_fields(node[1]) | _root_fields(node[2])
+    if kind == "cmp":
+        return _root_fields(node[2]) | _root_fields(node[3])
+    if kind == "not":
+        return _root_fields(node[1])
+    if kind in ("list", "func"):
+        items = node[1] if kind == "list" else node[2]
+        return set().union(*(_root_fields(n) for n in items)) if items else set()
+    if kind == "hash":
+        return set().union(*(_root_fields(n) for _, n in node[1])) if node[1] else set()
+    return set()
+
+
+def _uses_function(node: Any, name: str) -> bool:
+    if isinstance(node, tuple):
+        if node and node[0] == "func" and node[1] == name:
+            return True
+        return any(_uses_function(child, name) for child in node[1:])
+    if isinstance(node, list):
+        return any(_uses_function(child, name) for child in node)
+    return False
+
+
+def _conjuncts(node: tuple) -> List[tuple]:
+    if node[0] == "and":
+        return _conjuncts(node[1]) + _conjuncts(node[2])
+    return [node]
+
+
+def _lookup_for(term: tuple) -> Optional[Tuple[str, Optional[str], Any]]:
+    """An index lookup implied by one AND-term of a filter, if any."""
+    if term[0] == "cmp" and term[1] == "==":
+        left, right = term[2], term[3]
+        if right[0] == "field":
+            left, right = right, left
+        if left[0] == "field" and left[1] in INDEXED_FIELDS and right[0] == "literal" \
+                and isinstance(right[1], str):
+            return ("eq", left[1], right[1])
+    if term[0] == "func" and term[1] == "contains_ip" and len(term[2]) == 2:
+        target, operand = term[2]
+        if operand[0] == "literal" and target[0] in ("field", "current"):
+            field = target[1] if target[0] == "field" else None
+            if field is None or field in _SELECTOR_FIELDS or field == "value":
+                return ("ip", field, operand[1])
+    return None
+
+
+def _optimize(node: Any) -> Any:
+    """Rewrite root-collection filters that pin an indexed field into indexed filters."""
+    if isinstance(node, list):
+        return [_optimize(child) for child in node]
+    if not isinstance(node, tuple) or not node:
+        return node
+    if node[0] == "filter" and node[1][0] == "field" and node[1][1] in COLLECTIONS:
+        lookups = [l for l in (_lookup_for(t) for t in _conjuncts(node[2])) if l]
+        if lookups:
+            return ("indexed_filter", node[1][1], lookups, node[2], _optimize(node[3]))
+    if node[0] == "hash":
+        return ("hash", [(key, _optimize(child)) for key, child in node[1]])
+    if node[0] in ("literal", "field", "index", "slice", "current"):
+        return node
+    return tuple(_optimize(child) if isinstance(child, (tuple, list)) else child for child in node)
+
+
+class CompiledQuery:
+    """A parsed, index-optimized expression and the config categories it needs."""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        ast = _Parser(expression).parse()
+        collections = _root_fields(ast)
+        unknown = collections - set(COLLECTIONS)
+        if unknown or not collections:
+            raise ValueError(
+                f"Expressions start from a collection: {', '.join(COLLECTIONS)}"
+                + (f" (unknown: {', '.join(sorted(unknown))})" if unknown else "")
+            )
+        self.collections = collections
+        categories: List[str] = []
+        for name in sorted(collections):
+            categories.extend(COLLECTIONS[name][0])
+        if _uses_function(ast, "contains_ip"):
+            categories.extend(c for c in _ADDRESS_CATEGORIES if c not in categories)
+        self.categories = tuple(dict.fromkeys(categories))
+        self.ast = _optimize(ast)
+        self._fn = _compile(self.ast)
+        self.fingerprint = hashlib.blake2b(expression.encode(), digest_size=6).hexdigest()
+
+    def search(self, model: ConfigModel) -> Any:
+        return self._fn(_ROOT, context_for(model))
+
+    def page(self, model: ConfigModel, limit: int = 50, cursor: Optional[str] = None) -> Tuple[Any, Optional[Page]]:
+        """Run the query; list results come back as a Page of rows, anything else as-is."""
+        result = self.search(model)
+        if not isinstance(result, list):
+            return to_plain(result), None
+
+        start = 0
+        if cursor:
+            try:
+                padded = cursor + "=" * (-len(cursor) % 4)
+                state = json.loads(base64.urlsafe_b64decode(padded))
+            except (ValueError, TypeError):
+                raise ValueError("Invalid page cursor")
+            if state.get("h") != self.fingerprint:
+                raise ValueError("Page cursor belongs to a different expression")
+            start = int(state.get("o", 0))
+
+        chunk = result[start:start + limit]
+        rows = []
+        for value in chunk:
+            value = to_plain(value)
+            rows.append(value if isinstance(value, dict) else {"value": value})
+
+        def cursor_at(count: int) -> Optional[str]:
+            if count <= 0 or start + count >= len(result):
+                return None
+            raw = json.dumps({"h": self.fingerprint, "o": start + count}, separators=(",", ":")).encode()
+            return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+        return None, Page(rows, start, len(result), cursor_at(len(chunk)), cursor_at)
+
+
+@lru_cache(maxsize=256)
+def compile_query(expression: str) -> CompiledQuery:
+    """Parse and optimize an expression once; later calls hit the cache."""
+    return CompiledQuery(expression.strip())
@@ -0,0 +1,188 @@
+"""
+SonicWall Object Dependency Graph
+Forward and reverse reference indexes for impact analysis on config objects
+"""
+
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Set, Tuple, FrozenSet, Iterable
+
+from config_model import ConfigModel, Group, Policy, CATEGORY_KINDS, POLICY_KINDS
+
+logger = logging.getLogger(__name__)
+
+# A graph node is (kind, key). Objects and groups are keyed by name, policies
+# by UUID (falling back to name when the device omits it).
+Node = Tuple[str, str]
+
+OBJECT_KINDS = ("address_object", "address_group", "service_object", "service_group")
+
+# Config categories the graph is built from
+GRAPH_CATEGORIES = tuple(
+    category for category, kind in CATEGORY_KINDS.items()
+    if kind in OBJECT_KINDS or kind in POLICY_KINDS
+)
+
+
+def record_references(record: Any) -> Set[Node]:
+    """Return every object node directly referenced by a group or policy record."""
+    if isinstance(record, Group):
+        return set(record.members)
+    if isinstance(record, Policy):
+        return set(record.references())
+    return set()
+
+
+class DependencyGraph:
+    """Reference graph over address/service objects, groups and policies.
+
+    ``forward[n]`` holds the nodes ``n`` references; ``reverse[n]`` holds the
+    nodes referencing ``n``. Direct lookups are single dict hits, transitive
+    impact sets are memoized and invalidated only along the edges an update
+    touches. A graph attached to a ``ConfigModel`` is updated node by node
+    as the model's records change and travels with the model's snapshots.
+    """
+
+    def __init__(self):
+        self.forward: Dict[Node, Set[Node]] = defaultdict(set)
+        self.reverse: Dict[Node, Set[Node]] = defaultdict(set)
+        self.labels: Dict[Node, str] = {}
+        self.by_name: Dict[str, Set[Node]] = defaultdict(set)
+        self._impact_cache: Dict[Node, FrozenSet[Node]] = {}
+        self.generation = 0
+
+    @classmethod
+    def from_model(cls, model: ConfigModel) -> "DependencyGraph":
+        """Build a graph from the groups and policies held in a ``ConfigModel``."""
+        graph = cls()
+        for obj in model.address_objects:
+            graph._register(("address_object", obj.name), obj.name)
+        for obj in model.service_objects:
+            graph._register(("service_object", obj.name), obj.name)
+        for group in list(model.address_groups.values()) + list(model.service_groups.values()):
+            graph.set_node((group.kind, group.name), group.name, record_references(group))
+        for policy in model.all_policies():
+            graph.set_node((policy.kind, policy.key), policy.name, record_references(policy))
+        graph.generation = model.generation
+        logger.debug(f"Dependency graph built: {len(graph.labels)} nodes")
+        return graph
+
+    @classmethod
+    def attach(cls, model: ConfigModel) -> "DependencyGraph":
+        """Build a graph from ``model`` and keep it updated with the model's record changes."""
+        graph = cls.from_model(model)
+        model.indexes["dependency_graph"] = graph
+        return graph
+
+    @classmethod
+    def from_config(cls, config: Dict[str, List[Dict[str, Any]]]) -> "DependencyGraph":
+        """Build a graph from the output of ``config_loader.fetch_config``."""
+        return cls.from_model(ConfigModel.from_config(config))
+
+    def _register(self, node: Node, label: str):
+        previous = self.labels.get(node)
+        if previous is not None and previous != label:
+            self._unregister(node)
+        self.labels[node] = label
+        self.by_name[label].add(node)
+
+    def _unregister(self, node: Node):
+        label = self.labels.pop(node, None)
+        if label is not None:
+            self.by_name[label].discard(node)
+            if not self.by_name[label]:
+                del self.by_name[label]
+
+    def _invalidate(self, targets: Iterable[Node]):
+        """Drop cached impact sets for ``targets`` and everything they reference."""
+        stack = list(targets)
+        seen: Set[Node] = set()
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            self._impact_cache.pop(node, None)
+            stack.extend(self.forward.get(node, ()))
+
+    def set_node(self, node: Node, label: str, new_refs: Set[Node]) -> Node:
+        """Add or replace a node and its outgoing edges."""
+        self._register(node, label)
+
+        old_refs = self.forward.get(node, set())
+        if new_refs == old_refs:
+            return node
+
+        self._invalidate(old_refs | new_refs)
+        for target in old_refs - new_refs:
+            self.reverse[target].discard(node)
+        for target in new_refs - old_refs:
+            self.reverse[target].add(node)
+            if target not in self.labels:
+                # Referenced but not (yet) fetched, e.g. a default object
+                self._register(target, target[1])
+        self.forward[node] = set(new_refs)
+        return node
+
+    def remove_node(self, node: Node):
+        """Remove a node's outgoing edges.
+
+        The node itself is kept while something still references it, so a
+        dangling reference stays visible in impact queries.
+        """
+        old_refs = self.forward.pop(node, set())
+        self._invalidate(old_refs | {node})
+        for target in old_refs:
+            self.reverse[target].discard(node)
+        if not self.reverse.get(node):
+            self.reverse.pop(node, None)
+            self._unregister(node)
+
+    def apply(self, category: str, key: str, record: Any):
+        """``ConfigModel`` index hook: add, replace or remove the node of one record."""
+        kind = CATEGORY_KINDS[category]
+        if kind not in OBJECT_KINDS and kind not in POLICY_KINDS:
+            return
+        node = (kind, key)
+        if record is None:
+            self.remove_node(node)
+        elif kind in ("address_object", "service_object"):
+            self._register(node, key)
+        else:
+            self.set_node(node, record.name or key, record_references(record))
+
+    def find(self, name: str, kind: Optional[str] = None) -> List[Node]:
+        """Find nodes by display name, optionally restricted to one kind."""
+        nodes = self.by_name.get(name, set())
+        return sorted(n for n in nodes if kind is None or n[0] == kind)
+
+    def dependents(self, node: Node) -> Set[Node]:
+        """Nodes that directly reference ``node``."""
+        return self.reverse.get(node, set())
+
+    def dependencies(self, node: Node) -> Set[Node]:
+        """Nodes directly referenced by ``node``."""
+        return self.forward.get(node, set())
+
+    def impact(self, node: Node) -> FrozenSet[Node]:
+        """All nodes that reference ``node`` directly or through groups."""
+        cached = self._impact_cache.get(node)
+        if cached is not None:
+            return cached
+
+        result: Set[Node] = set()
+        stack = list(self.reverse.get(node, ()))
+        while stack:
+            current = stack.pop()
+            if current in result or current == node:
+                continue
+            result.add(current)
+            stack.extend(self.reverse.get(current, ()))
+
+        frozen = frozenset(result)
+        self._impact_cache[node] = frozen
+        return frozen
+
+    def label(self, node: Node) -> str:
+        """Human-readable name for a node."""
+        return self.labels.get(node, node[1])
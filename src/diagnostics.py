@@ -0,0 +1,446 @@
+"""
+SonicWall Diagnostics
+Composite overview and troubleshooting checks built from concurrent API reads
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from config_loader import CONFIG_ENDPOINTS
+from config_model import ConfigModel, Interface, Policy
+from nat_engine import NatEngine
+from object_resolver import ObjectResolver, in_ranges, service_matches
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+# Per-endpoint time limit; one slow endpoint only costs its own section
+DEFAULT_FETCH_TIMEOUT = float(os.getenv("SONICWALL_DIAG_TIMEOUT", "30"))
+
+DEFAULT_SSLVPN_PORT = 4433
+
+# Outside address (TEST-NET-3) used as the client when checking inbound rules and NAT
+PROBE_SOURCE = "203.0.113.10"
+
+_TCP = 6
+
+# Finding levels, most severe first
+LEVELS = {"fail": "❌", "warn": "⚠️", "ok": "✅", "info": "ℹ️"}
+
+SSLVPN_ENDPOINTS = {
+    "server": "ssl-vpn/server/base",
+    "accesses": "ssl-vpn/server/accesses",
+    "portal": "ssl-vpn/portal",
+    "sessions": "reporting/ssl-vpn/sessions",
+    "interface_status": "reporting/interfaces/ipv4/status",
+}
+
+SSLVPN_CATEGORIES = (
+    "interfaces_ipv4", "zones",
+    "access_rules_ipv4", "security_policies_ipv4", "nat_policies_ipv4",
+    "address_objects_ipv4", "address_groups_ipv4", "service_objects", "service_groups",
+)
+
+OVERVIEW_ENDPOINTS = {
+    "version": "version",
+    "system": "reporting/status/system",
+    "interface_status": "reporting/interfaces/ipv4/status",
+    "sessions": "reporting/ssl-vpn/sessions",
+    "vpn_tunnels": "reporting/tunnel-interfaces/vpn/status",
+}
+
+OVERVIEW_CATEGORIES = (
+    "interfaces_ipv4", "zones",
+    "access_rules_ipv4", "security_policies_ipv4", "nat_policies_ipv4", "route_policies_ipv4",
+    "address_objects_ipv4", "address_groups_ipv4", "service_objects", "service_groups",
+)
+
+
+class Fetched:
+    """Outcome of one endpoint read: its response or error, and how long it took."""
+
+    __slots__ = ("value", "error", "seconds")
+
+    def __init__(self, value: Any = None, error: Optional[str] = None, seconds: float = 0.0):
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+
+async def fan_out(client: SonicWallClient, endpoints: Dict[str, str],
+                  timeout: float = DEFAULT_FETCH_TIMEOUT) -> Dict[str, Fetched]:
+    """GET every endpoint concurrently; the call takes as long as the slowest one.
+
+    Failures (HTTP errors, timeouts) are recorded per endpoint instead of
+    cancelling the others, so a composite tool can still answer from what
+    it did get.
+    """
+    results: Dict[str, Fetched] = {}
+
+    async def fetch(key: str, path: str):
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout):
+                value = await client.get(path)
+            results[key] = Fetched(value, None, time.perf_counter() - started)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            results[key] = Fetched(None, error, time.perf_counter() - started)
+            logger.debug(f"Diagnostic fetch {path} failed: {error}")
+
+    async with asyncio.TaskGroup() as group:
+        for key, path in endpoints.items():
+            group.create_task(fetch(key, path))
+    return results
+
+
+def build_model(fetched: Dict[str, Fetched], categories) -> ConfigModel:
+    """Config model from the config categories that were fetched successfully."""
+    model = ConfigModel()
+    for category in categories:
+        result = fetched.get(category)
+        if result is not None and result.error is None:
+            model.ingest_response(category, result.value)
+    return model
+
+
+class Diagnosis:
+    """Findings and facts gathered by a composite tool, rendered as one answer."""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.facts: List[Tuple[str, str]] = []
+        self.findings: List[Tuple[str, str]] = []
+        self.sections: List[Tuple[str, List[str]]] = []
+        self.fetched: Dict[str, Fetched] = {}
+        self.elapsed = 0.0
+
+    def fact(self, label: str, value: Any):
+        self.facts.append((label, str(value)))
+
+    def add(self, level: str, text: str):
+        self.findings.append((level, text))
+
+    def section(self, title: str, lines: List[str]):
+        if lines:
+            self.sections.append((title, lines))
+
+    @property
+    def verdict(self) -> str:
+        levels = {level for level, _ in self.findings}
+        for level in ("fail", "warn"):
+            if level in levels:
+                return level
+        return "ok"
+
+    def render(self) -> str:
+        output = f"{self.title}:\n"
+        output += "=" * 50 + "\n"
+        for label, value in self.facts:
+            output += f"{label}: {value}\n"
+
+        order = list(LEVELS)
+        if self.findings:
+            output += "\nFindings:\n"
+            for level, text in sorted(self.findings, key=lambda f: order.index(f[0])):
+                output += f"{LEVELS[level]} {text}\n"
+
+        for title, lines in self.sections:
+            output += f"\n{title}:\n"
+            output += "".join(f"  {line}\n" for line in lines)
+
+        if self.fetched:
+            failed = {k: f for k, f in self.fetched.items() if f.error}
+            slowest = max(self.fetched.items(), key=lambda item: item[1].seconds)
+            serial = sum(f.seconds for f in self.fetched.values())
+            output += (
+                f"\nFetched {len(self.fetched) - len(failed)}/{len(self.fetched)} endpoints concurrently "
+                f"in {self.elapsed:.2f}s (slowest: {slowest[0]} {slowest[1].seconds:.2f}s; "
+                f"one at a time: {serial:.2f}s)\n"
+            )
+            for key, result in sorted(failed.items()):
+                output += f"  Unavailable: {key} - {result.error[:160]}\n"
+        return output
+
+
+def _entries(value: Any, *keys: str) -> Any:
+    """Walk nested dict keys, returning None when any step is missing."""
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _rows(value: Any) -> List[Any]:
+    """Rows of a reporting response: the list itself, or the first list inside a wrapping dict."""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        return next((v for v in value.values() if isinstance(v, list)), [])
+    return []
+
+
+def _interface_status(fetched: Dict[str, Fetched]) -> Dict[str, Dict[str, Any]]:
+    result = fetched.get("interface_status")
+    rows = result.value if result is not None and result.error is None else None
+    if isinstance(rows, dict):
+        rows = next((v for v in rows.values() if isinstance(v, list)), [])
+    return {row.get("name"): row for row in rows or () if isinstance(row, dict) and row.get("name")}
+
+
+def _link_up(status: Optional[Dict[str, Any]]) -> Optional[bool]:
+    """Link state from a reporting row; None when unknown."""
+    if not status:
+        return None
+    text = str(status.get("status", "")).lower()
+    if "no link" in text or "down" in text or status.get("connected") is False:
+        return False
+    if status.get("connected") or "mbps" in text or "gbps" in text or text == "up":
+        return True
+    return None
+
+
+def _interface_ip(interface: Interface, status: Optional[Dict[str, Any]]) -> Optional[str]:
+    ip = interface.ip or (status or {}).get("ip_address")
+    if not ip or ip == "0.0.0.0":
+        return None
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
+
+
+def _selector_text(sel) -> str:
+    return sel[1] if sel else "Any"
+
+
+def _ordered_rules(model: ConfigModel) -> Tuple[str, List[Policy]]:
+    """The rule set the device evaluates (security policies in policy mode, else access rules), in order."""
+    kind = "security_policy" if model.policies["security_policy"] else "access_rule"
+    rules = [p for p in model.policies[kind] if p.family in (None, "ipv4")]
+    # Device order within equal priorities; unprioritised rules keep their listed position
+    rules = sorted(enumerate(rules), key=lambda item: (item[1].priority is None, item[1].priority or 0, item[0]))
+    label = "security policies" if kind == "security_policy" else "access rules"
+    return label, [policy for _, policy in rules]
+
+
+def _zone_matches(rule_zone: Optional[str], zone: str) -> bool:
+    return rule_zone is None or rule_zone.lower() in ("any", zone.lower())
+
+
+def first_matching_rule(model: ConfigModel, resolver: ObjectResolver, from_zone: str, to_zone: str,
+                        dst: str, port: int, protocol: int = _TCP) -> Tuple[Optional[Policy], List[Policy]]:
+    """First enabled rule a connection to dst:port would hit, and disabled rules that would match before it.
+
+    The source is not checked (the client could be anywhere); a winning
+    rule with a narrowed source is reported by the caller.
+    """
+    _, rules = _ordered_rules(model)
+    address = int(ipaddress.ip_address(dst))
+    skipped: List[Policy] = []
+    for rule in rules:
+        if not (_zone_matches(rule.from_zone, from_zone) and _zone_matches(rule.to_zone, to_zone)):
+            continue
+        destination = resolver.resolve_address(rule.destination)
+        if destination is not None and not in_ranges(address, destination):
+            continue
+        if not service_matches(resolver.resolve_service(rule.service), protocol, port):
+            continue
+        if not rule.enabled:
+            skipped.append(rule)
+            continue
+        return rule, skipped
+    return None, skipped
+
+
+def _report_fetch_errors(diagnosis: Diagnosis, fetched: Dict[str, Fetched], required: List[str]):
+    unauthorized = [k for k, f in fetched.items() if f.error and ("401" in f.error or "Unauthorized" in f.error)]
+    if unauthorized:
+        diagnosis.add("warn", f"The API user was refused ({', '.join(sorted(unauthorized))}); "
+                              "check that it has full admin privileges and that the session is authenticated")
+    for key in required:
+        result = fetched.get(key)
+        if result is not None and result.error and key not in unauthorized:
+            diagnosis.add("warn", f"Could not read {key}; checks that need it were skipped")
+
+
+async def troubleshoot_sslvpn(client: SonicWallClient, port: Optional[int] = None,
+                              timeout: float = DEFAULT_FETCH_TIMEOUT) -> Diagnosis:
+    """Why can't clients reach the SSL VPN portal? One concurrent read, then local correlation.
+
+    Checks, per listening interface: SSL VPN access enabled on its zone,
+    an IP and link, the first matching WAN-to-WAN rule for the server
+    port, and any inbound NAT policy that redirects that port elsewhere.
+    """
+    started = time.perf_counter()
+    endpoints = dict(SSLVPN_ENDPOINTS)
+    endpoints.update({category: CONFIG_ENDPOINTS[category][0] for category in SSLVPN_CATEGORIES})
+    fetched = await fan_out(client, endpoints, timeout)
+    diagnosis = Diagnosis("SSL VPN Portal Troubleshooting")
+    diagnosis.fetched = fetched
+    model = build_model(fetched, SSLVPN_CATEGORIES)
+    resolver = ObjectResolver(model)
+    status = _interface_status(fetched)
+
+    # Server settings
+    server = _entries(fetched["server"].value, "ssl_vpn", "server") or {}
+    configured_port = server.get("port")
+    port = int(port or configured_port or DEFAULT_SSLVPN_PORT)
+    diagnosis.fact("Server port", f"tcp/{port}" + ("" if configured_port else " (default)"))
+    if server.get("auth_type"):
+        diagnosis.fact("Authentication", server["auth_type"])
+    if configured_port and port != int(configured_port):
+        diagnosis.add("warn", f"Checking tcp/{port}, but the SSL VPN server listens on tcp/{configured_port}")
+
+    # Zones with SSL VPN access
+    access = _entries(fetched["accesses"].value, "ssl_vpn", "server", "access")
+    enabled_zones = [a.get("zone") for a in access or () if isinstance(a, dict) and a.get("enable") and a.get("zone")]
+    zone_types = {name: zone.security_type for name, zone in model.zones.items()}
+    if fetched["accesses"].error is None:
+        diagnosis.fact("Access enabled on zones", ", ".join(enabled_zones) or "none")
+        if not enabled_zones:
+            diagnosis.add("fail", "SSL VPN access is not enabled on any zone (Network > SSL VPN > Server Settings)")
+        elif zone_types and not any(zone_types.get(z) == "untrusted" for z in enabled_zones):
+            untrusted = [z for z, t in zone_types.items() if t == "untrusted"]
+            diagnosis.add("warn", f"SSL VPN access is not enabled on an untrusted zone"
+                                  f"{' (' + ', '.join(untrusted) + ')' if untrusted else ''}, "
+                                  "so the portal is not reachable from the internet")
+
+    # Listeners: interfaces in those zones, with an address and link
+    listeners: List[Tuple[Interface, str]] = []
+    lines = []
+    for interface in model.interfaces.values():
+        if not interface.zone or interface.zone not in enabled_zones:
+            continue
+        row = status.get(interface.name)
+        ip = _interface_ip(interface, row)
+        link = _link_up(row)
+        state = {True: "link up", False: "NO LINK", None: "link unknown"}[link]
+        lines.append(f"{interface.name} ({interface.zone}) {ip or 'no IP'}:{port} - {state}")
+        if ip and link is not False:
+            listeners.append((interface, ip))
+        elif not ip:
+            diagnosis.add("warn", f"{interface.name} is in {interface.zone} but has no IP address")
+        else:
+            diagnosis.add("warn", f"{interface.name} ({ip}) has no link")
+    diagnosis.section("Listening interfaces", lines)
+    if enabled_zones and "interfaces_ipv4" in model.categories and not listeners:
+        diagnosis.add("fail", f"No interface in {', '.join(enabled_zones)} has an IP address and link, "
+                              "so nothing is listening for the portal")
+
+    # Rules and NAT for each listener
+    rules_label, _ = _ordered_rules(model)
+    have_rules = bool({"access_rules_ipv4", "security_policies_ipv4"} & model.categories)
+    engine = NatEngine.from_model(model) if "nat_policies_ipv4" in model.categories else None
+    for interface, ip in listeners:
+        zone = interface.zone
+        if have_rules:
+            rule, skipped = first_matching_rule(model, resolver, zone, zone, ip, port)
+            for disabled in skipped:
+                diagnosis.add("info", f"Disabled rule '{disabled.name}' ({zone} -> {zone}) would match tcp/{port} to {ip}")
+            if rule is None:
+                diagnosis.add("fail", f"No enabled {rules_label[:-1]} from {zone} to {zone} allows tcp/{port} to {ip}; "
+                                      "SonicOS normally adds one when SSL VPN access is enabled on the zone")
+            elif (rule.action or "").lower() != "allow":
+                diagnosis.add("fail", f"'{rule.name}' ({rule.action}, {zone} -> {zone}, "
+                                      f"service {_selector_text(rule.service)}) blocks tcp/{port} to {ip} "
+                                      "before any allow rule")
+            else:
+                source = resolver.resolve_address(rule.source)
+                if source is not None and not in_ranges(int(ipaddress.ip_address(PROBE_SOURCE)), source):
+                    diagnosis.add("warn", f"'{rule.name}' allows tcp/{port} to {ip} only from "
+                                          f"{_selector_text(rule.source)}")
+                else:
+                    diagnosis.add("ok", f"'{rule.name}' allows tcp/{port} to {ip} from {zone}")
+        if engine is not None:
+            nat = engine.lookup(PROBE_SOURCE, ip, "tcp", port, inbound=interface.name)
+            if nat is not None:
+                new_ip, new_port = nat["translated"][1], nat["translated"][2]
+                if new_ip != ip or new_port != port:
+                    diagnosis.add("fail", f"NAT policy '{nat['policy']}' forwards {ip}:{port} to {new_ip}:{new_port}, "
+                                          "so connections never reach the SSL VPN server")
+
+    # Live sessions show whether anyone gets in at all
+    sessions = fetched["sessions"]
+    if sessions.error is None:
+        rows = _rows(sessions.value)
+        diagnosis.fact("Active sessions", len(rows))
+        if rows:
+            diagnosis.add("info", f"{len(rows)} SSL VPN session(s) are active, so the portal works for some clients")
+
+    _report_fetch_errors(diagnosis, fetched, ["server", "accesses", "interfaces_ipv4", "zones", "nat_policies_ipv4"])
+    if not have_rules:
+        diagnosis.add("warn", "Could not read access rules or security policies; rule checks were skipped")
+    diagnosis.elapsed = time.perf_counter() - started
+    diagnosis.fact("Verdict", {"fail": "blocking problems found", "warn": "possible problems found",
+                               "ok": "no blocking configuration found"}[diagnosis.verdict])
+    return diagnosis
+
+
+async def overview(client: SonicWallClient, timeout: float = DEFAULT_FETCH_TIMEOUT) -> Diagnosis:
+    """Device, interface, zone and policy summary from one concurrent read."""
+    started = time.perf_counter()
+    endpoints = dict(OVERVIEW_ENDPOINTS)
+    endpoints.update({category: CONFIG_ENDPOINTS[category][0] for category in OVERVIEW_CATEGORIES})
+    fetched = await fan_out(client, endpoints, timeout)
+    diagnosis = Diagnosis("Firewall Overview")
+    diagnosis.fetched = fetched
+    model = build_model(fetched, OVERVIEW_CATEGORIES)
+    status = _interface_status(fetched)
+
+    system = fetched["system"].value if fetched["system"].error is None else None
+    version = fetched["version"].value if fetched["version"].error is None else None
+    device = {**(version if isinstance(version, dict) else {}), **(system if isinstance(system, dict) else {})}
+    for label, key in (("Model", "model"), ("Name", "firewall_name"), ("Serial", "serial_number"),
+                       ("Firmware", "firmware_version"), ("Uptime", "up_time"), ("Connections", "current_connections")):
+        value = device.get(key) or (device.get("system_uptime") if key == "up_time" else None)
+        if value:
+            diagnosis.fact(label, value)
+    if device.get("restart_required"):
+        diagnosis.add("warn", "The firewall reports that a restart is required")
+
+    # Interfaces and zones
+    lines = []
+    zone_members: Dict[str, List[str]] = {}
+    for interface in model.interfaces.values():
+        row = status.get(interface.name)
+        ip = _interface_ip(interface, row)
+        link = _link_up(row)
+        if interface.zone:
+            zone_members.setdefault(interface.zone, []).append(interface.name)
+        state = {True: "up", False: "no link", None: "?"}[link]
+        lines.append(f"{interface.name:<10} {interface.zone or '-':<10} {ip or '-':<16} {state}")
+        if ip and link is False:
+            diagnosis.add("warn", f"{interface.name} ({interface.zone}, {ip}) has an address but no link")
+    diagnosis.section("Interfaces", lines)
+    diagnosis.section("Zones", [
+        f"{name} ({zone.security_type or '?'}): {', '.join(zone_members.get(name, [])) or 'no interfaces'}"
+        for name, zone in model.zones.items()
+    ])
+
+    # Policy and object counts
+    counts = []
+    rules_label, rules = _ordered_rules(model)
+    if rules:
+        disabled = sum(1 for r in rules if not r.enabled)
+        counts.append(f"{rules_label.capitalize()}: {len(rules)} ({disabled} disabled)")
+    for label, kind in (("NAT policies", "nat_policy"), ("Route policies", "route_policy")):
+        if model.policies[kind]:
+            counts.append(f"{label}: {len(model.policies[kind])}")
+    counts.append(f"Address objects: {sum(1 for _ in model.address_objects)}, groups: {len(model.address_groups)}")
+    counts.append(f"Service objects: {sum(1 for _ in model.service_objects)}, groups: {len(model.service_groups)}")
+    diagnosis.section("Configuration", counts)
+
+    for key, label in (("sessions", "SSL VPN sessions"), ("vpn_tunnels", "VPN tunnels")):
+        result = fetched[key]
+        if result.error is None:
+            diagnosis.fact(label, len(_rows(result.value)))
+
+    _report_fetch_errors(diagnosis, fetched, ["interfaces_ipv4", "zones"])
+    diagnosis.elapsed = time.perf_counter() - started
+    return diagnosis
@@ -0,0 +1,218 @@
+"""
+SonicWall Export Archive
+Streams export/* bodies to disk and indexes their sections for memory-mapped reads
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+# (section, title, offset, length)
+IndexEntry = Tuple[str, str, int, int]
+
+# A top-level CLI line: its command word(s), e.g. "address-object ipv4", then the
+# rest of the line. Indented lines belong to the block above; comments are skipped.
+_CLI_TOP_LEVEL = re.compile(rb'^(?P<section>[^\s#!]\S*(?:[ \t]+[^\s"]\S*)?)(?P<rest>[^\n]{0,100})', re.M)
+
+# JSON strings (with escapes) and structural characters; scalars are skipped by the regex engine
+_JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\],:]')
+
+# Bytes sniffed to pick an indexer
+_SNIFF_BYTES = 4096
+
+_WHITESPACE = b" \t\r\n"
+
+
+def _strip_span(data, start: int, end: int) -> Tuple[int, int]:
+    while start < end and data[start] in _WHITESPACE:
+        start += 1
+    while end > start and data[end - 1] in _WHITESPACE:
+        end -= 1
+    return start, end
+
+
+def _index_cli(data) -> List[IndexEntry]:
+    """One entry per top-level CLI command block; the section is its command words."""
+    matches = list(_CLI_TOP_LEVEL.finditer(data))
+    entries: List[IndexEntry] = []
+    for i, match in enumerate(matches):
+        section = match.group("section").decode("utf-8", "replace")
+        if section in ("exit", "end"):
+            continue
+        start = match.start()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(data)
+        title = (section + match.group("rest").decode("utf-8", "replace")).strip()
+        entries.append((section, title, start, end - start))
+    return entries
+
+
+def _index_json(data) -> List[IndexEntry]:
+    """One entry per element of each top-level array, or per top-level value otherwise."""
+    entries: List[IndexEntry] = []
+    depth = 0
+    top_is_object = True
+    key: Optional[str] = None
+    mark = 0
+    in_array = False
+    array_done = False
+    item_depth = 2
+    item_no = 0
+
+    def emit(start: int, end: int, title: str):
+        start, end = _strip_span(data, start, end)
+        if end > start:
+            entries.append((key, title, start, end - start))
+
+    for token in _JSON_TOKEN.finditer(data):
+        char = data[token.start()]
+
+        if char == 0x22:  # string
+            if depth == 1 and top_is_object and key is None:
+                key = json.loads(token.group())
+        elif char in (0x7B, 0x5B):  # '{' '['
+            if depth == 0 and char == 0x5B:
+                top_is_object, key, in_array, item_depth, item_no, mark = False, "items", True, 1, 0, token.end()
+            elif depth == 1 and top_is_object and char == 0x5B and key is not None:
+                in_array, item_depth, item_no, mark = True, 2, 0, token.end()
+            depth += 1
+        elif char in (0x7D, 0x5D):  # '}' ']'
+            depth -= 1
+            if in_array and depth == item_depth - 1:
+                emit(mark, token.start(), f"{key}[{item_no}]")
+                in_array, array_done = False, True
+            elif depth == 0 and top_is_object and key is not None and not array_done:
+                emit(mark, token.start(), key)
+        elif char == 0x2C:  # ','
+            if in_array and depth == item_depth:
+                emit(mark, token.start(), f"{key}[{item_no}]")
+                item_no += 1
+                mark = token.end()
+            elif depth == 1 and top_is_object:
+                if key is not None and not array_done:
+                    emit(mark, token.start(), key)
+                key, array_done = None, False
+        elif char == 0x3A and depth == 1:  # ':'
+            mark = token.end()
+    return entries
+
+
+def detect_format(head: bytes) -> str:
+    """Guess "json", "cli" (line-oriented text) or "binary" from the first bytes of a body."""
+    stripped = head.lstrip()
+    if stripped[:1] in (b"{", b"["):
+        return "json"
+    if b"\x00" in head:
+        return "binary"
+    return "cli"
+
+
+class ExportArchive:
+    """An export body on disk plus a section index stored next to it (``<file>.idx``).
+
+    Sections are read back through ``mmap``, so only the pages of the
+    requested section are brought into memory, however large the export.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.format = "binary"
+        self.entries: List[IndexEntry] = []
+        self._by_section: Optional[Dict[str, List[IndexEntry]]] = None
+
+    @classmethod
+    def build(cls, path: str) -> "ExportArchive":
+        """Scan an export file and write its offset index."""
+        archive = cls(path)
+        size = os.path.getsize(path)
+        if size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                archive.format = detect_format(data[:_SNIFF_BYTES])
+                if archive.format == "json":
+                    archive.entries = _index_json(data)
+                elif archive.format == "cli":
+                    archive.entries = _index_cli(data)
+        if not archive.entries:
+            archive.entries = [("body", os.path.basename(path), 0, size)]
+
+        with open(archive.index_path, "w") as f:
+            json.dump({"format": archive.format, "size": size, "entries": archive.entries}, f)
+        logger.debug(f"Indexed {path}: {len(archive.entries)} entries ({archive.format})")
+        return archive
+
+    @classmethod
+    def open(cls, path: str) -> "ExportArchive":
+        archive = cls(path)
+        with open(archive.index_path) as f:
+            stored = json.load(f)
+        archive.format = stored["format"]
+        archive.entries = [tuple(entry) for entry in stored["entries"]]
+        return archive
+
+    def sections(self) -> "OrderedDict[str, int]":
+        """Section name -> number of items, in file order."""
+        counts: "OrderedDict[str, int]" = OrderedDict()
+        for section, _, _, _ in self.entries:
+            counts[section] = counts.get(section, 0) + 1
+        return counts
+
+    def items(self, section: str) -> List[IndexEntry]:
+        if self._by_section is None:
+            self._by_section = {}
+            for entry in self.entries:
+                self._by_section.setdefault(entry[0], []).append(entry)
+        return self._by_section.get(section, [])
+
+    def read(self, section: str, item: Optional[int] = None, limit: int = 64 * 1024) -> str:
+        """Read one item (or the whole section) of an export, up to ``limit`` bytes."""
+        items = self.items(section)
+        if not items:
+            raise ValueError(f"No section '{section}' in {os.path.basename(self.path)}")
+        if item is not None:
+            if not 0 <= item < len(items):
+                raise ValueError(f"Section '{section}' has {len(items)} items")
+            items = [items[item]]
+
+        parts = []
+        remaining = limit
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for _, _, offset, length in items:
+                if remaining <= 0:
+                    break
+                chunk = data[offset:offset + min(length, remaining)]
+                remaining -= len(chunk)
+                parts.append(chunk.decode("utf-8", "replace"))
+        text = "\n".join(parts)
+        if remaining <= 0:
+            text += f"\n... (truncated at {limit} bytes)"
+        return text
+
+
+def export_filename(endpoint: str) -> str:
+    stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    return f"{stamp}-{re.sub(r'[^A-Za-z0-9.-]+', '_', endpoint.strip('/'))}"
+
+
+def list_archives(directory: str) -> List[str]:
+    """Indexed export files in a directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".idx"))
+
+
+async def export_to_archive(client: SonicWallClient, endpoint: str, directory: str) -> ExportArchive:
+    """Stream ``export/<endpoint>`` to ``directory`` and index it."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, export_filename(endpoint))
+    await client.stream_to_file(f"export/{endpoint.strip('/')}", path)
+    return await asyncio.to_thread(ExportArchive.build, path)
@@ -0,0 +1,250 @@
+"""
+SonicWall Heavy Hitters
+Fixed-memory top-K tracking of polled top-N reports with Space-Saving and Count-Min sketches
+"""
+
+import logging
+import math
+import time
+from array import array
+from hashlib import blake2b
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from timeseries import to_number
+
+logger = logging.getLogger(__name__)
+
+# Row fields that identify what a row counts, in order of preference
+KEY_FIELDS = (
+    "source_ip_address", "destination_ip_address", "ip_address", "client_ip",
+    "application", "app", "user_name", "name",
+)
+
+# Row fields holding its weight; rows without one count once
+WEIGHT_FIELDS = ("source_count", "destination_count", "count", "connections", "bytes", "hits")
+
+DEFAULT_CAPACITY = 64       # Space-Saving counters per bucket
+DEFAULT_CMS_WIDTH = 256     # Count-Min columns
+DEFAULT_CMS_DEPTH = 4       # Count-Min rows (independent hashes)
+
+# (bucket seconds, buckets): 5-minute buckets for a day, hourly buckets for a week
+DEFAULT_TIERS = ((300, 288), (3600, 168))
+
+
+def row_key_weight(row: Dict[str, Any]) -> Optional[Tuple[str, float]]:
+    """(key, weight) of one report row, or None if it has no recognisable key."""
+    key = next((row[f] for f in KEY_FIELDS if row.get(f) not in (None, "")), None)
+    if key is None:
+        return None
+    for field in WEIGHT_FIELDS:
+        weight = to_number(row.get(field))
+        if weight is not None:
+            return str(key), weight
+    return str(key), 1.0
+
+
+class CountMinSketch:
+    """Count-Min sketch over a flat ``array('d')`` of depth x width cells.
+
+    Estimates never undercount; with total weight N they overcount by at
+    most e/width * N with probability 1 - e^-depth. Sketches of the same
+    shape merge by adding cells, which is how windows are combined.
+    """
+
+    __slots__ = ("width", "depth", "cells", "total")
+
+    def __init__(self, width: int = DEFAULT_CMS_WIDTH, depth: int = DEFAULT_CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.cells = array("d", bytes(8 * width * depth))
+        self.total = 0.0
+
+    def slots(self, key: str) -> List[int]:
+        """One cell per row, from independent 32-bit slices of one BLAKE2 digest of the key."""
+        digest = blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        width = self.width
+        return [row * width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % width
+                for row in range(self.depth)]
+
+    def add(self, key: str, weight: float = 1.0, slots: Optional[List[int]] = None):
+        cells = self.cells
+        for slot in slots or self.slots(key):
+            cells[slot] += weight
+        self.total += weight
+
+    def estimate(self, key: str) -> float:
+        cells = self.cells
+        return min(cells[slot] for slot in self.slots(key))
+
+    def merge(self, other: "CountMinSketch"):
+        cells = self.cells
+        for i, value in enumerate(other.cells):
+            if value:
+                cells[i] += value
+        self.total += other.total
+
+    @property
+    def error_bound(self) -> float:
+        return math.e / self.width * self.total
+
+    def clear(self):
+        self.cells = array("d", bytes(8 * self.width * self.depth))
+        self.total = 0.0
+
+
+class SpaceSaving:
+    """Space-Saving summary: at most ``capacity`` monitored keys with counts and error bounds.
+
+    Any key whose true weight exceeds total/capacity is guaranteed to be
+    monitored; a newcomer replaces the smallest counter and inherits its
+    count as error.
+    """
+
+    __slots__ = ("capacity", "counts", "errors")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+
+    def add(self, key: str, weight: float = 1.0):
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+        elif len(counts) < self.capacity:
+            counts[key] = weight
+            self.errors[key] = 0.0
+        else:
+            smallest = min(counts, key=counts.__getitem__)
+            floor = counts.pop(smallest)
+            self.errors.pop(smallest, None)
+            counts[key] = floor + weight
+            self.errors[key] = floor
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+
+
+class _Bucket:
+    __slots__ = ("start", "summary", "sketch")
+
+    def __init__(self, capacity: int, width: int, depth: int):
+        self.start: Optional[int] = None
+        self.summary = SpaceSaving(capacity)
+        self.sketch = CountMinSketch(width, depth)
+
+
+class WindowedTopK:
+    """Top-K over sliding windows from rings of time buckets, with constant memory.
+
+    Each tier is a ring of buckets (e.g. 288 x 5 minutes); a sample goes
+    into the current bucket of every tier. A query picks the finest tier
+    that covers the window, takes the union of the buckets' monitored keys
+    as candidates and ranks them by the merged Count-Min estimate. An
+    all-time summary covers anything longer.
+    """
+
+    def __init__(self, tiers: Iterable[Tuple[int, int]] = DEFAULT_TIERS, capacity: int = DEFAULT_CAPACITY,
+                 width: int = DEFAULT_CMS_WIDTH, depth: int = DEFAULT_CMS_DEPTH):
+        self.tiers = [(int(seconds), [_Bucket(capacity, width, depth) for _ in range(count)])
+                      for seconds, count in tiers]
+        self.all_time = _Bucket(capacity, width, depth)
+        self.first_seen: Optional[float] = None
+        self.last_seen: Optional[float] = None
+        self.samples = 0
+
+    def add(self, key: str, weight: float, timestamp: float):
+        # Every sketch has the same shape, so the key is hashed once
+        slots = self.all_time.sketch.slots(key)
+        for seconds, ring in self.tiers:
+            start = int(timestamp // seconds) * seconds
+            bucket = ring[(start // seconds) % len(ring)]
+            if bucket.start != start:
+                # The slot last held a bucket one full ring ago; reuse it
+                bucket.start = start
+                bucket.summary.clear()
+                bucket.sketch.clear()
+            bucket.summary.add(key, weight)
+            bucket.sketch.add(key, weight, slots)
+        self.all_time.summary.add(key, weight)
+        self.all_time.sketch.add(key, weight, slots)
+
+    def ingest(self, rows: Iterable[Dict[str, Any]], timestamp: Optional[float] = None) -> int:
+        """Add one polled report; returns how many rows were counted."""
+        timestamp = timestamp or time.time()
+        counted = 0
+        for row in rows:
+            if isinstance(row, dict):
+                pair = row_key_weight(row)
+                if pair is not None and pair[1] > 0:
+                    self.add(pair[0], pair[1], timestamp)
+                    counted += 1
+        if self.first_seen is None:
+            self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.samples += 1
+        return counted
+
+    def _buckets(self, window: float, now: float) -> Tuple[List[_Bucket], float]:
+        """Buckets covering the last ``window`` seconds and the span they actually cover."""
+        for seconds, ring in self.tiers:
+            if window <= seconds * len(ring):
+                oldest = int((now - window) // seconds) * seconds
+                buckets = [b for b in ring if b.start is not None and b.start >= oldest]
+                return buckets, now - oldest
+        return [self.all_time], now - (self.first_seen or now)
+
+    def top(self, k: int = 10, window: float = 3600, now: Optional[float] = None) -> Dict[str, Any]:
+        """The k heaviest keys in the window with estimates and an overcount bound."""
+        now = now or time.time()
+        buckets, span = self._buckets(window, now)
+        if not buckets:
+            return {"items": [], "total": 0.0, "error_bound": 0.0, "span": span}
+        merged = CountMinSketch(buckets[0].sketch.width, buckets[0].sketch.depth)
+        candidates = set()
+        for bucket in buckets:
+            merged.merge(bucket.sketch)
+            candidates.update(bucket.summary.counts)
+        ranked = sorted(((merged.estimate(key), key) for key in candidates), reverse=True)[:k]
+        total = merged.total
+        return {
+            "items": [{"key": key, "weight": weight, "share": weight / total if total else 0.0}
+                      for weight, key in ranked],
+            "total": total,
+            "error_bound": merged.error_bound,
+            "span": min(span, now - (self.first_seen or now)),
+        }
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate fixed footprint of the sketch cells."""
+        buckets = sum(len(ring) for _, ring in self.tiers) + 1
+        return buckets * len(self.all_time.sketch.cells) * 8
+
+
+class HeavyHitterTracker:
+    """One ``WindowedTopK`` per report stream, fed by the reporting poller."""
+
+    def __init__(self, tiers: Iterable[Tuple[int, int]] = DEFAULT_TIERS, capacity: int = DEFAULT_CAPACITY,
+                 width: int = DEFAULT_CMS_WIDTH, depth: int = DEFAULT_CMS_DEPTH):
+        self.tiers = tuple(tiers)
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.streams: Dict[str, WindowedTopK] = {}
+
+    def ingest(self, stream: str, response: Any, timestamp: Optional[float] = None) -> int:
+        if isinstance(response, dict):
+            response = next((v for v in response.values() if isinstance(v, list)), [])
+        if not isinstance(response, list):
+            return 0
+        topk = self.streams.get(stream)
+        if topk is None:
+            topk = self.streams[stream] = WindowedTopK(self.tiers, self.capacity, self.width, self.depth)
+        return topk.ingest(response, timestamp)
+
+    def listener(self, target, timestamp: float, response: Any):
+        """Reporting poller listener: sketch the targets marked for it."""
+        if getattr(target, "sketch", False):
+            self.ingest(target.name, response, timestamp)
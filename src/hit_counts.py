@@ -0,0 +1,328 @@
+"""
+SonicWall Hit Counts
+Per-policy hit counter history for finding unused and busy rules
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from sonicwall_client import SonicWallClient
+from timeseries import to_number
+
+logger = logging.getLogger(__name__)
+
+# Policy kind -> (reporting paths, hit counter field, byte counter fields)
+HIT_SOURCES = {
+    "security_policy": (("reporting/security-policies/statistics",), "usage", ("rxbytes", "txbytes")),
+    "access_rule": (("reporting/access-rules/ipv4", "reporting/access-rules/ipv6"), "usage", ("rxbytes", "txbytes")),
+    "nat_policy": (("reporting/nat-policies/ipv4", "reporting/nat-policies/ipv6", "reporting/nat-policies/nat64"),
+                   "usage_count", ("rx_bytes", "tx_bytes")),
+}
+
+DEFAULT_INTERVAL = 900.0
+DEFAULT_RETENTION_DAYS = 400
+
+DAY = 86400
+
+STORE_VERSION = 1
+
+
+def _label(kind: str, row: Dict[str, Any]) -> str:
+    """Short description of a policy from its reporting row (the rows carry no names)."""
+    if kind == "nat_policy":
+        parts = [row.get("original_source"), row.get("original_destination"), row.get("original_service")]
+        arrow = f"{row.get('inbound_interface') or 'any'}->{row.get('outbound_interface') or 'any'}"
+        return f"{arrow} {' / '.join(str(p) for p in parts if p)}".strip()
+    parts = [row.get("source"), row.get("destination"), row.get("service"), row.get("action")]
+    arrow = f"{row.get('from') or 'any'}->{row.get('to') or 'any'}"
+    return f"{arrow} {' / '.join(str(p) for p in parts if p)}".strip()
+
+
+class PolicyCounter:
+    """Counter history of one policy: daily hit and byte deltas keyed by UTC day number."""
+
+    __slots__ = ("kind", "uuid", "label", "raw_hits", "raw_bytes", "first_seen", "last_seen",
+                 "last_hit", "resets", "days")
+
+    def __init__(self, kind: str, uuid: str, label: str = ""):
+        self.kind = kind
+        self.uuid = uuid
+        self.label = label
+        self.raw_hits = 0.0
+        self.raw_bytes = 0.0
+        self.first_seen = 0.0
+        self.last_seen = 0.0
+        self.last_hit: Optional[float] = None  # device-reported time of the last hit, if any
+        self.resets = 0
+        self.days: Dict[int, List[float]] = {}
+
+    def hits_since(self, day: int) -> Tuple[float, float]:
+        """(hits, bytes) counted on or after a day number."""
+        hits = volume = 0.0
+        for d, (h, b) in self.days.items():
+            if d >= day:
+                hits += h
+                volume += b
+        return hits, volume
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind, "uuid": self.uuid, "label": self.label,
+            "raw": [self.raw_hits, self.raw_bytes], "seen": [self.first_seen, self.last_seen],
+            "last_hit": self.last_hit, "resets": self.resets,
+            "days": [[d, h, b] for d, (h, b) in sorted(self.days.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PolicyCounter":
+        counter = cls(data["kind"], data["uuid"], data.get("label", ""))
+        counter.raw_hits, counter.raw_bytes = data.get("raw", [0, 0])
+        counter.first_seen, counter.last_seen = data.get("seen", [0, 0])
+        counter.last_hit = data.get("last_hit")
+        counter.resets = data.get("resets", 0)
+        counter.days = {d: [h, b] for d, h, b in data.get("days", ())}
+        return counter
+
+
+class HitCounterStore:
+    """Per-UUID policy counters with daily deltas, kept in one JSON file.
+
+    Each snapshot turns the device's cumulative counters into increments
+    since the previous snapshot. A counter that went down was reset (reboot,
+    rule edit, cleared statistics), so its new value is what was counted
+    since the reset. The first sighting of a policy only sets its baseline:
+    hits from before tracking started are unknown, which is why ``unused``
+    reports how long each policy has been watched. Only days with traffic
+    are stored.
+    """
+
+    def __init__(self, path: Optional[str] = None, retention_days: int = DEFAULT_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self.counters: Dict[str, PolicyCounter] = {}
+        # Kind -> time of its last successful snapshot
+        self.snapshots: Dict[str, float] = {}
+        self.dirty = False
+        # Keeps flushes in order, so an older copy never overwrites a newer one
+        self._flushing = asyncio.Lock()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read hit counter store {self.path}: {str(e)}")
+            return
+        if data.get("version") != STORE_VERSION:
+            logger.warning(f"Ignoring hit counter store {self.path} with unknown version {data.get('version')}")
+            return
+        self.snapshots = data.get("snapshots", {})
+        for item in data.get("policies", ()):
+            counter = PolicyCounter.from_dict(item)
+            self.counters[f"{counter.kind}:{counter.uuid}"] = counter
+
+    def save(self):
+        """Write the store atomically (temporary file, then rename)."""
+        data = self.dump()
+        if data is not None:
+            self.write(data)
+
+    async def flush(self):
+        """Like ``save``, with the JSON encoded and written in a worker thread."""
+        async with self._flushing:
+            data = self.dump()
+            if data is None:
+                return
+            try:
+                await asyncio.to_thread(self.write, data)
+            except BaseException:
+                self.dirty = True
+                raise
+
+    def dump(self) -> Optional[Dict[str, Any]]:
+        """Copy of the store for ``write``, or None if nothing changed since the last save."""
+        if not self.path or not self.dirty:
+            return None
+        self.dirty = False
+        return {
+            "version": STORE_VERSION,
+            "snapshots": dict(self.snapshots),
+            "policies": [counter.to_dict() for counter in self.counters.values()],
+        }
+
+    def write(self, data: Dict[str, Any]):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temporary, self.path)
+
+    def ingest(self, kind: str, rows: Iterable[Dict[str, Any]], timestamp: Optional[float] = None,
+               complete: bool = True) -> int:
+        """Apply one snapshot of a kind's reporting rows; returns how many policies were updated.
+
+        Only a ``complete`` snapshot (every source path of the kind answered)
+        moves the kind's snapshot time, which is what drops policies missing
+        from it out of ``current``.
+        """
+        timestamp = timestamp or time.time()
+        _, hits_field, byte_fields = HIT_SOURCES[kind]
+        day = int(timestamp // DAY)
+        updated = 0
+        for row in rows:
+            if not isinstance(row, dict) or not row.get("uuid"):
+                continue
+            hits = to_number(row.get(hits_field))
+            if hits is None:
+                continue
+            volume = sum(to_number(row.get(field)) or 0.0 for field in byte_fields)
+            key = f"{kind}:{row['uuid']}"
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = self.counters[key] = PolicyCounter(kind, row["uuid"])
+                counter.first_seen = timestamp
+            else:
+                delta_hits = hits - counter.raw_hits
+                delta_bytes = volume - counter.raw_bytes
+                if delta_hits < 0 or delta_bytes < 0:
+                    counter.resets += 1
+                    delta_hits, delta_bytes = hits, volume
+                if delta_hits or delta_bytes:
+                    bucket = counter.days.setdefault(day, [0.0, 0.0])
+                    bucket[0] += delta_hits
+                    bucket[1] += delta_bytes
+            counter.raw_hits, counter.raw_bytes = hits, volume
+            counter.last_seen = timestamp
+            counter.label = _label(kind, row)
+            last_hit = to_number(row.get("time_last_hit"))
+            if last_hit is not None:
+                counter.last_hit = last_hit
+            updated += 1
+        if complete:
+            self.snapshots[kind] = timestamp
+        self.prune(day)
+        self.dirty = True
+        return updated
+
+    def prune(self, today: int):
+        """Drop days past retention and policies not seen for the whole retention period."""
+        oldest = today - self.retention_days
+        for key, counter in list(self.counters.items()):
+            if counter.last_seen and counter.last_seen // DAY < oldest:
+                del self.counters[key]
+                continue
+            if counter.days and min(counter.days) < oldest:
+                counter.days = {d: v for d, v in counter.days.items() if d >= oldest}
+
+    def current(self, kinds: Optional[Iterable[str]] = None) -> List[PolicyCounter]:
+        """Policies present in the latest snapshot of their kind (deleted ones drop out)."""
+        kinds = set(kinds) if kinds else set(HIT_SOURCES)
+        return [c for c in self.counters.values()
+                if c.kind in kinds and c.last_seen >= self.snapshots.get(c.kind, 0)]
+
+    def unused(self, days: int = 30, kinds: Optional[Iterable[str]] = None,
+               now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Policies with no hits in the last ``days`` days, oldest-watched first.
+
+        ``confirmed`` means the policy was watched for the whole period, or
+        the device's own last-hit time predates it.
+        """
+        now = now or time.time()
+        cutoff = now - days * DAY
+        results = []
+        for counter in self.current(kinds):
+            hits, _ = counter.hits_since(int(cutoff // DAY))
+            if hits:
+                continue
+            if counter.last_hit and counter.last_hit >= cutoff:
+                continue
+            tracked = (now - counter.first_seen) / DAY
+            device_quiet = counter.last_hit is not None and 0 < counter.last_hit < cutoff
+            results.append({
+                "counter": counter,
+                "tracked_days": tracked,
+                "confirmed": counter.first_seen <= cutoff or device_quiet,
+            })
+        results.sort(key=lambda r: (not r["confirmed"], -r["tracked_days"]))
+        return results
+
+    def top(self, n: int = 20, days: int = 30, by: str = "hits", kinds: Optional[Iterable[str]] = None,
+            now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Busiest policies over the last ``days`` days by hits or bytes."""
+        now = now or time.time()
+        since = int((now - days * DAY) // DAY)
+        rows = []
+        for counter in self.current(kinds):
+            hits, volume = counter.hits_since(since)
+            if hits or volume:
+                rows.append({"counter": counter, "hits": hits, "bytes": volume})
+        rows.sort(key=lambda r: r["bytes" if by == "bytes" else "hits"], reverse=True)
+        return rows[:n]
+
+
+class HitCountTracker:
+    """Snapshots policy counters on an interval into a ``HitCounterStore``."""
+
+    def __init__(self, client: SonicWallClient, store: HitCounterStore, interval: float = DEFAULT_INTERVAL):
+        self.client = client
+        self.store = store
+        self.interval = interval
+        self.errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def snapshot(self) -> Dict[str, int]:
+        """Fetch every counter source concurrently and ingest them; returns policies updated per kind.
+
+        Sources the device does not serve (security policies in classic
+        mode, access rules in policy mode) are skipped.
+        """
+        requests = [(kind, path) for kind, (paths, _, _) in HIT_SOURCES.items() for path in paths]
+        responses = await asyncio.gather(*(self.client.get(path) for _, path in requests), return_exceptions=True)
+        timestamp = time.time()
+        rows: Dict[str, List[Dict[str, Any]]] = {}
+        failed = set()
+        self.errors = {}
+        for (kind, path), response in zip(requests, responses):
+            if isinstance(response, Exception):
+                self.errors[path] = str(response)[:200]
+                failed.add(kind)
+                logger.debug(f"Hit counters from {path} unavailable: {str(response)}")
+                continue
+            if isinstance(response, dict):
+                response = next((v for v in response.values() if isinstance(v, list)), [])
+            rows.setdefault(kind, []).extend(response if isinstance(response, list) else [])
+        # A kind with a failed path keeps its previous snapshot time, so the
+        # policies only that path reports are not mistaken for deleted ones
+        updated = {kind: self.store.ingest(kind, kind_rows, timestamp, complete=kind not in failed)
+                   for kind, kind_rows in rows.items()}
+        await self.store.flush()
+        return updated
+
+    async def run(self):
+        """Snapshot forever on the configured interval."""
+        while True:
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.warning(f"Hit counter snapshot failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.store.flush()
@@ -0,0 +1,152 @@
+"""
+SonicWall HTTP Transport
+Streamable HTTP and SSE endpoints so many MCP clients can share one server process
+"""
+
+import contextlib
+import hmac
+import ipaddress
+import logging
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+import uvicorn
+from mcp.server.lowlevel import Server
+from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Mount, Route
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_HOST = "127.0.0.1"
+DEFAULT_HTTP_PORT = 8080
+
+MCP_PATH = "/mcp"
+SSE_PATH = "/sse"
+MESSAGES_PATH = "/messages/"
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class BearerTokenAuth:
+    """ASGI middleware that rejects HTTP requests without ``Authorization: Bearer <token>``."""
+
+    def __init__(self, app, token: str):
+        self.app = app
+        self.expected = f"Bearer {token}".encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            supplied = dict(scope["headers"]).get(b"authorization", b"")
+            if not hmac.compare_digest(supplied, self.expected):
+                response = PlainTextResponse("Unauthorized", status_code=401,
+                                             headers={"WWW-Authenticate": "Bearer"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def _hostname(value: str) -> Optional[str]:
+    """Host name in an ``Origin`` (scheme://host[:port]) or ``Host`` (host[:port]) header."""
+    try:
+        return urlsplit(value if "//" in value else f"//{value}").hostname
+    except ValueError:
+        return None
+
+
+class OriginGuard:
+    """ASGI middleware against cross-site browser requests and DNS rebinding.
+
+    A request with an ``Origin`` header is refused unless the origin is a
+    loopback address or one of ``hosts``. On a loopback listener the
+    ``Host`` header must name one as well, so a web page whose domain has
+    been re-pointed at 127.0.0.1 cannot reach the server either.
+    """
+
+    def __init__(self, app, check_host: bool, hosts: Iterable[str] = ()):
+        self.app = app
+        self.check_host = check_host
+        self.hosts = {host.lower() for host in hosts}
+
+    def _allowed(self, value: bytes) -> bool:
+        hostname = _hostname(value.decode("latin-1"))
+        return hostname is not None and (is_loopback(hostname) or hostname in self.hosts)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            origin = headers.get(b"origin")
+            host = headers.get(b"host", b"")
+            cross_site = origin is not None and not self._allowed(origin)
+            if cross_site or (self.check_host and not self._allowed(host)):
+                logger.warning(f"Refused HTTP request from origin {origin!r} for host {host!r}")
+                response = PlainTextResponse("Forbidden origin or host", status_code=403)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class StreamableHTTPEndpoint:
+    """ASGI app for the streamable HTTP path; routed as an app so ``/mcp`` needs no trailing slash."""
+
+    def __init__(self, manager: StreamableHTTPSessionManager):
+        self.manager = manager
+
+    async def __call__(self, scope, receive, send):
+        await self.manager.handle_request(scope, receive, send)
+
+
+def build_app(server: Server, token: Optional[str] = None, host: str = DEFAULT_HTTP_HOST,
+              allowed_hosts: Iterable[str] = ()) -> Starlette:
+    """Starlette app serving ``server`` over streamable HTTP (``/mcp``) and legacy SSE (``/sse``).
+
+    Every connection is its own MCP session running the same ``Server``,
+    so all clients share the process's firewall session, caches and
+    background components. Browser origins other than loopback and
+    ``allowed_hosts`` are refused (see ``OriginGuard``).
+    """
+    manager = StreamableHTTPSessionManager(app=server)
+    sse = SseServerTransport(MESSAGES_PATH)
+
+    async def handle_sse(request: Request) -> Response:
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+        return Response()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with manager.run():
+            yield
+
+    app = Starlette(
+        routes=[
+            Route(MCP_PATH, endpoint=StreamableHTTPEndpoint(manager), methods=["GET", "POST", "DELETE"]),
+            Route(SSE_PATH, endpoint=handle_sse, methods=["GET"]),
+            Mount(MESSAGES_PATH, app=sse.handle_post_message),
+        ],
+        lifespan=lifespan,
+    )
+    if token:
+        app.add_middleware(BearerTokenAuth, token=token)
+    app.add_middleware(OriginGuard, check_host=is_loopback(host), hosts=allowed_hosts)
+    return app
+
+
+async def serve_http(server: Server, host: str = DEFAULT_HTTP_HOST, port: int = DEFAULT_HTTP_PORT,
+                     token: Optional[str] = None, allowed_hosts: Iterable[str] = ()):
+    """Serve MCP over HTTP until cancelled or interrupted."""
+    if not token and not is_loopback(host):
+        raise ValueError(f"Refusing to listen on {host} without SONICWALL_HTTP_TOKEN")
+    config = uvicorn.Config(build_app(server, token, host, allowed_hosts), host=host, port=port, log_level="warning")
+    logger.info(f"🌐 Serving MCP on http://{host}:{port}{MCP_PATH} (SSE: {SSE_PATH})")
+    await uvicorn.Server(config).serve()
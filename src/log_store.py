@@ -0,0 +1,568 @@
+"""
+SonicWall Log Store
+Syslog events in hourly append-only segments, sealed into compressed column files with indexed IPs, rule and category
+"""
+
+import calendar
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+from columnar import GROUP_ROWS, ColumnarSegment, SegmentWriter, compact, rows_with
+
+logger = logging.getLogger(__name__)
+
+INDEXED_FIELDS = ("src", "dst", "rule", "category")
+
+SEGMENT_SECONDS = 3600
+
+# Events buffered in memory before they are indexed and written
+FLUSH_EVENTS = 5_000
+
+# Bytes lowercased at a time when searching a region of a segment for text
+GREP_CHUNK = 4 * 1024 * 1024
+
+# Index format of hours sealed by earlier versions; such hours are converted to column files on open
+INDEX_VERSION = 1
+
+DEFAULT_RETENTION_DAYS = 30
+
+# Column file layout of a sealed hour; the indexed fields are dictionary columns with bloom filters
+LOG_SCHEMA = {"time": "time", "src": "dict", "dst": "dict", "rule": "dict", "category": "dict", "line": "blob"}
+
+# Indexed keys in order of preference per field. Only these are pulled out while ingesting, with
+# bytes.find on the raw line; full parsing waits until an event is returned. The leading space
+# keeps "c=" from matching inside "proc=".
+_INDEX_KEYS = (
+    (b" src=", "src"), (b" srcV6=", "src"),
+    (b" dst=", "dst"), (b" dstV6=", "dst"),
+    (b" rule=", "rule"),
+    (b" gcat=", "category"), (b" c=", "category"),
+)
+
+# key=value, key="quoted value" or key='quoted value'
+_PAIRS = re.compile(rb'([A-Za-z][\w.]*)=("[^"]*"|\'[^\']*\'|\S*)')
+
+
+def index_values(line: bytes) -> Dict[str, str]:
+    """Indexed fields of one raw event: source and destination IPs, rule and category.
+
+    IPv4 endpoints arrive as "ip:port:interface[:host]" and are indexed by
+    address. The group category (gcat) is preferred over the legacy
+    category mask (c).
+    """
+    values: Dict[str, str] = {}
+    for key, field in _INDEX_KEYS:
+        if field in values:
+            continue
+        at = line.find(key)
+        if at < 0:
+            continue
+        at += len(key)
+        if line.startswith(b'"', at):
+            at += 1
+            end = line.find(b'"', at)
+        else:
+            end = line.find(b" ", at)
+        if end < 0:
+            end = len(line)
+        if field in ("src", "dst") and key[-2:] != b"6=":
+            colon = line.find(b":", at, end)
+            if colon >= 0:
+                end = colon
+        if end > at:
+            values[field] = line[at:end].decode("latin-1")
+    return values
+
+
+def parse_event(line: bytes) -> Dict[str, str]:
+    """Every key=value pair of a raw event, quotes removed."""
+    event = {}
+    for key, value in _PAIRS.findall(line):
+        if value[:1] in (b'"', b"'"):
+            value = value[1:-1]
+        event[key.decode("latin-1")] = value.decode("utf-8", "replace")
+    return event
+
+
+def _find_folded(view, needle: bytes, begin: int, finish: int) -> Iterator[int]:
+    """Offset of the first case-insensitive match of ``needle`` on each line in view[begin:finish].
+
+    The region is lowercased one chunk at a time (far faster than a
+    case-insensitive regex), with enough overlap that a match spanning two
+    chunks is still found.
+    """
+    overlap = len(needle) - 1
+    position = begin
+    while position < finish:
+        stop = min(position + GREP_CHUNK, finish)
+        chunk = view[position:min(stop + overlap, finish)].lower()
+        at = chunk.find(needle)
+        while 0 <= at and position + at < stop:
+            yield position + at
+            # One hit per line is enough
+            at = chunk.find(b"\n", at)
+            if at < 0:
+                break
+            at = chunk.find(needle, at)
+        position = stop
+
+
+class Segment:
+    """The hour being written: raw lines in ``events.log`` and their index in memory.
+
+    ``events.log`` holds the raw lines, newline-terminated and only ever
+    appended to; receive times, line offsets and per-value posting lists
+    (uint32 event numbers) are kept in arrays. When the hour is over the
+    segment is rewritten as a column file and its directory removed.
+    """
+
+    def __init__(self, directory: str, start: int):
+        self.directory = directory
+        self.start = start
+        self.times = array("d")
+        self.offsets = array("Q")
+        self.postings: Dict[str, Dict[str, array]] = {field: {} for field in INDEXED_FIELDS}
+        self.size = 0
+
+    @property
+    def end(self) -> int:
+        return self.start + SEGMENT_SECONDS
+
+    @property
+    def events_path(self) -> str:
+        return os.path.join(self.directory, "events.log")
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, lines: List[bytes], times: List[float]):
+        """Write a batch with one file write and index it."""
+        number = len(self.times)
+        offset = self.size
+        offsets = self.offsets
+        postings = self.postings
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+            for field, value in index_values(line).items():
+                ids = postings[field].get(value)
+                if ids is None:
+                    ids = postings[field][value] = array("I")
+                ids.append(number)
+            number += 1
+        self.times.extend(times)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.events_path, "ab") as f:
+            f.write(b"\n".join(lines) + b"\n")
+        self.size = offset
+
+    def write_columnar(self, path: str):
+        """Write the hour as an immutable column file (see ``LOG_SCHEMA``), one row group at a time."""
+        writer = SegmentWriter(path, LOG_SCHEMA)
+        try:
+            with open(self.events_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    offsets = self.offsets
+                    for first in range(0, len(self), GROUP_ROWS):
+                        last = min(first + GROUP_ROWS, len(self))
+                        bounds = list(offsets[first:last]) + [offsets[last] if last < len(self) else self.size]
+                        # Lines keep their newline so text search can skip to the next line, as in events.log
+                        lines = [view[a:b] for a, b in zip(bounds, bounds[1:])]
+                        columns: Dict[str, Any] = {"time": self.times[first:last], "line": lines}
+                        values = [index_values(line) for line in lines]
+                        for field in INDEXED_FIELDS:
+                            columns[field] = [v.get(field, "") for v in values]
+                        writer.append(columns)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+    @classmethod
+    def load(cls, directory: str, start: int) -> "Segment":
+        """Open an hour directory left on disk, from its older index files or by re-indexing ``events.log``."""
+        segment = cls(directory, start)
+        header_path = os.path.join(directory, "index.json")
+        if os.path.exists(header_path):
+            with open(header_path, "r", encoding="utf-8") as f:
+                header = json.load(f)
+            if header.get("version") == INDEX_VERSION:
+                count = header["count"]
+                with open(os.path.join(directory, "index.bin"), "rb") as f:
+                    segment.times.fromfile(f, count)
+                    segment.offsets.fromfile(f, count)
+                    blob = array("I", f.read())
+                for field, slices in header["postings"].items():
+                    segment.postings[field] = {value: blob[s:s + n] for value, (s, n) in slices.items()}
+                segment.size = header["size"]
+                return segment
+        # Interrupted before sealing: rebuild the index from the raw lines (receive times are lost,
+        # so events are spread evenly over the hour up to the file's modification time)
+        if os.path.exists(segment.events_path):
+            with open(segment.events_path, "rb") as f:
+                lines = f.read().split(b"\n")
+            if lines and not lines[-1]:
+                lines.pop()
+            if lines:
+                last = min(os.path.getmtime(segment.events_path), segment.end)
+                step = max(last - start, 0) / len(lines)
+                segment._index_existing(lines, [start + step * (i + 1) for i in range(len(lines))])
+        return segment
+
+    def _index_existing(self, lines: List[bytes], times: List[float]):
+        offset = 0
+        for number, line in enumerate(lines):
+            self.offsets.append(offset)
+            offset += len(line) + 1
+            for field, value in index_values(line).items():
+                self.postings[field].setdefault(value, array("I")).append(number)
+        self.times.extend(times)
+        self.size = offset
+
+
+def _matches(field: str, wanted: str):
+    """Predicate on index values for one filter: CIDR for IPs, id prefix for rules."""
+    if field in ("src", "dst") and "/" in wanted:
+        network = ipaddress.ip_network(wanted, strict=False)
+        family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+        first, last = int(network.network_address), int(network.broadcast_address)
+
+        def in_network(value: str) -> bool:
+            try:
+                return first <= int.from_bytes(socket.inet_pton(family, value), "big") <= last
+            except OSError:
+                return False
+        return in_network
+    if field == "rule":
+        lowered = wanted.lower()
+        return lambda value: value.lower() == lowered or value.lower().startswith(lowered + " ")
+    return lambda value: value == wanted
+
+
+class LogStore:
+    """Time-partitioned event segments under one directory.
+
+    Events are buffered and written in batches: the raw line goes to the
+    current hour's ``events.log`` and its indexed fields into in-memory
+    posting lists. When the hour is over it is rewritten as a compressed
+    column file (``seal_pending``, run off the event loop), and the
+    compactor later merges each day's hours into one file and deletes
+    days past retention.
+
+    Queries skip column files and row groups whose time range or bloom
+    filters rule them out, decompress only the columns a filter touches
+    and pull lines only for the rows returned; the open hour is searched
+    through its posting lists and mmap.
+
+    Layout::
+
+        <root>/<YYYYMMDDTHH>/events.log     hour being written
+        <root>/<YYYYMMDDTHH>.col            sealed hour
+        <root>/<YYYYMMDD>.col               compacted day
+    """
+
+    def __init__(self, root: str, retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.root = root
+        self.retention_days = retention_days
+        self.current: Optional[Segment] = None
+        # Finished hours waiting to be written as column files; still searchable meanwhile
+        self.sealing: List[Segment] = []
+        self.pending_lines: List[bytes] = []
+        self.pending_times: List[float] = []
+        self.events = 0
+        self._files: Dict[str, ColumnarSegment] = {}
+        # Held by searches, and by sealing and compaction while they swap files in
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(start: int) -> str:
+        return time.strftime("%Y%m%dT%H", time.gmtime(start))
+
+    def _hour_directories(self) -> List[int]:
+        """Start times of hours still kept as ``events.log``, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        starts = []
+        for name in os.listdir(self.root):
+            if not os.path.isdir(os.path.join(self.root, name)):
+                continue
+            try:
+                starts.append(calendar.timegm(time.strptime(name, "%Y%m%dT%H")))
+            except ValueError:
+                continue
+        return sorted(starts)
+
+    def open(self):
+        """Resume the current hour and seal every other hour left by an earlier run."""
+        os.makedirs(self.root, exist_ok=True)
+        hour = int(time.time() // SEGMENT_SECONDS) * SEGMENT_SECONDS
+        for start in self._hour_directories():
+            directory = os.path.join(self.root, self._name(start))
+            segment = Segment.load(directory, start)
+            legacy = os.path.exists(os.path.join(directory, "index.json"))
+            if start == hour and not legacy:
+                self.current = segment
+            else:
+                self.sealing.append(segment)
+        if self.sealing:
+            logger.info(f"Sealing {len(self.sealing)} log hour(s) left by an earlier run")
+            self.seal_pending()
+
+    def add(self, line: bytes, timestamp: float):
+        """Queue one raw event; cheap enough to call from the receive path."""
+        self.pending_lines.append(line)
+        self.pending_times.append(timestamp)
+        if len(self.pending_lines) >= FLUSH_EVENTS:
+            self.flush()
+
+    def flush(self):
+        """Index and write the queued events, rolling over to a new segment at each hour."""
+        lines, times = self.pending_lines, self.pending_times
+        if not lines:
+            return
+        self.pending_lines, self.pending_times = [], []
+        begin = 0
+        while begin < len(lines):
+            start = int(times[begin] // SEGMENT_SECONDS) * SEGMENT_SECONDS
+            if self.current is None or self.current.start != start:
+                self._roll(start)
+            end = bisect_left(times, start + SEGMENT_SECONDS, begin)
+            self.current.append(lines[begin:end], times[begin:end])
+            self.events += end - begin
+            begin = end
+
+    def _roll(self, start: int):
+        if self.current is not None and len(self.current):
+            self.sealing.append(self.current)
+        directory = os.path.join(self.root, self._name(start))
+        self.current = Segment.load(directory, start) if os.path.exists(directory) else Segment(directory, start)
+
+    def seal_pending(self):
+        """Rewrite finished hours as column files. Safe to run in a worker thread."""
+        while self.sealing:
+            segment = self.sealing[0]
+            path = os.path.join(self.root, f"{self._name(segment.start)}.col")
+            suffix = 1
+            while os.path.exists(path):
+                # The hour was resumed after a restart and sealed before
+                path = os.path.join(self.root, f"{self._name(segment.start)}.{suffix}.col")
+                suffix += 1
+            if len(segment):
+                segment.write_columnar(f"{path}.new")
+            with self._lock:
+                if len(segment):
+                    os.replace(f"{path}.new", path)
+                self.sealing.pop(0)
+                shutil.rmtree(segment.directory, ignore_errors=True)
+
+    def close(self):
+        self.flush()
+        if self.current is not None and len(self.current):
+            self.sealing.append(self.current)
+        self.current = None
+        self.seal_pending()
+        with self._lock:
+            for reader in self._files.values():
+                reader.close()
+            self._files.clear()
+
+    def compact(self) -> Dict[str, int]:
+        """Merge finished days and drop data past retention (see ``columnar.compact``)."""
+        return compact(self.root, self.retention_days, on_swap=self._swap)
+
+    def _swap(self, change):
+        with self._lock:
+            change()
+            for path in [p for p in self._files if not os.path.exists(p)]:
+                self._files.pop(path).close()
+
+    def _file(self, path: str) -> Optional[ColumnarSegment]:
+        reader = self._files.get(path)
+        if reader is None:
+            try:
+                reader = ColumnarSegment(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not open log segment {path}: {str(e)}")
+                return None
+            self._files[path] = reader
+        return reader
+
+    def footprint(self) -> Dict[str, int]:
+        """Files and bytes on disk, and events in column files."""
+        files = size = rows = 0
+        with self._lock:
+            for name in os.listdir(self.root) if os.path.isdir(self.root) else ():
+                path = os.path.join(self.root, name)
+                if name.endswith(".col"):
+                    reader = self._file(path)
+                    files += 1
+                    size += os.path.getsize(path)
+                    rows += reader.rows if reader else 0
+                elif os.path.isdir(path):
+                    size += sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        return {"files": files, "bytes": size, "rows": rows}
+
+    def search(self, start: float, end: float, filters: Optional[Dict[str, str]] = None,
+               text: Optional[str] = None, limit: int = 100) -> Tuple[List[Tuple[float, bytes]], int]:
+        """Events received in [start, end] matching every filter, newest first.
+
+        ``filters`` maps indexed fields to a value: an exact IP or a CIDR for
+        src/dst, a rule name or its leading id for rule, a category id.
+        ``text`` is a case-insensitive substring match on the raw line.
+        Returns up to ``limit`` (receive time, line) pairs and the total
+        number of matches; only the returned lines are copied out.
+
+        Safe to run in a worker thread while events keep arriving; events
+        still queued are not searched, so ``flush`` first on the thread
+        that adds them.
+        """
+        filters = {f: v for f, v in (filters or {}).items() if v}
+        needle = text.lower().encode() if text else None
+        results: List[Tuple[float, bytes]] = []
+        total = 0
+        with self._lock:
+            open_hours = ([self.current] if self.current is not None else []) + self.sealing[::-1]
+            for segment in open_hours:
+                if not len(segment) or segment.start + SEGMENT_SECONDS <= start or segment.start > end:
+                    continue
+                numbers = self._candidates(segment, start, end, filters)
+                if needle is not None and len(numbers):
+                    numbers = self._grep(segment, numbers, needle)
+                total += len(numbers)
+                if len(results) < limit:
+                    results.extend(self._read(segment, numbers[:limit - len(results)]))
+
+            readers = []
+            for name in os.listdir(self.root) if os.path.isdir(self.root) else ():
+                if name.endswith(".col"):
+                    reader = self._file(os.path.join(self.root, name))
+                    if reader is not None and reader.max_time >= start and reader.min_time <= end:
+                        readers.append(reader)
+            readers.sort(key=lambda r: r.max_time, reverse=True)
+            for reader in readers:
+                for group in range(len(reader.groups) - 1, -1, -1):
+                    found, rows = self._search_group(reader, group, start, end, filters, needle,
+                                                     limit - len(results))
+                    total += found
+                    results.extend(rows)
+        return results, total
+
+    @staticmethod
+    def _search_group(reader: ColumnarSegment, group: int, start: float, end: float, filters: Dict[str, str],
+                      needle: Optional[bytes], wanted: int) -> Tuple[int, List[Tuple[float, bytes]]]:
+        """Matches in one row group of a column file: (count, up to ``wanted`` newest rows)."""
+        if not reader.overlaps(group, start, end):
+            return 0, []
+        for field, value in filters.items():
+            # Bloom filters only answer exact values
+            if field in ("src", "dst", "category") and "/" not in value and \
+                    not reader.may_contain(group, field, value):
+                return 0, []
+        times = reader.column(group, "time")
+        lo = bisect_left(times, start)
+        hi = bisect_right(times, end)
+        if lo >= hi:
+            return 0, []
+        rows: Optional[List[int]] = None
+        for field, value in filters.items():
+            codes, dictionary = reader.column(group, field)
+            if field in ("src", "dst", "category") and "/" not in value:
+                wanted_codes = {code for code, entry in enumerate(dictionary) if entry == value}
+            else:
+                match = _matches(field, value)
+                wanted_codes = {code for code, entry in enumerate(dictionary) if entry and match(entry)}
+            found = [r for r in rows_with(codes, wanted_codes) if lo <= r < hi]
+            if rows is not None:
+                keep = set(found)
+                found = [r for r in rows if r in keep]
+            rows = found
+            if not rows:
+                return 0, []
+        numbers: Sequence[int] = range(lo, hi) if rows is None else rows
+        if needle is None and wanted <= 0:
+            return len(numbers), []
+
+        offsets, data = reader.column(group, "line")
+        if needle is not None:
+            if rows is None or len(rows) * 4 >= hi - lo:
+                keep = None if rows is None else set(rows)
+                hits: List[int] = []
+                for at in _find_folded(data, needle, offsets[lo], offsets[hi] - 1):
+                    number = bisect_right(offsets, at) - 1
+                    if (not hits or hits[-1] != number) and (keep is None or number in keep):
+                        hits.append(number)
+                numbers = hits
+            else:
+                numbers = [r for r in rows if needle in data[offsets[r]:offsets[r + 1] - 1].lower()]
+        newest = numbers[::-1][:max(wanted, 0)]
+        return len(numbers), [(times[r], data[offsets[r]:offsets[r + 1] - 1]) for r in newest]
+
+    @staticmethod
+    def _candidates(segment: Segment, start: float, end: float, filters: Dict[str, str]) -> Sequence[int]:
+        """Event numbers in the time range that pass every filter, newest first."""
+        lo = bisect_left(segment.times, start)
+        hi = bisect_right(segment.times, end)
+        if lo >= hi:
+            return []
+        candidates: Optional[List[int]] = None
+        for field, wanted in filters.items():
+            values = segment.postings.get(field, {})
+            if field in ("src", "dst", "category") and "/" not in wanted:
+                lists = [values[wanted]] if wanted in values else []
+            else:
+                match = _matches(field, wanted)
+                lists = [ids for value, ids in values.items() if match(value)]
+            # Posting lists are ascending, so the time range is a slice of each
+            slices = [ids[bisect_left(ids, lo):bisect_left(ids, hi)] for ids in lists]
+            ids = list(slices[0]) if len(slices) == 1 else sorted(set().union(*slices))
+            if candidates is None:
+                candidates = ids
+            else:
+                keep = set(ids)
+                candidates = [i for i in candidates if i in keep]
+            if not candidates:
+                return []
+        if candidates is None:
+            return range(hi - 1, lo - 1, -1)
+        return candidates[::-1]
+
+    @staticmethod
+    def _line_end(segment: Segment, number: int) -> int:
+        return segment.offsets[number + 1] - 1 if number + 1 < len(segment) else segment.size - 1
+
+    def _grep(self, segment: Segment, numbers: Sequence[int], needle: bytes) -> List[int]:
+        """The event numbers whose line contains ``needle`` (lowercase, matched case-insensitively), newest first."""
+        offsets = segment.offsets
+        with open(segment.events_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                newest, oldest = numbers[0], numbers[-1]
+                if not isinstance(numbers, range) and len(numbers) * 4 < newest - oldest + 1:
+                    return [n for n in numbers if needle in view[offsets[n]:self._line_end(segment, n)].lower()]
+                # Dense candidates: search the whole region a chunk at a time, then keep the candidates
+                keep = None if isinstance(numbers, range) else set(numbers)
+                hits: List[int] = []
+                for at in _find_folded(view, needle, offsets[oldest], self._line_end(segment, newest)):
+                    number = bisect_right(offsets, at) - 1
+                    if (not hits or hits[-1] != number) and (keep is None or number in keep):
+                        hits.append(number)
+                return hits[::-1]
+
+    def _read(self, segment: Segment, numbers: Sequence[int]) -> Iterator[Tuple[float, bytes]]:
+        if not len(numbers):
+            return
+        offsets = segment.offsets
+        with open(segment.events_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for number in numbers:
+                    yield segment.times[number], view[offsets[number]:self._line_end(segment, number)]
@@ -5,27 +5,183 @@ Based on the official MCP Python SDK patterns
 """
 
 import asyncio
+import contextvars
 import logging
 import os
+import time
 from typing import Any, Dict, List
 
 import mcp.server.stdio
 import mcp.types as types
-from mcp.server.lowlevel import NotificationOptions, Server
-from mcp.server.models import InitializationOptions
+from mcp.server.lowlevel import Server
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 
 from sonicwall_client import SonicWallClient
+from config_loader import CONFIG_ENDPOINTS
+from config_model import ConfigModel
+from config_mirror import ConfigMirror
+from snapshot_store import SnapshotStore
+from change_set import ChangeSet
+from spec_validator import SpecValidators
+from query import Query, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, VIEWS
+from renderer import FORMATS, budget_bytes, render_data
+from config_query import COLLECTIONS, compile_query
+from dependency_graph import DependencyGraph, GRAPH_CATEGORIES, OBJECT_KINDS
+from nat_engine import NAT_CATEGORIES
+from route_engine import ROUTE_CATEGORIES
+from analysis_pool import AnalysisPool
+from reporting_poller import ReportingPoller, parse_targets
+from hit_counts import HitCounterStore, HitCountTracker, HIT_SOURCES
+from heavy_hitters import HeavyHitterTracker
+from log_store import DEFAULT_RETENTION_DAYS as DEFAULT_LOG_RETENTION_DAYS, LogStore
+from metric_archive import (
+    DEFAULT_FLUSH_INTERVAL as DEFAULT_METRIC_FLUSH_INTERVAL,
+    DEFAULT_RETENTION_DAYS as DEFAULT_METRIC_RETENTION_DAYS,
+    MetricArchive,
+)
+from syslog_receiver import SyslogReceiver, parse_listeners
+from resource_watcher import DEFAULT_CONFIG_INTERVAL, DEFAULT_STATUS_INTERVAL, ResourceWatcher, default_resources
+from scheduler import DEFAULT_CLIENT_CONCURRENCY, DEFAULT_CONCURRENCY, FairScheduler, parse_weights
+from http_transport import DEFAULT_HTTP_HOST, DEFAULT_HTTP_PORT, serve_http
+from analysis_jobs import object_impact_job, nat_lookup_job, route_lookup_job
+from tools import list_firewall_rules, list_nat_policies, list_address_objects, get_interface_info
+from tools import snapshot_config, list_snapshots, diff_config, export_config, read_export
+from tools import stage_changes, preview_changes, commit_changes, discard_changes, import_objects
+from tools import query_config, network_overview, troubleshoot_sslvpn, get_metrics, get_traffic_rates, rule_hits
+from tools import top_talkers, search_logs, capture_flows, queue_stats
+from bulk_import import resolve_import_path
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create server instance
-server = Server("SonicMCP")
+
+
+# Sessions seen during the current Server.run, i.e. on one connection; their
+# per-session state is released when the connection ends
+connection_sessions: contextvars.ContextVar = contextvars.ContextVar("connection_sessions")
+
+
+class SonicMCPServer(Server):
+    """MCP server that advertises resource subscriptions and releases per-session state on disconnect."""
+
+    async def run(self, *args, **kwargs):
+        sessions = set()
+        token = connection_sessions.set(sessions)
+        try:
+            await super().run(*args, **kwargs)
+        finally:
+            connection_sessions.reset(token)
+            for session in sessions:
+                release_session(session)
+
+    def get_capabilities(self, notification_options, experimental_capabilities):
+        capabilities = super().get_capabilities(notification_options, experimental_capabilities)
+        if capabilities.resources is not None:
+            # The SDK always advertises subscribe=false
+            capabilities.resources.subscribe = True
+        return capabilities
+
+
+# Create server instance; the HTTP transport builds every session's initialization options from it
+server = SonicMCPServer("SonicMCP", version="1.0.0")
 
 # Global SonicWall client instance
 sonicwall_client: SonicWallClient = None
 
+# Shared typed config model; categories are fetched on first use
+config_model = ConfigModel()
+
+# Object dependency graph of config_model, updated with every record change
+# (fetches, mirror syncs and writes) and shipped to the analysis workers with it
+dependency_graph = DependencyGraph.attach(config_model)
+
+# Optional local mirror that keeps config_model in sync with the device
+config_mirror: ConfigMirror = None
+
+# Config snapshot store, opened on first use of the snapshot tools
+snapshot_store: SnapshotStore = None
+
+# Config writes staged by the change-set tools until they are committed, one set per client session
+change_sets: Dict[Any, ChangeSet] = {}
+
+# Request body validators from the API spec; the spec is parsed in the background at startup
+spec_validators = SpecValidators()
+
+# Background poller of reporting endpoints (SONICWALL_POLL); its ring buffers answer get_metrics
+reporting_poller: ReportingPoller = None
+
+# Heavy-hitter sketches over the poller's connection-limit targets; answers top_talkers
+heavy_hitters: HeavyHitterTracker = None
+
+# Column-file archive of the poller's samples (SONICWALL_METRICS_ARCHIVE); answers get_metrics beyond the rings
+metric_archive: MetricArchive = None
+
+# Local syslog listener and its indexed event store (SONICWALL_SYSLOG); answers search_logs
+syslog_receiver: SyslogReceiver = None
+
+# Background change detection behind resource subscriptions; checks only subscribed resources
+resource_watcher: ResourceWatcher = None
+
+# Fair admission of tool calls from many clients onto the shared firewall session (HTTP transport only)
+scheduler: FairScheduler = None
+
+# Policy hit counter history, opened on first use (snapshotted in the background with SONICWALL_HIT_TRACKING)
+hit_tracker: HitCountTracker = None
+
+# Config categories that name the policies behind each hit counter kind
+HIT_CATEGORIES = {
+    "security_policy": ("security_policies_ipv4", "security_policies_ipv6"),
+    "access_rule": ("access_rules_ipv4", "access_rules_ipv6"),
+    "nat_policy": ("nat_policies_ipv4", "nat_policies_ipv6", "nat_policies_nat64"),
+}
+
+# Scheduler priority class of each tool; tools not listed are interactive. Bulk
+# covers crawls, exports and writes, polling the tools agents call on a timer
+TOOL_PRIORITIES = {
+    "get_metrics": "polling",
+    "get_traffic_rates": "polling",
+    "top_talkers": "polling",
+    "rule_hits": "polling",
+    "explore_api_endpoints": "bulk",
+    "object_impact": "bulk",
+    "snapshot_config": "bulk",
+    "diff_config": "bulk",
+    "export_config": "bulk",
+    "capture_flows": "bulk",
+    "commit_changes": "bulk",
+    "import_objects": "bulk",
+}
+
+# Categories fetched for the listing tools while the mirror is off, kept
+# briefly so that paging through a listing does not refetch it every page
+listing_model = ConfigModel()
+listing_fetched: Dict[str, float] = {}
+
+# Worker processes for CPU-heavy analysis; each worker compiles the NAT/route
+# engines from a shared config snapshot, which also carries the dependency graph
+analysis_pool = AnalysisPool()
+
+
+def current_session():
+    """The calling client's MCP session, recorded so its state is released when it disconnects."""
+    session = server.request_context.session
+    sessions = connection_sessions.get(None)
+    if sessions is not None:
+        sessions.add(session)
+    return session
+
+
+def release_session(session):
+    """Forget everything held for a session whose connection has closed."""
+    if resource_watcher is not None:
+        resource_watcher.drop_session(session)
+    staged = change_sets.pop(session, None)
+    if staged is not None and len(staged):
+        logger.info(f"🗑️  Dropped {len(staged)} staged changes of a closed session")
+    if staged is not None and staged.applied:
+        logger.warning(f"⚠️  A closed session left {len(staged.applied)} previewed changes pending on the firewall")
+
 
 async def initialize_sonicwall_client() -> bool:
     """Initialize the SonicWall client with credentials from environment or 1Password."""
@@ -72,6 +228,7 @@ async def initialize_sonicwall_client() -> bool:
                 return False
         
         sonicwall_client = SonicWallClient(host, port, username, password, totp)
+        sonicwall_client.validators = spec_validators
         success = await sonicwall_client.connect()
         
         if success:
@@ -88,6 +245,47 @@ async def initialize_sonicwall_client() -> bool:
         return False
 
 
+def query_properties(view: str) -> Dict[str, Any]:
+    """Input schema properties shared by the listing tools."""
+    fields = ", ".join(VIEWS[view].fields)
+    return {
+        "fields": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": f"Fields to return (available: {fields})"
+        },
+        "where": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Filters as 'field op value'; ops: = != ~ (contains) !~ > < >= <= (e.g. 'name~web', 'enabled=true')"
+        },
+        "sort": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Fields to sort by; prefix with '-' for descending"
+        },
+        "limit": {
+            "type": "integer",
+            "description": f"Page size (max {MAX_PAGE_SIZE})",
+            "default": DEFAULT_PAGE_SIZE
+        },
+        "cursor": {
+            "type": "string",
+            "description": "Page token from a previous call with the same filters and sort"
+        },
+        "format": {
+            "type": "string",
+            "enum": list(FORMATS),
+            "description": "Output format; table, csv and jsonl are the most compact",
+            "default": "list"
+        },
+        "max_tokens": {
+            "type": "integer",
+            "description": "Approximate response size limit; longer pages end with a cursor to continue"
+        },
+    }
+
+
 @server.list_tools()
 async def handle_list_tools() -> List[types.Tool]:
     """List available SonicWall management tools."""
@@ -101,6 +299,293 @@ async def handle_list_tools() -> List[types.Tool]:
                 "required": [],
             },
         ),
+        types.Tool(
+            name="network_overview",
+            description="One-call summary of the firewall: device, interfaces with link state, zones, policy and object counts, VPN sessions (all endpoints fetched concurrently)",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="troubleshoot_sslvpn",
+            description="Diagnose why clients cannot reach the SSL VPN portal: checks zone access, listening interfaces, the rules and NAT in front of the server port, and live sessions in one concurrent read",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "port": {
+                        "type": "integer",
+                        "description": "Port to check (defaults to the configured SSL VPN server port)"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="get_metrics",
+            description="Rates, levels, peaks and trends of polled reporting metrics (interface traffic, policy counters, connections) over a recent window, answered from memory",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "metric": {
+                        "type": "string",
+                        "description": "Metric name or glob, e.g. 'interfaces/X1/*', '*/rx_bytes', 'system/current_connections'",
+                        "default": "*"
+                    },
+                    "window": {
+                        "type": "integer",
+                        "description": "Seconds of history to summarise; beyond the poller's retention, samples come from the metric archive",
+                        "default": 3600
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of metrics to show",
+                        "default": 100
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="get_traffic_rates",
+            description="Per-interface bits/s, packets/s and error rates from polled interface counters, with EWMA baselines and z-score spike/drop flags",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "interface": {
+                        "type": "string",
+                        "description": "Interface name or glob, e.g. 'X1' or 'X0:V*'",
+                        "default": "*"
+                    },
+                    "window": {
+                        "type": "integer",
+                        "description": "Seconds of history to analyse",
+                        "default": 900
+                    },
+                    "threshold": {
+                        "type": "number",
+                        "description": "Flag samples this many standard deviations from the baseline",
+                        "default": 3
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="top_talkers",
+            description="Approximate top sources and destinations by connection count over a sliding window (up to a week), from fixed-memory sketches of polled connection-limit reports",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "stream": {
+                        "type": "string",
+                        "description": "Poll target name or glob, e.g. 'top_sources_*' or 'top_destinations_LAN_WAN'",
+                        "default": "*"
+                    },
+                    "window": {
+                        "type": "integer",
+                        "description": "Seconds of history to rank over",
+                        "default": 3600
+                    },
+                    "k": {
+                        "type": "integer",
+                        "description": "Number of keys to show per stream",
+                        "default": 10
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="rule_hits",
+            description="Find unused rules (no hits in N days) or the busiest rules, from per-policy hit counters tracked over time across reboots",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "mode": {
+                        "type": "string",
+                        "enum": ["unused", "top"],
+                        "description": "'unused' for policies without hits, 'top' for the busiest",
+                        "default": "unused"
+                    },
+                    "days": {
+                        "type": "integer",
+                        "description": "Window in days",
+                        "default": 30
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of policies to show",
+                        "default": 50
+                    },
+                    "by": {
+                        "type": "string",
+                        "enum": ["hits", "bytes"],
+                        "description": "Ranking for 'top'",
+                        "default": "hits"
+                    },
+                    "kind": {
+                        "type": "string",
+                        "enum": list(HIT_SOURCES),
+                        "description": "Only this kind of policy"
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Take a counter snapshot first",
+                        "default": False
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="search_logs",
+            description="Search firewall syslog events received by the server's syslog listener, by time range, source/destination IP or CIDR, rule, category and text",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "src": {
+                        "type": "string",
+                        "description": "Source IP or CIDR, e.g. '10.0.0.5' or '10.0.0.0/24'"
+                    },
+                    "dst": {
+                        "type": "string",
+                        "description": "Destination IP or CIDR"
+                    },
+                    "rule": {
+                        "type": "string",
+                        "description": "Rule as logged, or its leading id, e.g. '5' for '5 (LAN->WAN)'"
+                    },
+                    "category": {
+                        "type": "string",
+                        "description": "Log category id (gcat, or c when gcat is absent)"
+                    },
+                    "text": {
+                        "type": "string",
+                        "description": "Case-insensitive text the raw event must contain, e.g. 'denied'"
+                    },
+                    "minutes": {
+                        "type": "number",
+                        "description": "Length of the time range in minutes",
+                        "default": 60
+                    },
+                    "end": {
+                        "type": "string",
+                        "description": "End of the time range as ISO 8601 local time (default: now)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of events to return, newest first",
+                        "default": 50
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="capture_flows",
+            description="Download a packet-monitor capture and summarise it as a flow table (5-tuple, packets, bytes each way, TCP flags, retransmits), parsed while it streams to disk",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "source": {
+                        "type": "string",
+                        "enum": ["libpcap", "pcapng"],
+                        "description": "Capture format to export from the packet monitor",
+                        "default": "libpcap"
+                    },
+                    "name": {
+                        "type": "string",
+                        "description": "Summarise a capture saved earlier instead (file name or prefix, or 'latest')"
+                    },
+                    "sort": {
+                        "type": "string",
+                        "enum": ["bytes", "packets", "retransmits", "duration"],
+                        "default": "bytes"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of flows to show",
+                        "default": 25
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="get_queue_stats",
+            description="Queue and run times of tool calls per priority class (interactive, polling, bulk) and per client when several clients share this server over HTTP",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "default": "table"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    }
+                },
+                "required": [],
+            },
+        ),
         types.Tool(
             name="list_firewall_rules",
             description="List firewall access rules with optional filtering",
@@ -119,11 +604,72 @@ async def handle_list_tools() -> List[types.Tool]:
                         "type": "boolean",
                         "description": "Show only enabled rules",
                         "default": True
-                    }
+                    },
+                    **query_properties("firewall_rules")
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="list_nat_policies",
+            description="List NAT policies with optional filtering",
+            inputSchema={
+                "type": "object",
+                "properties": query_properties("nat_policies"),
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="list_address_objects",
+            description="List address objects with optional filtering",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name_filter": {
+                        "type": "string",
+                        "description": "Only objects whose name contains this text"
+                    },
+                    **query_properties("address_objects")
                 },
                 "required": [],
             },
         ),
+        types.Tool(
+            name="query_config",
+            description="Query the configuration with a JMESPath-style expression, e.g. "
+                        "\"firewall_rules[?from == 'LAN' && contains_ip(destination, '10.0.0.5')].name\"",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "expression": {
+                        "type": "string",
+                        "description": f"Expression starting from a collection ({', '.join(COLLECTIONS)}); "
+                                       "supports .field, [*], [?cond], [n], [a:b], {k: expr}, | and functions "
+                                       "length, contains, starts_with, ends_with, lower, sort_by, contains_ip"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": f"Page size for list results (max {MAX_PAGE_SIZE})",
+                        "default": DEFAULT_PAGE_SIZE
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "Page token from a previous call with the same expression"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": list(FORMATS),
+                        "description": "Output format for list results",
+                        "default": "list"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "Approximate response size limit"
+                    },
+                },
+                "required": ["expression"],
+            },
+        ),
         types.Tool(
             name="list_interfaces",
             description="List network interfaces and their configuration",
@@ -133,7 +679,8 @@ async def handle_list_tools() -> List[types.Tool]:
                     "interface_type": {
                         "type": "string",
                         "description": "Filter by interface type (e.g., 'physical', 'vlan', 'tunnel')"
-                    }
+                    },
+                    **query_properties("interfaces")
                 },
                 "required": [],
             },
@@ -153,141 +700,838 @@ async def handle_list_tools() -> List[types.Tool]:
                 "required": [],
             },
         ),
-    ]
-
-
-@server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
-    """Handle tool calls."""
-    global sonicwall_client
-    
-    if not sonicwall_client:
-        return [types.TextContent(
-            type="text",
-            text="❌ SonicWall client not initialized. Please check credentials."
-        )]
-    
-    # Check circuit breaker status - allow get_system_status to bypass for reset
-    if (sonicwall_client.connection_failed and 
-        sonicwall_client.failed_attempts >= sonicwall_client.max_retries and 
-        name != "get_system_status"):
-        return [types.TextContent(
-            type="text",
-            text=f"❌ SonicWall connection circuit breaker is open due to {sonicwall_client.failed_attempts} failed attempts. Use 'get_system_status' to test connectivity and reset."
-        )]
-    
-    try:
-        if name == "get_system_status":
-            return await handle_get_system_status(arguments)
-        elif name == "list_firewall_rules":
-            return await handle_list_firewall_rules(arguments)
-        elif name == "list_interfaces":
-            return await handle_list_interfaces(arguments)
-        elif name == "explore_api_endpoints":
-            return await handle_explore_api_endpoints(arguments)
-        else:
-            return [types.TextContent(
-                type="text",
-                text=f"❌ Unknown tool: {name}"
-            )]
-            
-    except Exception as e:
-        logger.error(f"Error executing tool {name}: {e}")
-        return [types.TextContent(
-            type="text",
-            text=f"❌ Error executing {name}: {str(e)}"
-        )]
-
-
-async def handle_get_system_status(arguments: Dict[str, Any]) -> List[types.TextContent]:
-    """Get SonicWall system status."""
-    try:
-        # If circuit breaker is open, try to reset it first
-        if sonicwall_client.connection_failed and sonicwall_client.failed_attempts >= sonicwall_client.max_retries:
-            logger.info("Attempting to reset circuit breaker and reconnect...")
-            sonicwall_client.reset_circuit_breaker()
+        types.Tool(
+            name="object_impact",
+            description="Show every rule, NAT policy, route policy and group that references an address or service object, directly or through groups",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string",
+                        "description": "Object or group name to analyze"
+                    },
+                    "kind": {
+                        "type": "string",
+                        "description": "Restrict the lookup to one object kind",
+                        "enum": list(OBJECT_KINDS)
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Re-fetch the configuration and rebuild the dependency graph",
+                        "default": False
+                    }
+                },
+                "required": ["name"],
+            },
+        ),
+        types.Tool(
+            name="nat_lookup",
+            description="Find the NAT policy a flow matches and the translated source, destination and port",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "src": {
+                        "type": "string",
+                        "description": "Original source IP address"
+                    },
+                    "dst": {
+                        "type": "string",
+                        "description": "Original destination IP address"
+                    },
+                    "protocol": {
+                        "type": "string",
+                        "description": "Protocol name or number (e.g., 'tcp', 'udp', '6')"
+                    },
+                    "port": {
+                        "type": "integer",
+                        "description": "Original destination port"
+                    },
+                    "inbound": {
+                        "type": "string",
+                        "description": "Inbound interface (e.g., 'X1')"
+                    },
+                    "outbound": {
+                        "type": "string",
+                        "description": "Outbound interface (e.g., 'X0')"
+                    },
+                    "flows": {
+                        "type": "array",
+                        "description": "Batch of flows, each with src, dst and optional protocol, port, inbound, outbound",
+                        "items": {"type": "object"}
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Re-fetch NAT policies and objects before the lookup",
+                        "default": False
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="route_lookup",
+            description="Find where a packet would be routed: matching route policy, egress interface and gateway",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "dst": {
+                        "type": "string",
+                        "description": "Destination IP address"
+                    },
+                    "src": {
+                        "type": "string",
+                        "description": "Source IP address (for source-based policy routes)"
+                    },
+                    "protocol": {
+                        "type": "string",
+                        "description": "Protocol name or number (for service-based policy routes)"
+                    },
+                    "port": {
+                        "type": "integer",
+                        "description": "Destination port (for service-based policy routes)"
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Re-fetch route policies and interfaces before the lookup",
+                        "default": False
+                    }
+                },
+                "required": ["dst"],
+            },
+        ),
+        types.Tool(
+            name="snapshot_config",
+            description="Fetch the current configuration and store it as a deduplicated snapshot",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "label": {
+                        "type": "string",
+                        "description": "Optional label (e.g., 'before VPN change')"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="list_snapshots",
+            description="List stored configuration snapshots",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="diff_config",
+            description="Show objects and policies added, removed or changed between two config snapshots",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "from_snapshot": {
+                        "type": "string",
+                        "description": "Older snapshot ID or prefix, or 'previous'",
+                        "default": "previous"
+                    },
+                    "to_snapshot": {
+                        "type": "string",
+                        "description": "Newer snapshot ID or prefix, or 'latest'",
+                        "default": "latest"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="export_config",
+            description="Stream an export (e.g. the CLI config) to disk and index its sections",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "endpoint": {
+                        "type": "string",
+                        "description": "Export path under /export (e.g., 'current-config/cli', 'security-policies', 'log/csv')",
+                        "default": "current-config/cli"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="read_export",
+            description="List saved exports, show an export's sections, or read one section without loading the whole file",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string",
+                        "description": "Export file name or prefix, or 'latest' (omit to list exports)"
+                    },
+                    "section": {
+                        "type": "string",
+                        "description": "Section to read (omit to list sections)"
+                    },
+                    "item": {
+                        "type": "integer",
+                        "description": "Read only this item of the section (0-based)"
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="stage_changes",
+            description="Stage config adds, updates or deletes locally; nothing is sent until preview or commit",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "operation": {
+                        "type": "string",
+                        "enum": ["add", "update", "delete"],
+                        "description": "Operation to stage"
+                    },
+                    "category": {
+                        "type": "string",
+                        "enum": sorted(CONFIG_ENDPOINTS),
+                        "description": "Config category the entries belong to"
+                    },
+                    "entries": {
+                        "type": "array",
+                        "items": {"type": "object"},
+                        "description": "Entries to add or update, without the family wrapper (e.g. {\"name\": \"web1\", \"zone\": \"DMZ\", \"host\": {\"ip\": \"10.0.0.5\"}})"
+                    },
+                    "keys": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Names or UUIDs of entries to delete"
+                    },
+                    "by": {
+                        "type": "string",
+                        "enum": ["name", "uuid"],
+                        "description": "Whether delete keys are names or UUIDs (policies are deleted by UUID)",
+                        "default": "name"
+                    }
+                },
+                "required": ["operation", "category"],
+            },
+        ),
+        types.Tool(
+            name="preview_changes",
+            description="Send staged changes to the firewall as pending (uncommitted) config and show the pending diff",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "apply": {
+                        "type": "boolean",
+                        "description": "Send staged changes first; false only lists what is staged locally",
+                        "default": True
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="commit_changes",
+            description="Send any remaining staged changes and commit all pending config in one commit",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "best_effort": {
+                        "type": "boolean",
+                        "description": "Commit what the firewall accepts and report the rest instead of rejecting everything",
+                        "default": False
+                    },
+                    "force": {
+                        "type": "boolean",
+                        "description": "Commit even if other sessions have previewed changes, which are committed too",
+                        "default": False
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="discard_changes",
+            description="Drop staged changes and discard the firewall's pending config",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "force": {
+                        "type": "boolean",
+                        "description": "Discard even if other sessions have previewed changes, which are discarded too",
+                        "default": False
+                    }
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="import_objects",
+            description="Bulk-import address or service objects from a CSV or JSON file on the server, committed once",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "path": {
+                        "type": "string",
+                        "description": "CSV (name,type,value,zone / name,protocol,port), JSON array or JSON Lines file, relative to the server's import directory"
+                    },
+                    "kind": {
+                        "type": "string",
+                        "enum": ["address", "service"],
+                        "description": "Type of objects in the file",
+                        "default": "address"
+                    },
+                    "on_duplicate": {
+                        "type": "string",
+                        "enum": ["skip", "update"],
+                        "description": "What to do with names that already exist on the firewall",
+                        "default": "skip"
+                    },
+                    "dry_run": {
+                        "type": "boolean",
+                        "description": "Validate and dedupe only; nothing is sent",
+                        "default": False
+                    },
+                    "force": {
+                        "type": "boolean",
+                        "description": "Import even if other sessions have previewed changes, which the import's commit commits too",
+                        "default": False
+                    }
+                },
+                "required": ["path"],
+            },
+        ),
+    ]
+
+
+@server.list_resources()
+async def handle_list_resources() -> List[types.Resource]:
+    """List the config categories and status endpoints clients can read and subscribe to."""
+    if resource_watcher is None:
+        return []
+    return [
+        types.Resource(uri=r.uri, name=r.name, description=r.description, mimeType="application/json")
+        for r in resource_watcher.resources.values()
+    ]
+
+
+@server.read_resource()
+async def handle_read_resource(uri) -> List[ReadResourceContents]:
+    """Read a resource, from the watcher's last check when it is fresh."""
+    if resource_watcher is None:
+        raise ValueError("SonicWall client not initialized. Please check credentials.")
+    return [ReadResourceContents(content=await resource_watcher.read(str(uri)), mime_type="application/json")]
+
+
+@server.subscribe_resource()
+async def handle_subscribe_resource(uri) -> None:
+    """Send resources/updated to this client whenever the resource changes."""
+    if resource_watcher is None:
+        raise ValueError("SonicWall client not initialized. Please check credentials.")
+    resource_watcher.subscribe(str(uri), current_session())
+
+
+@server.unsubscribe_resource()
+async def handle_unsubscribe_resource(uri) -> None:
+    if resource_watcher is not None:
+        resource_watcher.unsubscribe(str(uri), current_session())
+
+
+@server.call_tool()
+async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Handle tool calls."""
+    global sonicwall_client
+    
+    if not sonicwall_client:
+        return [types.TextContent(
+            type="text",
+            text="❌ SonicWall client not initialized. Please check credentials."
+        )]
+    
+    # Check circuit breaker status - allow get_system_status to bypass for reset
+    if (sonicwall_client.connection_failed and 
+        sonicwall_client.failed_attempts >= sonicwall_client.max_retries and 
+        name != "get_system_status"):
+        return [types.TextContent(
+            type="text",
+            text=f"❌ SonicWall connection circuit breaker is open due to {sonicwall_client.failed_attempts} failed attempts. Use 'get_system_status' to test connectivity and reset."
+        )]
+    
+    if scheduler is not None:
+        # Each connected session is one client of the shared firewall session
+        session = current_session()
+        params = getattr(session, "client_params", None)
+        label = params.clientInfo.name if params is not None else ""
+        async with scheduler.slot(session, label, name, TOOL_PRIORITIES.get(name, "interactive")):
+            return await dispatch_tool(name, arguments)
+    return await dispatch_tool(name, arguments)
+
+
+async def dispatch_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Run one tool call."""
+    try:
+        if name == "get_system_status":
+            return await handle_get_system_status(arguments)
+        elif name == "network_overview":
+            return await handle_network_overview(arguments)
+        elif name == "troubleshoot_sslvpn":
+            return await handle_troubleshoot_sslvpn(arguments)
+        elif name == "get_metrics":
+            return await handle_get_metrics(arguments)
+        elif name == "get_traffic_rates":
+            return await handle_get_traffic_rates(arguments)
+        elif name == "top_talkers":
+            return await handle_top_talkers(arguments)
+        elif name == "rule_hits":
+            return await handle_rule_hits(arguments)
+        elif name == "search_logs":
+            return await handle_search_logs(arguments)
+        elif name == "capture_flows":
+            return await handle_capture_flows(arguments)
+        elif name == "get_queue_stats":
+            return await handle_get_queue_stats(arguments)
+        elif name == "list_firewall_rules":
+            return await handle_list_firewall_rules(arguments)
+        elif name == "list_interfaces":
+            return await handle_list_interfaces(arguments)
+        elif name == "list_nat_policies":
+            return await handle_list_nat_policies(arguments)
+        elif name == "list_address_objects":
+            return await handle_list_address_objects(arguments)
+        elif name == "query_config":
+            return await handle_query_config(arguments)
+        elif name == "explore_api_endpoints":
+            return await handle_explore_api_endpoints(arguments)
+        elif name == "object_impact":
+            return await handle_object_impact(arguments)
+        elif name == "nat_lookup":
+            return await handle_nat_lookup(arguments)
+        elif name == "route_lookup":
+            return await handle_route_lookup(arguments)
+        elif name == "snapshot_config":
+            return await handle_snapshot_config(arguments)
+        elif name == "list_snapshots":
+            return await handle_list_snapshots(arguments)
+        elif name == "diff_config":
+            return await handle_diff_config(arguments)
+        elif name == "export_config":
+            return await handle_export_config(arguments)
+        elif name == "read_export":
+            return await handle_read_export(arguments)
+        elif name == "stage_changes":
+            return await handle_stage_changes(arguments)
+        elif name == "preview_changes":
+            return await handle_preview_changes(arguments)
+        elif name == "commit_changes":
+            return await handle_commit_changes(arguments)
+        elif name == "discard_changes":
+            return await handle_discard_changes(arguments)
+        elif name == "import_objects":
+            return await handle_import_objects(arguments)
+        else:
+            return [types.TextContent(
+                type="text",
+                text=f"❌ Unknown tool: {name}"
+            )]
+            
+    except Exception as e:
+        logger.error(f"Error executing tool {name}: {e}")
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Error executing {name}: {str(e)}"
+        )]
+
+
+async def handle_get_system_status(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Get SonicWall system status."""
+    try:
+        # If circuit breaker is open, try to reset it first
+        if sonicwall_client.connection_failed and sonicwall_client.failed_attempts >= sonicwall_client.max_retries:
+            logger.info("Attempting to reset circuit breaker and reconnect...")
+            sonicwall_client.reset_circuit_breaker()
         
         # Try the most likely status endpoint first
         try:
             response = await sonicwall_client.get("status")
             return [types.TextContent(
                 type="text",
-                text=f"✅ System Status:\n\n{response}"
+                text=f"✅ System Status:\n\n{render_data(response)}"
             )]
         except Exception as e:
             logger.debug(f"Status endpoint failed: {e}")
         
-        # Fallback to device endpoint which should contain system info
-        try:
-            response = await sonicwall_client.get("device")
+        # Fallback to device endpoint which should contain system info
+        try:
+            response = await sonicwall_client.get("device")
+            return [types.TextContent(
+                type="text",
+                text=f"✅ Device Information:\n\n{render_data(response)}"
+            )]
+        except Exception as e:
+            logger.debug(f"Device endpoint failed: {e}")
+        
+        # Last resort: return the base API structure
+        response = await sonicwall_client.get("")
+        if response and isinstance(response, dict):
+            text = "✅ SonicWall API Connected\n\nAvailable endpoints:\n"
+            for key, value in response.items():
+                if key.endswith("_url"):
+                    category = key.replace("_url", "").replace("_", " ").title()
+                    text += f"• {category}: {value}\n"
+            text += "\n💡 Use specific endpoint tools to get detailed information"
+            return [types.TextContent(type="text", text=text)]
+        else:
+            return [types.TextContent(
+                type="text",
+                text=f"✅ Connected to SonicWall\n\nResponse: {render_data(response)}"
+            )]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to get system status: {str(e)}"
+        )]
+
+
+async def get_listing_model(category: str) -> ConfigModel:
+    """Model holding a category for the listing tools: the mirror if it is current,
+    otherwise a short-lived cache of the last fetch."""
+    if config_mirror is not None and config_mirror.fresh(category):
+        return config_model
+    ttl = float(os.getenv("SONICWALL_LIST_CACHE_TTL", "60"))
+    if category not in listing_model.categories or time.time() - listing_fetched.get(category, 0) > ttl:
+        path, _ = CONFIG_ENDPOINTS[category]
+        listing_model.ingest_response(category, await sonicwall_client.get(path))
+        listing_fetched[category] = time.time()
+    return listing_model
+
+
+async def handle_network_overview(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Summarise the firewall in one call."""
+    try:
+        text = await network_overview(sonicwall_client)
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to build network overview: {str(e)}"
+        )]
+
+
+async def handle_troubleshoot_sslvpn(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Diagnose SSL VPN portal reachability."""
+    try:
+        port = arguments.get("port")
+        text = await troubleshoot_sslvpn(sonicwall_client, int(port) if port else None)
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to troubleshoot SSL VPN: {str(e)}"
+        )]
+
+
+async def handle_get_metrics(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Summarise polled reporting metrics."""
+    try:
+        if reporting_poller is None:
+            return [types.TextContent(
+                type="text",
+                text="❌ The reporting poller is not running. Set SONICWALL_POLL (e.g. '1' or 'interfaces,system=10') and restart."
+            )]
+        text = await get_metrics(
+            reporting_poller,
+            arguments.get("metric") or "*",
+            window=float(arguments.get("window", 3600)),
+            limit=max(1, int(arguments.get("limit", 100))),
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+            archive=metric_archive,
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to get metrics: {str(e)}"
+        )]
+
+
+async def handle_get_traffic_rates(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Interface traffic rates and anomalies from polled counters."""
+    try:
+        if reporting_poller is None:
+            return [types.TextContent(
+                type="text",
+                text="❌ The reporting poller is not running. Set SONICWALL_POLL (e.g. '1' or 'interfaces=30') and restart."
+            )]
+        text = await get_traffic_rates(
+            reporting_poller,
+            arguments.get("interface") or "*",
+            window=float(arguments.get("window", 900)),
+            threshold=float(arguments.get("threshold", 3)),
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to get traffic rates: {str(e)}"
+        )]
+
+
+async def handle_top_talkers(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Heavy hitters from sketched connection-limit reports."""
+    try:
+        if heavy_hitters is None:
+            return [types.TextContent(
+                type="text",
+                text="❌ The reporting poller is not running. Set SONICWALL_POLL (e.g. 'top:LAN:WAN') and restart."
+            )]
+        text = await top_talkers(
+            heavy_hitters,
+            arguments.get("stream") or "*",
+            window=float(arguments.get("window", 3600)),
+            k=max(1, int(arguments.get("k", 10))),
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to get top talkers: {str(e)}"
+        )]
+
+
+def get_hit_tracker() -> HitCountTracker:
+    """Open the hit counter store for the connected device."""
+    global hit_tracker
+    
+    if hit_tracker is None:
+        if sonicwall_client is None:
+            raise ValueError("SonicWall client not initialized. Please check credentials.")
+        path = os.getenv(
+            "SONICWALL_HITS_FILE",
+            os.path.join(os.path.expanduser("~"), ".local", "share", "sonicmcp", sonicwall_client.host, "hit_counts.json")
+        )
+        store = HitCounterStore(path, retention_days=int(os.getenv("SONICWALL_HITS_RETENTION_DAYS", "400")))
+        store.load()
+        hit_tracker = HitCountTracker(
+            sonicwall_client, store, interval=float(os.getenv("SONICWALL_HITS_INTERVAL", "900"))
+        )
+    return hit_tracker
+
+
+async def handle_rule_hits(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Report unused or busiest policies from tracked hit counters."""
+    try:
+        tracker = get_hit_tracker()
+        kind = arguments.get("kind")
+        # Name the policies from config, for the kinds this device reports counters for
+        kinds = [kind] if kind else list(tracker.store.snapshots) or list(HIT_SOURCES)
+        model = await get_query_model([c for k in kinds for c in HIT_CATEGORIES[k]])
+        text = await rule_hits(
+            tracker,
+            mode=arguments.get("mode", "unused"),
+            days=max(1, int(arguments.get("days", 30))),
+            limit=max(1, int(arguments.get("limit", 50))),
+            by=arguments.get("by", "hits"),
+            kind=kind,
+            model=model,
+            refresh=arguments.get("refresh", False),
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to report rule hits: {str(e)}"
+        )]
+
+
+async def handle_search_logs(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Search received syslog events."""
+    try:
+        if syslog_receiver is None:
             return [types.TextContent(
                 type="text",
-                text=f"✅ Device Information:\n\n{response}"
+                text="❌ The syslog receiver is not running. Set SONICWALL_SYSLOG (e.g. '514' or 'udp:5514,tcp:5514'), "
+                     "point the firewall's syslog server at this host and restart."
             )]
-        except Exception as e:
-            logger.debug(f"Device endpoint failed: {e}")
+        text = await search_logs(
+            syslog_receiver,
+            src=arguments.get("src"),
+            dst=arguments.get("dst"),
+            rule=arguments.get("rule"),
+            category=arguments.get("category"),
+            text=arguments.get("text"),
+            minutes=float(arguments.get("minutes", 60)),
+            end=arguments.get("end"),
+            limit=max(1, int(arguments.get("limit", 50))),
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
         
-        # Last resort: return the base API structure
-        response = await sonicwall_client.get("")
-        if response and isinstance(response, dict):
-            text = "✅ SonicWall API Connected\n\nAvailable endpoints:\n"
-            for key, value in response.items():
-                if key.endswith("_url"):
-                    category = key.replace("_url", "").replace("_", " ").title()
-                    text += f"• {category}: {value}\n"
-            text += "\n💡 Use specific endpoint tools to get detailed information"
-            return [types.TextContent(type="text", text=text)]
-        else:
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to search logs: {str(e)}"
+        )]
+
+
+async def handle_capture_flows(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Summarise a packet-monitor capture by flow."""
+    try:
+        text = await capture_flows(
+            sonicwall_client,
+            get_export_dir(),
+            source=arguments.get("source", "libpcap"),
+            name=arguments.get("name"),
+            sort=arguments.get("sort", "bytes"),
+            limit=max(1, int(arguments.get("limit", 25))),
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to summarise capture: {str(e)}"
+        )]
+
+
+async def handle_get_queue_stats(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Scheduler queue-time statistics."""
+    try:
+        if scheduler is None:
             return [types.TextContent(
                 type="text",
-                text=f"✅ Connected to SonicWall\n\nResponse: {response}"
+                text="❌ No scheduler is running. Tool calls are only queued with SONICWALL_TRANSPORT=http."
             )]
+        text = await queue_stats(
+            scheduler,
+            fmt=arguments.get("format", "table"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
         
     except Exception as e:
         return [types.TextContent(
             type="text",
-            text=f"❌ Failed to get system status: {str(e)}"
+            text=f"❌ Failed to get queue stats: {str(e)}"
         )]
 
 
 async def handle_list_firewall_rules(arguments: Dict[str, Any]) -> List[types.TextContent]:
     """List firewall access rules."""
     try:
-        # Extract filter arguments
-        zone_from = arguments.get("zone_from")
-        zone_to = arguments.get("zone_to") 
-        enabled_only = arguments.get("enabled_only", True)
-        
-        filter_info = []
-        if zone_from:
-            filter_info.append(f"From Zone: {zone_from}")
-        if zone_to:
-            filter_info.append(f"To Zone: {zone_to}")
-        if enabled_only:
-            filter_info.append("Enabled rules only")
+        text = await list_firewall_rules(
+            sonicwall_client,
+            arguments.get("zone_from"),
+            arguments.get("zone_to"),
+            model=await get_listing_model("access_rules_ipv4"),
+            enabled_only=arguments.get("enabled_only", True),
+            query=Query.from_arguments(arguments),
+            fmt=arguments.get("format", "list"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
         
-        filter_text = f" (Filters: {', '.join(filter_info)})" if filter_info else ""
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to list firewall rules: {str(e)}"
+        )]
+
+
+async def handle_list_nat_policies(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """List NAT policies."""
+    try:
+        text = await list_nat_policies(
+            sonicwall_client,
+            model=await get_listing_model("nat_policies_ipv4"),
+            query=Query.from_arguments(arguments),
+            fmt=arguments.get("format", "list"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
         
-        # Try the accessible policies endpoint instead of config
-        try:
-            # Try main policies endpoint (should be accessible)
-            response = await sonicwall_client.get_policies()
-            return [types.TextContent(
-                type="text",
-                text=f"✅ Security Policies{filter_text}:\n\n{response}"
-            )]
-        except Exception as e:
-            logger.debug(f"policies endpoint failed: {e}")
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to list NAT policies: {str(e)}"
+        )]
+
+
+async def handle_list_address_objects(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """List address objects."""
+    try:
+        text = await list_address_objects(
+            sonicwall_client,
+            arguments.get("name_filter"),
+            model=await get_listing_model("address_objects_ipv4"),
+            query=Query.from_arguments(arguments),
+            fmt=arguments.get("format", "list"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
         
+    except Exception as e:
         return [types.TextContent(
             type="text",
-            text="❌ Could not access firewall policies. Try using 'explore_api_endpoints' to discover available policy endpoints."
+            text=f"❌ Failed to list address objects: {str(e)}"
         )]
+
+
+async def get_query_model(categories) -> ConfigModel:
+    """Model for query_config: the mirror if it is current for every category,
+    otherwise the listing cache, refreshing stale categories (failures are left to the query)."""
+    if config_mirror is not None and all(config_mirror.fresh(c) for c in categories):
+        return config_model
+    ttl = float(os.getenv("SONICWALL_LIST_CACHE_TTL", "60"))
+    stale = [c for c in categories
+             if c not in listing_model.categories or time.time() - listing_fetched.get(c, 0) > ttl]
+    responses = await asyncio.gather(
+        *(sonicwall_client.get(CONFIG_ENDPOINTS[c][0]) for c in stale), return_exceptions=True
+    )
+    for category, response in zip(stale, responses):
+        if isinstance(response, Exception):
+            logger.warning(f"Could not refresh {category} for query: {str(response)}")
+            continue
+        listing_model.ingest_response(category, response)
+        listing_fetched[category] = time.time()
+    return listing_model
+
+
+async def handle_query_config(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Run a config query expression."""
+    try:
+        expression = arguments["expression"]
+        text = await query_config(
+            sonicwall_client,
+            expression,
+            model=await get_query_model(compile_query(expression).categories),
+            limit=max(1, min(int(arguments.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)),
+            cursor=arguments.get("cursor"),
+            fmt=arguments.get("format", "list"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
+        return [types.TextContent(type="text", text=text)]
         
     except Exception as e:
         return [types.TextContent(
             type="text",
-            text=f"❌ Failed to list firewall rules: {str(e)}"
+            text=f"❌ Failed to query config: {str(e)}"
         )]
 
 
@@ -295,39 +1539,37 @@ async def handle_list_interfaces(arguments: Dict[str, Any]) -> List[types.TextCo
     """List network interfaces."""
     try:
         interface_type = arguments.get("interface_type")
+        query = Query.from_arguments(arguments)
         
-        # Get interface information directly
-        result = await sonicwall_client.get("interfaces/ipv4")
-        
-        if not result:
-            return [types.TextContent(
-                type="text",
-                text="No interface information found."
-            )]
-        
-        # Format the interface information
-        output = "Network Interfaces:\n"
-        output += "=" * 30 + "\n"
-        
-        interfaces = result.get("interfaces", [])
-        if not isinstance(interfaces, list):
-            interfaces = [interfaces] if interfaces else []
+        # VLAN sub-interfaces are listed as "<parent>:V<vlan>"
+        if interface_type == "vlan":
+            query.filter("name~:V")
+        elif interface_type == "physical":
+            query.filter("name!~:V")
+        elif interface_type:
+            query.filter(f"name~{interface_type}")
         
-        for iface_container in interfaces:
-            iface = iface_container.get("ipv4", {})
-            assignment = iface.get("ip_assignment", {})
-            mode = assignment.get("mode", {})
-            static_config = mode.get("static", {})
+        if config_mirror is None or not config_mirror.fresh("interfaces_ipv4"):
+            # Get interface information directly
+            result = await sonicwall_client.get("interfaces/ipv4")
+            
+            if not result:
+                return [types.TextContent(
+                    type="text",
+                    text="No interface information found."
+                )]
             
-            output += f"\nInterface: {iface.get('name', 'Unknown')}\n"
-            output += f"  Zone: {assignment.get('zone', 'Unknown')}\n"
-            output += f"  IP: {static_config.get('ip', 'Unknown')}\n"
-            output += f"  Netmask: {static_config.get('netmask', 'Unknown')}\n"
-            output += f"  Admin Status: {iface.get('admin', 'Unknown')}\n"
+            # Convert into the shared config model, which also refreshes route lookups
+            config_model.ingest_response("interfaces_ipv4", result)
         
+        text = await get_interface_info(
+            sonicwall_client, model=config_model, query=query,
+            fmt=arguments.get("format", "list"),
+            max_bytes=budget_bytes(max_tokens=arguments.get("max_tokens")),
+        )
         return [types.TextContent(
             type="text",
-            text=output
+            text=text
         )]
         
     except Exception as e:
@@ -348,7 +1590,7 @@ async def handle_explore_api_endpoints(arguments: Dict[str, Any]) -> List[types.
                 response = await sonicwall_client.get(path)
                 return [types.TextContent(
                     type="text",
-                    text=f"📍 Endpoint: /{path}\n\n{response}"
+                    text=f"📍 Endpoint: /{path}\n\n{render_data(response)}"
                 )]
             except Exception as e:
                 return [types.TextContent(
@@ -374,7 +1616,7 @@ async def handle_explore_api_endpoints(arguments: Dict[str, Any]) -> List[types.
             else:
                 return [types.TextContent(
                     type="text",
-                    text=f"✅ Connected to SonicWall API\n\nResponse: {response}"
+                    text=f"✅ Connected to SonicWall API\n\nResponse: {render_data(response)}"
                 )]
         except Exception as e:
             return [types.TextContent(
@@ -389,29 +1631,476 @@ async def handle_explore_api_endpoints(arguments: Dict[str, Any]) -> List[types.
         )]
 
 
+async def handle_object_impact(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Analyze which policies and groups depend on an object."""
+    try:
+        object_name = arguments.get("name")
+        if not object_name:
+            return [types.TextContent(
+                type="text",
+                text="❌ Missing required argument: name"
+            )]
+        
+        await config_model.load(sonicwall_client, GRAPH_CATEGORIES, arguments.get("refresh", False))
+        text = await analysis_pool.run(
+            object_impact_job, object_name, arguments.get("kind"), model=config_model
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to analyze object impact: {str(e)}"
+        )]
+
+
+async def handle_nat_lookup(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Translate one or more flows through the compiled NAT table."""
+    try:
+        flows = arguments.get("flows")
+        if not flows:
+            if not arguments.get("src") or not arguments.get("dst"):
+                return [types.TextContent(
+                    type="text",
+                    text="❌ Provide 'src' and 'dst', or a 'flows' list"
+                )]
+            flows = [{
+                key: arguments[key]
+                for key in ("src", "dst", "protocol", "port", "inbound", "outbound")
+                if arguments.get(key) is not None
+            }]
+        
+        await config_model.load(sonicwall_client, NAT_CATEGORIES, arguments.get("refresh", False))
+        text = await analysis_pool.run(nat_lookup_job, flows, model=config_model)
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to run NAT lookup: {str(e)}"
+        )]
+
+
+async def handle_route_lookup(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Look up the egress route for a destination."""
+    try:
+        dst = arguments.get("dst")
+        if not dst:
+            return [types.TextContent(
+                type="text",
+                text="❌ Missing required argument: dst"
+            )]
+        
+        await config_model.load(sonicwall_client, ROUTE_CATEGORIES, arguments.get("refresh", False))
+        text = await analysis_pool.run(
+            route_lookup_job, dst, arguments.get("src"),
+            arguments.get("protocol"), arguments.get("port"), model=config_model
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to run route lookup: {str(e)}"
+        )]
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Open the snapshot store for the connected device."""
+    global snapshot_store
+    
+    if snapshot_store is None:
+        directory = os.getenv(
+            "SONICWALL_SNAPSHOT_DIR",
+            os.path.join(os.path.expanduser("~"), ".local", "share", "sonicmcp", sonicwall_client.host)
+        )
+        snapshot_store = SnapshotStore(directory)
+    return snapshot_store
+
+
+async def handle_snapshot_config(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Store a snapshot of the current configuration."""
+    try:
+        text = await snapshot_config(sonicwall_client, get_snapshot_store(), arguments.get("label", ""))
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to snapshot config: {str(e)}"
+        )]
+
+
+async def handle_list_snapshots(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """List stored configuration snapshots."""
+    try:
+        text = await list_snapshots(get_snapshot_store())
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to list snapshots: {str(e)}"
+        )]
+
+
+async def handle_diff_config(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Diff two configuration snapshots."""
+    try:
+        text = await diff_config(
+            get_snapshot_store(),
+            arguments.get("from_snapshot", "previous"),
+            arguments.get("to_snapshot", "latest")
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to diff config: {str(e)}"
+        )]
+
+
+def get_export_dir() -> str:
+    """Directory for streamed exports of the connected device."""
+    return os.getenv(
+        "SONICWALL_EXPORT_DIR",
+        os.path.join(os.path.expanduser("~"), ".local", "share", "sonicmcp", sonicwall_client.host, "exports")
+    )
+
+
+def get_import_dir() -> str:
+    """Directory import_objects may read files from (and writes their error reports to)."""
+    return os.getenv(
+        "SONICWALL_IMPORT_DIR",
+        os.path.join(os.path.expanduser("~"), ".local", "share", "sonicmcp", sonicwall_client.host, "imports")
+    )
+
+
+async def handle_export_config(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Stream an export to disk."""
+    try:
+        text = await export_config(
+            sonicwall_client, arguments.get("endpoint", "current-config/cli"), get_export_dir()
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to export config: {str(e)}"
+        )]
+
+
+async def handle_read_export(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Read a saved export through its section index."""
+    try:
+        text = await read_export(
+            get_export_dir(), arguments.get("name"), arguments.get("section"), arguments.get("item")
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to read export: {str(e)}"
+        )]
+
+
+def get_change_set() -> ChangeSet:
+    """The calling session's change set, so clients never stage into or commit each other's writes."""
+    session = current_session()
+    change_set = change_sets.get(session)
+    if change_set is None:
+        change_set = change_sets[session] = ChangeSet(
+            sonicwall_client, batch_size=int(os.getenv("SONICWALL_CHANGE_BATCH_SIZE", "100"))
+        )
+    return change_set
+
+
+async def handle_stage_changes(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Stage config writes for a later single commit."""
+    try:
+        text = await stage_changes(
+            get_change_set(),
+            arguments["operation"],
+            arguments["category"],
+            arguments.get("entries"),
+            arguments.get("keys"),
+            arguments.get("by", "name")
+        )
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to stage changes: {str(e)}"
+        )]
+
+
+async def handle_preview_changes(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Apply staged changes as pending config and show them."""
+    try:
+        text = await preview_changes(get_change_set(), arguments.get("apply", True))
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to preview changes: {str(e)}"
+        )]
+
+
+def previewed_elsewhere() -> int:
+    """Changes other sessions have previewed: sent to the firewall's pending config, which
+    every session shares, and not yet committed."""
+    session = current_session()
+    return sum(len(change_set.applied) for key, change_set in change_sets.items() if key is not session)
+
+
+def refuse_shared_pending(action: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Refusal for committing or discarding the shared pending config under other sessions, unless forced."""
+    previewed = previewed_elsewhere()
+    if not previewed or arguments.get("force", False):
+        return []
+    return [types.TextContent(
+        type="text",
+        text=f"❌ {previewed} changes previewed by other sessions are pending on the firewall, and "
+             f"the firewall's pending config is shared, so they would be {action} too. "
+             f"Pass force=true to go ahead anyway."
+    )]
+
+
+def settle_shared_pending(text: str):
+    """After a commit or discard of the whole pending config, no session has previewed changes left."""
+    if not text.startswith("Error"):
+        session = current_session()
+        for key, change_set in change_sets.items():
+            if key is not session:
+                change_set.applied.clear()
+
+
+async def handle_commit_changes(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Commit staged and pending config changes."""
+    try:
+        refusal = refuse_shared_pending("committed", arguments)
+        if refusal:
+            return refusal
+        text = await commit_changes(get_change_set(), arguments.get("best_effort", False))
+        settle_shared_pending(text)
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to commit changes: {str(e)}"
+        )]
+
+
+async def handle_discard_changes(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Discard staged and pending config changes."""
+    try:
+        refusal = refuse_shared_pending("discarded", arguments)
+        if refusal:
+            return refusal
+        text = await discard_changes(get_change_set())
+        settle_shared_pending(text)
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to discard changes: {str(e)}"
+        )]
+
+
+async def handle_import_objects(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    """Bulk-import objects from a file."""
+    try:
+        dry_run = arguments.get("dry_run", False)
+        refusal = [] if dry_run else refuse_shared_pending("committed", arguments)
+        if refusal:
+            return refusal
+        kind = arguments.get("kind", "address")
+        category = "address_objects_ipv4" if kind == "address" else "service_objects"
+        # Dedupe against the mirror when it is current, otherwise against a fresh fetch
+        model = config_model if config_mirror and config_mirror.fresh(category) else None
+        text = await import_objects(
+            sonicwall_client,
+            resolve_import_path(get_import_dir(), arguments["path"]),
+            kind,
+            model,
+            on_duplicate=arguments.get("on_duplicate", "skip"),
+            dry_run=dry_run,
+            batch_size=int(os.getenv("SONICWALL_CHANGE_BATCH_SIZE", "100")),
+        )
+        if not dry_run:
+            settle_shared_pending(text)
+        return [types.TextContent(type="text", text=text)]
+        
+    except Exception as e:
+        return [types.TextContent(
+            type="text",
+            text=f"❌ Failed to import objects: {str(e)}"
+        )]
+
+
+async def start_config_mirror():
+    """Warm the config mirror from disk and start its background sync."""
+    global config_mirror
+    
+    directory = os.getenv(
+        "SONICWALL_MIRROR_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "sonicmcp", sonicwall_client.host)
+    )
+    config_mirror = ConfigMirror(
+        sonicwall_client, config_model,
+        directory=directory,
+        interval=float(os.getenv("SONICWALL_MIRROR_INTERVAL", "300")),
+    )
+    config_mirror.load_disk()
+    config_mirror.start()
+    logger.info(f"🪞 Config mirror enabled ({directory})")
+
+
+def start_reporting_poller(spec: str):
+    """Start polling the reporting endpoints named in SONICWALL_POLL."""
+    global reporting_poller, heavy_hitters, metric_archive
+    
+    targets = parse_targets(spec)
+    reporting_poller = ReportingPoller(
+        sonicwall_client, targets,
+        concurrency=int(os.getenv("SONICWALL_POLL_CONCURRENCY", "2")),
+        retention=float(os.getenv("SONICWALL_POLL_RETENTION", "3600")),
+    )
+    heavy_hitters = HeavyHitterTracker()
+    reporting_poller.listeners.append(heavy_hitters.listener)
+    reporting_poller.start()
+    logger.info(f"📈 Polling {len(targets)} reporting endpoint(s): {', '.join(t.name for t in targets)}")
+    
+    archive = os.getenv("SONICWALL_METRICS_ARCHIVE", "")
+    if archive and archive.lower() not in ("0", "false", "no"):
+        directory = archive if archive.lower() not in ("1", "true", "yes") else os.path.join(
+            os.path.expanduser("~"), ".local", "share", "sonicmcp",
+            os.getenv("SONICWALL_HOST", "192.168.100.1"), "metrics"
+        )
+        metric_archive = MetricArchive(
+            reporting_poller.store, directory,
+            # Flush well within the ring retention so no sample is overwritten before it is archived
+            interval=min(DEFAULT_METRIC_FLUSH_INTERVAL, reporting_poller.retention / 2),
+            retention_days=float(os.getenv("SONICWALL_METRICS_RETENTION_DAYS", str(DEFAULT_METRIC_RETENTION_DAYS))),
+        )
+        metric_archive.start()
+        logger.info(f"🗄️  Archiving polled metrics to {directory}")
+
+
+def start_resource_watcher():
+    """Start the shared change watcher behind resource subscriptions."""
+    global resource_watcher
+    
+    resource_watcher = ResourceWatcher(sonicwall_client, default_resources(
+        status_interval=float(os.getenv("SONICWALL_WATCH_INTERVAL", str(DEFAULT_STATUS_INTERVAL))),
+        config_interval=float(os.getenv("SONICWALL_WATCH_CONFIG_INTERVAL", str(DEFAULT_CONFIG_INTERVAL))),
+    ))
+    sonicwall_client.write_listeners.append(resource_watcher.record_write)
+    if reporting_poller is not None:
+        reporting_poller.listeners.append(resource_watcher.listener)
+    resource_watcher.start()
+
+
+async def start_syslog_receiver(spec: str):
+    """Start the syslog listeners named in SONICWALL_SYSLOG."""
+    global syslog_receiver
+    
+    directory = os.getenv(
+        "SONICWALL_LOG_DIR",
+        os.path.join(os.path.expanduser("~"), ".local", "share", "sonicmcp",
+                     os.getenv("SONICWALL_HOST", "192.168.100.1"), "logs")
+    )
+    store = LogStore(
+        directory,
+        retention_days=float(os.getenv("SONICWALL_LOG_RETENTION_DAYS", str(DEFAULT_LOG_RETENTION_DAYS))),
+    )
+    receiver = SyslogReceiver(store, parse_listeners(spec))
+    await receiver.start()
+    syslog_receiver = receiver
+    logger.info(f"📜 Receiving syslog on {', '.join(receiver.status()['listeners'])} into {directory}")
+
+
+async def run_http_server():
+    """Serve MCP over HTTP so that many clients share this process and its firewall session."""
+    global scheduler
+    
+    scheduler = FairScheduler(
+        concurrency=int(os.getenv("SONICWALL_MAX_CONCURRENCY", str(DEFAULT_CONCURRENCY))),
+        client_concurrency=int(os.getenv("SONICWALL_CLIENT_CONCURRENCY", str(DEFAULT_CLIENT_CONCURRENCY))),
+        weights=parse_weights(os.getenv("SONICWALL_CLIENT_WEIGHTS", "")),
+    )
+    await serve_http(
+        server,
+        host=os.getenv("SONICWALL_HTTP_HOST", DEFAULT_HTTP_HOST),
+        port=int(os.getenv("MCP_SERVER_PORT", str(DEFAULT_HTTP_PORT))),
+        token=os.getenv("SONICWALL_HTTP_TOKEN") or None,
+        allowed_hosts=[h.strip() for h in os.getenv("SONICWALL_HTTP_ALLOWED_HOSTS", "").split(",") if h.strip()],
+    )
+
+
 async def main():
     """Main entry point for the SonicMCP server."""
     logger.info("🚀 Starting SonicMCP server...")
     
+    # Parse the API spec off the event loop; writes made before it finishes wait for it
+    spec_loading = asyncio.create_task(asyncio.to_thread(spec_validators.load))
+    
     # Initialize SonicWall client
     success = await initialize_sonicwall_client()
     if not success:
         logger.warning("⚠️  SonicWall client initialization failed - tools may not work properly")
+    else:
+        if os.getenv("SONICWALL_MIRROR", "").lower() in ("1", "true", "yes"):
+            await start_config_mirror()
+        poll = os.getenv("SONICWALL_POLL", "")
+        if poll and poll.lower() not in ("0", "false", "no"):
+            start_reporting_poller(poll)
+        if os.getenv("SONICWALL_HIT_TRACKING", "").lower() in ("1", "true", "yes"):
+            get_hit_tracker().start()
+            logger.info("🎯 Tracking policy hit counters")
+        start_resource_watcher()
+    
+    # The syslog listener only needs the local disk, so it runs even if the device is unreachable
+    syslog = os.getenv("SONICWALL_SYSLOG", "")
+    if syslog and syslog.lower() not in ("0", "false", "no"):
+        try:
+            await start_syslog_receiver(syslog)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Failed to start syslog receiver: {str(e)}")
     
     # Run the MCP server
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        logger.info("✅ SonicMCP server ready for connections")
-        
-        initialization_options = InitializationOptions(
-            server_name="SonicMCP",
-            server_version="1.0.0",
-            capabilities=server.get_capabilities(
-                notification_options=NotificationOptions(),
-                experimental_capabilities={},
-            ),
-        )
-        
-        await server.run(read_stream, write_stream, initialization_options)
+    try:
+        if os.getenv("SONICWALL_TRANSPORT", "stdio").lower() == "http":
+            await run_http_server()
+        else:
+            async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+                logger.info("✅ SonicMCP server ready for connections")
+                await server.run(read_stream, write_stream, server.create_initialization_options())
+    finally:
+        if config_mirror is not None:
+            await config_mirror.stop()
+        if reporting_poller is not None:
+            await reporting_poller.stop()
+        if metric_archive is not None:
+            await metric_archive.stop()
+        if hit_tracker is not None:
+            await hit_tracker.stop()
+        if resource_watcher is not None:
+            await resource_watcher.stop()
+        if syslog_receiver is not None:
+            await syslog_receiver.stop()
+        try:
+            await spec_loading
+        except Exception as e:
+            logger.warning(f"⚠️  Loading the API spec failed: {str(e)}")
+        await analysis_pool.close()
 
 
 if __name__ == "__main__":
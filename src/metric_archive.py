@@ -0,0 +1,205 @@
+"""
+SonicWall Metric Archive
+Polled metric samples persisted as compressed column files beyond the in-memory ring buffers
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional, Tuple
+
+from columnar import ColumnarSegment, Compactor, SegmentWriter, compact, rows_with, segment_name
+from timeseries import DEFAULT_COUNTER_FIELDS, MetricStore, Series
+
+logger = logging.getLogger(__name__)
+
+METRIC_SCHEMA = {"time": "time", "metric": "dict", "value": "f8"}
+
+DEFAULT_FLUSH_INTERVAL = 300.0
+DEFAULT_RETENTION_DAYS = 90
+
+_GLOB_CHARS = set("*?[")
+
+
+class MetricArchive:
+    """Samples from a ``MetricStore`` appended to column files every few minutes.
+
+    Each flush writes the samples recorded since the previous one, sorted
+    by metric so the dictionary codes and time deltas compress well. The
+    compactor merges a day's flushes into one file and drops days past
+    retention. Reads skip files and row groups by time range and, for an
+    exact metric name, by bloom filter.
+    """
+
+    def __init__(self, store: MetricStore, directory: str, interval: float = DEFAULT_FLUSH_INTERVAL,
+                 retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.store = store
+        self.directory = directory
+        self.interval = interval
+        self.retention_days = retention_days
+        # Metric -> timestamp of its newest archived sample
+        self.flushed: Dict[str, float] = {}
+        self.rows = 0
+        self._files: Dict[str, ColumnarSegment] = {}
+        self._lock = threading.Lock()
+        self.compactor = Compactor(self.compact, name="metric archive")
+        self._task: Optional[asyncio.Task] = None
+
+    def collect(self) -> Optional[Dict[str, list]]:
+        """Samples not archived yet, as columns; advances the archive marks."""
+        times: List[float] = []
+        metrics: List[str] = []
+        values: List[float] = []
+        for name in sorted(self.store.series):
+            series = self.store.series[name]
+            since = self.flushed.get(name)
+            window_times, window_values = series.ring.window(since or 0.0)
+            if since is not None:
+                # window() includes samples at ``since``; those went out last time
+                skip = 0
+                while skip < len(window_times) and window_times[skip] <= since:
+                    skip += 1
+                window_times, window_values = window_times[skip:], window_values[skip:]
+            if not window_times:
+                continue
+            times.extend(window_times)
+            values.extend(window_values)
+            metrics.extend([name] * len(window_times))
+            self.flushed[name] = window_times[-1]
+        for name in [n for n in self.flushed if n not in self.store.series]:
+            # Evicted from the store; nothing more will be recorded under this mark
+            del self.flushed[name]
+        if not times:
+            return None
+        return {"time": times, "metric": metrics, "value": values}
+
+    def write(self, columns: Dict[str, list]) -> str:
+        """Write collected samples as a new column file. Safe to run in a worker thread."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, segment_name(min(columns["time"])))
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, segment_name(min(columns["time"]))[:-4] + f".{suffix}.col")
+            suffix += 1
+        writer = SegmentWriter(f"{path}.new", METRIC_SCHEMA)
+        try:
+            writer.append(columns)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        with self._lock:
+            os.replace(f"{path}.new", path)
+        self.rows += len(columns["time"])
+        return path
+
+    async def flush(self):
+        columns = self.collect()
+        if columns:
+            await asyncio.to_thread(self.write, columns)
+
+    def compact(self) -> Dict[str, int]:
+        """Merge finished days and drop data past retention (see ``columnar.compact``)."""
+        return compact(self.directory, self.retention_days, on_swap=self._swap)
+
+    def _swap(self, change):
+        with self._lock:
+            change()
+            for path in [p for p in self._files if not os.path.exists(p)]:
+                self._files.pop(path).close()
+
+    def samples(self, pattern: str, since: float, until: Optional[float] = None) -> Dict[str, Tuple[List[float], List[float]]]:
+        """Archived (times, values) per metric matching a glob, oldest first."""
+        until = until or time.time()
+        exact = not (_GLOB_CHARS & set(pattern))
+        found: Dict[str, List[Tuple[float, float]]] = {}
+        with self._lock:
+            names = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+            for name in names:
+                if not name.endswith(".col"):
+                    continue
+                path = os.path.join(self.directory, name)
+                reader = self._files.get(path)
+                if reader is None:
+                    try:
+                        reader = self._files[path] = ColumnarSegment(path)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Could not open metric segment {path}: {str(e)}")
+                        continue
+                if reader.max_time < since or reader.min_time > until:
+                    continue
+                for group in range(len(reader.groups)):
+                    if not reader.overlaps(group, since, until):
+                        continue
+                    if exact and not reader.may_contain(group, "metric", pattern):
+                        continue
+                    codes, dictionary = reader.column(group, "metric")
+                    wanted = {code for code, metric in enumerate(dictionary) if fnmatchcase(metric, pattern)}
+                    rows = rows_with(codes, wanted)
+                    if not rows:
+                        continue
+                    times = reader.column(group, "time")
+                    values = reader.column(group, "value")
+                    for row in rows:
+                        if since <= times[row] <= until:
+                            found.setdefault(dictionary[codes[row]], []).append((times[row], values[row]))
+        result = {}
+        for metric, pairs in found.items():
+            pairs.sort()
+            result[metric] = ([t for t, _ in pairs], [v for _, v in pairs])
+        return result
+
+    def merged(self, pattern: str, since: float) -> List[Series]:
+        """Series matching a glob with archived samples ahead of what the rings still hold."""
+        archived = self.samples(pattern, since)
+        live = {series.metric: series for series in self.store.match(pattern)}
+        merged = []
+        for metric in sorted(set(archived) | set(live)):
+            ring_times, ring_values = live[metric].ring.window(since) if metric in live else ([], [])
+            old_times, old_values = archived.get(metric, ([], []))
+            first_live = ring_times[0] if len(ring_times) else float("inf")
+            keep = [i for i, t in enumerate(old_times) if t < first_live]
+            counter = live[metric].counter if metric in live else \
+                bool(DEFAULT_COUNTER_FIELDS.search(metric.rsplit("/", 1)[-1]))
+            series = Series(metric, counter, max(1, len(keep) + len(ring_times)))
+            for i in keep:
+                series.ring.append(old_times[i], old_values[i])
+            for t, v in zip(ring_times, ring_values):
+                series.ring.append(t, v)
+            merged.append(series)
+        return merged
+
+    async def run(self):
+        """Archive new samples on the configured interval."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Archiving metrics failed: {str(e)}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        self.compactor.start()
+
+    async def stop(self):
+        await self.compactor.stop()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Archiving metrics failed: {str(e)}")
+        with self._lock:
+            for reader in self._files.values():
+                reader.close()
+            self._files.clear()
@@ -0,0 +1,232 @@
+"""
+SonicWall NAT Engine
+Compiles NAT policies into an ordered, indexed table for local flow translation lookups
+"""
+
+import heapq
+import ipaddress
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config_model import ConfigModel, Policy
+from object_resolver import (
+    ObjectResolver, Range, ServiceRange, in_ranges, service_matches, parse_protocol
+)
+
+logger = logging.getLogger(__name__)
+
+# Config categories the engine needs (see config_loader.CONFIG_ENDPOINTS).
+# The spec only exposes DELETE on all-nat-policies, so each family is fetched on its own.
+NAT_CATEGORIES = (
+    "nat_policies_ipv4", "nat_policies_ipv6", "nat_policies_nat64",
+    "address_objects_ipv4", "address_objects_ipv6", "address_objects_fqdn",
+    "address_groups_ipv4", "address_groups_ipv6",
+    "service_objects", "service_groups",
+)
+
+# Evaluation order across families; policies keep device order within each
+NAT_FAMILIES = ("ipv4", "ipv6", "nat64")
+
+# Destination sets up to this many single hosts are indexed address-by-address
+HOST_INDEX_LIMIT = 64
+
+
+def _is_any(interface: Optional[str]) -> bool:
+    return not interface or interface.lower() == "any"
+
+
+class CompiledNatPolicy:
+    """A NAT policy with all object references resolved to numeric ranges."""
+
+    __slots__ = (
+        "index", "uuid", "name", "family", "enabled", "inbound", "outbound",
+        "source", "destination", "service",
+        "translated_source", "translated_destination", "translated_service",
+    )
+
+    def __init__(self, index: int, policy: Policy, resolver: ObjectResolver):
+        self.index = index
+        self.family = policy.family
+        self.uuid = policy.uuid or ""
+        self.name = policy.name
+        self.enabled = policy.enabled
+        self.inbound = policy.inbound or "Any"
+        self.outbound = policy.outbound or "Any"
+        # For NAT64 the model stores the pref64 prefix as the destination
+        self.source: Optional[List[Range]] = resolver.resolve_address(policy.source)
+        self.destination: Optional[List[Range]] = resolver.resolve_address(policy.destination)
+        self.service: Optional[List[ServiceRange]] = resolver.resolve_service(policy.service)
+        self.translated_source: Optional[List[Range]] = resolver.resolve_address(policy.translated_source)
+        self.translated_destination: Optional[List[Range]] = resolver.resolve_address(policy.translated_destination)
+        self.translated_service: Optional[List[ServiceRange]] = resolver.resolve_service(policy.translated_service)
+
+    def matches(self, src: int, dst: int, protocol: Optional[int], port: Optional[int],
+                outbound: Optional[str]) -> bool:
+        """Check a flow against this policy (inbound interface is handled by the index)."""
+        if not self.enabled:
+            return False
+        if outbound and not _is_any(self.outbound) and self.outbound.lower() != outbound.lower():
+            return False
+        if self.source is not None and not in_ranges(src, self.source):
+            return False
+        if self.destination is not None and not in_ranges(dst, self.destination):
+            return False
+        return service_matches(self.service, protocol, port)
+
+
+def _translate_address(value: int, original: Optional[List[Range]], translated: Optional[List[Range]]) -> int:
+    """Map an address through a translated object.
+
+    Equal-sized single ranges are remapped by offset (block remap); anything
+    else translates to the first address of the translated object.
+    """
+    if not translated:
+        return value
+    if original and len(original) == 1 and len(translated) == 1:
+        o_lo, o_hi = original[0]
+        t_lo, t_hi = translated[0]
+        if o_hi - o_lo == t_hi - t_lo and o_lo <= value <= o_hi:
+            return t_lo + (value - o_lo)
+    return translated[0][0]
+
+
+def _format_ip(value: int, family: str) -> str:
+    if family == "ipv4" and value <= 0xFFFFFFFF:
+        return str(ipaddress.IPv4Address(value))
+    return str(ipaddress.IPv6Address(value))
+
+
+class NatEngine:
+    """Ordered NAT table with per-interface, per-destination-host indexes.
+
+    Policies keep device order (the order SonicOS evaluates them in). For a
+    lookup only the candidate lists for the flow's inbound interface and
+    destination host are merged, and the first full match wins.
+    """
+
+    def __init__(self):
+        self.policies: List[CompiledNatPolicy] = []
+        # (family, inbound-or-None) -> (host index, wildcard list)
+        self._buckets: Dict[Tuple[str, Optional[str]], Tuple[Dict[int, List[int]], List[int]]] = {}
+        self.generation = 0
+
+    @classmethod
+    def from_model(cls, model: ConfigModel) -> "NatEngine":
+        """Compile the NAT policies held in a ``ConfigModel``."""
+        engine = cls()
+        resolver = ObjectResolver(model)
+        for family in NAT_FAMILIES:
+            for policy in model.policies["nat_policy"]:
+                if policy.family == family:
+                    engine.policies.append(CompiledNatPolicy(len(engine.policies), policy, resolver))
+        engine._build_index()
+        engine.generation = model.generation
+        logger.debug(f"NAT engine compiled {len(engine.policies)} policies")
+        return engine
+
+    @classmethod
+    def from_config(cls, config: Dict[str, List[Dict[str, Any]]]) -> "NatEngine":
+        """Compile NAT policies from the output of ``config_loader.fetch_config``."""
+        return cls.from_model(ConfigModel.from_config(config))
+
+    def _bucket(self, family: str, inbound: Optional[str]):
+        key = (family, inbound)
+        if key not in self._buckets:
+            self._buckets[key] = (defaultdict(list), [])
+        return self._buckets[key]
+
+    def _build_index(self):
+        self._buckets.clear()
+        for policy in self.policies:
+            if not policy.enabled:
+                continue
+            # NAT64 matches IPv6 flows alongside plain IPv6 policies
+            family = "ipv4" if policy.family == "ipv4" else "ipv6"
+            inbound = "any" if _is_any(policy.inbound) else policy.inbound.lower()
+
+            hosts: Optional[List[int]] = None
+            dst = policy.destination
+            if dst is not None and sum(hi - lo + 1 for lo, hi in dst) <= HOST_INDEX_LIMIT:
+                hosts = [ip for lo, hi in dst for ip in range(lo, hi + 1)]
+
+            for bucket_key in (inbound, None):
+                host_index, wildcard = self._bucket(family, bucket_key)
+                if hosts is None:
+                    wildcard.append(policy.index)
+                else:
+                    for ip in hosts:
+                        host_index[ip].append(policy.index)
+
+    def _candidates(self, family: str, dst: int, inbound: Optional[str]):
+        keys = [None] if inbound is None else [inbound.lower(), "any"]
+        lists = []
+        for key in keys:
+            bucket = self._buckets.get((family, key))
+            if bucket is None:
+                continue
+            host_index, wildcard = bucket
+            if dst in host_index:
+                lists.append(host_index[dst])
+            lists.append(wildcard)
+        if len(lists) == 1:
+            return lists[0]
+        return heapq.merge(*lists)
+
+    def lookup(self, src: str, dst: str, protocol: Any = None, port: Optional[int] = None,
+               inbound: Optional[str] = None, outbound: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Find the first NAT policy matching a flow and return the translated tuple."""
+        src_addr = ipaddress.ip_address(src)
+        dst_addr = ipaddress.ip_address(dst)
+        family = "ipv4" if src_addr.version == 4 else "ipv6"
+        src_int, dst_int = int(src_addr), int(dst_addr)
+        proto = parse_protocol(protocol)
+        port = int(port) if port not in (None, "") else None
+
+        if inbound is not None and _is_any(inbound):
+            inbound = None
+
+        for index in self._candidates(family, dst_int, inbound):
+            policy = self.policies[index]
+            if not policy.matches(src_int, dst_int, proto, port, outbound):
+                continue
+
+            new_src = _translate_address(src_int, policy.source, policy.translated_source)
+            new_dst = _translate_address(dst_int, policy.destination, policy.translated_destination)
+            new_port = port
+            if policy.translated_service:
+                t_proto, t_lo, t_hi = policy.translated_service[0]
+                if t_lo == t_hi:
+                    new_port = t_lo
+
+            # NAT64 translates IPv6 flows to IPv4 addresses
+            out_family = "ipv4" if policy.family == "nat64" else family
+            return {
+                "policy": policy.name,
+                "uuid": policy.uuid,
+                "index": policy.index,
+                "family": policy.family,
+                "inbound": policy.inbound,
+                "outbound": policy.outbound,
+                "original": (str(src_addr), str(dst_addr), port),
+                "translated": (
+                    _format_ip(new_src, out_family if policy.translated_source else family),
+                    _format_ip(new_dst, out_family if policy.translated_destination else family),
+                    new_port,
+                ),
+            }
+        return None
+
+    def lookup_many(self, flows: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Translate a batch of flows given as dicts of ``lookup`` keyword arguments."""
+        results = []
+        for flow in flows:
+            try:
+                results.append(self.lookup(
+                    flow["src"], flow["dst"], flow.get("protocol"), flow.get("port"),
+                    flow.get("inbound"), flow.get("outbound")
+                ))
+            except (KeyError, ValueError) as e:
+                logger.debug(f"Skipping invalid flow {flow}: {e}")
+                results.append(None)
+        return results
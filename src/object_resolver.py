@@ -0,0 +1,158 @@
+"""
+SonicWall Object Resolver
+Expands address/service objects and groups into numeric ranges for local matching
+"""
+
+import ipaddress
+import logging
+from bisect import bisect_right
+from typing import Any, List, Optional, Tuple
+
+from config_model import ConfigModel, Selector, PROTOCOL_NUMBERS
+
+logger = logging.getLogger(__name__)
+
+# Inclusive integer interval, used for both IP addresses and ports
+Range = Tuple[int, int]
+
+# (IP protocol number, first port, last port); ports are 0-65535 for portless protocols
+ServiceRange = Tuple[int, int, int]
+
+
+def merge_ranges(ranges: List[Range]) -> List[Range]:
+    """Sort and coalesce overlapping or adjacent ranges."""
+    merged: List[Range] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def in_ranges(value: int, ranges: List[Range]) -> bool:
+    """Membership test against a merged, sorted range list."""
+    i = bisect_right(ranges, (value, float("inf"))) - 1
+    return i >= 0 and ranges[i][0] <= value <= ranges[i][1]
+
+
+class ObjectResolver:
+    """Name -> numeric range lookups over the address/service tables of a ``ConfigModel``.
+
+    Group expansion is memoized; call ``invalidate`` after changing the model.
+    """
+
+    def __init__(self, model: ConfigModel):
+        self.model = model
+        self._address_cache = {}
+        self._service_cache = {}
+
+    def invalidate(self):
+        """Forget memoized group expansions."""
+        self._address_cache.clear()
+        self._service_cache.clear()
+
+    def address_ranges(self, kind: str, name: str, _seen: Optional[set] = None) -> List[Range]:
+        """Merged IP ranges for an address object ("name") or group ("group")."""
+        key = (kind, name)
+        if key in self._address_cache:
+            return self._address_cache[key]
+
+        seen = _seen if _seen is not None else set()
+        if key in seen:
+            return []
+        seen.add(key)
+
+        ranges: List[Range] = []
+        table = self.model.address_objects
+        if kind == "name":
+            row = table.row_of(name)
+            if row is not None:
+                bounds = table.range(row)
+                ranges = [bounds] if bounds else []
+            elif name in self.model.address_groups:
+                ranges = self.address_ranges("group", name, seen)
+        else:
+            group = self.model.address_groups.get(name)
+            for member_kind, member in (group.members if group else ()):
+                sub_kind = "name" if member_kind == "address_object" else "group"
+                ranges.extend(self.address_ranges(sub_kind, member, seen))
+
+        merged = merge_ranges(ranges)
+        self._address_cache[key] = merged
+        return merged
+
+    def service_ranges(self, kind: str, name: str, _seen: Optional[set] = None) -> List[ServiceRange]:
+        """Protocol/port ranges for a service object ("name") or group ("group")."""
+        key = (kind, name)
+        if key in self._service_cache:
+            return self._service_cache[key]
+
+        seen = _seen if _seen is not None else set()
+        if key in seen:
+            return []
+        seen.add(key)
+
+        ranges: List[ServiceRange] = []
+        table = self.model.service_objects
+        if kind == "name":
+            row = table.row_of(name)
+            if row is not None:
+                bounds = table.range(row)
+                ranges = [bounds] if bounds else []
+            elif name in self.model.service_groups:
+                ranges = self.service_ranges("group", name, seen)
+        else:
+            group = self.model.service_groups.get(name)
+            for member_kind, member in (group.members if group else ()):
+                sub_kind = "name" if member_kind == "service_object" else "group"
+                ranges.extend(self.service_ranges(sub_kind, member, seen))
+
+        ranges = sorted(set(ranges))
+        self._service_cache[key] = ranges
+        return ranges
+
+    def resolve_address(self, sel: Selector) -> Optional[List[Range]]:
+        """Resolve an address selector; ``None`` means "any"/"original"."""
+        if sel is None:
+            return None
+        kind, name = sel
+        if kind == "host":
+            try:
+                value = int(ipaddress.ip_address(name.strip()))
+            except ValueError:
+                return []
+            return [(value, value)]
+        return self.address_ranges(kind, name)
+
+    def resolve_service(self, sel: Selector) -> Optional[List[ServiceRange]]:
+        """Resolve a service selector; ``None`` means "any"/"original"."""
+        if sel is None:
+            return None
+        kind, name = sel
+        return self.service_ranges("group" if kind == "group" else "name", name)
+
+
+def service_matches(ranges: Optional[List[ServiceRange]], protocol: Optional[int], port: Optional[int]) -> bool:
+    """True if (protocol, port) falls in any of the service ranges; ``None`` ranges match all."""
+    if ranges is None:
+        return True
+    for proto, lo, hi in ranges:
+        if protocol is not None and proto != protocol:
+            continue
+        if port is None or lo <= port <= hi:
+            return True
+    return False
+
+
+def parse_protocol(value: Any) -> Optional[int]:
+    """Accept a protocol number or name such as "tcp"."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().lower()
+    if text.isdigit():
+        return int(text)
+    return PROTOCOL_NUMBERS.get(text)
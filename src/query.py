@@ -0,0 +1,421 @@
+"""
+SonicWall Query
+Field projection, filters, sorting and cursor pagination for the listing tools
+"""
+
+import base64
+import bisect
+import hashlib
+import ipaddress
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from config_model import AddressObject, Selector, PROTOCOL_NUMBERS
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+def _selector_text(sel: Selector, default: str = "Any") -> str:
+    return sel[1] if sel else default
+
+
+def address_value(obj: AddressObject) -> Optional[str]:
+    """Display form of an address object's value (IP, CIDR, range or FQDN)."""
+    if obj.kind == "host":
+        return str(ipaddress.ip_address(obj.lo))
+    if obj.kind == "network":
+        return str(next(ipaddress.summarize_address_range(
+            ipaddress.ip_address(obj.lo), ipaddress.ip_address(obj.hi))))
+    if obj.kind == "range":
+        return f"{ipaddress.ip_address(obj.lo)}-{ipaddress.ip_address(obj.hi)}"
+    return obj.value
+
+
+Getter = Callable[[Any], Any]
+
+_PROTOCOL_NAMES: Dict[int, str] = {}
+for _name, _number in PROTOCOL_NUMBERS.items():
+    _PROTOCOL_NAMES.setdefault(_number, _name)
+
+_RULE_FIELDS: Dict[str, Getter] = {
+    "name": lambda p: p.name,
+    "uuid": lambda p: p.uuid,
+    "family": lambda p: p.family,
+    "from": lambda p: p.from_zone or "Any",
+    "to": lambda p: p.to_zone or "Any",
+    "source": lambda p: _selector_text(p.source),
+    "destination": lambda p: _selector_text(p.destination),
+    "service": lambda p: _selector_text(p.service),
+    "action": lambda p: p.action or "Unknown",
+    "enabled": lambda p: p.enabled,
+    "priority": lambda p: p.priority,
+    "comment": lambda p: p.comment,
+}
+
+_ROUTE_FIELDS: Dict[str, Getter] = {
+    "name": lambda p: p.name,
+    "uuid": lambda p: p.uuid,
+    "family": lambda p: p.family,
+    "source": lambda p: _selector_text(p.source),
+    "destination": lambda p: _selector_text(p.destination),
+    "service": lambda p: _selector_text(p.service),
+    "interface": lambda p: p.interface,
+    "gateway": lambda p: _selector_text(p.gateway, "Default"),
+    "metric": lambda p: p.metric,
+    "distance": lambda p: p.distance,
+    "type": lambda p: p.route_type,
+    "enabled": lambda p: p.enabled,
+    "comment": lambda p: p.comment,
+}
+
+_NAT_FIELDS: Dict[str, Getter] = {
+    "name": lambda p: p.name,
+    "uuid": lambda p: p.uuid,
+    "family": lambda p: p.family,
+    "inbound": lambda p: p.inbound,
+    "outbound": lambda p: p.outbound,
+    "original_source": lambda p: _selector_text(p.source),
+    "translated_source": lambda p: _selector_text(p.translated_source, "Original"),
+    "original_destination": lambda p: _selector_text(p.destination),
+    "translated_destination": lambda p: _selector_text(p.translated_destination, "Original"),
+    "original_service": lambda p: _selector_text(p.service),
+    "translated_service": lambda p: _selector_text(p.translated_service, "Original"),
+    "enabled": lambda p: p.enabled,
+    "priority": lambda p: p.priority,
+    "comment": lambda p: p.comment,
+}
+
+_ADDRESS_FIELDS: Dict[str, Getter] = {
+    "name": lambda o: o.name,
+    "uuid": lambda o: o.uuid,
+    "type": lambda o: o.kind,
+    "family": lambda o: o.family,
+    "zone": lambda o: o.zone or "Unknown",
+    "value": address_value,
+}
+
+_SERVICE_FIELDS: Dict[str, Getter] = {
+    "name": lambda o: o.name,
+    "uuid": lambda o: o.uuid,
+    "protocol": lambda o: _PROTOCOL_NAMES.get(o.protocol, o.protocol if o.protocol >= 0 else None),
+    "port_begin": lambda o: o.port_lo,
+    "port_end": lambda o: o.port_hi,
+}
+
+_GROUP_FIELDS: Dict[str, Getter] = {
+    "name": lambda g: g.name,
+    "uuid": lambda g: g.uuid,
+    "family": lambda g: g.family,
+    "members": lambda g: [name for _, name in g.members],
+}
+
+_ZONE_FIELDS: Dict[str, Getter] = {
+    "name": lambda z: z.name,
+    "uuid": lambda z: z.uuid,
+    "security_type": lambda z: z.security_type,
+}
+
+_INTERFACE_FIELDS: Dict[str, Getter] = {
+    "name": lambda i: i.name,
+    "zone": lambda i: i.zone or "Unknown",
+    "ip": lambda i: i.ip or "Unknown",
+    "netmask": lambda i: i.netmask or "Unknown",
+    "gateway": lambda i: i.gateway,
+    "admin_status": lambda i: i.admin if i.admin is not None else "Unknown",
+    "comment": lambda i: i.comment,
+}
+
+
+class View:
+    """Fields a listing exposes over one record type, and how rows are identified."""
+
+    def __init__(self, name: str, fields: Dict[str, Getter], default_fields: Sequence[str],
+                 key: Getter):
+        self.name = name
+        self.fields = fields
+        self.default_fields = tuple(default_fields)
+        self.key = key
+
+
+VIEWS: Dict[str, View] = {
+    "firewall_rules": View(
+        "firewall_rules", _RULE_FIELDS,
+        ("name", "from", "to", "source", "destination", "service", "action", "enabled"),
+        key=lambda p: p.key,
+    ),
+    "nat_policies": View(
+        "nat_policies", _NAT_FIELDS,
+        ("name", "original_source", "translated_source", "original_destination", "translated_destination"),
+        key=lambda p: p.key,
+    ),
+    "address_objects": View(
+        "address_objects", _ADDRESS_FIELDS,
+        ("name", "type", "zone", "value"),
+        key=lambda o: o.name,
+    ),
+    "interfaces": View(
+        "interfaces", _INTERFACE_FIELDS,
+        ("name", "zone", "ip", "netmask", "admin_status"),
+        key=lambda i: i.name,
+    ),
+    "security_policies": View(
+        "security_policies", _RULE_FIELDS,
+        ("name", "from", "to", "source", "destination", "service", "action", "enabled"),
+        key=lambda p: p.key,
+    ),
+    "route_policies": View(
+        "route_policies", _ROUTE_FIELDS,
+        ("name", "source", "destination", "service", "interface", "gateway", "metric"),
+        key=lambda p: p.key,
+    ),
+    "service_objects": View(
+        "service_objects", _SERVICE_FIELDS,
+        ("name", "protocol", "port_begin", "port_end"),
+        key=lambda o: o.name,
+    ),
+    "address_groups": View(
+        "address_groups", _GROUP_FIELDS, ("name", "family", "members"), key=lambda g: g.name,
+    ),
+    "service_groups": View(
+        "service_groups", _GROUP_FIELDS, ("name", "members"), key=lambda g: g.name,
+    ),
+    "zones": View(
+        "zones", _ZONE_FIELDS, ("name", "security_type"), key=lambda z: z.name,
+    ),
+}
+
+
+_FILTER = re.compile(r"^\s*([A-Za-z_]+)\s*(!=|>=|<=|!~|=|~|>|<)\s*(.*?)\s*$")
+
+_TRUE = ("true", "yes", "1", "on")
+
+
+def _coerce(text: str, value: Any) -> Any:
+    """Parse a filter operand to the type of the field value it is compared with."""
+    if isinstance(value, bool):
+        return text.lower() in _TRUE
+    if isinstance(value, (int, float)):
+        try:
+            return type(value)(text)
+        except ValueError:
+            return None
+    return text.lower()
+
+
+def _normalize(value: Any) -> Any:
+    return value.lower() if isinstance(value, str) else value
+
+
+@lru_cache(maxsize=256)
+def compile_filter(expression: str) -> Tuple[str, Callable[[Any], bool]]:
+    """Compile "field op value" into (field, predicate over the field's value).
+
+    Operators: ``=`` ``!=`` (case-insensitive equality), ``~`` ``!~``
+    (substring), ``>`` ``<`` ``>=`` ``<=`` (numeric, or string order).
+    """
+    match = _FILTER.match(expression)
+    if not match:
+        raise ValueError(f"Invalid filter '{expression}' (expected e.g. 'from=LAN' or 'name~web')")
+    field, op, operand = match.groups()
+    lowered = operand.lower()
+
+    if op in ("~", "!~"):
+        negate = op == "!~"
+
+        def predicate(value):
+            return (value is not None and lowered in str(value).lower()) != negate
+        return field, predicate
+
+    def predicate(value):
+        if value is None:
+            return op == "!=" and lowered not in ("", "none", "null")
+        target = _coerce(operand, value)
+        if target is None:
+            return op == "!="
+        value = _normalize(value)
+        if op == "=":
+            return value == target
+        if op == "!=":
+            return value != target
+        try:
+            if op == ">":
+                return value > target
+            if op == "<":
+                return value < target
+            if op == ">=":
+                return value >= target
+            return value <= target
+        except TypeError:
+            return False
+    return field, predicate
+
+
+def _sort_value(value: Any) -> Tuple[int, Any]:
+    """Total order over mixed field values (None first)."""
+    if value is None:
+        return (0, "")
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    return (2, str(value).lower())
+
+
+class Page:
+    """One page of query results."""
+
+    def __init__(self, rows: List[Dict[str, Any]], start: int, total: int, next_cursor: Optional[str],
+                 cursor_at: Optional[Callable[[int], Optional[str]]] = None):
+        self.rows = rows
+        self.start = start
+        self.total = total
+        self.next_cursor = next_cursor
+        self._cursor_at = cursor_at
+
+    def cursor_at(self, count: int) -> Optional[str]:
+        """Cursor resuming after the first ``count`` rows of this page (for truncated output)."""
+        if count >= len(self.rows):
+            return self.next_cursor
+        return self._cursor_at(count) if self._cursor_at else None
+
+
+class Query:
+    """Projection, filters, sort order and page position for a listing.
+
+    Page tokens are keyset cursors: they record the sort key and identity
+    of the last row returned, so the next page starts right after that
+    row even if entries were added or removed in between. A token only
+    works with the same view, filters and sort it was issued for.
+    """
+
+    def __init__(self, fields: Optional[Sequence[str]] = None, where: Optional[Iterable[str]] = None,
+                 sort: Optional[Sequence[str]] = None, limit: int = DEFAULT_PAGE_SIZE,
+                 cursor: Optional[str] = None):
+        self.fields = [f.strip() for f in fields or [] if f and f.strip()] or None
+        self.where = [w for w in (where or []) if w and w.strip()]
+        self.sort = [s.strip() for s in (sort or []) if s and s.strip()]
+        self.limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        self.cursor = cursor or None
+
+    @classmethod
+    def from_arguments(cls, arguments: Dict[str, Any]) -> "Query":
+        """Build a query from tool arguments (fields, where, sort, limit, cursor)."""
+        def as_list(value, split: bool = True):
+            if isinstance(value, str):
+                return [v.strip() for v in value.split(",")] if split else [value]
+            return list(value or [])
+        return cls(
+            fields=as_list(arguments.get("fields")),
+            # Filter operands may contain commas, so a single string is one filter
+            where=as_list(arguments.get("where"), split=False),
+            sort=as_list(arguments.get("sort")),
+            limit=arguments.get("limit", DEFAULT_PAGE_SIZE),
+            cursor=arguments.get("cursor"),
+        )
+
+    def filter(self, expression: str) -> "Query":
+        self.where.append(expression)
+        return self
+
+    def _fingerprint(self, view: View) -> str:
+        spec = json.dumps([view.name, sorted(self.where), self.sort])
+        return hashlib.blake2b(spec.encode(), digest_size=6).hexdigest()
+
+    def _check_field(self, view: View, field: str):
+        if field not in view.fields:
+            raise ValueError(f"Unknown field '{field}' (available: {', '.join(view.fields)})")
+
+    def run(self, view: View, records: Iterable[Any]) -> Page:
+        """Filter, sort, page and project ``records`` through ``view``."""
+        fields = self.fields or list(view.default_fields)
+        for field in fields:
+            self._check_field(view, field)
+
+        predicates = []
+        for expression in self.where:
+            field, predicate = compile_filter(expression)
+            self._check_field(view, field)
+            predicates.append((view.fields[field], predicate))
+
+        matches = [r for r in records if all(pred(get(r)) for get, pred in predicates)]
+        fingerprint = self._fingerprint(view)
+
+        order = []
+        for item in self.sort:
+            descending = item.startswith("-")
+            field = item.lstrip("+-")
+            self._check_field(view, field)
+            order.append((view.fields[field], descending))
+
+        after = self._decode_cursor(fingerprint)
+        start = 0
+        if order:
+            # Row identity breaks ties, so the order is total and cursors can bisect
+            def position(r) -> Tuple:
+                parts = [_Descending(_sort_value(get(r))) if descending else _sort_value(get(r))
+                         for get, descending in order]
+                return tuple(parts) + (str(view.key(r)),)
+            positions = [position(r) for r in matches]
+            ranked = sorted(range(len(matches)), key=positions.__getitem__)
+            matches = [matches[i] for i in ranked]
+            if after is not None:
+                target = tuple(
+                    _Descending(tuple(value)) if descending else tuple(value)
+                    for (_, descending), value in zip(order, after["k"])
+                ) + (str(after["u"]),)
+                start = bisect.bisect_right([positions[i] for i in ranked], target)
+        elif after is not None:
+            keys = [view.key(r) for r in matches]
+            try:
+                start = keys.index(after["u"]) + 1
+            except ValueError:
+                start = min(after["i"] + 1, len(matches))
+
+        page_records = matches[start:start + self.limit]
+        rows = [{field: view.fields[field](r) for field in fields} for r in page_records]
+
+        def cursor_at(count: int) -> Optional[str]:
+            if count <= 0 or start + count >= len(matches):
+                return None
+            last = page_records[count - 1]
+            return self._encode_cursor({
+                "h": fingerprint,
+                "k": [list(_sort_value(get(last))) for get, _ in order],
+                "u": view.key(last),
+                "i": start + count - 1,
+            })
+
+        return Page(rows, start, len(matches), cursor_at(len(page_records)), cursor_at)
+
+    @staticmethod
+    def _encode_cursor(state: Dict[str, Any]) -> str:
+        raw = json.dumps(state, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def _decode_cursor(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        if not self.cursor:
+            return None
+        try:
+            padded = self.cursor + "=" * (-len(self.cursor) % 4)
+            state = json.loads(base64.urlsafe_b64decode(padded))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid page cursor")
+        if state.get("h") != fingerprint:
+            raise ValueError("Page cursor belongs to a different query (filters or sort changed)")
+        return state
+
+
+class _Descending:
+    """Inverts the order of a sort value, for descending keys inside a tuple."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
@@ -0,0 +1,183 @@
+"""
+SonicWall Renderer
+Size-budgeted list, table, CSV and JSON-lines output for tool results
+"""
+
+import csv
+import io
+import json
+import os
+from typing import Dict, Any, List, Optional
+
+from query import Page
+
+FORMATS = ("list", "table", "csv", "jsonl")
+
+# Default response budget; roughly 16k tokens
+DEFAULT_MAX_BYTES = int(os.getenv("SONICWALL_OUTPUT_MAX_BYTES", "65536"))
+
+# Rough bytes per LLM token for English-ish tool output
+BYTES_PER_TOKEN = 4
+
+# Widest table cell before it is cut with "…"
+MAX_CELL_WIDTH = 40
+
+# Room kept for the truncation footer and its cursor
+_FOOTER_RESERVE = 320
+
+
+def budget_bytes(max_bytes: Optional[int] = None, max_tokens: Optional[int] = None) -> int:
+    """Byte budget from an explicit byte or token limit, else the default."""
+    if max_bytes:
+        return max(1024, int(max_bytes))
+    if max_tokens:
+        return max(1024, int(max_tokens) * BYTES_PER_TOKEN)
+    return DEFAULT_MAX_BYTES
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _label(field: str) -> str:
+    return field.replace("_", " ").title()
+
+
+class _Writer:
+    """Collects output parts and their byte size; joined once at the end."""
+
+    def __init__(self, limit: int):
+        self.parts: List[str] = []
+        self.size = 0
+        self.limit = limit
+
+    def fits(self, text: str) -> bool:
+        return self.size + len(text.encode()) <= self.limit
+
+    def add(self, text: str):
+        self.parts.append(text)
+        self.size += len(text.encode())
+
+    def getvalue(self) -> str:
+        return "".join(self.parts)
+
+
+def _list_row(number: int, row: Dict[str, Any]) -> str:
+    fields = list(row.items())
+    if fields and fields[0][0] == "name":
+        lines = [f"\n{number}. {_text(fields[0][1])}\n"]
+        fields = fields[1:]
+    else:
+        lines = [f"\n{number}.\n"]
+    lines.extend(f"   {_label(field)}: {_text(value)}\n" for field, value in fields)
+    return "".join(lines)
+
+
+def _cell(value: Any, width: int) -> str:
+    text = _text(value).replace("\n", " ")
+    if len(text) > width:
+        text = text[:width - 1] + "…"
+    return text.ljust(width)
+
+
+def _row_formatter(fmt: str, fields: List[str], rows: List[Dict[str, Any]], last_number: int):
+    """(header, function rendering one numbered row) for a format."""
+    if fmt == "table":
+        widths = [min(MAX_CELL_WIDTH, max([len(f)] + [len(_text(r.get(f))) for r in rows])) for f in fields]
+        number_width = len(str(last_number))
+        header = " " * number_width + "  " + "  ".join(_cell(f, w) for f, w in zip(fields, widths)).rstrip() + "\n"
+        header += " " * number_width + "  " + "  ".join("-" * w for w in widths) + "\n"
+
+        def render(number, row):
+            cells = "  ".join(_cell(row.get(f), w) for f, w in zip(fields, widths)).rstrip()
+            return f"{str(number).rjust(number_width)}  {cells}\n"
+        return header, render
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+
+        def render(number, row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([_text(row.get(f)) for f in fields])
+            return buffer.getvalue()
+        buffer.seek(0)
+        writer.writerow(fields)
+        return buffer.getvalue(), render
+
+    if fmt == "jsonl":
+        def render(number, row):
+            return json.dumps(row, separators=(",", ":"), default=str) + "\n"
+        return "", render
+
+    return "", _list_row
+
+
+def render_page(title: str, page: Page, fmt: str = "list", max_bytes: Optional[int] = None,
+                width: int = 50) -> str:
+    """Render a query page, stopping at the byte budget.
+
+    Rows are added whole until the next one would not fit; the footer then
+    carries a cursor that resumes right after the last row shown, so a
+    truncated page loses nothing. At least one row is always shown.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (expected one of: {', '.join(FORMATS)})")
+    limit = budget_bytes(max_bytes)
+    fields = list(page.rows[0]) if page.rows else []
+    header, render = _row_formatter(fmt, fields, page.rows, page.start + len(page.rows))
+
+    body = _Writer(limit - _FOOTER_RESERVE)
+    body.add(header)
+    shown = 0
+    for number, row in enumerate(page.rows, page.start + 1):
+        text = render(number, row)
+        if shown and not body.fits(text):
+            break
+        body.add(text)
+        shown += 1
+
+    end = page.start + shown
+    truncated = shown < len(page.rows)
+    if page.rows:
+        summary = f"{title} ({page.start + 1}-{end} of {page.total}"
+        summary += f", {fmt})" if fmt != "list" else ")"
+    else:
+        summary = title
+    output = f"{summary}:\n"
+    if fmt == "list":
+        output += "=" * width + "\n"
+    output += body.getvalue()
+
+    cursor = page.cursor_at(shown) if truncated else page.next_cursor
+    if truncated:
+        output += f"\nOutput limited to {limit} bytes; showing {shown} of {len(page.rows)} rows on this page.\n"
+    if cursor:
+        output += f"\nMore results: pass cursor=\"{cursor}\" for the next page\n"
+    return output
+
+
+def render_data(data: Any, max_bytes: Optional[int] = None) -> str:
+    """Compact JSON for a raw API response, cut off at the byte budget.
+
+    The encoder is consumed incrementally, so a multi-megabyte response
+    costs only as much work as the part that is returned.
+    """
+    if isinstance(data, str):
+        chunks = iter([data])
+    else:
+        chunks = json.JSONEncoder(separators=(",", ":"), default=str).iterencode(data)
+    limit = budget_bytes(max_bytes)
+    out = _Writer(limit)
+    for chunk in chunks:
+        if not out.fits(chunk):
+            room = limit - out.size
+            out.add(chunk.encode()[:max(room, 0)].decode("utf-8", "ignore"))
+            return out.getvalue() + f"\n... (truncated at {limit} bytes)"
+        out.add(chunk)
+    return out.getvalue()
@@ -0,0 +1,207 @@
+"""
+SonicWall Reporting Poller
+Polls reporting endpoints in the background into ring-buffer time series
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Dict, Any, Iterable, List, Optional, Pattern
+
+from sonicwall_client import SonicWallClient
+from timeseries import DEFAULT_COUNTER_FIELDS, MetricStore
+
+logger = logging.getLogger(__name__)
+
+# Built-in targets: name -> (reporting path, seconds between polls)
+DEFAULT_TARGETS = {
+    "interfaces": ("reporting/interfaces/ipv4/statistics", 30.0),
+    "security_policies": ("reporting/security-policies/statistics", 60.0),
+    "vpn_tunnels": ("reporting/tunnel-interfaces/vpn/status", 60.0),
+    "system": ("reporting/status/system", 30.0),
+}
+
+DEFAULT_POLL_CONCURRENCY = 2
+DEFAULT_RETENTION = 3600.0
+
+# Each wait is the interval +/- this fraction, so targets drift apart instead of firing together
+DEFAULT_JITTER = 0.1
+
+# Longest wait after repeated failures, as a multiple of the interval
+MAX_BACKOFF = 8
+
+MIN_INTERVAL = 5.0
+
+# Per-IP connection counts from one zone to another; "top:LAN:WAN" polls the source and destination rankings
+TOP_TALKER_PATHS = {
+    "top_sources": "reporting/connection-limits/ipv4/src-connect/from/{}/to/{}",
+    "top_destinations": "reporting/connection-limits/ipv4/dst-connect/from/{}/to/{}",
+}
+
+# Reporting paths whose rows are per-key tallies: sketched for heavy hitters rather than stored per row
+SKETCH_PREFIXES = ("reporting/connection-limits/",)
+
+
+class PollTarget:
+    """One reporting endpoint polled on its own schedule."""
+
+    def __init__(self, name: str, path: str, interval: float, counters: Pattern = DEFAULT_COUNTER_FIELDS,
+                 sketch: Optional[bool] = None):
+        if interval < MIN_INTERVAL:
+            raise ValueError(f"Poll interval for '{name}' must be at least {MIN_INTERVAL:g}s")
+        self.name = name
+        self.path = path.strip("/")
+        # Sketch targets feed heavy-hitter listeners only: one series per IP would grow without bound
+        self.sketch = self.path.startswith(SKETCH_PREFIXES) if sketch is None else sketch
+        self.interval = float(interval)
+        self.counters = counters
+        self.polled_at: Optional[float] = None
+        self.took = 0.0
+        self.polls = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def capacity(self, retention: float) -> int:
+        """Ring slots holding ``retention`` seconds of samples, with headroom for jitter."""
+        return math.ceil(retention / (self.interval * (1 - DEFAULT_JITTER))) + 1
+
+
+def parse_targets(spec: str) -> List[PollTarget]:
+    """Targets from "interfaces,system=10,reporting/arp/statistics=120".
+
+    Names pick a built-in target; anything containing "/" is a reporting
+    path polled as a new target named after it. "top:FROM:TO" polls the
+    top sources and destinations by connection count between two zones.
+    "=N" overrides the interval. "1", "true" or "yes" select all built-in
+    targets.
+    """
+    spec = spec.strip()
+    if spec.lower() in ("1", "true", "yes", "default"):
+        return [PollTarget(name, path, interval) for name, (path, interval) in DEFAULT_TARGETS.items()]
+
+    targets = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, interval = item.partition("=")
+        key = key.strip()
+        if key.startswith("top:"):
+            zones = key.split(":")[1:]
+            if len(zones) != 2 or not all(zones):
+                raise ValueError(f"Top talker target '{key}' must be top:FROMZONE:TOZONE")
+            for prefix, template in TOP_TALKER_PATHS.items():
+                name = f"{prefix}_{zones[0]}_{zones[1]}"
+                targets.append(PollTarget(name, template.format(*zones), float(interval) if interval else 60.0))
+            continue
+        if key in DEFAULT_TARGETS:
+            path, default_interval = DEFAULT_TARGETS[key]
+            name = key
+        elif "/" in key:
+            path, default_interval = key, 60.0
+            name = key.strip("/").removeprefix("reporting/").replace("/", "_")
+        else:
+            raise ValueError(f"Unknown poll target '{key}' (expected one of: {', '.join(DEFAULT_TARGETS)} "
+                             "or a reporting path)")
+        targets.append(PollTarget(name, path, float(interval) if interval else default_interval))
+    return targets
+
+
+class ReportingPoller:
+    """Background polling of reporting endpoints into a ``MetricStore``.
+
+    Each target runs its own loop on a fixed schedule with jitter; a
+    semaphore bounds how many requests are in flight so the device never
+    sees more than ``concurrency`` reporting reads at once. Failing targets
+    back off exponentially, and polling pauses while the client's circuit
+    breaker is open. Samples are timestamped at the midpoint of the request.
+    """
+
+    def __init__(self, client: SonicWallClient, targets: Iterable[PollTarget],
+                 concurrency: int = DEFAULT_POLL_CONCURRENCY, retention: float = DEFAULT_RETENTION,
+                 store: Optional[MetricStore] = None):
+        self.client = client
+        self.targets: Dict[str, PollTarget] = {target.name: target for target in targets}
+        self.retention = float(retention)
+        self.store = store if store is not None else MetricStore()
+        self.listeners: List = []
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._task: Optional[asyncio.Task] = None
+
+    def _breaker_open(self) -> bool:
+        client = self.client
+        return client.connection_failed and client.failed_attempts >= client.max_retries
+
+    async def poll(self, target: PollTarget) -> bool:
+        """Fetch one target and record its samples; True on success."""
+        async with self._semaphore:
+            started = time.time()
+            try:
+                response = await self.client.get(target.path)
+            except Exception as e:
+                target.failures += 1
+                target.last_error = str(e)[:200]
+                logger.debug(f"Polling {target.path} failed: {target.last_error}")
+                return False
+            finished = time.time()
+        timestamp = (started + finished) / 2
+        if not target.sketch:
+            self.store.record(target.name, timestamp, response, target.capacity(self.retention), target.counters)
+        target.polled_at = timestamp
+        target.took = finished - started
+        target.polls += 1
+        target.failures = 0
+        target.last_error = None
+        for listener in self.listeners:
+            try:
+                listener(target, timestamp, response)
+            except Exception as e:
+                logger.warning(f"Poll listener failed for {target.name}: {str(e)}")
+        return True
+
+    async def _run_target(self, target: PollTarget):
+        # Spread the first polls over one interval
+        await asyncio.sleep(random.uniform(0, target.interval))
+        while True:
+            if not self._breaker_open():
+                try:
+                    await self.poll(target)
+                except Exception as e:
+                    target.failures += 1
+                    target.last_error = str(e)[:200]
+                    logger.warning(f"Recording {target.name} samples failed: {str(e)}")
+            backoff = min(2 ** target.failures, MAX_BACKOFF) if target.failures else 1
+            jitter = random.uniform(1 - DEFAULT_JITTER, 1 + DEFAULT_JITTER)
+            await asyncio.sleep(target.interval * backoff * jitter)
+
+    async def run(self):
+        """Poll every target forever."""
+        async with asyncio.TaskGroup() as group:
+            for target in self.targets.values():
+                group.create_task(self._run_target(target))
+
+    def start(self):
+        if self._task is None and self.targets:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Per-target schedule and health."""
+        now = time.time()
+        return [{
+            "target": target.name,
+            "path": target.path,
+            "interval": target.interval,
+            "polls": target.polls,
+            "age": round(now - target.polled_at, 1) if target.polled_at else None,
+            "took": round(target.took, 3),
+            "failures": target.failures,
+            "error": target.last_error,
+        } for target in self.targets.values()]
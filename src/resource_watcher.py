@@ -0,0 +1,247 @@
+"""
+SonicWall Resource Watcher
+Config and status endpoints as MCP resources, re-checked in the background and announced only when they change
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from config_loader import CONFIG_ENDPOINTS
+from config_mirror import category_for_path
+from sonicwall_client import SonicWallClient
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_SCHEME = "sonicwall://"
+
+# Status resources: name -> (reporting path, description)
+STATUS_RESOURCES = {
+    "system": ("reporting/status/system", "Model, firmware and system status"),
+    "interfaces": ("reporting/interfaces/ipv4/status", "Link state, zone and addressing of every interface"),
+    "vpn-tunnels": ("reporting/tunnel-interfaces/vpn/status", "Site-to-site VPN tunnel status"),
+}
+
+DEFAULT_STATUS_INTERVAL = 30.0
+DEFAULT_CONFIG_INTERVAL = 300.0
+DEFAULT_WATCH_CONCURRENCY = 2
+
+# Fields left out of a status resource's change hash: counters, rates and clocks change
+# on every read without anything an agent would call a change. Config bodies are hashed
+# whole, since settings such as max_connections or cache_lifetime end the same way
+VOLATILE_FIELDS = re.compile(
+    r"(bytes|packets|pkts|errors|drops|dropped|hits|count|rate|usage|utilization|load|uptime|"
+    r"time|timestamp|age|seconds|cpu|memory|connections|sessions)s?$",
+    re.IGNORECASE,
+)
+
+
+def _stable(value: Any) -> Any:
+    """``value`` without volatile fields, at any depth."""
+    if isinstance(value, dict):
+        return {k: _stable(v) for k, v in value.items() if not VOLATILE_FIELDS.search(k.replace("-", "_"))}
+    if isinstance(value, list):
+        return [_stable(v) for v in value]
+    return value
+
+
+def change_digest(body: Any, strip_volatile: bool = True) -> bytes:
+    """Hash of the parts of a response that matter for change detection."""
+    if strip_volatile:
+        body = _stable(body)
+    return hashlib.blake2b(json.dumps(body, sort_keys=True, default=str).encode(), digest_size=16).digest()
+
+
+class WatchedResource:
+    """One API endpoint exposed as a resource, with its last digest and subscribers."""
+
+    __slots__ = ("uri", "name", "path", "interval", "description", "strip_volatile", "digest", "body",
+                 "checked_at", "changed_at", "subscribers", "checks", "changes")
+
+    def __init__(self, uri: str, name: str, path: str, interval: float, description: str,
+                 strip_volatile: bool = False):
+        self.uri = uri
+        self.name = name
+        self.path = path
+        self.interval = interval
+        self.description = description
+        # Leave counters and clocks out of the change hash (status resources)
+        self.strip_volatile = strip_volatile
+        self.digest: Optional[bytes] = None
+        self.body: Any = None
+        self.checked_at: Optional[float] = None
+        self.changed_at: Optional[float] = None
+        self.subscribers: Set[Any] = set()
+        self.checks = 0
+        self.changes = 0
+
+    def due(self, now: float) -> float:
+        """Seconds until the next check (0 if it is due)."""
+        if self.checked_at is None:
+            return 0.0
+        return max(self.checked_at + self.interval - now, 0.0)
+
+
+def default_resources(status_interval: float = DEFAULT_STATUS_INTERVAL,
+                      config_interval: float = DEFAULT_CONFIG_INTERVAL) -> List[WatchedResource]:
+    """Status resources plus one resource per config category."""
+    resources = [
+        WatchedResource(f"{RESOURCE_SCHEME}status/{name}", f"{name} status", path, status_interval, description,
+                        strip_volatile=True)
+        for name, (path, description) in STATUS_RESOURCES.items()
+    ]
+    for category, (path, _) in CONFIG_ENDPOINTS.items():
+        resources.append(WatchedResource(
+            f"{RESOURCE_SCHEME}config/{category}", category.replace("_", " "), path, config_interval,
+            f"Configured {category.replace('_', ' ')} (/{path})",
+        ))
+    return resources
+
+
+class ResourceWatcher:
+    """Shared watcher behind MCP resource subscriptions.
+
+    Only resources with at least one subscriber are checked, each on its
+    own interval, with a small concurrency limit shared by all of them. A
+    check hashes the response (without volatile fields, for status) and sends
+    ``notifications/resources/updated`` to the subscribers when the hash
+    moves; the body is kept so the read that usually follows is answered
+    without another request. Responses the reporting poller fetches anyway
+    and writes made through this server feed the same hashes, so a watched
+    endpoint is never fetched twice for one change.
+    """
+
+    def __init__(self, client: SonicWallClient, resources: Iterable[WatchedResource],
+                 concurrency: int = DEFAULT_WATCH_CONCURRENCY):
+        self.client = client
+        self.resources: Dict[str, WatchedResource] = {r.uri: r for r in resources}
+        self._by_path: Dict[str, WatchedResource] = {r.path: r for r in self.resources.values()}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Notification tasks in flight, referenced so they are not collected mid-send
+        self._sending: Set[asyncio.Task] = set()
+
+    def get(self, uri: str) -> WatchedResource:
+        resource = self.resources.get(uri)
+        if resource is None:
+            raise ValueError(f"Unknown resource '{uri}'")
+        return resource
+
+    def subscribe(self, uri: str, session: Any):
+        resource = self.get(uri)
+        resource.subscribers.add(session)
+        self._wake.set()
+
+    def unsubscribe(self, uri: str, session: Any):
+        resource = self.get(uri)
+        resource.subscribers.discard(session)
+        if not resource.subscribers:
+            resource.body = None
+
+    def drop_session(self, session: Any):
+        """Forget a session's subscriptions (it disconnected or can no longer be notified)."""
+        for resource in self.resources.values():
+            if session in resource.subscribers:
+                resource.subscribers.discard(session)
+                if not resource.subscribers:
+                    resource.body = None
+
+    async def read(self, uri: str) -> str:
+        """Resource contents as JSON; a subscribed resource checked within its interval is served from memory."""
+        resource = self.get(uri)
+        if resource.body is None or resource.due(time.time()) == 0.0:
+            await self.check(resource)
+        body = resource.body
+        if not resource.subscribers:
+            resource.body = None
+        return json.dumps(body, indent=1, default=str)
+
+    async def check(self, resource: WatchedResource) -> bool:
+        """Fetch one resource; True if it changed since the last check."""
+        async with self._semaphore:
+            body = await self.client.get(resource.path)
+        return self.observe(resource, body)
+
+    def observe(self, resource: WatchedResource, body: Any) -> bool:
+        """Record a fresh response for a resource and notify subscribers if its hash moved."""
+        digest = change_digest(body, resource.strip_volatile)
+        now = time.time()
+        changed = resource.digest is not None and digest != resource.digest
+        resource.digest = digest
+        resource.body = body
+        resource.checked_at = now
+        resource.checks += 1
+        if changed:
+            resource.changed_at = now
+            resource.changes += 1
+            if resource.subscribers:
+                task = asyncio.get_running_loop().create_task(self.notify(resource))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+        return changed
+
+    async def notify(self, resource: WatchedResource):
+        for session in list(resource.subscribers):
+            try:
+                await session.send_resource_updated(resource.uri)
+            except Exception as e:
+                # The client went away; forget it everywhere
+                logger.debug(f"Dropping subscriber of {resource.uri}: {str(e)}")
+                self.drop_session(session)
+
+    def listener(self, target, timestamp: float, response: Any):
+        """Reporting poller listener: reuse polls of watched paths instead of fetching them again."""
+        resource = self._by_path.get(target.path)
+        if resource is not None and resource.subscribers:
+            self.observe(resource, response)
+
+    def record_write(self, method: str, path: str, data: Optional[Dict[str, Any]]):
+        """Client write listener: re-check the written category soon rather than at its next interval."""
+        category = category_for_path(path)
+        resource = self.resources.get(f"{RESOURCE_SCHEME}config/{category}") if category else None
+        if resource is not None and resource.subscribers:
+            resource.checked_at = None
+            self._wake.set()
+
+    async def _check_logged(self, resource: WatchedResource):
+        try:
+            await self.check(resource)
+        except Exception as e:
+            # Back off for one interval; the subscription stays
+            resource.checked_at = time.time()
+            logger.debug(f"Checking {resource.uri} failed: {str(e)}")
+
+    async def run(self):
+        """Check subscribed resources as they fall due."""
+        while True:
+            now = time.time()
+            watched = [r for r in self.resources.values() if r.subscribers]
+            due = [r for r in watched if r.due(now) == 0.0]
+            if due:
+                await asyncio.gather(*(self._check_logged(r) for r in due))
+                continue
+            wait = min((r.due(now) for r in watched), default=3600.0)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
@@ -0,0 +1,259 @@
+"""
+SonicWall Route Engine
+Longest-prefix-match route lookups over route policies and connected networks
+"""
+
+import ipaddress
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from config_model import ConfigModel, Interface, Policy
+from object_resolver import (
+    ObjectResolver, Range, ServiceRange, in_ranges, service_matches, parse_protocol
+)
+
+logger = logging.getLogger(__name__)
+
+# Config categories the engine needs (see config_loader.CONFIG_ENDPOINTS).
+# SD-WAN policies come back from route-policies/* with type "sdwan"; the
+# route-policies-sdwan/all path is DELETE-only in the spec.
+ROUTE_CATEGORIES = (
+    "route_policies_ipv4", "route_policies_ipv6", "interfaces_ipv4",
+    "address_objects_ipv4", "address_objects_ipv6",
+    "address_groups_ipv4", "address_groups_ipv6",
+    "service_objects", "service_groups",
+)
+
+ROUTE_FAMILIES = {
+    "ipv4": 4,
+    "ipv6": 6,
+}
+
+FAMILY_BITS = {4: 32, 6: 128}
+
+# SonicOS metrics for auto-added routes
+CONNECTED_METRIC = 0
+DEFAULT_GATEWAY_METRIC = 20
+
+
+class Route:
+    """A single compiled route: a destination prefix plus optional policy constraints."""
+
+    __slots__ = (
+        "index", "name", "uuid", "kind", "family", "prefix", "interface", "gateway",
+        "metric", "distance", "priority", "source", "service", "profile",
+    )
+
+    def __init__(self, index: int, name: str, kind: str, family: int, prefix: str,
+                 interface: str, gateway: Optional[str] = None, metric: int = 1,
+                 distance: int = 0, priority: int = 0, uuid: str = "",
+                 source: Optional[List[Range]] = None,
+                 service: Optional[List[ServiceRange]] = None,
+                 profile: Optional[str] = None):
+        self.index = index
+        self.name = name
+        self.uuid = uuid
+        self.kind = kind
+        self.family = family
+        self.prefix = prefix
+        self.interface = interface
+        self.gateway = gateway
+        self.metric = metric
+        self.distance = distance
+        self.priority = priority
+        self.source = source
+        self.service = service
+        self.profile = profile
+
+    def sort_key(self) -> Tuple:
+        """Policy-route order among routes sharing a prefix.
+
+        Routes constrained by source, then by service, win over broader ones;
+        ties break on manual priority, metric, admin distance and config order.
+        """
+        return (
+            self.source is None,
+            self.service is None,
+            self.priority or 0,
+            self.metric,
+            self.distance,
+            self.index,
+        )
+
+    def matches(self, src: Optional[int], protocol: Optional[int], port: Optional[int]) -> bool:
+        if self.source is not None and (src is None or not in_ranges(src, self.source)):
+            return False
+        if self.service is not None and protocol is None and port is None:
+            return False
+        return service_matches(self.service, protocol, port)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "uuid": self.uuid,
+            "type": self.kind,
+            "prefix": self.prefix,
+            "interface": self.interface,
+            "gateway": self.gateway or "directly connected",
+            "metric": self.metric,
+            "profile": self.profile,
+        }
+
+
+class RadixTrie:
+    """Binary trie keyed on address bits; each node is [child0, child1, routes]."""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root: List[Any] = [None, None, None]
+        self.max_depth = 0
+
+    def insert(self, network: int, length: int, route: Route):
+        node = self.root
+        for depth in range(length):
+            bit = (network >> (self.bits - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            node[2] = []
+        node[2].append(route)
+        node[2].sort(key=Route.sort_key)
+        self.max_depth = max(self.max_depth, length)
+
+    def matches(self, address: int) -> List[List[Route]]:
+        """Route lists along the address path, longest prefix first."""
+        found = []
+        node = self.root
+        if node[2]:
+            found.append(node[2])
+        shift = self.bits - 1
+        for _ in range(self.max_depth):
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[2]:
+                found.append(node[2])
+            shift -= 1
+        found.reverse()
+        return found
+
+
+def _range_prefixes(lo: int, hi: int, family: int) -> List[ipaddress._BaseNetwork]:
+    """Split an integer address range into CIDR prefixes."""
+    address = ipaddress.IPv4Address if family == 4 else ipaddress.IPv6Address
+    return list(ipaddress.summarize_address_range(address(lo), address(hi)))
+
+
+class RouteEngine:
+    """Per-family radix tries of route policies plus connected interface networks."""
+
+    def __init__(self):
+        self.tries: Dict[int, RadixTrie] = {family: RadixTrie(bits) for family, bits in FAMILY_BITS.items()}
+        self.routes: List[Route] = []
+        self.interfaces: Dict[str, Dict[str, Any]] = {}
+        self.generation = 0
+
+    @classmethod
+    def from_model(cls, model: ConfigModel) -> "RouteEngine":
+        """Compile the route policies and interfaces held in a ``ConfigModel``."""
+        engine = cls()
+        resolver = ObjectResolver(model)
+
+        for iface in model.interfaces.values():
+            engine._add_interface(iface)
+
+        for policy in model.policies["route_policy"]:
+            if not policy.enabled:
+                continue
+            family = ROUTE_FAMILIES.get(policy.family)
+            if family:
+                engine._add_policy(policy, family, resolver)
+
+        engine.generation = model.generation
+        logger.debug(f"Route engine compiled {len(engine.routes)} routes")
+        return engine
+
+    @classmethod
+    def from_config(cls, config: Dict[str, List[Dict[str, Any]]]) -> "RouteEngine":
+        """Compile routes from the output of ``config_loader.fetch_config``."""
+        return cls.from_model(ConfigModel.from_config(config))
+
+    def add_route(self, route: Route):
+        network = ipaddress.ip_network(route.prefix, strict=False)
+        self.routes.append(route)
+        self.tries[route.family].insert(int(network.network_address), network.prefixlen, route)
+
+    def _add_interface(self, iface: Interface):
+        name = iface.name
+        self.interfaces[name] = {
+            "zone": iface.zone or "Unknown",
+            "ip": iface.ip,
+            "netmask": iface.netmask,
+        }
+        if not iface.ip or not iface.netmask:
+            return
+        try:
+            network = ipaddress.ip_network(f"{iface.ip}/{iface.netmask}", strict=False)
+        except ValueError:
+            logger.debug(f"Skipping interface {name} with invalid address")
+            return
+        if int(network.network_address) == 0:
+            return
+
+        self.add_route(Route(len(self.routes), f"{name} connected", "connected", 4,
+                             str(network), name, metric=CONNECTED_METRIC))
+        gateway = iface.gateway
+        if gateway and gateway != "0.0.0.0":
+            self.add_route(Route(len(self.routes), f"{name} default", "default", 4,
+                                 "0.0.0.0/0", name, gateway=gateway, metric=DEFAULT_GATEWAY_METRIC))
+
+    def _add_policy(self, policy: Policy, family: int, resolver: ObjectResolver):
+        gateway = None
+        if policy.gateway and policy.gateway[0] == "host":
+            gateway = policy.gateway[1]
+        elif policy.gateway:
+            ranges = resolver.address_ranges("name", policy.gateway[1])
+            gateway = str(ipaddress.ip_address(ranges[0][0])) if ranges else policy.gateway[1]
+
+        destination = resolver.resolve_address(policy.destination)
+        if destination is None:
+            prefixes = ["0.0.0.0/0" if family == 4 else "::/0"]
+        else:
+            prefixes = [str(net) for lo, hi in destination for net in _range_prefixes(lo, hi, family)]
+
+        source = resolver.resolve_address(policy.source)
+        service = resolver.resolve_service(policy.service)
+        for prefix in prefixes:
+            self.add_route(Route(
+                len(self.routes),
+                policy.name,
+                policy.route_type,
+                family,
+                prefix,
+                policy.interface,
+                gateway=gateway,
+                metric=policy.metric,
+                distance=policy.distance,
+                priority=policy.priority or 0,
+                uuid=policy.uuid or "",
+                source=source,
+                service=service,
+                profile=policy.profile,
+            ))
+
+    def lookup(self, dst: str, src: Optional[str] = None, protocol: Any = None,
+               port: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Return the route a packet would take, with egress interface details."""
+        dst_addr = ipaddress.ip_address(dst)
+        src_int = int(ipaddress.ip_address(src)) if src else None
+        proto = parse_protocol(protocol)
+        port = int(port) if port not in (None, "") else None
+
+        for routes in self.tries[dst_addr.version].matches(int(dst_addr)):
+            for route in routes:
+                if route.matches(src_int, proto, port):
+                    result = route.to_dict()
+                    result["egress"] = self.interfaces.get(route.interface, {})
+                    return result
+        return None
@@ -0,0 +1,283 @@
+"""
+SonicWall Request Scheduler
+Weighted fair admission of tool calls from many MCP clients onto the one shared firewall session
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CLIENT_CONCURRENCY = 2
+
+# Priority classes, most urgent first, and their share of the session when they compete
+PRIORITIES = ("interactive", "polling", "bulk")
+DEFAULT_CLASS_WEIGHTS = {"interactive": 8.0, "polling": 2.0, "bulk": 1.0}
+
+# Seconds a kind of call is assumed to take before it has been timed
+DEFAULT_COST = 1.0
+MIN_COST = 0.01
+MAX_COST = 120.0
+COST_SMOOTHING = 0.2
+
+# Recent samples kept per class for the queue-time percentiles
+STAT_SAMPLES = 2048
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse ``name=weight,...`` (as in SONICWALL_CLIENT_WEIGHTS)."""
+    weights = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, value = item.rpartition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Expected name=weight, got '{item}'")
+        weight = float(value)
+        if weight <= 0:
+            raise ValueError(f"Weight for '{name.strip()}' must be positive")
+        weights[name.strip()] = weight
+    return weights
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class _Waiter:
+    __slots__ = ("future", "start", "enqueued")
+
+    def __init__(self, future: asyncio.Future, start: float, enqueued: float):
+        self.future = future
+        self.start = start
+        self.enqueued = enqueued
+
+
+class _Flow:
+    """Waiting calls of one client in one priority class, in arrival order."""
+
+    __slots__ = ("priority", "weight", "finish", "waiting")
+
+    def __init__(self, priority: str, weight: float):
+        self.priority = priority
+        self.weight = weight
+        # Virtual finish tag of the flow's latest call
+        self.finish = 0.0
+        self.waiting: Deque[_Waiter] = deque()
+
+    def head(self) -> Optional[_Waiter]:
+        while self.waiting and self.waiting[0].future.done():
+            self.waiting.popleft()
+        return self.waiting[0] if self.waiting else None
+
+
+class _Client:
+    __slots__ = ("label", "running", "flows")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.running = 0
+        self.flows: Dict[str, _Flow] = {}
+
+
+class QueueStats:
+    """Counters and recent samples for one priority class or client."""
+
+    __slots__ = ("admitted", "running", "waiting", "total_wait", "max_wait", "waits", "services")
+
+    def __init__(self):
+        self.admitted = 0
+        self.running = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waits: Deque[float] = deque(maxlen=STAT_SAMPLES)
+        self.services: Deque[float] = deque(maxlen=STAT_SAMPLES)
+
+    def row(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "wait_p50_ms": round(percentile(self.waits, 0.5) * 1000, 1),
+            "wait_p99_ms": round(percentile(self.waits, 0.99) * 1000, 1),
+            "wait_max_ms": round(self.max_wait * 1000, 1),
+            "wait_mean_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "run_p50_ms": round(percentile(self.services, 0.5) * 1000, 1),
+            "run_p99_ms": round(percentile(self.services, 0.99) * 1000, 1),
+        }
+
+
+class FairScheduler:
+    """Weighted fair admission of tool calls across clients and priority classes.
+
+    At most ``concurrency`` calls run against the firewall at once and at
+    most ``client_concurrency`` of them belong to any one client. Waiting
+    calls queue per client and priority class and are admitted by
+    start-time fair queuing: each call is tagged with a virtual start time
+    and advances its queue's tag by its expected run time divided by the
+    queue's weight (class weight times client weight), and a freed slot
+    goes to the smallest eligible tag. A client that queues fifty calls
+    therefore delays the others by about one call of its own, and a
+    minute-long export is charged for a minute.
+
+    Calls cannot be preempted, so ``reserve`` slots are only ever given to
+    interactive calls and bulk calls may hold at most half of the rest;
+    a quick status check then waits for other interactive calls at worst,
+    never behind a row of exports. Expected run times are learnt per call
+    kind (tool name) from the calls already made.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY,
+                 client_concurrency: int = DEFAULT_CLIENT_CONCURRENCY,
+                 weights: Optional[Dict[str, float]] = None,
+                 class_weights: Optional[Dict[str, float]] = None,
+                 reserve: int = 1):
+        if concurrency < 1 or client_concurrency < 1:
+            raise ValueError("Concurrency limits must be at least 1")
+        self.concurrency = concurrency
+        self.client_concurrency = client_concurrency
+        # Client name -> weight; unnamed clients weigh 1
+        self.weights = weights or {}
+        self.class_weights = dict(DEFAULT_CLASS_WEIGHTS, **(class_weights or {}))
+        self.reserve = max(0, min(reserve, concurrency - 1))
+        self.bulk_limit = max(1, (concurrency - self.reserve + 1) // 2)
+        self.running = 0
+        self.virtual_time = 0.0
+        # Call kind -> smoothed run time in seconds
+        self.costs: Dict[str, float] = {}
+        self.classes: Dict[str, QueueStats] = {priority: QueueStats() for priority in PRIORITIES}
+        # Client name -> stats; several sessions of the same client program share a row
+        self.client_stats: Dict[str, QueueStats] = {}
+        self._clients: Dict[Any, _Client] = {}
+
+    @property
+    def waiting(self) -> int:
+        return sum(stats.waiting for stats in self.classes.values())
+
+    def cost(self, kind: str) -> float:
+        return self.costs.get(kind, DEFAULT_COST)
+
+    async def acquire(self, client: Any, label: str = "", kind: str = "", priority: str = "interactive") -> float:
+        """Wait for a slot; returns the seconds spent queued."""
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority class '{priority}'. Use one of: {', '.join(PRIORITIES)}")
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = _Client(label or "unknown")
+        flow = state.flows.get(priority)
+        if flow is None:
+            weight = self.class_weights[priority] * self.weights.get(state.label, 1.0)
+            flow = state.flows[priority] = _Flow(priority, weight)
+        start = max(self.virtual_time, flow.finish)
+        flow.finish = start + self.cost(kind) / flow.weight
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), start, time.monotonic())
+        flow.waiting.append(waiter)
+        self._stats(state, priority, "waiting", 1)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the caller gave up; hand the slot on
+                self.release(client, kind, priority)
+            else:
+                self._stats(state, priority, "waiting", -1)
+                if waiter in flow.waiting:
+                    flow.waiting.remove(waiter)
+                self._forget(client)
+            raise
+        return time.monotonic() - waiter.enqueued
+
+    def release(self, client: Any, kind: str = "", priority: str = "interactive", elapsed: Optional[float] = None):
+        """Free a slot; ``elapsed`` (seconds run) refines the expected cost of ``kind``."""
+        state = self._clients[client]
+        state.running -= 1
+        self.running -= 1
+        self._stats(state, priority, "running", -1)
+        if elapsed is not None:
+            for stats in (self.classes[priority], self.client_stats.get(state.label)):
+                if stats is not None:
+                    stats.services.append(elapsed)
+            if kind:
+                sample = min(max(elapsed, MIN_COST), MAX_COST)
+                previous = self.costs.get(kind)
+                self.costs[kind] = sample if previous is None else previous + COST_SMOOTHING * (sample - previous)
+        self._dispatch()
+        self._forget(client)
+
+    @asynccontextmanager
+    async def slot(self, client: Any, label: str = "", kind: str = "", priority: str = "interactive"):
+        """Hold one of ``client``'s slots for the duration of the block."""
+        await self.acquire(client, label, kind, priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client, kind, priority, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Queue-time statistics per priority class and per client name."""
+        return {
+            "classes": [dict(priority=priority, **self.classes[priority].row()) for priority in PRIORITIES],
+            "clients": [dict(client=label, weight=self.weights.get(label, 1.0), **stats.row())
+                        for label, stats in sorted(self.client_stats.items())],
+        }
+
+    def _eligible(self, state: _Client, priority: str) -> bool:
+        if self.running >= self.concurrency or state.running >= self.client_concurrency:
+            return False
+        if priority == "interactive":
+            return True
+        if self.running >= self.concurrency - self.reserve:
+            return False
+        return priority != "bulk" or self.classes["bulk"].running < self.bulk_limit
+
+    def _dispatch(self):
+        """Give free slots to the eligible waiting calls with the smallest start tags."""
+        while self.running < self.concurrency:
+            best = None
+            for state in self._clients.values():
+                for flow in state.flows.values():
+                    head = flow.head()
+                    if head is None or (best is not None and head.start >= best[2].start):
+                        continue
+                    if self._eligible(state, flow.priority):
+                        best = (state, flow, head)
+            if best is None:
+                return
+            state, flow, waiter = best
+            flow.waiting.popleft()
+            self.virtual_time = max(self.virtual_time, waiter.start)
+            state.running += 1
+            self.running += 1
+            self._stats(state, flow.priority, "waiting", -1)
+            self._stats(state, flow.priority, "running", 1)
+            wait = time.monotonic() - waiter.enqueued
+            for stats in (self.classes[flow.priority], self.client_stats[state.label]):
+                stats.admitted += 1
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+                stats.waits.append(wait)
+            waiter.future.set_result(None)
+
+    def _stats(self, state: _Client, priority: str, field: str, delta: int):
+        client_stats = self.client_stats.get(state.label)
+        if client_stats is None:
+            client_stats = self.client_stats[state.label] = QueueStats()
+        for stats in (self.classes[priority], client_stats):
+            setattr(stats, field, getattr(stats, field) + delta)
+
+    def _forget(self, client: Any):
+        state = self._clients.get(client)
+        if state is not None and not state.running and not any(flow.head() for flow in state.flows.values()):
+            del self._clients[client]
@@ -0,0 +1,266 @@
+"""
+SonicWall Snapshot Store
+Content-addressed, deduplicated config snapshots with hash-first structural diffs
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (object key, object hash)
+TreeEntry = Tuple[str, str]
+
+# A chunk ends after a key whose hash has these low bits clear (~64 entries per
+# chunk). Boundaries depend only on keys, so an insert or edit rewrites one
+# chunk instead of the whole category.
+CHUNK_MASK = 0x3F
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def _is_boundary(key: str) -> bool:
+    return hashlib.blake2b(key.encode(), digest_size=4).digest()[0] & CHUNK_MASK == 0
+
+
+def object_key(entry: Dict[str, Any]) -> str:
+    """Stable identity for an entry across snapshots: UUID, else name (+VLAN)."""
+    if entry.get("uuid"):
+        return str(entry["uuid"])
+    name = str(entry.get("name", ""))
+    return f"{name}:V{entry['vlan']}" if entry.get("vlan") else name
+
+
+class SnapshotStore:
+    """Snapshots stored as a hash tree of compressed blobs in append-only packs.
+
+    Every entry is stored once under the hash of its canonical JSON. A
+    category is a list of chunk hashes, each chunk a list of (key, entry
+    hash) pairs, and a snapshot manifest maps categories to their tree
+    hash. Unchanged entries, chunks and whole categories are shared between
+    snapshots, so a daily snapshot of a mostly static config costs a few
+    kilobytes plus the entries that actually changed. Categories that
+    could not be fetched are listed as ``missing`` in the manifest and are
+    left out of diffs rather than compared as empty.
+
+    Layout::
+
+        <root>/packs/<n>.pack           zlib-compressed blobs written by one save
+        <root>/index                    "<hash> <pack> <offset> <length>" per blob
+        <root>/snapshots/<id>.json      manifest
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.packs_dir = os.path.join(root, "packs")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.index_path = os.path.join(root, "index")
+        self._index: Optional[Dict[str, Tuple[int, int, int]]] = None
+        self._blobs: Dict[str, Any] = {}
+        self._manifests: Dict[str, Dict[str, Any]] = {}
+        # save() runs in worker threads; each one appends its own pack
+        self._save_lock = threading.Lock()
+
+    def _load_index(self) -> Dict[str, Tuple[int, int, int]]:
+        if self._index is None:
+            self._index = {}
+            try:
+                with open(self.index_path) as f:
+                    for line in f:
+                        digest, pack, offset, length = line.split()
+                        self._index[digest] = (int(pack), int(offset), int(length))
+            except FileNotFoundError:
+                pass
+        return self._index
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.packs_dir, f"{pack}.pack")
+
+    def _get(self, digest: str) -> Any:
+        """Load a blob; trees and chunks are immutable, so they are cached."""
+        if digest in self._blobs:
+            return self._blobs[digest]
+        pack, offset, length = self._load_index()[digest]
+        with open(self._pack_path(pack), "rb") as f:
+            f.seek(offset)
+            value = json.loads(zlib.decompress(f.read(length)))
+        if isinstance(value, list):
+            self._blobs[digest] = value
+        return value
+
+    def entry(self, digest: str) -> Dict[str, Any]:
+        return self._get(digest)
+
+    def chunks(self, tree_hash: str) -> List[str]:
+        return self._get(tree_hash)
+
+    def chunk(self, chunk_hash: str) -> List[TreeEntry]:
+        return self._get(chunk_hash)
+
+    def save(self, config: Dict[str, List[Dict[str, Any]]], label: str = "",
+             missing: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Store a snapshot of ``config_loader.fetch_config`` output and return its manifest.
+
+        ``missing`` names categories that failed to fetch and are not in ``config``.
+        """
+        with self._save_lock:
+            return self._save(config, label, missing or [])
+
+    def _save(self, config: Dict[str, List[Dict[str, Any]]], label: str, missing: List[str]) -> Dict[str, Any]:
+        index = self._load_index()
+        os.makedirs(self.packs_dir, exist_ok=True)
+        pack = max((p for p, _, _ in index.values()), default=-1) + 1
+        new_blobs: List[Tuple[str, int, int]] = []
+        raw_bytes = 0
+
+        with open(self._pack_path(pack), "wb") as pack_file:
+            def put(data: bytes) -> str:
+                digest = _hash(data)
+                if digest not in index:
+                    compressed = zlib.compress(data, 6)
+                    offset = pack_file.tell()
+                    pack_file.write(compressed)
+                    index[digest] = (pack, offset, len(compressed))
+                    new_blobs.append((digest, offset, len(compressed)))
+                return digest
+
+            categories: Dict[str, str] = {}
+            for category in sorted(config):
+                chunk_hashes: List[str] = []
+                chunk: List[TreeEntry] = []
+                seen: Dict[str, int] = {}
+                for entry in config[category]:
+                    data = _canonical(entry)
+                    raw_bytes += len(data)
+                    key = object_key(entry)
+                    # Keep keys unique within a category even if the device repeats a name
+                    seen[key] = seen.get(key, 0) + 1
+                    if seen[key] > 1:
+                        key = f"{key}#{seen[key]}"
+                    chunk.append((key, put(data)))
+                    if _is_boundary(key):
+                        chunk_hashes.append(put(_canonical(chunk)))
+                        chunk = []
+                if chunk:
+                    chunk_hashes.append(put(_canonical(chunk)))
+                categories[category] = put(_canonical(chunk_hashes))
+
+        stored_bytes = sum(length for _, _, length in new_blobs)
+        if new_blobs:
+            with open(self.index_path, "a") as f:
+                f.writelines(f"{digest} {pack} {offset} {length}\n" for digest, offset, length in new_blobs)
+        else:
+            os.remove(self._pack_path(pack))
+
+        created = time.time()
+        root_hash = _hash(_canonical(categories))
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(created)) + f".{int(created * 1000) % 1000:03d}Z"
+        manifest = {
+            "id": f"{stamp}-{root_hash[:8]}",
+            "created": created,
+            "label": label,
+            "root": root_hash,
+            "categories": categories,
+            "missing": sorted(missing),
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+        }
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        with open(os.path.join(self.snapshots_dir, f"{manifest['id']}.json"), "w") as f:
+            json.dump(manifest, f)
+        logger.info(f"Stored snapshot {manifest['id']}: {raw_bytes} raw bytes, {stored_bytes} new bytes")
+        return manifest
+
+    def ids(self) -> List[str]:
+        """Snapshot IDs, oldest first."""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.snapshots_dir) if name.endswith(".json"))
+
+    def manifest(self, snapshot_id: str) -> Dict[str, Any]:
+        """Load a manifest by ID, unique ID prefix, "latest" or "previous"."""
+        ids = self.ids()
+        if snapshot_id in ("latest", "previous"):
+            index = -1 if snapshot_id == "latest" else -2
+            if len(ids) < -index:
+                raise ValueError(f"Not enough snapshots for '{snapshot_id}'")
+            snapshot_id = ids[index]
+        elif snapshot_id not in ids:
+            matches = [i for i in ids if i.startswith(snapshot_id)]
+            if len(matches) != 1:
+                raise ValueError(f"Unknown or ambiguous snapshot '{snapshot_id}'")
+            snapshot_id = matches[0]
+        if snapshot_id not in self._manifests:
+            with open(os.path.join(self.snapshots_dir, f"{snapshot_id}.json")) as f:
+                self._manifests[snapshot_id] = json.load(f)
+        return self._manifests[snapshot_id]
+
+    def _changed_entries(self, tree_hash: Optional[str], shared: set) -> Dict[str, str]:
+        """key -> entry hash for the chunks of a tree that the other side does not share."""
+        if tree_hash is None:
+            return {}
+        entries: Dict[str, str] = {}
+        for chunk_hash in self.chunks(tree_hash):
+            if chunk_hash not in shared:
+                entries.update(self.chunk(chunk_hash))
+        return entries
+
+    def uncompared(self, old_id: str, new_id: str) -> List[str]:
+        """Categories one snapshot has and the other failed to fetch."""
+        old, new = self.manifest(old_id), self.manifest(new_id)
+        return sorted(
+            (set(new["categories"]) & set(old.get("missing", [])))
+            | (set(old["categories"]) & set(new.get("missing", [])))
+        )
+
+    def diff(self, old_id: str, new_id: str) -> Dict[str, Dict[str, Any]]:
+        """Per-category added/removed/changed keys between two snapshots.
+
+        Categories whose tree hashes match are skipped without being read,
+        and within a category only chunks that differ are loaded. A category
+        whose entries are identical but reordered (e.g. moved policies) is
+        reported with ``reordered`` set and empty key lists. Categories
+        either snapshot failed to fetch are skipped (see ``uncompared``).
+        """
+        old = self.manifest(old_id)["categories"]
+        new = self.manifest(new_id)["categories"]
+        skipped = set(self.uncompared(old_id, new_id))
+        result: Dict[str, Dict[str, Any]] = {}
+
+        for category in sorted((set(old) | set(new)) - skipped):
+            old_tree, new_tree = old.get(category), new.get(category)
+            if old_tree == new_tree:
+                continue
+            shared = set(self.chunks(old_tree)) & set(self.chunks(new_tree)) if old_tree and new_tree else set()
+            old_entries = self._changed_entries(old_tree, shared)
+            new_entries = self._changed_entries(new_tree, shared)
+            changes = {
+                "added": [k for k in new_entries if k not in old_entries],
+                "removed": [k for k in old_entries if k not in new_entries],
+                "changed": [k for k in new_entries if k in old_entries and new_entries[k] != old_entries[k]],
+            }
+            changes["reordered"] = not any(changes.values())
+            # (old, new) entry hashes of changed keys, for changed_fields()
+            changes["versions"] = {k: (old_entries[k], new_entries[k]) for k in changes["changed"]}
+            result[category] = changes
+        return result
+
+    def changed_fields(self, old_hash: str, new_hash: str) -> List[str]:
+        """Top-level fields that differ between two versions of an entry."""
+        old_entry, new_entry = self.entry(old_hash), self.entry(new_hash)
+        return sorted(
+            field for field in set(old_entry) | set(new_entry)
+            if old_entry.get(field) != new_entry.get(field)
+        )
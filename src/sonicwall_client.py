@@ -7,7 +7,7 @@ import httpx
 import json
 import logging
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, List
 from urllib.parse import urljoin
 from httpx._auth import DigestAuth
 
@@ -29,6 +29,10 @@ class SonicWallClient:
         self.connection_failed = False
         self.failed_attempts = 0
         self.max_retries = 3
+        # Called as listener(method, path, data) after each successful config write
+        self.write_listeners: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
+        # Optional SpecValidators; config writes are checked against the API spec before sending
+        self.validators = None
         
     async def connect(self) -> bool:
         """Connect and test authentication with the SonicWall device."""
@@ -248,21 +252,60 @@ class SonicWallClient:
     async def post_config(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Post configuration to the specified path."""
         endpoint = f"config/{path}"
-        return await self._make_request("POST", endpoint, data)
+        await self.validators_ready()
+        self.validate("POST", endpoint, data)
+        result = await self._make_request("POST", endpoint, data)
+        self._notify_write("POST", path, data)
+        return result
     
     async def put_config(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Put configuration to the specified path."""
         endpoint = f"config/{path}"
-        return await self._make_request("PUT", endpoint, data)
+        await self.validators_ready()
+        self.validate("PUT", endpoint, data)
+        result = await self._make_request("PUT", endpoint, data)
+        self._notify_write("PUT", path, data)
+        return result
     
     async def delete_config(self, path: str) -> Dict[str, Any]:
         """Delete configuration at the specified path."""
         endpoint = f"config/{path}"
-        return await self._make_request("DELETE", endpoint)
+        await self.validators_ready()
+        self.validate("DELETE", endpoint)
+        result = await self._make_request("DELETE", endpoint)
+        self._notify_write("DELETE", path, None)
+        return result
     
-    async def commit_config(self) -> Dict[str, Any]:
+    def validate(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None):
+        """Check a config write against the API spec; raises ValidationError without sending anything."""
+        if self.validators is not None:
+            self.validators.validate(method, endpoint, data)
+    
+    async def validators_ready(self):
+        """Wait (off the event loop) for the API spec if it is still being parsed."""
+        if self.validators is not None:
+            await self.validators.ready()
+    
+    def _notify_write(self, method: str, path: str, data: Optional[Dict[str, Any]]):
+        """Tell write listeners (e.g. the config mirror) about an accepted change."""
+        for listener in self.write_listeners:
+            try:
+                listener(method, path, data)
+            except Exception as e:
+                logger.warning(f"Config write listener failed: {str(e)}")
+    
+    async def commit_config(self, best_effort: bool = False) -> Dict[str, Any]:
         """Commit pending configuration changes."""
-        return await self._make_request("POST", "config/pending")
+        endpoint = "config/pending/best-effort" if best_effort else "config/pending"
+        return await self._make_request("POST", endpoint)
+    
+    async def get_pending(self) -> Dict[str, Any]:
+        """Get pending (uncommitted) configuration changes."""
+        return await self._make_request("GET", "config/pending")
+    
+    async def discard_pending(self) -> Dict[str, Any]:
+        """Discard all pending (uncommitted) configuration changes."""
+        return await self._make_request("DELETE", "config/pending")
     
     async def get_status(self, path: str = "") -> Dict[str, Any]:
         """Get status information from the specified path."""
@@ -388,6 +431,55 @@ class SonicWallClient:
         """Make a generic GET request to any endpoint."""
         return await self._make_request("GET", endpoint)
     
+    async def post(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Make a generic POST request to any endpoint."""
+        await self.validators_ready()
+        self.validate("POST", endpoint, data)
+        result = await self._make_request("POST", endpoint, data)
+        self._notify_write("POST", endpoint, data)
+        return result
+    
+    async def put(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Make a generic PUT request to any endpoint."""
+        await self.validators_ready()
+        self.validate("PUT", endpoint, data)
+        result = await self._make_request("PUT", endpoint, data)
+        self._notify_write("PUT", endpoint, data)
+        return result
+    
+    async def delete(self, endpoint: str) -> Dict[str, Any]:
+        """Make a generic DELETE request to any endpoint."""
+        await self.validators_ready()
+        self.validate("DELETE", endpoint)
+        result = await self._make_request("DELETE", endpoint)
+        self._notify_write("DELETE", endpoint, None)
+        return result
+    
+    async def stream_to_file(self, endpoint: str, file_path: str, chunk_size: int = 1024 * 1024) -> Dict[str, Any]:
+        """Stream a GET response body straight to disk without buffering it in memory."""
+        if not self.client:
+            raise Exception("Client not connected. Call connect() first.")
+
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        headers = {}
+        auth = None
+        if self.bearer_token:
+            headers["Authorization"] = f"Bearer {self.bearer_token}"
+        else:
+            auth = self.auth
+
+        size = 0
+        async with self.client.stream("GET", url, headers=headers, auth=auth) as response:
+            response.raise_for_status()
+            with open(file_path, "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+            content_type = response.headers.get("content-type", "")
+
+        logger.debug(f"Streamed {size} bytes from {endpoint} to {file_path}")
+        return {"path": file_path, "size": size, "content_type": content_type}
+
     def reset_circuit_breaker(self):
         """Reset the circuit breaker to allow new connection attempts."""
         self.connection_failed = False
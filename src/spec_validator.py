@@ -0,0 +1,305 @@
+"""
+SonicWall Spec Validator
+Request body validators compiled from the SonicOS OpenAPI spec
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+try:
+    import yaml
+except ImportError:  # validation is skipped without PyYAML
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPEC_PATH = os.getenv(
+    "SONICWALL_API_SPEC",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "your_firewall_api.yml"),
+)
+
+# strict: reject invalid writes locally; warn: log and send anyway; off: no checks
+VALIDATION_MODES = ("strict", "warn", "off")
+
+# Errors reported per body before giving up
+MAX_ERRORS = 20
+
+# Compiled check: (value, location, errors) -> None, appending messages to errors
+Check = Callable[[Any, str, List[str]], None]
+
+_TYPES: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+}
+
+
+class ValidationError(ValueError):
+    """A write body that does not match the API spec; raised before any request is made."""
+
+    def __init__(self, method: str, endpoint: str, errors: List[str]):
+        self.method = method
+        self.endpoint = endpoint
+        self.errors = errors
+        shown = "; ".join(errors[:5])
+        more = f" (+{len(errors) - 5} more)" if len(errors) > 5 else ""
+        super().__init__(f"Invalid {method} {endpoint}: {shown}{more}")
+
+
+def _at(location: str, key: Any) -> str:
+    if isinstance(key, int):
+        return f"{location}[{key}]"
+    return f"{location}.{key}" if location else str(key)
+
+
+class _Compiler:
+    """Turns spec schemas into nested closures, compiling each $ref once per mode.
+
+    ``enforce_required`` is on for POST bodies only: PUT and PATCH carry
+    partial entries keyed by name or uuid.
+    """
+
+    def __init__(self, schemas: Dict[str, Any], enforce_required: bool):
+        self.schemas = schemas
+        self.enforce_required = enforce_required
+        self.refs: Dict[str, Check] = {}
+
+    def ref(self, ref: str) -> Check:
+        name = ref.rsplit("/", 1)[-1]
+        check = self.refs.get(name)
+        if check is None:
+            # Placeholder first so recursive schemas terminate
+            cell: List[Check] = []
+            self.refs[name] = lambda value, where, errors: cell[0](value, where, errors)
+            cell.append(self.compile(self.schemas.get(name) or {}))
+            check = self.refs[name] = cell[0]
+        return check
+
+    def resolve(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        while "$ref" in schema:
+            schema = self.schemas.get(schema["$ref"].rsplit("/", 1)[-1]) or {}
+        return schema
+
+    def compile(self, schema: Dict[str, Any], closed: bool = True) -> Check:
+        if "$ref" in schema:
+            return self.ref(schema["$ref"])
+
+        checks: List[Check] = []
+        nullable = schema.get("nullable", False)
+        kind = schema.get("type")
+        if kind in _TYPES:
+            is_type = _TYPES[kind]
+            checks.append(lambda v, where, errors: None if is_type(v) else
+                          errors.append(f"{where or 'body'}: expected {kind}, got {type(v).__name__}"))
+        if "enum" in schema:
+            allowed = tuple(schema["enum"])
+            checks.append(lambda v, where, errors: None if v in allowed else
+                          errors.append(f"{where}: {v!r} is not one of {', '.join(map(str, allowed))}"))
+        if "minimum" in schema or "maximum" in schema:
+            low, high = schema.get("minimum"), schema.get("maximum")
+
+            def bounds(v, where, errors):
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    if (low is not None and v < low) or (high is not None and v > high):
+                        errors.append(f"{where}: {v} is outside {low}..{high}")
+            checks.append(bounds)
+        if "minLength" in schema or "maxLength" in schema:
+            shortest, longest = schema.get("minLength", 0), schema.get("maxLength")
+
+            def length(v, where, errors):
+                if isinstance(v, str) and (len(v) < shortest or (longest is not None and len(v) > longest)):
+                    errors.append(f"{where}: length {len(v)} is outside {shortest}..{longest}")
+            checks.append(length)
+        if kind == "object" or "properties" in schema or "oneOf" in schema:
+            checks.append(self.compile_object(schema, closed))
+        if kind == "array" and isinstance(schema.get("items"), dict):
+            item = self.compile(schema["items"])
+
+            def items(v, where, errors):
+                if isinstance(v, list):
+                    for i, element in enumerate(v):
+                        if len(errors) >= MAX_ERRORS:
+                            return
+                        item(element, _at(where, i), errors)
+            checks.append(items)
+
+        def check(value, where, errors):
+            if value is None:
+                if not nullable:
+                    errors.append(f"{where or 'body'}: must not be null")
+                return
+            for step in checks:
+                step(value, where, errors)
+        return check
+
+    def compile_object(self, schema: Dict[str, Any], closed: bool) -> Check:
+        properties = {key: self.compile(sub) for key, sub in (schema.get("properties") or {}).items()}
+        enforce_required = self.enforce_required
+        required = tuple(schema.get("required") or ()) if enforce_required else ()
+
+        # oneOf alternatives are objects told apart by which of their keys are present
+        alternatives: List[Tuple[frozenset, Check]] = []
+        for option in schema.get("oneOf") or ():
+            keys = frozenset((self.resolve(option).get("properties") or {}).keys())
+            alternatives.append((keys, self.compile(self.resolve(option), closed=False)))
+        known = set(properties).union(*(keys for keys, _ in alternatives))
+        # Objects without declared properties are free-form
+        closed = closed and bool(known)
+
+        def check(value, where, errors):
+            if not isinstance(value, dict):
+                return
+            for key in required:
+                if key not in value:
+                    errors.append(f"{_at(where, key)}: required")
+            for key, item in value.items():
+                sub = properties.get(key)
+                if sub is not None:
+                    sub(item, _at(where, key), errors)
+                elif closed and key not in known:
+                    errors.append(f"{_at(where, key)}: unknown field")
+            if alternatives and value:
+                chosen = [(keys, alt) for keys, alt in alternatives if not keys.isdisjoint(value)]
+                if len(chosen) > 1:
+                    names = sorted(set().union(*(keys & value.keys() for keys, _ in chosen)))
+                    errors.append(f"{where or 'body'}: only one of {', '.join(names)} may be set")
+                elif chosen:
+                    chosen[0][1](value, where, errors)
+                elif enforce_required:
+                    options = sorted(set().union(*(keys for keys, _ in alternatives)))
+                    errors.append(f"{where or 'body'}: expected one of {', '.join(options)}")
+        return check
+
+
+class SpecValidators:
+    """Per-operation request body validators for the SonicOS API spec.
+
+    The spec is parsed once (``load``, safe to call from a worker thread)
+    and each operation's body schema is compiled to closures on first use,
+    so checking a body costs a walk over the body, not the schema.
+    """
+
+    def __init__(self, spec_path: str = DEFAULT_SPEC_PATH, mode: Optional[str] = None):
+        mode = (mode or os.getenv("SONICWALL_VALIDATE_WRITES", "strict")).lower()
+        if mode not in VALIDATION_MODES:
+            raise ValueError(f"Unknown validation mode '{mode}' (expected one of: {', '.join(VALIDATION_MODES)})")
+        self.spec_path = spec_path
+        self.mode = mode
+        self.available = yaml is not None and mode != "off"
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._bodies: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        self._literal: Dict[str, Dict[str, str]] = {}
+        self._templates: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        self._compilers: Dict[bool, _Compiler] = {}
+        self._validators: Dict[Tuple[str, str], Check] = {}
+        self._routes: Dict[Tuple[str, str], Optional[str]] = {}
+        if yaml is None and mode != "off":
+            logger.warning("PyYAML is not installed; config writes will not be validated locally")
+
+    def load(self):
+        """Parse the spec and index its operations (once)."""
+        if self._loaded or not self.available:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            try:
+                with open(self.spec_path, "r", encoding="utf-8") as f:
+                    spec = yaml.load(f, Loader=loader)
+            except (OSError, yaml.YAMLError) as e:
+                logger.warning(f"Could not load API spec {self.spec_path}; config writes will not be validated: {e}")
+                self.available = False
+                return
+            schemas = (spec.get("components") or {}).get("schemas") or {}
+            for path, item in (spec.get("paths") or {}).items():
+                for method, operation in item.items():
+                    method = method.upper()
+                    if method not in ("POST", "PUT", "PATCH", "DELETE") or not isinstance(operation, dict):
+                        continue
+                    body = ((operation.get("requestBody") or {}).get("content") or {}).get("application/json")
+                    self._bodies[(method, path)] = body.get("schema") if body else None
+                    if "{" in path:
+                        segments = tuple(path.strip("/").split("/"))
+                        self._templates.setdefault(method, []).append((segments, path))
+                    else:
+                        self._literal.setdefault(method, {})[path.strip("/")] = path
+            self._compilers = {flag: _Compiler(schemas, flag) for flag in (True, False)}
+            self._loaded = True
+            logger.info(f"Loaded API spec with {len(self._bodies)} write operations")
+
+    async def ready(self):
+        """Finish loading the spec in a worker thread, so a write arriving mid-parse does not block the event loop."""
+        if self.available and not self._loaded:
+            await asyncio.to_thread(self.load)
+
+    def operation(self, method: str, endpoint: str) -> Optional[str]:
+        """Spec path template for a concrete endpoint (e.g. "address-objects/ipv4/name/x")."""
+        key = (method, endpoint)
+        if key in self._routes:
+            return self._routes[key]
+        path = endpoint.split("?", 1)[0].strip("/")
+        candidates = [path]
+        if path.startswith("config/"):
+            candidates.append(path[len("config/"):])
+        found = None
+        for candidate in candidates:
+            found = self._literal.get(method, {}).get(candidate)
+            if found:
+                break
+            segments = candidate.split("/")
+            for template, spec_path in self._templates.get(method, ()):
+                if len(template) == len(segments) and all(
+                        t == s or t.startswith("{") for t, s in zip(template, segments)):
+                    found = spec_path
+                    break
+            if found:
+                break
+        if len(self._routes) > 4096:
+            self._routes.clear()
+        self._routes[key] = found
+        return found
+
+    def validator(self, method: str, spec_path: str) -> Optional[Check]:
+        """Compiled body check for one operation, cached."""
+        key = (method, spec_path)
+        check = self._validators.get(key)
+        if check is None:
+            schema = self._bodies.get(key)
+            if schema is None:
+                return None
+            check = self._compilers[method == "POST"].compile(schema)
+            self._validators[key] = check
+        return check
+
+    def check(self, method: str, endpoint: str, body: Any = None) -> List[str]:
+        """Problems with a write, or [] if it matches the spec."""
+        if not self.available:
+            return []
+        self.load()
+        method = method.upper()
+        spec_path = self.operation(method, endpoint)
+        if spec_path is None:
+            return [f"no {method} operation for '{endpoint}' in the API spec"]
+        check = self.validator(method, spec_path)
+        errors: List[str] = []
+        if check is not None and body is not None:
+            check(body, "", errors)
+        return errors[:MAX_ERRORS]
+
+    def validate(self, method: str, endpoint: str, body: Any = None):
+        """Raise ValidationError for an invalid write (or log it in warn mode)."""
+        errors = self.check(method, endpoint, body)
+        if not errors:
+            return
+        if self.mode == "warn":
+            logger.warning(str(ValidationError(method.upper(), endpoint, errors)))
+            return
+        raise ValidationError(method.upper(), endpoint, errors)
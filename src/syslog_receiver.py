@@ -0,0 +1,234 @@
+"""
+SonicWall Syslog Receiver
+UDP/TCP syslog listener that feeds raw SonicWall events into the log store in batches
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from columnar import Compactor
+from log_store import LogStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 514
+
+# Seconds between batch flushes to the store
+FLUSH_INTERVAL = 0.1
+
+# Kernel receive buffer requested for the UDP socket, so bursts queue instead of being dropped
+UDP_RECEIVE_BUFFER = 8 * 1024 * 1024
+
+# Longest event kept; anything longer is cut here
+MAX_EVENT = 16 * 1024
+
+# Datagrams read per wakeup before yielding to the event loop
+UDP_DRAIN = 512
+
+
+def parse_listeners(spec: str) -> List[Tuple[str, str, int]]:
+    """(protocol, host, port) from "514", "udp:5514,tcp:0.0.0.0:6514" or "1" (UDP 514)."""
+    spec = spec.strip()
+    if spec.lower() in ("1", "true", "yes"):
+        return [("udp", "0.0.0.0", DEFAULT_PORT)]
+    listeners = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        protocol = "udp"
+        if item.split(":", 1)[0].lower() in ("udp", "tcp"):
+            protocol, _, item = item.partition(":")
+            protocol = protocol.lower()
+        host, _, port = item.rpartition(":")
+        if not port.isdigit():
+            raise ValueError(f"Invalid syslog listener '{item}' (expected [udp:|tcp:][host:]port)")
+        listeners.append((protocol, host or "0.0.0.0", int(port)))
+    return listeners
+
+
+def _clean(line: bytes) -> bytes:
+    line = line.rstrip(b"\r\n\x00 ")
+    return line[:MAX_EVENT]
+
+
+class _TcpProtocol(asyncio.Protocol):
+    """One TCP sender, framed by octet counting ("LEN <pri>...") or by newlines (RFC 6587)."""
+
+    def __init__(self, receiver: "SyslogReceiver"):
+        self.receiver = receiver
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.receiver.connections += 1
+
+    def connection_lost(self, exc):
+        self.receiver.connections -= 1
+        if self.buffer:
+            self._emit(bytes(self.buffer))
+            self.buffer.clear()
+
+    def _emit(self, line: bytes):
+        line = _clean(line)
+        if line:
+            self.receiver.received += 1
+            self.receiver.store.add(line, time.time())
+
+    def data_received(self, data: bytes):
+        buffer = self.buffer
+        buffer += data
+        start = 0
+        while start < len(buffer):
+            if buffer[start:start + 1].isdigit():
+                space = buffer.find(b" ", start, start + 8)
+                if space > start and buffer[start:space].isdigit():
+                    end = space + 1 + int(buffer[start:space])
+                    if end > len(buffer):
+                        break
+                    self._emit(bytes(buffer[space + 1:end]))
+                    start = end
+                    continue
+            newline = buffer.find(b"\n", start)
+            if newline < 0:
+                if len(buffer) - start > MAX_EVENT:
+                    self._emit(bytes(buffer[start:]))
+                    start = len(buffer)
+                break
+            self._emit(bytes(buffer[start:newline]))
+            start = newline + 1
+        del buffer[:start]
+
+
+class SyslogReceiver:
+    """Syslog listeners writing into a ``LogStore``.
+
+    The receive path only timestamps each event and queues the raw bytes;
+    indexing and disk writes happen in batches on a timer (or when the
+    queue fills), so a burst costs one file write per batch rather than
+    one per event. Finished hours are converted to column files in a
+    worker thread, and a compactor merges days and enforces retention.
+    """
+
+    def __init__(self, store: LogStore, listeners: List[Tuple[str, str, int]],
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.store = store
+        self.listeners = listeners
+        self.flush_interval = flush_interval
+        self.received = 0
+        self.connections = 0
+        self.started_at: Optional[float] = None
+        self._sockets: List[socket.socket] = []
+        self._servers: List[asyncio.AbstractServer] = []
+        self.compactor = Compactor(store.compact, name="syslog segments")
+        self._task: Optional[asyncio.Task] = None
+        self._sealing: Optional[asyncio.Task] = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.store.open()
+        for protocol, host, port in self.listeners:
+            if protocol == "udp":
+                sock = self._udp_socket(host, port)
+                # Read straight off the socket: the datagram transport does one recvfrom per
+                # wakeup, while draining everything queued per wakeup keeps up with bursts
+                loop.add_reader(sock.fileno(), self._drain, sock)
+                self._sockets.append(sock)
+            else:
+                self._servers.append(await loop.create_server(lambda: _TcpProtocol(self), host, port))
+        self.started_at = time.time()
+        self._task = asyncio.create_task(self.run())
+        self.compactor.start()
+
+    @staticmethod
+    def _udp_socket(host: str, port: int) -> socket.socket:
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+        except OSError:
+            pass
+        # Linux reports twice the size it grants; the grant is capped by net.core.rmem_max
+        granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if granted < UDP_RECEIVE_BUFFER:
+            logger.info(f"Syslog UDP receive buffer is {granted // 1024} KiB; raise net.core.rmem_max "
+                        f"to {UDP_RECEIVE_BUFFER // 1024} KiB or more to absorb bursts")
+        sock.setblocking(False)
+        sock.bind((host, port))
+        return sock
+
+    def _drain(self, sock: socket.socket):
+        """Read every queued datagram (up to ``UDP_DRAIN``); one event per datagram, or one per line."""
+        add = self.store.add
+        now = time.time()
+        received = 0
+        while received < UDP_DRAIN:
+            try:
+                data = sock.recv(MAX_EVENT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                logger.debug(f"Syslog receive failed: {str(e)}")
+                break
+            received += 1
+            # Usually one event per datagram; only split when a newline appears before the end
+            if data.find(b"\n", 0, len(data) - 1) >= 0:
+                for line in data.split(b"\n"):
+                    line = _clean(line)
+                    if line:
+                        add(line, now)
+            else:
+                line = _clean(data)
+                if line:
+                    add(line, now)
+        self.received += received
+
+    async def run(self):
+        """Flush queued events on the configured interval."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.store.flush()
+                if self.store.sealing and (self._sealing is None or self._sealing.done()):
+                    self._sealing = asyncio.create_task(self._seal())
+            except Exception as e:
+                logger.warning(f"Writing syslog events failed: {str(e)}")
+
+    async def _seal(self):
+        """Convert finished hours to column files without blocking the receive path."""
+        try:
+            await asyncio.to_thread(self.store.seal_pending)
+        except Exception as e:
+            logger.warning(f"Converting syslog segments failed: {str(e)}")
+
+    async def stop(self):
+        loop = asyncio.get_running_loop()
+        for sock in self._sockets:
+            loop.remove_reader(sock.fileno())
+            sock.close()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._sockets, self._servers = [], []
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.compactor.stop()
+        if self._sealing is not None:
+            # Let a running conversion finish; close() converts whatever is left
+            await self._sealing
+            self._sealing = None
+        self.store.close()
+
+    def status(self) -> Dict[str, Any]:
+        uptime = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "listeners": [f"{protocol}:{host}:{port}" for protocol, host, port in self.listeners],
+            "received": self.received,
+            "stored": self.store.events,
+            "rate": self.received / uptime if uptime > 0 else 0.0,
+            "tcp_connections": self.connections,
+        }
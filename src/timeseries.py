@@ -0,0 +1,272 @@
+"""
+SonicWall Time Series
+Fixed-size ring buffers of reporting samples and their window summaries
+"""
+
+import logging
+import math
+import re
+from array import array
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Dict, Any, Iterator, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cumulative fields: summarised as rates, not levels
+DEFAULT_COUNTER_FIELDS = re.compile(r"(bytes|packets|pkts|errors|drops|dropped|hits)$|^usage$")
+
+# Row fields that name the entity a row describes, in order of preference
+ENTITY_FIELDS = ("interface_name", "name", "uuid", "id", "zone", "ip")
+
+# Numeric fields that are identifiers or timestamps rather than measurements
+SKIP_FIELDS = re.compile(r"^(id|priority|index|time_.*|.*_time)$")
+
+# Interface statistics counters are 32-bit on some platforms
+COUNTER_WRAP = 2.0 ** 32
+
+# Upper bound on distinct series, so an endpoint listing thousands of entities cannot exhaust memory
+MAX_SERIES = 50_000
+
+
+def counter_delta(prev: float, cur: float) -> float:
+    """Increase of a cumulative counter between two samples.
+
+    A drop from the upper half of the 32-bit range is a wrap; any other
+    drop is a reset (reboot, cleared statistics), so the new value is the
+    amount counted since.
+    """
+    delta = cur - prev
+    if delta < 0:
+        return delta + COUNTER_WRAP if COUNTER_WRAP / 2 <= prev < COUNTER_WRAP else cur
+    return delta
+
+
+def to_number(value: Any) -> Optional[float]:
+    """Float for numbers and numeric strings ("1234", "12%"); None otherwise."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip().rstrip("%").replace(",", "")
+        if text and (text[0].isdigit() or text[0] in "-."):
+            try:
+                return float(text)
+            except ValueError:
+                return None
+    return None
+
+
+def _entity(row: Dict[str, Any], position: int) -> str:
+    for field in ENTITY_FIELDS:
+        value = row.get(field)
+        if value not in (None, ""):
+            return str(value)
+    return str(position)
+
+
+def _fields(row: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """Numeric measurements in a row, nested objects flattened with dots."""
+    for field, value in row.items():
+        if isinstance(value, dict):
+            yield from _fields(value, f"{prefix}{field}.")
+            continue
+        if SKIP_FIELDS.match(field):
+            continue
+        number = to_number(value)
+        if number is not None:
+            yield f"{prefix}{field}", number
+
+
+def extract_samples(source: str, response: Any) -> Iterator[Tuple[str, float]]:
+    """(metric, value) pairs from a reporting response.
+
+    Lists give "<source>/<entity>/<field>" per row plus "<source>/count";
+    objects give "<source>/<field>". A list wrapped in a single-key object
+    (e.g. {"sessions": [...]}) is treated as the list.
+    """
+    if isinstance(response, dict):
+        lists = [v for v in response.values() if isinstance(v, list)]
+        if len(response) == 1 and lists:
+            response = lists[0]
+    if isinstance(response, list):
+        yield f"{source}/count", float(len(response))
+        for position, row in enumerate(response):
+            if isinstance(row, dict):
+                entity = _entity(row, position)
+                for field, value in _fields(row):
+                    yield f"{source}/{entity}/{field}", value
+    elif isinstance(response, dict):
+        for field, value in _fields(response):
+            yield f"{source}/{field}", value
+
+
+class RingBuffer:
+    """Timestamps and values in two preallocated ``array('d')`` rings.
+
+    Appending overwrites the oldest sample once full, so memory per series
+    is fixed at 16 bytes per slot no matter how long the server runs.
+    """
+
+    __slots__ = ("capacity", "times", "values", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(2, int(capacity))
+        self.times = array("d", bytes(8 * self.capacity))
+        self.values = array("d", bytes(8 * self.capacity))
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, value: float):
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        if not self.count:
+            return None
+        slot = (self.head - 1) % self.capacity
+        return self.times[slot], self.values[slot]
+
+    def window(self, since: float = 0.0) -> Tuple[array, array]:
+        """Samples at or after ``since``, oldest first, as new arrays."""
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            times = self.times[start:start + self.count]
+            values = self.values[start:start + self.count]
+        else:
+            times = self.times[start:] + self.times[:self.head]
+            values = self.values[start:] + self.values[:self.head]
+        if since and times and times[0] < since:
+            # Timestamps are ascending; bisect for the first sample in the window
+            lo, hi = 0, len(times)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[mid] < since:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            times, values = times[lo:], values[lo:]
+        return times, values
+
+
+class Series:
+    __slots__ = ("metric", "counter", "ring")
+
+    def __init__(self, metric: str, counter: bool, capacity: int):
+        self.metric = metric
+        self.counter = counter
+        self.ring = RingBuffer(capacity)
+
+
+class MetricStore:
+    """All polled series, keyed by metric name ("interfaces/X1/rx_bytes").
+
+    Series are kept in update order; once ``MAX_SERIES`` is reached, the
+    least recently updated series makes room for a new one, so entities
+    that stopped reporting give way to current ones.
+    """
+
+    def __init__(self):
+        self.series: Dict[str, Series] = OrderedDict()
+        self.evicted = 0
+        self._full_warned = False
+
+    def __len__(self) -> int:
+        return len(self.series)
+
+    def record(self, source: str, timestamp: float, response: Any, capacity: int,
+               counters: Pattern = DEFAULT_COUNTER_FIELDS) -> int:
+        """Append one poll's samples; returns how many were stored."""
+        stored = 0
+        for metric, value in extract_samples(source, response):
+            series = self.series.get(metric)
+            if series is None:
+                if len(self.series) >= MAX_SERIES:
+                    if not self._full_warned:
+                        logger.warning(f"Metric store is full ({MAX_SERIES} series); "
+                                       "evicting the least recently updated series")
+                        self._full_warned = True
+                    self.series.popitem(last=False)
+                    self.evicted += 1
+                field = metric.rsplit("/", 1)[-1]
+                series = self.series[metric] = Series(metric, bool(counters.search(field)), capacity)
+            else:
+                self.series.move_to_end(metric)
+            series.ring.append(timestamp, value)
+            stored += 1
+        return stored
+
+    def match(self, pattern: str = "*") -> List[Series]:
+        """Series whose metric name matches a glob ("interfaces/X1/*", "*/rx_bytes")."""
+        if pattern in self.series:
+            return [self.series[pattern]]
+        return [s for name, s in sorted(self.series.items()) if fnmatchcase(name, pattern)]
+
+
+def summarize(series: Series, since: float = 0.0) -> Optional[Dict[str, Any]]:
+    """Window statistics for one series, or None if it has no samples in the window.
+
+    Counters report per-second rates: average over the window, the last
+    interval and the peak interval. A counter that goes down has wrapped
+    or been reset (see ``counter_delta``). Gauges report last, min, mean,
+    max and a least-squares trend per minute.
+    """
+    times, values = series.ring.window(since)
+    n = len(times)
+    if not n:
+        return None
+    summary: Dict[str, Any] = {
+        "metric": series.metric,
+        "kind": "counter" if series.counter else "gauge",
+        "samples": n,
+        "span": times[-1] - times[0],
+    }
+    if series.counter:
+        total = 0.0
+        peak = last_rate = None
+        peak_at = None
+        for i in range(1, n):
+            dt = times[i] - times[i - 1]
+            if dt <= 0:
+                continue
+            delta = counter_delta(values[i - 1], values[i])
+            total += delta
+            last_rate = delta / dt
+            if peak is None or last_rate > peak:
+                peak, peak_at = last_rate, times[i]
+        span = summary["span"]
+        summary.update({
+            "last": values[-1],
+            "rate": total / span if span > 0 else None,
+            "last_rate": last_rate,
+            "peak_rate": peak,
+            "peak_at": peak_at,
+        })
+        return summary
+
+    mean = math.fsum(values) / n
+    peak_index = max(range(n), key=values.__getitem__)
+    trend = None
+    if n > 1:
+        t0 = times[0]
+        mean_t = math.fsum(t - t0 for t in times) / n
+        var_t = math.fsum((t - t0 - mean_t) ** 2 for t in times)
+        if var_t > 0:
+            cov = math.fsum((t - t0 - mean_t) * (v - mean) for t, v in zip(times, values))
+            trend = cov / var_t * 60
+    summary.update({
+        "last": values[-1],
+        "min": min(values),
+        "mean": mean,
+        "max": values[peak_index],
+        "peak_at": times[peak_index],
+        "trend_per_min": trend,
+    })
+    return summary
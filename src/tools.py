@@ -3,92 +3,120 @@ SonicWall MCP Tools
 Implementation of various SonicWall management tools
 """
 
-import json
+import asyncio
+import fnmatch
+import ipaddress
 import logging
-from typing import Dict, Any, Optional, List
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
 from sonicwall_client import SonicWallClient
+from config_loader import CONFIG_ENDPOINTS, fetch_config
+from config_model import ConfigModel, Selector
+from dependency_graph import DependencyGraph
+from nat_engine import NatEngine
+from route_engine import RouteEngine
+from snapshot_store import SnapshotStore
+from export_archive import ExportArchive, export_filename, export_to_archive, list_archives
+from query import Page, Query, VIEWS
+from renderer import render_page, render_data
+from change_set import ChangeSet, bulk_body
+from bulk_import import import_objects as run_import
+from config_query import compile_query
+import diagnostics
+from reporting_poller import ReportingPoller
+from timeseries import summarize
+from hit_counts import HIT_SOURCES, HitCountTracker
+from metric_archive import MetricArchive
+from traffic_analytics import DEFAULT_Z_THRESHOLD, analyse as analyse_traffic
+from heavy_hitters import HeavyHitterTracker
+from log_store import parse_event
+from syslog_receiver import SyslogReceiver
+from capture_flows import summarize_file
+from scheduler import FairScheduler
 
 logger = logging.getLogger(__name__)
 
-async def list_firewall_rules(client: SonicWallClient, zone_from: Optional[str] = None, zone_to: Optional[str] = None) -> str:
+async def _load_category(client: SonicWallClient, category: str, model: Optional[ConfigModel] = None) -> ConfigModel:
+    """Fetch one config category into a new model, or reuse a shared model that already has it (e.g. the mirror)."""
+    if model is not None and category in model.categories:
+        return model
+    model = model if model is not None else ConfigModel()
+    path, _ = CONFIG_ENDPOINTS[category]
+    result = await client.get(path)
+    model.ingest_response(category, result)
+    return model
+
+_UUID = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+def _object_ref(value: Optional[str], default: str = "any") -> Dict[str, Any]:
+    """Object reference for a rule field: {"name": value}, or {default: True} for any/original."""
+    if not value or value.lower() in ("any", "original"):
+        return {default: True}
+    return {"name": value}
+
+def _selector_text(sel: Selector, default: str = "Any") -> str:
+    """Display form of an object selector from the config model."""
+    return sel[1] if sel else default
+
+async def list_firewall_rules(client: SonicWallClient, zone_from: Optional[str] = None, zone_to: Optional[str] = None,
+                              model: Optional[ConfigModel] = None, enabled_only: bool = False,
+                              query: Optional[Query] = None, fmt: str = "list",
+                              max_bytes: Optional[int] = None) -> str:
     """List firewall access rules, optionally filtered by zones."""
     try:
         # Get access rules
-        result = await client.get_config("access-rule/ipv4")
+        model = await _load_category(client, "access_rules_ipv4", model)
+        access_rules = [p for p in model.policies["access_rule"] if p.family == "ipv4"]
         
-        if not result:
+        if not access_rules:
             return "No firewall rules found."
         
-        # Parse and format the rules
-        rules = []
-        access_rules = result.get("access-rule", {}).get("ipv4", [])
-        
-        if not isinstance(access_rules, list):
-            access_rules = [access_rules] if access_rules else []
-        
-        for rule in access_rules:
-            rule_info = {
-                "name": rule.get("name", "Unnamed"),
-                "from": rule.get("from", "Any"),
-                "to": rule.get("to", "Any"), 
-                "source": rule.get("source", {}).get("any", "Any"),
-                "destination": rule.get("destination", {}).get("any", "Any"),
-                "service": rule.get("service", {}).get("any", "Any"),
-                "action": rule.get("action", "Unknown"),
-                "enabled": rule.get("enable", False)
-            }
-            
-            # Apply zone filters if specified
-            if zone_from and rule_info["from"] != zone_from:
-                continue
-            if zone_to and rule_info["to"] != zone_to:
-                continue
-                
-            rules.append(rule_info)
+        # Zone and state filters become query predicates
+        query = query or Query()
+        if zone_from:
+            query.filter(f"from={zone_from}")
+        if zone_to:
+            query.filter(f"to={zone_to}")
+        if enabled_only:
+            query.filter("enabled=true")
         
-        if not rules:
+        page = query.run(VIEWS["firewall_rules"], access_rules)
+        if not page.total:
             return "No firewall rules match the specified criteria."
         
-        # Format output
-        output = "Firewall Rules:\n"
-        output += "=" * 50 + "\n"
-        
-        for i, rule in enumerate(rules, 1):
-            output += f"\n{i}. {rule['name']}\n"
-            output += f"   From: {rule['from']} → To: {rule['to']}\n"
-            output += f"   Source: {rule['source']}\n"
-            output += f"   Destination: {rule['destination']}\n"
-            output += f"   Service: {rule['service']}\n"
-            output += f"   Action: {rule['action']}\n"
-            output += f"   Enabled: {rule['enabled']}\n"
-        
-        return output
+        return render_page("Firewall Rules", page, fmt, max_bytes)
         
     except Exception as e:
         logger.error(f"Failed to list firewall rules: {str(e)}")
         return f"Error listing firewall rules: {str(e)}"
 
 async def create_firewall_rule(client: SonicWallClient, name: str, from_zone: str, to_zone: str, 
-                             source: str, destination: str, service: str, action: str) -> str:
-    """Create a new firewall access rule."""
-    try:
-        rule_data = {
-            "access-rule": {
-                "ipv4": {
-                    "name": name,
-                    "from": from_zone,
-                    "to": to_zone,
-                    "source": {"any": True} if source.lower() == "any" else {"address": source},
-                    "destination": {"any": True} if destination.lower() == "any" else {"address": destination},
-                    "service": {"any": True} if service.lower() == "any" else {"service": service},
-                    "action": action,
-                    "enable": True
-                }
-            }
+                             source: str, destination: str, service: str, action: str,
+                             change_set: Optional[ChangeSet] = None) -> str:
+    """Create a new firewall access rule (or stage it in ``change_set``)."""
+    try:
+        rule = {
+            "name": name,
+            "from": from_zone,
+            "to": to_zone,
+            "source": {"address": _object_ref(source), "port": {"any": True}},
+            "destination": {"address": _object_ref(destination)},
+            "service": _object_ref(service),
+            "action": action,
+            "schedule": {"always_on": True},
+            "enable": True
         }
         
+        if change_set is not None:
+            change_set.add("access_rules_ipv4", rule)
+            return f"Staged firewall rule '{name}' ({len(change_set)} changes staged)"
+        
         # Create the rule
-        result = await client.post_config("access-rule/ipv4", rule_data)
+        path, _ = CONFIG_ENDPOINTS["access_rules_ipv4"]
+        result = await client.post(path, bulk_body("access_rules_ipv4", [rule]))
         
         # Commit the changes
         await client.commit_config()
@@ -99,11 +127,27 @@ async def create_firewall_rule(client: SonicWallClient, name: str, from_zone: st
         logger.error(f"Failed to create firewall rule: {str(e)}")
         return f"Error creating firewall rule: {str(e)}"
 
-async def delete_firewall_rule(client: SonicWallClient, rule_id: str) -> str:
-    """Delete a firewall access rule by ID or name."""
+async def delete_firewall_rule(client: SonicWallClient, rule_id: str,
+                             change_set: Optional[ChangeSet] = None) -> str:
+    """Delete a firewall access rule by UUID or name (or stage the delete in ``change_set``)."""
     try:
-        # Try to delete by name first
-        result = await client.delete_config(f"access-rule/ipv4/name/{rule_id}")
+        # Access rules can only be deleted by UUID; look names up first
+        uuid = rule_id
+        if not _UUID.match(rule_id):
+            model = await _load_category(client, "access_rules_ipv4")
+            matches = [p.uuid for p in model.policies["access_rule"] if p.name == rule_id and p.uuid]
+            if not matches:
+                return f"Error: No firewall rule named '{rule_id}'"
+            if len(matches) > 1:
+                return f"Error: {len(matches)} firewall rules are named '{rule_id}'; delete by UUID instead"
+            uuid = matches[0]
+        
+        if change_set is not None:
+            change_set.delete("access_rules_ipv4", uuid, by="uuid")
+            return f"Staged delete of firewall rule '{rule_id}' ({len(change_set)} changes staged)"
+        
+        path, _ = CONFIG_ENDPOINTS["access_rules_ipv4"]
+        result = await client.delete(f"{path}/uuid/{uuid}")
         
         # Commit the changes
         await client.commit_config()
@@ -114,38 +158,29 @@ async def delete_firewall_rule(client: SonicWallClient, rule_id: str) -> str:
         logger.error(f"Failed to delete firewall rule: {str(e)}")
         return f"Error deleting firewall rule: {str(e)}"
 
-async def get_interface_info(client: SonicWallClient, interface_name: Optional[str] = None) -> str:
+async def get_interface_info(client: SonicWallClient, interface_name: Optional[str] = None,
+                             model: Optional[ConfigModel] = None,
+                             query: Optional[Query] = None, fmt: str = "list",
+                             max_bytes: Optional[int] = None) -> str:
     """Get network interface information."""
     try:
-        if interface_name:
-            result = await client.get(f"interfaces/ipv4/{interface_name}")
-        else:
-            result = await client.get("interfaces/ipv4")
-        
-        if not result:
-            return "No interface information found."
-        
-        # Format the interface information
-        output = "Network Interfaces:\n"
-        output += "=" * 30 + "\n"
-        
-        interfaces = result.get("interfaces", [])
-        if not isinstance(interfaces, list):
-            interfaces = [interfaces] if interfaces else []
-        
-        for iface_container in interfaces:
-            iface = iface_container.get("ipv4", {})
-            assignment = iface.get("ip_assignment", {})
-            mode = assignment.get("mode", {})
-            static_config = mode.get("static", {})
+        if model is None or "interfaces_ipv4" not in model.categories or interface_name:
+            if interface_name:
+                result = await client.get(f"interfaces/ipv4/{interface_name}")
+            else:
+                result = await client.get("interfaces/ipv4")
             
-            output += f"\nInterface: {iface.get('name', 'Unknown')}\n"
-            output += f"  Zone: {assignment.get('zone', 'Unknown')}\n"
-            output += f"  IP: {static_config.get('ip', 'Unknown')}\n"
-            output += f"  Netmask: {static_config.get('netmask', 'Unknown')}\n"
-            output += f"  Admin Status: {iface.get('admin', 'Unknown')}\n"
+            if not result:
+                return "No interface information found."
+            
+            model = ConfigModel()
+            model.ingest_response("interfaces_ipv4", result)
         
-        return output
+        page = (query or Query()).run(VIEWS["interfaces"], model.interfaces.values())
+        if not page.total:
+            return "No interfaces match the specified criteria."
+        
+        return render_page("Network Interfaces", page, fmt, max_bytes, 30)
         
     except Exception as e:
         logger.error(f"Failed to get interface info: {str(e)}")
@@ -178,30 +213,22 @@ async def get_system_status(client: SonicWallClient) -> str:
         logger.error(f"Failed to get system status: {str(e)}")
         return f"Error getting system status: {str(e)}"
 
-async def list_nat_policies(client: SonicWallClient) -> str:
+async def list_nat_policies(client: SonicWallClient, model: Optional[ConfigModel] = None,
+                            query: Optional[Query] = None, fmt: str = "list",
+                            max_bytes: Optional[int] = None) -> str:
     """List NAT policies."""
     try:
-        result = await client.get_config("nat-policy/ipv4")
+        model = await _load_category(client, "nat_policies_ipv4", model)
+        policies = [p for p in model.policies["nat_policy"] if p.family == "ipv4"]
         
-        if not result:
+        if not policies:
             return "No NAT policies found."
         
-        # Format NAT policies
-        output = "NAT Policies:\n"
-        output += "=" * 15 + "\n"
-        
-        policies = result.get("nat-policy", {}).get("ipv4", [])
-        if not isinstance(policies, list):
-            policies = [policies] if policies else []
+        page = (query or Query()).run(VIEWS["nat_policies"], policies)
+        if not page.total:
+            return "No NAT policies match the specified criteria."
         
-        for i, policy in enumerate(policies, 1):
-            output += f"\n{i}. {policy.get('name', 'Unnamed')}\n"
-            output += f"   Original Source: {policy.get('original-source', 'Any')}\n"
-            output += f"   Translated Source: {policy.get('translated-source', 'Any')}\n"
-            output += f"   Original Destination: {policy.get('original-destination', 'Any')}\n"
-            output += f"   Translated Destination: {policy.get('translated-destination', 'Any')}\n"
-        
-        return output
+        return render_page("NAT Policies", page, fmt, max_bytes, 15)
         
     except Exception as e:
         logger.error(f"Failed to list NAT policies: {str(e)}")
@@ -211,22 +238,28 @@ async def create_nat_policy(client: SonicWallClient, name: str,
                           original_source: Optional[str] = None,
                           translated_source: Optional[str] = None,
                           original_destination: Optional[str] = None,
-                          translated_destination: Optional[str] = None) -> str:
-    """Create a new NAT policy."""
-    try:
-        policy_data = {
-            "nat-policy": {
-                "ipv4": {
-                    "name": name,
-                    "original-source": original_source or "any",
-                    "translated-source": translated_source or "any",
-                    "original-destination": original_destination or "any",
-                    "translated-destination": translated_destination or "any"
-                }
-            }
+                          translated_destination: Optional[str] = None,
+                          change_set: Optional[ChangeSet] = None) -> str:
+    """Create a new NAT policy (or stage it in ``change_set``)."""
+    try:
+        policy = {
+            "name": name,
+            "inbound": "any",
+            "outbound": "any",
+            "source": _object_ref(original_source),
+            "translated_source": _object_ref(translated_source, "original"),
+            "destination": _object_ref(original_destination),
+            "translated_destination": _object_ref(translated_destination, "original"),
+            "service": {"any": True},
+            "translated_service": {"original": True}
         }
         
-        result = await client.post_config("nat-policy/ipv4", policy_data)
+        if change_set is not None:
+            change_set.add("nat_policies_ipv4", policy)
+            return f"Staged NAT policy '{name}' ({len(change_set)} changes staged)"
+        
+        path, _ = CONFIG_ENDPOINTS["nat_policies_ipv4"]
+        result = await client.post(path, bulk_body("nat_policies_ipv4", [policy]))
         await client.commit_config()
         
         return f"Successfully created NAT policy '{name}'"
@@ -235,78 +268,63 @@ async def create_nat_policy(client: SonicWallClient, name: str,
         logger.error(f"Failed to create NAT policy: {str(e)}")
         return f"Error creating NAT policy: {str(e)}"
 
-async def list_address_objects(client: SonicWallClient, name_filter: Optional[str] = None) -> str:
+async def list_address_objects(client: SonicWallClient, name_filter: Optional[str] = None,
+                               model: Optional[ConfigModel] = None,
+                               query: Optional[Query] = None, fmt: str = "list",
+                               max_bytes: Optional[int] = None) -> str:
     """List address objects."""
     try:
-        result = await client.get_config("address-object/ipv4")
+        model = await _load_category(client, "address_objects_ipv4", model)
         
-        if not result:
+        if not len(model.address_objects):
             return "No address objects found."
         
-        # Format address objects
-        output = "Address Objects:\n"
-        output += "=" * 20 + "\n"
+        query = query or Query()
+        if name_filter:
+            query.filter(f"name~{name_filter}")
         
-        objects = result.get("address-object", {}).get("ipv4", [])
-        if not isinstance(objects, list):
-            objects = [objects] if objects else []
+        page = query.run(VIEWS["address_objects"], model.address_objects)
+        if not page.total:
+            return "No address objects match the specified criteria."
         
-        for i, obj in enumerate(objects, 1):
-            name = obj.get('name', 'Unnamed')
-            
-            # Apply name filter if specified
-            if name_filter and name_filter.lower() not in name.lower():
-                continue
-            
-            output += f"\n{i}. {name}\n"
-            output += f"   Type: {obj.get('type', 'Unknown')}\n"
-            output += f"   Zone: {obj.get('zone', 'Unknown')}\n"
-            
-            if 'host' in obj:
-                output += f"   Host: {obj['host'].get('ip', 'Unknown')}\n"
-            elif 'network' in obj:
-                output += f"   Network: {obj['network'].get('subnet', 'Unknown')}\n"
-            elif 'range' in obj:
-                output += f"   Range: {obj['range'].get('begin', 'Unknown')} - {obj['range'].get('end', 'Unknown')}\n"
-            elif 'fqdn' in obj:
-                output += f"   FQDN: {obj['fqdn'].get('domain', 'Unknown')}\n"
-        
-        return output
+        return render_page("Address Objects", page, fmt, max_bytes, 20)
         
     except Exception as e:
         logger.error(f"Failed to list address objects: {str(e)}")
         return f"Error listing address objects: {str(e)}"
 
-async def create_address_object(client: SonicWallClient, name: str, obj_type: str, value: str, zone: str) -> str:
-    """Create a new address object."""
-    try:
-        # Build the address object data based on type
-        obj_data = {
-            "address-object": {
-                "ipv4": {
-                    "name": name,
-                    "zone": zone
-                }
-            }
-        }
+async def create_address_object(client: SonicWallClient, name: str, obj_type: str, value: str, zone: str,
+                                change_set: Optional[ChangeSet] = None) -> str:
+    """Create a new address object (or stage it in ``change_set``)."""
+    try:
+        # Build the address object entry based on type
+        category = "address_objects_ipv4"
+        entry = {"name": name, "zone": zone}
         
         if obj_type == "host":
-            obj_data["address-object"]["ipv4"]["host"] = {"ip": value}
+            entry["host"] = {"ip": value}
         elif obj_type == "network":
-            obj_data["address-object"]["ipv4"]["network"] = {"subnet": value}
+            network = ipaddress.ip_network(value, strict=False)
+            entry["network"] = {"subnet": str(network.network_address), "mask": str(network.netmask)}
         elif obj_type == "range":
             # Expect value in format "start_ip-end_ip"
             if "-" in value:
                 start, end = value.split("-", 1)
-                obj_data["address-object"]["ipv4"]["range"] = {"begin": start.strip(), "end": end.strip()}
+                entry["range"] = {"begin": start.strip(), "end": end.strip()}
             else:
                 return "Error: Range format should be 'start_ip-end_ip'"
         elif obj_type == "fqdn":
-            obj_data["address-object"]["ipv4"]["fqdn"] = {"domain": value}
+            category = "address_objects_fqdn"
+            entry["domain"] = value
         else:
             return f"Error: Unsupported address object type '{obj_type}'"
         
-        result = await client.post_config("address-object/ipv4", obj_data)
+        if change_set is not None:
+            change_set.add(category, entry)
+            return f"Staged address object '{name}' ({len(change_set)} changes staged)"
+        
+        path, _ = CONFIG_ENDPOINTS[category]
+        result = await client.post(path, bulk_body(category, [entry]))
         await client.commit_config()
         
         return f"Successfully created address object '{name}'"
@@ -314,3 +332,782 @@ async def create_address_object(client: SonicWallClient, name: str, obj_type: st
     except Exception as e:
         logger.error(f"Failed to create address object: {str(e)}")
         return f"Error creating address object: {str(e)}"
+
+async def object_impact(graph: DependencyGraph, name: str, kind: Optional[str] = None) -> str:
+    """Show every rule, policy and group that references an object, directly or transitively."""
+    try:
+        nodes = graph.find(name, kind)
+        if not nodes:
+            return f"No object named '{name}' found in the dependency graph."
+        
+        output = f"Impact Analysis: {name}\n"
+        output += "=" * 30 + "\n"
+        
+        for node in nodes:
+            direct = graph.dependents(node)
+            transitive = graph.impact(node)
+            
+            output += f"\n{node[0]}: {graph.label(node)}\n"
+            output += f"   Direct references: {len(direct)}\n"
+            output += f"   Total impact: {len(transitive)}\n"
+            
+            if not transitive:
+                output += "   Not referenced - safe to delete or edit\n"
+                continue
+            
+            for ref_kind, ref_key in sorted(transitive):
+                via = "direct" if (ref_kind, ref_key) in direct else "via group"
+                output += f"   - {ref_kind}: {graph.label((ref_kind, ref_key))} ({via})\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to analyze object impact: {str(e)}")
+        return f"Error analyzing object impact: {str(e)}"
+
+async def nat_lookup(engine: NatEngine, flows: List[Dict[str, Any]]) -> str:
+    """Show which NAT policy each flow hits and how it is translated."""
+    try:
+        results = engine.lookup_many(flows)
+        
+        output = "NAT Lookup:\n"
+        output += "=" * 15 + "\n"
+        
+        for i, (flow, result) in enumerate(zip(flows, results), 1):
+            port = f":{flow.get('port')}" if flow.get("port") else ""
+            output += f"\n{i}. {flow.get('src')} → {flow.get('dst')}{port}"
+            if flow.get("protocol"):
+                output += f" ({flow['protocol']})"
+            if flow.get("inbound"):
+                output += f" in {flow['inbound']}"
+            output += "\n"
+            
+            if result is None:
+                output += "   No matching NAT policy - traffic is not translated\n"
+                continue
+            
+            t_src, t_dst, t_port = result["translated"]
+            t_port = f":{t_port}" if t_port else ""
+            output += f"   Policy #{result['index'] + 1}: {result['policy']} ({result['family']})\n"
+            output += f"   Interfaces: {result['inbound']} → {result['outbound']}\n"
+            output += f"   Translated: {t_src} → {t_dst}{t_port}\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to run NAT lookup: {str(e)}")
+        return f"Error running NAT lookup: {str(e)}"
+
+async def route_lookup(engine: RouteEngine, dst: str, src: Optional[str] = None,
+                       protocol: Optional[str] = None, port: Optional[int] = None) -> str:
+    """Show the route, egress interface and gateway a packet would use."""
+    try:
+        result = engine.lookup(dst, src, protocol, port)
+        
+        output = f"Route Lookup: {dst}\n"
+        output += "=" * 30 + "\n"
+        if src:
+            output += f"Source: {src}\n"
+        if protocol or port:
+            output += f"Service: {protocol or 'any'}/{port or 'any'}\n"
+        
+        if result is None:
+            return output + "\nNo matching route - traffic would be dropped\n"
+        
+        egress = result["egress"]
+        output += f"\nRoute: {result['name']} ({result['type']})\n"
+        output += f"   Prefix: {result['prefix']}\n"
+        output += f"   Interface: {result['interface']}\n"
+        output += f"   Gateway: {result['gateway']}\n"
+        output += f"   Metric: {result['metric']}\n"
+        if result.get("profile"):
+            output += f"   Path Selection Profile: {result['profile']}\n"
+        if egress:
+            output += f"   Egress Zone: {egress.get('zone', 'Unknown')}\n"
+            output += f"   Egress IP: {egress.get('ip') or 'Unknown'}\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to run route lookup: {str(e)}")
+        return f"Error running route lookup: {str(e)}"
+
+async def snapshot_config(client: SonicWallClient, store: SnapshotStore, label: str = "") -> str:
+    """Fetch the configuration and store it as a deduplicated snapshot."""
+    try:
+        config = await fetch_config(client, skip_failed=True)
+        if not config:
+            raise Exception("no config category could be fetched")
+        missing = [category for category in CONFIG_ENDPOINTS if category not in config]
+        manifest = await asyncio.to_thread(store.save, config, label, missing)
+        
+        raw, stored = manifest["raw_bytes"], manifest["stored_bytes"]
+        output = f"Snapshot Created: {manifest['id']}\n"
+        output += "=" * 30 + "\n"
+        if label:
+            output += f"Label: {label}\n"
+        output += f"Categories: {len(manifest['categories'])}\n"
+        if missing:
+            output += f"Not fetched (left out of diffs): {', '.join(missing)}\n"
+        output += f"Entries: {sum(len(entries) for entries in config.values())}\n"
+        output += f"Raw size: {raw} bytes\n"
+        output += f"New data stored: {stored} bytes"
+        if raw:
+            output += f" ({stored / raw:.1%} of raw)"
+        output += "\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to snapshot config: {str(e)}")
+        return f"Error creating config snapshot: {str(e)}"
+
+async def list_snapshots(store: SnapshotStore) -> str:
+    """List stored config snapshots."""
+    try:
+        ids = store.ids()
+        if not ids:
+            return "No config snapshots found."
+        
+        output = "Config Snapshots:\n"
+        output += "=" * 20 + "\n"
+        
+        for i, snapshot_id in enumerate(ids, 1):
+            manifest = store.manifest(snapshot_id)
+            label = f" - {manifest['label']}" if manifest.get("label") else ""
+            output += f"\n{i}. {snapshot_id}{label}\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to list snapshots: {str(e)}")
+        return f"Error listing snapshots: {str(e)}"
+
+async def diff_config(store: SnapshotStore, old: str = "previous", new: str = "latest") -> str:
+    """Show what changed between two config snapshots."""
+    try:
+        old_id, new_id = store.manifest(old)["id"], store.manifest(new)["id"]
+        changes = store.diff(old_id, new_id)
+        skipped = store.uncompared(old_id, new_id)
+        
+        output = f"Config Diff: {old_id} → {new_id}\n"
+        output += "=" * 50 + "\n"
+        if skipped:
+            output += f"Not compared (fetch failed in one snapshot): {', '.join(skipped)}\n"
+        
+        if not changes:
+            return output + "\nNo changes\n"
+        
+        for category, delta in changes.items():
+            output += f"\n{category}:\n"
+            if delta["reordered"]:
+                output += "   Entries reordered\n"
+            for key in delta["added"]:
+                output += f"   + {key}\n"
+            for key in delta["removed"]:
+                output += f"   - {key}\n"
+            for key in delta["changed"]:
+                fields = store.changed_fields(*delta["versions"][key])
+                output += f"   ~ {key} ({', '.join(fields)})\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to diff config: {str(e)}")
+        return f"Error diffing config snapshots: {str(e)}"
+
+async def export_config(client: SonicWallClient, endpoint: str, directory: str) -> str:
+    """Stream an export to disk and summarize its indexed sections."""
+    try:
+        archive = await export_to_archive(client, endpoint, directory)
+        
+        output = f"Export Saved: {os.path.basename(archive.path)}\n"
+        output += "=" * 30 + "\n"
+        output += f"Size: {os.path.getsize(archive.path)} bytes\n"
+        output += f"Format: {archive.format}\n"
+        output += "\nSections:\n"
+        for section, count in archive.sections().items():
+            output += f"   {section}: {count}\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to export {endpoint}: {str(e)}")
+        return f"Error exporting {endpoint}: {str(e)}"
+
+async def read_export(directory: str, name: Optional[str] = None, section: Optional[str] = None,
+                      item: Optional[int] = None) -> str:
+    """List saved exports, an export's sections, or read one section through its index."""
+    try:
+        names = list_archives(directory)
+        if not names:
+            return "No saved exports found."
+        
+        if not name:
+            output = "Saved Exports:\n"
+            output += "=" * 20 + "\n"
+            for i, export_name in enumerate(names, 1):
+                output += f"\n{i}. {export_name}\n"
+            return output
+        
+        matches = [n for n in names if n == name or n.startswith(name)] if name != "latest" else names[-1:]
+        if len(matches) != 1:
+            return f"Unknown or ambiguous export '{name}'"
+        archive = ExportArchive.open(os.path.join(directory, matches[0]))
+        
+        if not section:
+            output = f"Export: {matches[0]} ({archive.format})\n"
+            output += "=" * 30 + "\n"
+            for section_name, count in archive.sections().items():
+                output += f"   {section_name}: {count}\n"
+            return output
+        
+        return archive.read(section, item)
+        
+    except Exception as e:
+        logger.error(f"Failed to read export: {str(e)}")
+        return f"Error reading export: {str(e)}"
+
+async def stage_changes(change_set: ChangeSet, operation: str, category: str,
+                        entries: Optional[List[Dict[str, Any]]] = None,
+                        keys: Optional[List[str]] = None, by: str = "name") -> str:
+    """Stage add/update/delete operations in a change set without touching the device."""
+    staged_before = len(change_set.staged)
+    try:
+        await change_set.client.validators_ready()
+        if operation == "add":
+            for entry in entries or []:
+                change_set.add(category, entry)
+            count = len(entries or [])
+        elif operation == "update":
+            for entry in entries or []:
+                change_set.update(category, entry)
+            count = len(entries or [])
+        elif operation == "delete":
+            for key in keys or []:
+                change_set.delete(category, key, by)
+            count = len(keys or [])
+        else:
+            return f"Error: Unsupported operation '{operation}'"
+        
+        return f"Staged {count} {operation} operation(s) on {category} ({len(change_set)} changes staged)"
+        
+    except Exception as e:
+        # All or nothing: drop whatever this call staged before the bad entry
+        del change_set.staged[staged_before:]
+        logger.error(f"Failed to stage changes: {str(e)}")
+        return f"Error staging changes: {str(e)}"
+
+def _format_staged(change_set: ChangeSet) -> str:
+    output = f"Staged Changes ({len(change_set)}):\n"
+    output += "=" * 20 + "\n"
+    for i, change in enumerate(change_set.staged, 1):
+        output += f"{i}. {change.describe()}\n"
+    return output
+
+async def preview_changes(change_set: ChangeSet, apply: bool = True) -> str:
+    """Send staged changes as pending config and show what the device will commit."""
+    try:
+        if not apply:
+            return _format_staged(change_set)
+        
+        requests = await change_set.apply() if len(change_set) else 0
+        pending = await change_set.pending()
+        
+        output = f"Pending Changes ({len(change_set.applied)} sent in {requests} requests):\n"
+        output += "=" * 30 + "\n"
+        output += render_data(pending)
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to preview changes: {str(e)}")
+        return f"Error previewing changes: {str(e)}\n\n" + _format_staged(change_set)
+
+async def commit_changes(change_set: ChangeSet, best_effort: bool = False) -> str:
+    """Apply remaining staged changes and commit all pending config once."""
+    try:
+        count = len(change_set) + len(change_set.applied)
+        result = await change_set.commit(best_effort=best_effort)
+        
+        output = f"Committed {count} staged changes"
+        output += " (best effort)\n" if best_effort else "\n"
+        if best_effort:
+            output += render_data(result)
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to commit changes: {str(e)}")
+        return f"Error committing changes: {str(e)}\n\n" + _format_staged(change_set)
+
+async def discard_changes(change_set: ChangeSet) -> str:
+    """Drop staged changes and discard the device's pending config."""
+    try:
+        count = len(change_set) + len(change_set.applied)
+        await change_set.discard()
+        return f"Discarded {count} staged changes and the device's pending config"
+        
+    except Exception as e:
+        logger.error(f"Failed to discard changes: {str(e)}")
+        return f"Error discarding changes: {str(e)}"
+
+async def import_objects(client: SonicWallClient, path: str, kind: str = "address",
+                         model: Optional[ConfigModel] = None, on_duplicate: str = "skip",
+                         dry_run: bool = False, batch_size: int = 100, concurrency: int = 4) -> str:
+    """Bulk-import address or service objects from a CSV/JSON file with a single commit."""
+    try:
+        # Existing names to dedupe against; address object names are unique across families
+        if kind == "address":
+            categories = ["address_objects_ipv4", "address_objects_ipv6", "address_objects_fqdn", "address_objects_mac"]
+        else:
+            categories = ["service_objects"]
+        model = await _load_category(client, categories[0], model)
+        for category in categories[1:]:
+            try:
+                model = await _load_category(client, category, model)
+            except Exception as e:
+                logger.warning(f"Could not load {category} for duplicate checks: {str(e)}")
+        
+        report = await run_import(
+            client, path, kind, model,
+            on_duplicate=on_duplicate,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            dry_run=dry_run,
+        )
+        
+        output = f"Import {'Check' if dry_run else 'Results'}: {os.path.basename(path)}\n"
+        output += "=" * 30 + "\n"
+        output += f"Rows read: {report.rows}\n"
+        output += f"{'Would create' if dry_run else 'Created'}: {report.imported}\n"
+        if report.updated:
+            output += f"{'Would update' if dry_run else 'Updated'}: {report.updated}\n"
+        output += f"Duplicates skipped: {report.duplicates}\n"
+        output += f"Invalid rows: {report.invalid}\n"
+        if not dry_run:
+            output += f"Rejected by firewall: {report.failed}\n"
+            output += f"API requests: {report.requests}\n"
+            if report.committed:
+                output += "Changes committed.\n"
+            elif report.commit_error:
+                output += f"Commit failed: {report.commit_error}\n"
+        if report.errors:
+            output += f"\nPer-row errors written to {report.error_path}\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to import objects: {str(e)}")
+        return f"Error importing objects: {str(e)}"
+
+async def query_config(client: SonicWallClient, expression: str, model: Optional[ConfigModel] = None,
+                       limit: int = 50, cursor: Optional[str] = None, fmt: str = "list",
+                       max_bytes: Optional[int] = None) -> str:
+    """Run a JMESPath-style expression against the config model."""
+    try:
+        compiled = compile_query(expression)
+        for category in compiled.categories:
+            try:
+                model = await _load_category(client, category, model)
+            except Exception as e:
+                logger.warning(f"Could not load {category} for query: {str(e)}")
+        if model is None:
+            return "No configuration could be loaded for this query."
+        
+        value, page = compiled.page(model, limit, cursor)
+        if page is None:
+            return f"Query Result:\n{render_data(value, max_bytes)}"
+        if not page.total:
+            return "No results for this query."
+        
+        return render_page("Query Results", page, fmt, max_bytes)
+        
+    except Exception as e:
+        logger.error(f"Failed to run config query: {str(e)}")
+        return f"Error running query: {str(e)}"
+
+
+async def troubleshoot_sslvpn(client: SonicWallClient, port: Optional[int] = None) -> str:
+    """Diagnose SSL VPN portal reachability from one concurrent read of everything involved."""
+    try:
+        diagnosis = await diagnostics.troubleshoot_sslvpn(client, port)
+        return diagnosis.render()
+        
+    except Exception as e:
+        logger.error(f"Failed to troubleshoot SSL VPN: {str(e)}")
+        return f"Error troubleshooting SSL VPN: {str(e)}"
+
+
+async def network_overview(client: SonicWallClient) -> str:
+    """Summarise device, interfaces, zones and policy counts from one concurrent read."""
+    try:
+        diagnosis = await diagnostics.overview(client)
+        return diagnosis.render()
+        
+    except Exception as e:
+        logger.error(f"Failed to build network overview: {str(e)}")
+        return f"Error building network overview: {str(e)}"
+
+
+def _metric_value(value: Optional[float]) -> str:
+    """Compact display of a sample value or rate."""
+    if value is None:
+        return ""
+    if abs(value) >= 1000:
+        return f"{value:,.0f}"
+    return f"{value:.3g}"
+
+
+async def get_metrics(poller: ReportingPoller, pattern: str = "*", window: float = 3600,
+                      limit: int = 100, fmt: str = "table", max_bytes: Optional[int] = None,
+                      archive: Optional[MetricArchive] = None) -> str:
+    """Summarise polled reporting series over a recent window.
+
+    Windows longer than the poller's ring retention are read from the
+    metric archive, when one is configured.
+    """
+    try:
+        output = "Reporting Poller:\n"
+        for status in poller.status():
+            age = f"{status['age']:.0f}s ago" if status["age"] is not None else "not yet polled"
+            output += f"  {status['target']} ({status['path']}) every {status['interval']:g}s, last {age}"
+            if status["failures"]:
+                output += f", {status['failures']} failure(s): {status['error']}"
+            output += "\n"
+        
+        since = time.time() - window
+        rows = []
+        if archive is not None and window > poller.retention:
+            matched = await asyncio.to_thread(archive.merged, pattern, since)
+        else:
+            matched = poller.store.match(pattern)
+        for series in matched:
+            summary = summarize(series, since)
+            if summary is None:
+                continue
+            if series.counter:
+                rows.append({
+                    "metric": series.metric,
+                    "kind": "counter",
+                    "samples": summary["samples"],
+                    "last": _metric_value(summary["last"]),
+                    "avg": _metric_value(summary["rate"]),
+                    "peak": _metric_value(summary["peak_rate"]),
+                    "trend_per_min": "",
+                })
+            else:
+                rows.append({
+                    "metric": series.metric,
+                    "kind": "gauge",
+                    "samples": summary["samples"],
+                    "last": _metric_value(summary["last"]),
+                    "avg": _metric_value(summary["mean"]),
+                    "peak": _metric_value(summary["max"]),
+                    "trend_per_min": _metric_value(summary["trend_per_min"]),
+                })
+        if not rows:
+            return output + f"\nNo samples for '{pattern}' in the last {window:g}s."
+        
+        page = Page(rows[:limit], 0, len(rows), None)
+        output += "\nFor counters, avg and peak are per-second rates; for gauges, levels.\n"
+        return output + "\n" + render_page(f"Metrics for '{pattern}' over {window:g}s", page, fmt, max_bytes)
+        
+    except Exception as e:
+        logger.error(f"Failed to summarise metrics: {str(e)}")
+        return f"Error summarising metrics: {str(e)}"
+
+
+def _bits_per_second(value: Optional[float]) -> str:
+    """Human-readable bit rate."""
+    if value is None:
+        return ""
+    for unit, size in (("Gbps", 1e9), ("Mbps", 1e6), ("kbps", 1e3)):
+        if abs(value) >= size:
+            return f"{value / size:.2f} {unit}"
+    return f"{value:.0f} bps"
+
+
+async def get_traffic_rates(poller: ReportingPoller, interface: str = "*", window: float = 900,
+                            threshold: float = DEFAULT_Z_THRESHOLD, fmt: str = "table",
+                            max_bytes: Optional[int] = None) -> str:
+    """Per-interface bit, packet and error rates with anomaly flags, from polled counters."""
+    try:
+        report = analyse_traffic(poller.store, window=window, threshold=threshold)
+        rows = []
+        for row in report.rows:
+            if not fnmatch.fnmatchcase(row["interface"], interface):
+                continue
+            errors = [row["rx_errors_ps"], row["tx_errors_ps"]]
+            rows.append({
+                "interface": row["interface"],
+                "rx": _bits_per_second(row["rx_bps"]),
+                "tx": _bits_per_second(row["tx_bps"]),
+                "rx_pps": _metric_value(row["rx_pps"]),
+                "tx_pps": _metric_value(row["tx_pps"]),
+                "errors_ps": _metric_value(sum(e for e in errors if e is not None)) if any(
+                    e is not None for e in errors) else "",
+                "avg_rx": _bits_per_second(row["avg_rx_bps"]),
+                "avg_tx": _bits_per_second(row["avg_tx_bps"]),
+                "peak_rx": _bits_per_second(row["peak_rx_bps"]),
+                "peak_tx": _bits_per_second(row["peak_tx_bps"]),
+            })
+        if not rows:
+            return (f"No interface counters for '{interface}' in the last {window:g}s. "
+                    "Rates need at least two polls of the 'interfaces' reporting target (SONICWALL_POLL).")
+        
+        page = Page(rows, 0, len(rows), None)
+        output = render_page(f"Traffic Rates over {window:g}s", page, fmt, max_bytes)
+        
+        anomalies = [a for a in report.anomalies if fnmatch.fnmatchcase(a["interface"], interface)]
+        if anomalies:
+            output += f"\nAnomalies (|z| >= {threshold:g} against the EWMA baseline, newest first):\n"
+            for anomaly in anomalies[:20]:
+                when = time.strftime("%H:%M:%S", time.localtime(anomaly["at"]))
+                rate = anomaly["rate"]
+                shown = _bits_per_second(rate) if anomaly["field"].endswith("bps") else f"{_metric_value(rate)}/s"
+                direction = "spike" if anomaly["z"] > 0 else "drop"
+                output += f"  {when} {anomaly['interface']} {anomaly['field']} {direction} to {shown} (z={anomaly['z']:.1f})\n"
+            if len(anomalies) > 20:
+                output += f"  ... {len(anomalies) - 20} more\n"
+        else:
+            output += f"\nNo anomalies (|z| >= {threshold:g}) in this window.\n"
+        output += f"\nComputed for {len(report.entities)} interfaces in {report.elapsed * 1000:.1f} ms ({report.backend})\n"
+        
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to compute traffic rates: {str(e)}")
+        return f"Error computing traffic rates: {str(e)}"
+
+
+def _policy_names(model: Optional[ConfigModel]) -> Dict[Tuple[str, str], Tuple[str, bool]]:
+    """(kind, uuid) -> (name, enabled) from the config model, for labelling counter rows."""
+    names = {}
+    if model is not None:
+        for kind in HIT_SOURCES:
+            for policy in model.policies.get(kind, ()):
+                if policy.uuid:
+                    names[(kind, policy.uuid)] = (policy.name, policy.enabled)
+    return names
+
+
+def _when(timestamp: Optional[float]) -> str:
+    if not timestamp:
+        return "never"
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+async def rule_hits(tracker: HitCountTracker, mode: str = "unused", days: int = 30, limit: int = 50,
+                    by: str = "hits", kind: Optional[str] = None, model: Optional[ConfigModel] = None,
+                    refresh: bool = False, fmt: str = "table", max_bytes: Optional[int] = None) -> str:
+    """Unused or busiest policies from the hit counter history."""
+    try:
+        if mode not in ("unused", "top"):
+            return f"Error: unknown mode '{mode}' (expected 'unused' or 'top')"
+        if kind and kind not in HIT_SOURCES:
+            return f"Error: unknown policy kind '{kind}' (expected one of: {', '.join(HIT_SOURCES)})"
+        store = tracker.store
+        if refresh or not store.snapshots:
+            await tracker.snapshot()
+        if not store.snapshots:
+            errors = "; ".join(f"{path}: {error}" for path, error in tracker.errors.items())
+            return f"No policy counters could be read. {errors}"
+        
+        kinds = [kind] if kind else None
+        names = _policy_names(model)
+        rows = []
+        if mode == "unused":
+            results = store.unused(days, kinds)
+            for result in results[:limit]:
+                counter = result["counter"]
+                name, enabled = names.get((counter.kind, counter.uuid), ("", True))
+                rows.append({
+                    "kind": counter.kind,
+                    "name": name or counter.uuid,
+                    "policy": counter.label,
+                    "enabled": enabled,
+                    "device_last_hit": _when(counter.last_hit) if counter.last_hit is not None else "",
+                    "tracked_days": f"{result['tracked_days']:.1f}",
+                    "status": "confirmed" if result["confirmed"] else "provisional",
+                })
+            title = f"Policies with no hits in {days} days"
+            total = len(results)
+        else:
+            for result in store.top(limit, days, by, kinds):
+                counter = result["counter"]
+                name, enabled = names.get((counter.kind, counter.uuid), ("", True))
+                rows.append({
+                    "kind": counter.kind,
+                    "name": name or counter.uuid,
+                    "policy": counter.label,
+                    "hits": f"{result['hits']:,.0f}",
+                    "bytes": f"{result['bytes']:,.0f}",
+                    "hits_per_day": f"{result['hits'] / days:,.1f}",
+                    "resets": counter.resets,
+                })
+            title = f"Top {limit} policies by {by} over {days} days"
+            total = len(rows)
+        
+        first = min((c.first_seen for c in store.current(kinds)), default=min(store.snapshots.values()))
+        footer = (f"\nCounters tracked since {_when(first)} ({(time.time() - first) / 86400:.1f} days); "
+                  f"last snapshot {_when(max(store.snapshots.values()))}.\n")
+        if mode == "unused":
+            footer += ("'provisional' rows have been watched for less than the window and have no older "
+                       "device last-hit time; keep tracking before removing them.\n")
+        if not rows:
+            return f"{title}: none.{footer}"
+        
+        page = Page(rows, 0, total, None)
+        return render_page(title, page, fmt, max_bytes) + footer
+        
+    except Exception as e:
+        logger.error(f"Failed to report rule hits: {str(e)}")
+        return f"Error reporting rule hits: {str(e)}"
+
+
+async def top_talkers(tracker: HeavyHitterTracker, stream: str = "*", window: float = 3600, k: int = 10,
+                      fmt: str = "table", max_bytes: Optional[int] = None) -> str:
+    """Approximate heaviest keys per sketched reporting stream over a recent window."""
+    try:
+        streams = [name for name in sorted(tracker.streams) if fnmatch.fnmatchcase(name, stream)]
+        if not streams:
+            return (f"No heavy-hitter streams match '{stream}'. Add connection-limit targets to "
+                    "SONICWALL_POLL, e.g. 'top:LAN:WAN'.")
+        
+        output = ""
+        for name in streams:
+            topk = tracker.streams[name]
+            result = topk.top(k, window)
+            title = f"Top {k} in {name} over {window:g}s"
+            if not result["items"]:
+                output += f"{title}: no samples.\n\n"
+                continue
+            rows = [{
+                "rank": rank,
+                "key": item["key"],
+                "weight": f"{item['weight']:,.0f}",
+                "share": f"{item['share'] * 100:.1f}%",
+            } for rank, item in enumerate(result["items"], 1)]
+            page = Page(rows, 0, len(rows), None)
+            output += render_page(title, page, fmt, max_bytes)
+            output += (f"\n{topk.samples} samples, {result['span'] / 60:.0f} min covered; total weight "
+                       f"{result['total']:,.0f}, estimates may overcount by up to {result['error_bound']:,.0f}; "
+                       f"sketch memory {topk.memory_bytes // 1024} KiB.\n\n")
+        
+        output += "Weights add up each poll's reported counts, so a key's weight grows with how long it stays busy.\n"
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to report top talkers: {str(e)}")
+        return f"Error reporting top talkers: {str(e)}"
+
+
+async def search_logs(receiver: SyslogReceiver, src: Optional[str] = None, dst: Optional[str] = None,
+                      rule: Optional[str] = None, category: Optional[str] = None, text: Optional[str] = None,
+                      minutes: float = 60, end: Optional[str] = None, limit: int = 50,
+                      fmt: str = "table", max_bytes: Optional[int] = None) -> str:
+    """Syslog events received in a time range, filtered through the log store's indexes."""
+    try:
+        until = datetime.fromisoformat(end).timestamp() if end else time.time()
+        since = until - minutes * 60
+        started = time.perf_counter()
+        filters = {"src": src, "dst": dst, "rule": rule, "category": category}
+        # Column files are decompressed group by group, so search off the loop
+        # that receives the datagrams; queued events are indexed first
+        receiver.store.flush()
+        events, total = await asyncio.to_thread(receiver.store.search, since, until, filters, text, limit)
+        elapsed = time.perf_counter() - started
+        
+        status = receiver.status()
+        footer = (f"\nSearched in {elapsed * 1000:.1f} ms. Receiver on {', '.join(status['listeners'])}: "
+                  f"{status['received']:,} events received since start.\n")
+        window = f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(since))} to " \
+                 f"{time.strftime('%H:%M', time.localtime(until))}"
+        if not events:
+            return f"No log events match between {window}.{footer}"
+        
+        rows = []
+        for received, line in events:
+            event = parse_event(line)
+            rows.append({
+                "received": time.strftime("%m-%d %H:%M:%S", time.localtime(received)),
+                "pri": event.get("pri", ""),
+                "msg": event.get("msg", ""),
+                "src": event.get("src") or event.get("srcV6", ""),
+                "dst": event.get("dst") or event.get("dstV6", ""),
+                "proto": event.get("proto", ""),
+                "rule": event.get("rule", ""),
+                "action": event.get("fw_action", ""),
+                "category": event.get("gcat") or event.get("c", ""),
+                "user": event.get("usr", ""),
+            })
+        page = Page(rows, 0, total, None)
+        return render_page(f"Log events {window}", page, fmt, max_bytes) + footer
+        
+    except Exception as e:
+        logger.error(f"Failed to search logs: {str(e)}")
+        return f"Error searching logs: {str(e)}"
+
+
+async def capture_flows(client: SonicWallClient, directory: str, source: str = "libpcap", name: Optional[str] = None,
+                        sort: str = "bytes", limit: int = 25, fmt: str = "table",
+                        max_bytes: Optional[int] = None) -> str:
+    """Per-flow summary of a packet-monitor capture, downloaded now (or a saved one) and parsed in a worker thread."""
+    try:
+        started = time.perf_counter()
+        if name:
+            saved = sorted(n for n in os.listdir(directory) if "captured-packets" in n) if os.path.isdir(directory) else []
+            matches = [n for n in saved if n == name or n.startswith(name)] if name != "latest" else saved[-1:]
+            if len(matches) != 1:
+                return f"Unknown or ambiguous capture '{name}'"
+            path = os.path.join(directory, matches[0])
+            parser = await asyncio.to_thread(summarize_file, path)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, export_filename(f"captured-packets/{source}"))
+            await client.stream_to_file(f"export/captured-packets/{source}", path)
+            # Parsing is pure Python and CPU-bound; keep it off the event loop
+            parser = await asyncio.to_thread(summarize_file, path)
+        elapsed = time.perf_counter() - started
+        
+        flows = parser.flows
+        output = f"Capture: {os.path.basename(path)} ({parser.format}, {parser.bytes:,} bytes)\n"
+        output += f"Packets: {flows.total_packets:,} ({flows.total_bytes:,} bytes on the wire), flows: {len(flows):,}\n"
+        if flows.other_packets:
+            output += f"Non-IP packets: {flows.other_packets:,}\n"
+        if flows.unattributed_packets:
+            output += (f"Flow table full at {flows.max_flows:,} flows: {flows.unattributed_packets:,} packets "
+                       f"({flows.unattributed_bytes:,} bytes) of later flows are only in the totals\n")
+        output += f"Parsed in {elapsed:.2f}s\n"
+        if not len(flows):
+            return output + "\nNo IP flows in the capture."
+        
+        page = Page(flows.top(sort, limit), 0, len(flows), None)
+        output += "\nbytes_out is initiator to responder; retransmits counts TCP segments resent in either direction.\n"
+        return output + "\n" + render_page(f"Flows by {sort}", page, fmt, max_bytes)
+        
+    except Exception as e:
+        logger.error(f"Failed to summarise capture: {str(e)}")
+        return f"Error summarising capture: {str(e)}"
+
+
+async def queue_stats(scheduler: FairScheduler, fmt: str = "table", max_bytes: Optional[int] = None) -> str:
+    """Queue and run times of tool calls per priority class and per client."""
+    try:
+        snapshot = scheduler.snapshot()
+        output = (f"Running {scheduler.running} of {scheduler.concurrency} slots ({scheduler.reserve} kept for "
+                  f"interactive calls, bulk capped at {scheduler.bulk_limit}, {scheduler.client_concurrency} per client); "
+                  f"{scheduler.waiting} calls waiting.\n\n")
+        classes = snapshot["classes"]
+        output += render_page("Priority classes", Page(classes, 0, len(classes), None), fmt, max_bytes)
+        clients = snapshot["clients"]
+        if clients:
+            output += "\n" + render_page("Clients", Page(clients, 0, len(clients), None), fmt, max_bytes)
+        if scheduler.costs:
+            slowest = sorted(scheduler.costs.items(), key=lambda item: -item[1])[:10]
+            output += "\nExpected run times: " + ", ".join(f"{kind} {cost:.2f}s" for kind, cost in slowest) + "\n"
+        output += "\nPercentiles cover the most recent calls of each class or client.\n"
+        return output
+        
+    except Exception as e:
+        logger.error(f"Failed to report queue stats: {str(e)}")
+        return f"Error reporting queue stats: {str(e)}"
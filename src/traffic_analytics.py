@@ -0,0 +1,290 @@
+"""
+SonicWall Traffic Analytics
+Interface bit and packet rates with EWMA baselines and z-score anomaly flags
+"""
+
+import logging
+import math
+import time
+import warnings
+from array import array
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # falls back to the pure-Python path below
+    np = None
+
+from timeseries import COUNTER_WRAP, MetricStore, counter_delta
+
+logger = logging.getLogger(__name__)
+
+# Derived rates: name -> (cumulative source fields summed per interval, scale, smallest meaningful deviation)
+RATE_FIELDS = {
+    "rx_bps": (("rx_bytes",), 8.0, 8000.0),
+    "tx_bps": (("tx_bytes",), 8.0, 8000.0),
+    "rx_pps": (("rx_unicast_packets", "rx_broadcast_packets"), 1.0, 10.0),
+    "tx_pps": (("tx_unicast_packets", "tx_broadcast_packets"), 1.0, 10.0),
+    "rx_errors_ps": (("rx_errors",), 1.0, 0.1),
+    "tx_errors_ps": (("tx_errors",), 1.0, 0.1),
+}
+
+DEFAULT_ALPHA = 0.1
+DEFAULT_Z_THRESHOLD = 3.0
+
+# Intervals a baseline needs before its deviations are scored
+WARMUP = 5
+
+# Relative floor on the baseline deviation, so a flat series does not flag every wiggle
+_RELATIVE_FLOOR = 0.05
+
+
+class SampleBlock:
+    """Counter samples for many interfaces, aligned on the right (newest) edge.
+
+    ``times[i]`` and ``values[field][i]`` are equal-length sequences for
+    entity ``i``; entities that appeared later have fewer samples.
+    """
+
+    def __init__(self, entities: List[str], times: List[array], values: Dict[str, List[Optional[array]]]):
+        self.entities = entities
+        self.times = times
+        self.values = values
+
+    @property
+    def length(self) -> int:
+        return max((len(t) for t in self.times), default=0)
+
+
+def interface_sources(store: MetricStore) -> List[str]:
+    """Poll targets in the store that look like interface statistics."""
+    sources = {name.split("/", 1)[0] for name in store.series}
+    return sorted(s for s in sources if s == "interfaces" or (s.startswith("interfaces_") and "statistics" in s))
+
+
+def collect(store: MetricStore, sources: Iterable[str], since: float = 0.0) -> SampleBlock:
+    """Per-interface counter windows for the fields ``RATE_FIELDS`` needs."""
+    wanted = {field for fields, _, _ in RATE_FIELDS.values() for field in fields}
+    by_entity: Dict[Tuple[str, str], Dict[str, Tuple[array, array]]] = {}
+    prefixes = tuple(f"{source}/" for source in sources)
+    for name, series in store.series.items():
+        if not name.startswith(prefixes):
+            continue
+        parts = name.split("/")
+        if len(parts) != 3 or parts[2] not in wanted:
+            continue
+        by_entity.setdefault((parts[0], parts[1]), {})[parts[2]] = series.ring.window(since)
+
+    entities, times = [], []
+    values: Dict[str, List[Optional[array]]] = {field: [] for field in wanted}
+    for (source, entity), fields in sorted(by_entity.items(), key=lambda item: (item[0][0] != "interfaces", item[0])):
+        # All fields of one entity come from the same polls; keep the newest samples they share
+        n = min(len(t) for t, _ in fields.values())
+        if n < 2:
+            continue
+        entities.append(entity if source == "interfaces" else f"{entity} ({source})")
+        times.append(next(iter(fields.values()))[0][-n:])
+        for field in wanted:
+            window = fields.get(field)
+            values[field].append(window[1][-n:] if window else None)
+    return SampleBlock(entities, times, values)
+
+
+class TrafficReport:
+    """Rates per interface and the anomalies found in them."""
+
+    def __init__(self, entities: List[str], rows: List[Dict[str, Any]], anomalies: List[Dict[str, Any]],
+                 backend: str, elapsed: float):
+        self.entities = entities
+        self.rows = rows
+        self.anomalies = anomalies
+        self.backend = backend
+        self.elapsed = elapsed
+
+
+# --- NumPy path: every interface and rate field in one set of array operations
+
+
+def _matrix(rows: List[Optional[array]], width: int):
+    """Entities x width float matrix, right-aligned, NaN-padded (and NaN for missing fields)."""
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        if row is not None and len(row):
+            matrix[i, width - len(row):] = np.frombuffer(row, dtype=np.float64)
+    return matrix
+
+
+def _deltas_numpy(values):
+    """Per-interval increases of cumulative counters, allowing for 32-bit wrap and resets."""
+    prev, cur = values[:, :-1], values[:, 1:]
+    deltas = cur - prev
+    with np.errstate(invalid="ignore"):
+        wrapped = (deltas < 0) & (prev < COUNTER_WRAP) & (prev >= COUNTER_WRAP / 2)
+        deltas = np.where(wrapped, deltas + COUNTER_WRAP, deltas)
+        # Anything else going down is a reset: the new value was counted since then
+        return np.where(deltas < 0, cur, deltas)
+
+
+def _ewma_scores_numpy(rates, floors, alpha: float):
+    """EWMA mean and variance per row; z of each sample against the baseline before it."""
+    rows, width = rates.shape
+    mean = np.zeros(rows)
+    var = np.zeros(rows)
+    seen = np.zeros(rows, dtype=np.int64)
+    scores = np.full(rates.shape, np.nan)
+    for t in range(width):
+        x = rates[:, t]
+        valid = ~np.isnan(x)
+        std = np.maximum(np.sqrt(var), np.maximum(np.abs(mean) * _RELATIVE_FLOOR, floors))
+        ready = valid & (seen >= WARMUP)
+        scores[ready, t] = (x[ready] - mean[ready]) / std[ready]
+        diff = np.where(valid, x - mean, 0.0)
+        first = valid & (seen == 0)
+        mean = np.where(first, x, mean + alpha * diff)
+        var = np.where(first, 0.0, np.where(valid, (1 - alpha) * (var + alpha * diff * diff), var))
+        seen += valid
+    return mean, scores
+
+
+def _analyse_numpy(block: SampleBlock, alpha: float, threshold: float):
+    width = block.length
+    times = _matrix(block.times, width)
+    dt = np.diff(times, axis=1)
+    with np.errstate(invalid="ignore"):
+        dt = np.where(dt > 0, dt, np.nan)
+
+    names = list(RATE_FIELDS)
+    stacked = []
+    for name in names:
+        fields, scale, _ = RATE_FIELDS[name]
+        total = None
+        for field in fields:
+            deltas = _deltas_numpy(_matrix(block.values[field], width))
+            total = deltas if total is None else total + deltas
+        stacked.append(total * scale / dt)
+    # (fields * entities) x intervals: one baseline pass covers everything
+    rates = np.vstack(stacked)
+    floors = np.repeat([RATE_FIELDS[name][2] for name in names], len(block.entities))
+    baseline, scores = _ewma_scores_numpy(rates, floors, alpha)
+
+    # Rows that are all NaN (missing fields) warn in nanmean/nanmax and yield NaN, which is what we want
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        current = rates[:, -1]
+        average = np.nanmean(rates, axis=1)
+        peak = np.nanmax(rates, axis=1)
+    with np.errstate(invalid="ignore"):
+        flagged = np.argwhere(np.abs(scores) >= threshold)
+    ends = times[:, 1:]
+    count = len(block.entities)
+    hits = [(int(k), float(scores[k, j]), float(rates[k, j]), float(ends[k % count, j])) for k, j in flagged]
+    return names, current.tolist(), average.tolist(), peak.tolist(), baseline.tolist(), hits
+
+
+# --- Pure-Python path, same arithmetic one series at a time
+
+
+def _deltas_python(values: Optional[array]) -> List[Optional[float]]:
+    if values is None:
+        return []
+    deltas = []
+    for prev, cur in zip(values, values[1:]):
+        deltas.append(counter_delta(prev, cur))
+    return deltas
+
+
+def _ewma_scores_python(rates: List[Optional[float]], floor: float, alpha: float):
+    mean = var = 0.0
+    seen = 0
+    scores: List[Optional[float]] = []
+    for x in rates:
+        if x is None:
+            scores.append(None)
+            continue
+        std = max(math.sqrt(var), abs(mean) * _RELATIVE_FLOOR, floor)
+        scores.append((x - mean) / std if seen >= WARMUP else None)
+        if seen == 0:
+            mean, var = x, 0.0
+        else:
+            diff = x - mean
+            mean += alpha * diff
+            var = (1 - alpha) * (var + alpha * diff * diff)
+        seen += 1
+    return mean, scores
+
+
+def _analyse_python(block: SampleBlock, alpha: float, threshold: float):
+    names = list(RATE_FIELDS)
+    current, average, peak, baseline, hits = [], [], [], [], []
+    for name in names:
+        fields, scale, floor = RATE_FIELDS[name]
+        for i, times in enumerate(block.times):
+            columns = [_deltas_python(block.values[field][i]) for field in fields]
+            row = []
+            for j in range(len(times) - 1):
+                dt = times[j + 1] - times[j]
+                parts = [column[j] for column in columns if column]
+                if dt <= 0 or len(parts) < len(fields):
+                    row.append(None)
+                else:
+                    row.append(sum(parts) * scale / dt)
+            valid = [x for x in row if x is not None]
+            mean, scores = _ewma_scores_python(row, floor, alpha)
+            k = len(current)
+            current.append(row[-1] if row else None)
+            average.append(math.fsum(valid) / len(valid) if valid else None)
+            peak.append(max(valid) if valid else None)
+            baseline.append(mean)
+            hits.extend((k, z, row[j], times[j + 1]) for j, z in enumerate(scores)
+                        if z is not None and abs(z) >= threshold)
+    return names, current, average, peak, baseline, hits
+
+
+def _value(x: Optional[float]) -> Optional[float]:
+    return None if x is None or x != x else x
+
+
+def analyse(store: MetricStore, sources: Optional[Iterable[str]] = None, window: float = 3600,
+            alpha: float = DEFAULT_ALPHA, threshold: float = DEFAULT_Z_THRESHOLD,
+            use_numpy: Optional[bool] = None) -> TrafficReport:
+    """Rates, baselines and anomalies for every polled interface in one pass.
+
+    Bytes become bits per second and unicast plus broadcast packets become
+    packets per second. Each rate series gets an exponentially weighted
+    mean and variance (``alpha`` per interval); a sample more than
+    ``threshold`` standard deviations from the baseline that preceded it
+    is flagged. With NumPy installed all interfaces and fields are
+    processed as one matrix; without it the same arithmetic runs per series.
+    """
+    started = time.perf_counter()
+    sources = list(sources) if sources else interface_sources(store)
+    block = collect(store, sources, time.time() - window)
+    vectorised = (np is not None) if use_numpy is None else (use_numpy and np is not None)
+    if not block.entities:
+        return TrafficReport([], [], [], "numpy" if vectorised else "python", time.perf_counter() - started)
+
+    names, current, average, peak, baseline, hits = (
+        _analyse_numpy if vectorised else _analyse_python)(block, alpha, threshold)
+
+    count = len(block.entities)
+    rows = []
+    for i, entity in enumerate(block.entities):
+        row: Dict[str, Any] = {"interface": entity}
+        for f, name in enumerate(names):
+            k = f * count + i
+            row[name] = _value(current[k])
+            row[f"avg_{name}"] = _value(average[k])
+            row[f"peak_{name}"] = _value(peak[k])
+            row[f"baseline_{name}"] = _value(baseline[k])
+        rows.append(row)
+
+    anomalies = [{
+        "interface": block.entities[k % count],
+        "field": names[k // count],
+        "z": z,
+        "rate": _value(rate),
+        "at": at,
+    } for k, z, rate, at in hits]
+    anomalies.sort(key=lambda a: (-a["at"], -abs(a["z"])))
+    return TrafficReport(block.entities, rows, anomalies, "numpy" if vectorised else "python",
+                         time.perf_counter() - started)